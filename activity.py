@@ -0,0 +1,288 @@
+# activity.py
+"""
+Customer activity events, written in batches off the request path.
+
+    log_activity(customer.id, "profile_viewed")
+    log_activity(customer.id, "bill_created", bill.id)
+
+``log_activity`` stamps the event and puts it on a bounded in-memory
+queue; it never touches the database. A background writer thread (one
+per process, started on the first event) drains the queue and inserts
+up to ACTIVITY_BATCH rows per transaction, at the latest
+ACTIVITY_FLUSH_MS after the oldest pending event. Events therefore show
+up in the timeline after a short delay, ordered by the time they were
+logged, not written.
+
+When the queue (ACTIVITY_QUEUE_SIZE) is full the request waits up to
+ACTIVITY_BLOCK_MS (default 0) for room, then the event is dropped and
+counted; a slow disk costs activity rows, never checkouts. Queue depth,
+drops, waits and batch timings are on /crm/api/activity/metrics and,
+with INSTRUMENTATION on, in /metrics.
+
+Pending events are written on interpreter exit and when a gunicorn
+worker exits (gunicorn.conf.py); a hard kill loses at most one queue.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import current_tenant
+from instrumentation import metrics
+from models import DEFAULT_TENANT_ID, CustomerActivity
+
+log = logging.getLogger(__name__)
+
+ACTIONS = ("customer_created", "profile_viewed", "profile_updated", "bill_created")
+# "full": the queue had no room; "dropped": ... and none freed up within ACTIVITY_BLOCK_MS
+COUNTERS = ("enqueued", "written", "dropped", "failed", "full", "batches")
+
+
+class ActivityLog:
+    """Bounded queue + single writer thread for customer_activity rows."""
+
+    def __init__(self, engine, maxsize=10_000, batch=500, flush_ms=200, block_ms=0, tenant_engine=None):
+        self.engine = engine
+        # store id -> its own database's engine, or None for the main one (tenancy.py)
+        self.tenant_engine = tenant_engine
+        self.maxsize = maxsize
+        self.batch = batch
+        self.flush_interval = flush_ms / 1000
+        self.block_timeout = block_ms / 1000
+        self._reset()
+
+    def _reset(self):
+        # also the fork handler: the child gets an empty queue and no writer
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self.maxsize)
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.blocked_seconds = 0.0
+        self.write_seconds = 0.0
+        self.max_depth = 0
+        self.last_batch = 0
+
+    # ---- producer side ----
+    def log(self, customer_id, action, reference_id=None):
+        """Queue one event; returns False if it was dropped."""
+        if self._closed:
+            return False
+        if self._pid != os.getpid():
+            self._start()
+        # stamped here: the writer thread has no store of its own
+        row = {"customer_id": customer_id, "action": action, "reference_id": reference_id,
+               "created_at": datetime.utcnow(), "tenant_id": current_tenant.get() or DEFAULT_TENANT_ID}
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if not self._wait_for_room(row):
+                return False
+        depth = self._queue.qsize()
+        with self._lock:
+            self.counters["enqueued"] += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def _wait_for_room(self, row):
+        start = time.perf_counter()
+        try:
+            if not self.block_timeout:
+                raise queue.Full
+            self._queue.put(row, timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+            return False
+        finally:
+            with self._lock:
+                self.counters["full"] += 1
+                self.blocked_seconds += time.perf_counter() - start
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    # ---- writer side ----
+    def _take_batch(self, timeout=None):
+        """Block for the first event, then gather until the batch is full
+        or the flush interval since that event has passed."""
+        try:
+            rows = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch:
+            remaining = deadline - time.monotonic()
+            try:
+                rows.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._closed:
+            rows = []
+            try:
+                rows = self._take_batch(timeout=0.5)
+                if rows:
+                    self._write(rows)
+            except Exception:
+                # the writer outlives any one batch; its events count as failed
+                log.exception("activity writer: batch of %d events lost", len(rows))
+                with self._lock:
+                    self.counters["failed"] += len(rows)
+                for _ in rows:
+                    self._queue.task_done()
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        written = failed = 0
+        if self.tenant_engine is None:
+            written, failed = self._insert(self.engine, rows)
+        else:
+            by_engine = {}
+            for row in rows:
+                engine = self.tenant_engine(row["tenant_id"]) or self.engine
+                by_engine.setdefault(engine, []).append(row)
+            for engine, engine_rows in by_engine.items():
+                ok, bad = self._insert(engine, engine_rows)
+                written += ok
+                failed += bad
+        if failed:
+            log.error("dropped %d of %d activity events", failed, len(rows))
+        with self._lock:
+            self.counters["written"] += written
+            self.counters["failed"] += failed
+            self.counters["batches"] += 1
+            self.last_batch = len(rows)
+            self.write_seconds += time.perf_counter() - start
+        for _ in rows:
+            self._queue.task_done()
+
+    def _insert(self, engine, rows):
+        table = CustomerActivity.__table__
+        try:
+            with engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+            return len(rows), 0
+        except SQLAlchemyError:
+            pass
+        # one bad row (e.g. a customer deleted meanwhile) must not cost the batch
+        written = failed = 0
+        for row in rows:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(table.insert(), [row])
+                written += 1
+            except SQLAlchemyError:
+                failed += 1
+        return written, failed
+
+    # ---- lifecycle ----
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is written."""
+        deadline = time.monotonic() + timeout
+        # Queue.join() without a timeout: unfinished_tasks drops on task_done
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Stop the writer and write what is still queued (shutdown)."""
+        if self._closed or self._pid != os.getpid():
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while True:
+            rows = self._take_batch(timeout=0)
+            if not rows:
+                break
+            self._write(rows)
+
+    def stats(self):
+        with self._lock:
+            batches = self.counters["batches"]
+            return {
+                **self.counters,
+                "depth": self._queue.qsize(),
+                "capacity": self.maxsize,
+                "max_depth": self.max_depth,
+                "last_batch": self.last_batch,
+                "blocked_seconds": round(self.blocked_seconds, 4),
+                "write_ms_per_batch": round(self.write_seconds * 1000 / batches, 3) if batches else None,
+            }
+
+    def render_prometheus(self):
+        stats = self.stats()
+        lines = []
+        for name in COUNTERS:
+            lines += [f"# TYPE smartbill_activity_{name}_total counter",
+                      f"smartbill_activity_{name}_total {stats[name]}"]
+        lines += ["# TYPE smartbill_activity_queue_depth gauge",
+                  f"smartbill_activity_queue_depth {stats['depth']}",
+                  "# TYPE smartbill_activity_blocked_seconds_total counter",
+                  f"smartbill_activity_blocked_seconds_total {stats['blocked_seconds']}",
+                  "# TYPE smartbill_activity_write_seconds_total counter",
+                  f"smartbill_activity_write_seconds_total {round(self.write_seconds, 4)}"]
+        return lines
+
+
+def log_activity(customer_id, action, reference_id=None):
+    """Record ``action`` for ``customer_id`` without waiting for the database."""
+    activity_log = current_app.extensions.get("activity_log")
+    if activity_log is None or not customer_id:
+        return False
+    return activity_log.log(customer_id, action, reference_id)
+
+
+# the process's writer for /metrics (the last app created, i.e. the only one outside benchmarks)
+_activity_log = None
+
+
+def _render_prometheus():
+    return _activity_log.render_prometheus() if _activity_log is not None else []
+
+
+metrics.collectors.append(_render_prometheus)
+
+
+def init_activity(app, db):
+    """Create the process's activity writer when ACTIVITY_LOG is on."""
+    global _activity_log
+
+    if not app.config.get("ACTIVITY_LOG"):
+        return
+    with app.app_context():
+        engine = db.engine
+    databases = app.extensions.get("tenant_databases")
+    _activity_log = ActivityLog(
+        engine,
+        maxsize=app.config["ACTIVITY_QUEUE_SIZE"],
+        batch=app.config["ACTIVITY_BATCH"],
+        flush_ms=app.config["ACTIVITY_FLUSH_MS"],
+        block_ms=app.config["ACTIVITY_BLOCK_MS"],
+        tenant_engine=databases.engine if databases is not None else None,
+    )
+    app.extensions["activity_log"] = _activity_log
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_activity_log._reset)
@@ -0,0 +1,550 @@
+# analytics.py
+"""
+In-memory columnar sales cube for the reports and the AI assistant.
+
+Two fact tables held as NumPy columns:
+
+    lines   day x product x customer -> quantity        from bill items
+    bills   day x customer           -> bills, total    from bill headers (rupees)
+
+``day`` is days since 1970-01-01 and customer 0 stands for walk-ins.
+The cube is loaded on first use from every partition (archived years
+included, see archive.py) and then caught up on each query with the
+bills and items whose ids are above the last ones it saw, so it follows
+checkouts from every worker process at the cost of two primary key range
+queries. Daily / monthly trends, totals and top products are then
+bincounts over the columns instead of GROUP BYs over the tables.
+
+The catch-up only sees new rows. Code that changes bills already loaded
+(``rebuild_crm`` and ``bootstrap_customers`` relink their customers)
+calls ``invalidate_sales_cube``, which bumps the store's counter in a
+RevisionStore file shared by the host's workers
+(ANALYTICS_CUBE_REVISIONS, default <instance>/analytics.rev); each
+worker's cube reloads when it next sees the counter moved.
+
+Memory is accounted as the bytes of the column buffers. Above
+ANALYTICS_CUBE_MAX_MB the oldest days are rolled up, a month at a time:
+first they lose the customer dimension, then products are kept per
+month instead of per day (daily revenue stays exact); if that is not
+enough the cube switches itself off. Queries it can no longer answer (a
+breakdown reaching into rolled-up days, or anything when off) return
+None and callers fall back to SQL. Size and state are on /admin/analytics
+and, with INSTRUMENTATION on, in /metrics.
+
+There is one cube per store (tenancy.py), made on first use and capped
+at ANALYTICS_CUBE_MAX_MB each; requests use their store's, code outside
+a request the one over every store.
+
+Loading reads every bill once (tens of seconds per million). With
+ANALYTICS_CUBE_BACKGROUND=1 (the default) it runs on a thread and the
+queries return None, i.e. SQL, until it is in; a periodic reload swaps
+the new cube in while the old one keeps answering. Under gunicorn the
+master loads every store's cube before forking the workers
+(ANALYTICS_CUBE_PRELOAD, see gunicorn.conf.py and ``warm_sales_cubes``),
+so workers, including those recycled after max_requests, start with it
+and only catch up on the bills since.
+
+Ids are handed out in commit order on SQLite. On PostgreSQL a bill can
+commit after one with a higher id and be skipped by the catch-up; set
+ANALYTICS_CUBE_RELOAD_SECONDS there to rebuild the cube periodically.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from flask import current_app, jsonify
+from flask_login import login_required
+from sqlalchemy import func, select
+
+from archive import bill_partitions
+from database import current_tenant, day_bucket
+from http_cache import RevisionStore
+from instrumentation import metrics
+from models import db, Bill, BillItem, Product, Tenant
+from tenancy import tenant_context
+
+log = logging.getLogger(__name__)
+
+EPOCH = np.datetime64("1970-01-01", "D")
+WALK_IN = 0
+LOAD_CHUNK = 200_000
+COARSEN_DAYS = 30  # days rolled up per step when over the cap
+
+DaySales = namedtuple("DaySales", "date revenue")
+MonthSales = namedtuple("MonthSales", "month revenue bills")
+ProductSales = namedtuple("ProductSales", "name sold")
+
+LINE_COLUMNS = {"day": np.int32, "product": np.int32, "customer": np.int32, "quantity": np.int64}
+BILL_COLUMNS = {"day": np.int32, "customer": np.int32, "bills": np.int64, "total": np.float64}
+
+
+class Columns:
+    """Growable set of equal-length NumPy columns."""
+
+    def __init__(self, dtypes):
+        self.dtypes = dtypes
+        self.size = 0
+        self.data = {name: np.empty(0, dtype) for name, dtype in dtypes.items()}
+
+    def __getitem__(self, name):
+        return self.data[name][:self.size]
+
+    def __contains__(self, name):
+        return name in self.data
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.data.values())
+
+    def append(self, columns):
+        n = len(next(iter(columns.values())))
+        if not n:
+            return
+        end = self.size + n
+        capacity = len(self.data["day"])
+        if end > capacity:
+            capacity = max(end, int(capacity * 1.5), 1024)
+            for name, a in self.data.items():
+                grown = np.empty(capacity, a.dtype)
+                grown[:self.size] = a[:self.size]
+                self.data[name] = grown
+        for name, values in columns.items():
+            self.data[name][self.size:end] = values
+        self.size = end
+
+    def replace(self, columns):
+        """Swap in new contents, trimmed to size (compaction)."""
+        self.size = len(next(iter(columns.values())))
+        self.data = {name: np.ascontiguousarray(columns[name], dtype) for name, dtype in self.dtypes.items()}
+
+
+def _compact(columns, keys, sums):
+    """One row per distinct ``keys`` combination with ``sums`` added up."""
+    if not columns.size:
+        return
+    order = np.lexsort([columns[k] for k in reversed(keys)])
+    sorted_keys = [columns[k][order] for k in keys]
+    starts = np.flatnonzero(np.r_[True, np.any([k[1:] != k[:-1] for k in sorted_keys], axis=0)])
+    merged = {k: v[starts] for k, v in zip(keys, sorted_keys)}
+    for name in sums:
+        merged[name] = np.add.reduceat(columns[name][order], starts)
+    columns.replace(merged)
+
+
+def _days(values):
+    return (np.array(values, dtype="datetime64[D]") - EPOCH).astype(np.int32)
+
+
+def _day(value):
+    """A date as days since EPOCH (None stays None)."""
+    return None if value is None else int((np.datetime64(value, "D") - EPOCH).astype(int))
+
+
+def _month_start(days):
+    months = (EPOCH + days.astype("timedelta64[D]")).astype("datetime64[M]")
+    return (months.astype("datetime64[D]") - EPOCH).astype(days.dtype)
+
+
+def _day_label(day):
+    return str(EPOCH + np.timedelta64(int(day), "D"))
+
+
+class SalesCube:
+    def __init__(self, max_bytes, reload_seconds=0, tenant_id=None, background=False, revisions=None):
+        self.max_bytes = max_bytes
+        self.reload_seconds = reload_seconds
+        self.tenant_id = tenant_id  # None: every store
+        self.background = background
+        self.revisions = revisions  # RevisionStore shared by the host's workers
+        self.revision = None  # the store's counter as of the last load
+        self.loaded_at = None
+        self.load_seconds = None
+        self._reset_data()
+        self._after_fork()
+
+    def _after_fork(self):
+        # a child keeps the data loaded before the fork (copy-on-write) but
+        # not the parent's lock or load thread
+        self._lock = threading.RLock()
+        self._loader = None
+
+    # ---- loading ----
+    def _scope(self, bills):
+        # explicit: the load runs Core on the connection, which the ORM tenant filter never sees
+        return () if self.tenant_id is None else (bills.tenant_id == self.tenant_id,)
+
+    def _line_query(self, bills, items):
+        return (
+            select(items.id, day_bucket(bills.bill_date), items.product_id,
+                   func.coalesce(bills.customer_id, WALK_IN), items.quantity)
+            .join(bills, bills.id == items.bill_id)
+            .where(*self._scope(bills))
+        )
+
+    def _bill_query(self, bills):
+        return select(bills.id, day_bucket(bills.bill_date), func.coalesce(bills.customer_id, WALK_IN),
+                      func.coalesce(bills.total, 0.0)).where(*self._scope(bills))
+
+    def _roll_up(self, columns):
+        """Apply the roll-ups so far to ``columns`` (a Columns or new rows)."""
+        day = columns["day"]
+        if self.full_from is not None:
+            columns["customer"][day < self.full_from] = WALK_IN
+        if self.daily_from is not None and "product" in columns:
+            old = day < self.daily_from
+            day[old] = _month_start(day[old])
+
+    def _add_lines(self, rows):
+        ids, day, product, customer, quantity = zip(*rows)
+        columns = {
+            "day": _days(day), "product": np.array(product, np.int32), "customer": np.array(customer, np.int32),
+            "quantity": np.array(quantity, np.int64),
+        }
+        self._roll_up(columns)  # older partitions, back-dated bills
+        self.lines.append(columns)
+        self.last_item_id = max(self.last_item_id, max(ids))
+
+    def _add_bills(self, rows):
+        ids, day, customer, total = zip(*rows)
+        columns = {
+            "day": _days(day), "customer": np.array(customer, np.int32),
+            "bills": np.ones(len(ids), np.int64), "total": np.array(total, np.float64),
+        }
+        self._roll_up(columns)
+        self.bills.append(columns)
+        self.last_bill_id = max(self.last_bill_id, max(ids))
+
+    @property
+    def nbytes(self):
+        return self.lines.nbytes + self.bills.nbytes
+
+    def _read(self, statement, add):
+        connection = db.session.connection()
+        for rows in connection.execute(statement.execution_options(yield_per=LOAD_CHUNK)).partitions():
+            add(rows)
+            if self.nbytes > self.max_bytes:
+                # leave room for the chunks still to come, or every one would compact again
+                self._enforce_cap(self.max_bytes * 3 // 4)
+                if self.disabled:
+                    return
+
+    def load(self):
+        """(Re)build the cube from every partition."""
+        started = time.perf_counter()
+        # read first: a bump while loading makes the next query load again
+        self.revision = self._current_revision()
+        self._reset_data()
+        for bills, items in bill_partitions():
+            self._read(self._bill_query(bills), self._add_bills)
+            if not self.disabled:
+                self._read(self._line_query(bills, items), self._add_lines)
+            if self.disabled:
+                break
+        if not self.disabled:
+            self._enforce_cap()
+        self.loaded_at = time.monotonic()
+        self.load_seconds = time.perf_counter() - started
+        if self.disabled:
+            log.warning("sales cube needs more than ANALYTICS_CUBE_MAX_MB; reports use SQL")
+
+    def _load_in_background(self):
+        """Build a new cube on a thread and swap it in when done."""
+        if self._loader is not None and self._loader.is_alive():
+            return
+        app = current_app._get_current_object()
+        fresh = SalesCube(self.max_bytes, tenant_id=self.tenant_id, revisions=self.revisions)
+
+        def run():
+            with app.app_context(), tenant_context(self.tenant_id):
+                try:
+                    fresh.load()
+                except Exception:
+                    log.exception("sales cube load failed; reports use SQL")
+                    return
+                finally:
+                    db.session.remove()
+            with self._lock:
+                self._adopt(fresh)
+
+        self._loader = threading.Thread(target=run, name="sales-cube-load", daemon=True)
+        self._loader.start()
+
+    def _adopt(self, other):
+        for name in ("lines", "bills", "last_bill_id", "last_item_id", "full_from", "daily_from",
+                     "disabled", "revision", "loaded_at", "load_seconds"):
+            setattr(self, name, getattr(other, name))
+
+    def _reset_data(self):
+        self.lines = Columns(LINE_COLUMNS)
+        self.bills = Columns(BILL_COLUMNS)
+        self.last_bill_id = self.last_item_id = 0
+        self.full_from = None   # first day that still has customers (None: all days)
+        self.daily_from = None  # first day of products by day; before it by month
+        self.disabled = False
+
+    def _current_revision(self):
+        return self.revisions.get(_revision_key(self.tenant_id))[0] if self.revisions is not None else 0
+
+    def refresh(self):
+        """Load on first use (or when due for a reload, or invalidated), else
+        append what was billed since."""
+        if self.loaded_at is None or self.revision != self._current_revision() or (
+            self.reload_seconds and time.monotonic() - self.loaded_at > self.reload_seconds
+        ):
+            if not self.background:
+                self.load()
+                return
+            self._load_in_background()
+        if self.loaded_at is None or self.disabled:
+            return
+        # new bills always go to the hot tables; both are primary key range scans
+        rows = db.session.execute(self._line_query(Bill, BillItem).where(BillItem.id > self.last_item_id)).all()
+        if rows:
+            self._add_lines(rows)
+        rows = db.session.execute(self._bill_query(Bill).where(Bill.id > self.last_bill_id)).all()
+        if rows:
+            self._add_bills(rows)
+        if self.nbytes > self.max_bytes:
+            self._enforce_cap()
+
+    # ---- memory ----
+    def _compact(self):
+        _compact(self.lines, ("day", "product", "customer"), ("quantity",))
+        _compact(self.bills, ("day", "customer"), ("bills", "total"))
+
+    def _enforce_cap(self, target=None):
+        """Compact, then roll the oldest days up COARSEN_DAYS at a time until
+        the cube fits ``target`` (default: the cap): first without customers,
+        then products by month. Switch off if it still is over the cap."""
+        target = self.max_bytes if target is None else target
+        self._compact()
+        while self.nbytes > target and (self.lines.size or self.bills.size):
+            days = [c["day"] for c in (self.lines, self.bills) if c.size]
+            first, last = min(int(d.min()) for d in days), max(int(d.max()) for d in days)
+            if self.full_from is None or self.full_from <= last:
+                self.full_from = min((first if self.full_from is None else self.full_from) + COARSEN_DAYS, last + 1)
+            elif self.daily_from is None or self.daily_from <= last:
+                self.daily_from = min((first if self.daily_from is None else self.daily_from) + COARSEN_DAYS, last + 1)
+            else:
+                break  # nothing left to roll up
+            self._roll_up(self.lines)
+            self._roll_up(self.bills)
+            self._compact()
+        if self.nbytes > self.max_bytes:
+            self._reset_data()
+            self.disabled = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenant_id": self.tenant_id,
+                "enabled": not self.disabled,
+                "loaded": self.loaded_at is not None,
+                "loading": self._loader is not None and self._loader.is_alive(),
+                "line_rows": self.lines.size,
+                "bill_rows": self.bills.size,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "customers_from": _day_label(self.full_from) if self.full_from is not None else None,
+                "daily_products_from": _day_label(self.daily_from) if self.daily_from is not None else None,
+                "last_bill_id": self.last_bill_id,
+                "last_item_id": self.last_item_id,
+                "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            }
+
+    # ---- queries ----
+    def _query(self, fn):
+        with self._lock:
+            self.refresh()
+            if self.loaded_at is None or self.disabled:
+                return None  # still loading, or off
+            return fn()
+
+    def summary(self, top=5):
+        """Everything /reports/data shows: daily and monthly sales, top
+        products, totals; None when the cube is off."""
+        def build():
+            days, revenue, bills = self._by_day()
+            months = days.astype("datetime64[D]").astype("datetime64[M]") if len(days) else days
+            month_keys, month_index = np.unique(months, return_inverse=True)
+            return {
+                "daily_sales": [DaySales(_day_label(d), r) for d, r in zip(days.tolist(), revenue.tolist())],
+                "monthly_stats": [
+                    MonthSales(str(m), r, int(b))
+                    for m, r, b in zip(month_keys,
+                                       np.bincount(month_index, revenue, len(month_keys)).tolist(),
+                                       np.bincount(month_index, bills, len(month_keys)).tolist())
+                ],
+                "top_products": self._top_products(top),
+                "total_sales": float(revenue.sum()),
+                "total_bills": int(bills.sum()),
+            }
+        return self._query(build)
+
+    def _by_day(self):
+        """(days with bills, revenue, bill count), days as datetime64 offsets."""
+        day = self.bills["day"]
+        if not len(day):
+            return np.zeros(0, np.int64), np.zeros(0), np.zeros(0, np.int64)
+        first = int(day.min())
+        revenue = np.bincount(day - first, self.bills["total"])
+        bills = np.bincount(day - first, self.bills["bills"])
+        present = np.flatnonzero(bills)
+        return present + first, revenue[present], bills[present]
+
+    def _top_products(self, n, since=None):
+        product, quantity = self.lines["product"], self.lines["quantity"]
+        if since is not None:
+            keep = self.lines["day"] >= since
+            product, quantity = product[keep], quantity[keep]
+        if not len(product):
+            return []
+        sold = np.bincount(product, quantity)
+        # a few spare in case top products were deleted since
+        candidates = np.argsort(-sold, kind="stable")[:n + 10]
+        candidates = candidates[sold[candidates] > 0].tolist()
+        names = dict(db.session.query(Product.id, Product.name).filter(Product.id.in_(candidates)))
+        return [ProductSales(names[p], int(sold[p])) for p in candidates if p in names][:n]
+
+    def top_products(self, n=5, since=None):
+        """Products by units sold (since ``since``, a date), as (name, sold);
+        None when products are only kept by month that far back."""
+        since_day = _day(since)
+
+        def build():
+            if since_day is not None and self.daily_from is not None and since_day < self.daily_from:
+                return None
+            return self._top_products(n, since_day)
+        return self._query(build)
+
+    def totals(self):
+        """(bills, sales) over all time."""
+        return self._query(lambda: (int(self.bills["bills"].sum()), float(self.bills["total"].sum())))
+
+    def day_totals(self, day):
+        """(bills, sales) on ``day``, a date."""
+        def build():
+            on_day = self.bills["day"] == _day(day)
+            return int(self.bills["bills"][on_day].sum()), float(self.bills["total"][on_day].sum())
+        return self._query(build)
+
+
+class SalesCubes:
+    """One SalesCube per store, made on first use."""
+
+    def __init__(self, max_bytes, reload_seconds=0, background=False, revisions=None):
+        self.max_bytes = max_bytes
+        self.reload_seconds = reload_seconds
+        self.background = background
+        self.revisions = revisions
+        self._cubes = {}
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        for cube in self._cubes.values():
+            cube._after_fork()
+
+    def get(self, tenant_id):
+        cube = self._cubes.get(tenant_id)
+        if cube is None:
+            with self._lock:
+                cube = self._cubes.setdefault(
+                    tenant_id,
+                    SalesCube(self.max_bytes, self.reload_seconds, tenant_id, self.background, self.revisions))
+        return cube
+
+    def all(self):
+        with self._lock:
+            return list(self._cubes.values())
+
+
+def sales_cube():
+    """The current store's cube, or None when ANALYTICS_CUBE is off."""
+    cubes = current_app.extensions.get("sales_cubes")
+    return cubes.get(current_tenant.get()) if cubes is not None else None
+
+
+def _revision_key(tenant_id):
+    return "cube" if tenant_id is None else f"cube@{tenant_id}"
+
+
+def invalidate_sales_cube():
+    """Have every worker reload the current store's cube (and the one over
+    every store) on its next query, after bills it holds were changed."""
+    cubes = current_app.extensions.get("sales_cubes")
+    if cubes is not None and cubes.revisions is not None:
+        cubes.revisions.bump([_revision_key(None), _revision_key(current_tenant.get())])
+
+
+def warm_sales_cubes(app):
+    """Load every store's cube now, e.g. in the gunicorn master before it
+    forks the workers. Returns {store id: seconds}."""
+    cubes = app.extensions.get("sales_cubes")
+    if cubes is None:
+        return {}
+    timings = {}
+    with app.app_context():
+        stores = db.session.execute(db.select(Tenant.id).order_by(Tenant.id)).scalars().all()
+        db.session.remove()
+        for tenant_id in stores:
+            with tenant_context(tenant_id):
+                cube = cubes.get(tenant_id)
+                with cube._lock:
+                    cube.load()
+                timings[tenant_id] = cube.load_seconds
+                db.session.remove()
+    return timings
+
+
+@login_required
+def cube_stats_view():
+    cube = sales_cube()
+    if cube is None:
+        return jsonify({"enabled": False})
+    return jsonify(cube.stats())
+
+
+# the process's cubes for /metrics (the last app created, i.e. the only one outside benchmarks)
+_cubes = None
+
+
+def _render_prometheus():
+    if _cubes is None:
+        return []
+    bytes_lines = ["# TYPE smartbill_sales_cube_bytes gauge"]
+    row_lines = ["# TYPE smartbill_sales_cube_rows gauge"]
+    for cube in _cubes.all():
+        stats = cube.stats()
+        tenant = "all" if stats["tenant_id"] is None else stats["tenant_id"]
+        bytes_lines.append(f'smartbill_sales_cube_bytes{{tenant="{tenant}"}} {stats["bytes"]}')
+        row_lines.append(f'smartbill_sales_cube_rows{{tenant="{tenant}",table="lines"}} {stats["line_rows"]}')
+        row_lines.append(f'smartbill_sales_cube_rows{{tenant="{tenant}",table="bills"}} {stats["bill_rows"]}')
+    return bytes_lines + row_lines
+
+
+metrics.collectors.append(_render_prometheus)
+
+
+def init_analytics(app, db):
+    """Set up the (lazily loaded) per-store sales cubes when ANALYTICS_CUBE is on."""
+    global _cubes
+
+    if not app.config.get("ANALYTICS_CUBE"):
+        return
+    path = app.config.get("ANALYTICS_CUBE_REVISIONS") or os.path.join(app.instance_path, "analytics.rev")
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _cubes = SalesCubes(
+        int(app.config["ANALYTICS_CUBE_MAX_MB"] * 2**20),
+        app.config["ANALYTICS_CUBE_RELOAD_SECONDS"],
+        app.config["ANALYTICS_CUBE_BACKGROUND"],
+        RevisionStore(None if path == ":memory:" else path),
+    )
+    app.extensions["sales_cubes"] = _cubes
+    app.add_url_rule("/admin/analytics", "sales_cube_stats", cube_stats_view)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_cubes._after_fork)
@@ -1,5 +1,6 @@
 from flask import Flask, jsonify, render_template
 from flask_login import LoginManager, login_required, current_user
+from flask_migrate import Migrate
 
 # Models
 from models import (
@@ -19,6 +20,30 @@ from routes.product import bp as product_bp
 from routes.dashboard import dashboard_bp
 from flask import redirect, url_for
 from routes import crm
+from user_cache import configure_user_cache, load_user as load_cached_user
+from passwords import configure_password_hashing, DEFAULT_METHOD as DEFAULT_HASH_METHOD
+from instrumentation import init_instrumentation
+from profiling import init_profiling
+from json_provider import init_json
+from compression import init_compression
+from http_cache import init_http_cache
+from stock_alerts import init_stock_alerts
+from archive import init_archive
+from backup import init_backup
+from activity import init_activity
+from analytics import init_analytics
+from tenancy import init_tenancy
+from render_cache import init_render_cache
+from inventory import record_movements
+from database import (
+    init_database,
+    database_url_from_env,
+    engine_options,
+    pool_settings_from_env,
+    upgrade_database,
+    collect_query_plans,
+    find_full_scans,
+)
 
 import os
 import sys
@@ -26,98 +51,345 @@ import sys
 # Ensure project root is in path (safe, unchanged behavior)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# ==========================
-# App Initialization
-# ==========================
-app = Flask(__name__)
-
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///database.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SECRET_KEY"] = "dev-secret-key"  # change in production
-
-# ==========================
-# Extensions
-# ==========================
-db.init_app(app)
+migrate = Migrate()
 
 login_manager = LoginManager()
 login_manager.login_message = None
 login_manager.login_view = "auth.login_page"
-login_manager.init_app(app)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_cached_user(int(user_id))
 
 
 # ==========================
-# Blueprints Registration
+# Configuration
 # ==========================
-app.register_blueprint(auth.bp)
-app.register_blueprint(billing.bp)
-app.register_blueprint(reports.reports_bp)
-app.register_blueprint(ai_module.ai_bp)
-app.register_blueprint(settings.settings_bp)
-app.register_blueprint(product_bp)
-app.register_blueprint(dashboard_bp)
-app.register_blueprint(crm.crm_bp)
+def default_config():
+    """Settings from the environment; create_app(config) overrides them."""
+    return {
+        # sqlite:///database.db (default) or postgresql://user:pw@host/db
+        "SQLALCHEMY_DATABASE_URI": database_url_from_env(),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SECRET_KEY": os.getenv("SECRET_KEY", "dev-secret-key"),  # change in production
+
+        # SQLite engine profile: "tuned" (WAL, synchronous=NORMAL, ...) or "default"
+        "SQLITE_PROFILE": os.getenv("SQLITE_PROFILE", "tuned"),
+
+        # user loader cache (see user_cache.py); TTL 0 disables it
+        "USER_CACHE_TTL": int(os.getenv("USER_CACHE_TTL", 60)),
+        "USER_SESSION_IDENTITY": os.getenv("USER_SESSION_IDENTITY", "0").lower() in ("1", "true", "yes"),
+        "USER_CACHE_REVISIONS": os.getenv("USER_CACHE_REVISIONS"),  # default: <instance>/user_cache.rev
+
+        # shared expiry of the cached CRM summary (see routes/crm.py)
+        "CRM_SUMMARY_REVISIONS": os.getenv("CRM_SUMMARY_REVISIONS"),  # default: <instance>/crm_summary.rev
+
+        # password hashing policy + bounded verification pool (see passwords.py)
+        "PASSWORD_HASH_METHOD": os.getenv("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD),
+        "PASSWORD_WORKERS": int(os.getenv("PASSWORD_WORKERS", 2)),
+
+        # set GPT_INSIGHTS=0 to skip the OpenAI call in /reports/data
+        "GPT_INSIGHTS": os.getenv("GPT_INSIGHTS", "1").lower() in ("1", "true", "yes"),
+
+        # request / SQL timing, /metrics and Server-Timing (see instrumentation.py)
+        "INSTRUMENTATION": os.getenv("INSTRUMENTATION", "0").lower() in ("1", "true", "yes"),
+        "INSTRUMENTATION_ROWS": os.getenv("INSTRUMENTATION_ROWS", "0").lower() in ("1", "true", "yes"),
+        "METRICS_TOKEN": os.getenv("METRICS_TOKEN"),
+
+        # JSON encoder: "fast" (orjson if installed) or "stdlib" (see json_provider.py)
+        "JSON_PROVIDER": os.getenv("JSON_PROVIDER", "fast"),
+
+        # gzip / brotli for responses >= COMPRESS_MIN_SIZE bytes (see compression.py);
+        # turn off when a reverse proxy already compresses
+        "COMPRESSION": os.getenv("COMPRESSION", "1").lower() in ("1", "true", "yes"),
+        "COMPRESS_MIN_SIZE": int(os.getenv("COMPRESS_MIN_SIZE", 1024)),
+        "COMPRESS_GZIP_LEVEL": int(os.getenv("COMPRESS_GZIP_LEVEL", 6)),
+        "COMPRESS_BROTLI_QUALITY": int(os.getenv("COMPRESS_BROTLI_QUALITY", 4)),
+
+        # ETag / 304 for read-mostly JSON endpoints (see http_cache.py)
+        "HTTP_CACHE": os.getenv("HTTP_CACHE", "1").lower() in ("1", "true", "yes"),
+        "HTTP_CACHE_REVISIONS": os.getenv("HTTP_CACHE_REVISIONS"),  # default: <instance>/http_cache.rev
+        "HTTP_CACHE_SALT": os.getenv("HTTP_CACHE_SALT"),
+
+        # per-request / slow-request profiles under /admin/profiles (see profiling.py)
+        "PROFILING": os.getenv("PROFILING", "0").lower() in ("1", "true", "yes"),
+        "PROFILE_SLOW_MS": int(os.getenv("PROFILE_SLOW_MS", 0)),  # 0: only on request
+        "PROFILE_INTERVAL_MS": float(os.getenv("PROFILE_INTERVAL_MS", 5)),
+        "PROFILE_DIR": os.getenv("PROFILE_DIR"),  # default: <instance>/profiles
+        "PROFILE_KEEP": int(os.getenv("PROFILE_KEEP", 50)),
+        # lets a request without the main store's login ask for and fetch profiles
+        "PROFILE_TOKEN": os.getenv("PROFILE_TOKEN"),
+
+        # bill archive partitions (see archive.py): SQLite files go to ARCHIVE_DIR
+        "ARCHIVE_DIR": os.getenv("ARCHIVE_DIR"),  # default: <database>-archive/ next to the db file
+        "ARCHIVE_MONTHS": int(os.getenv("ARCHIVE_MONTHS", 18)),
+
+        # online SQLite backups (see backup.py): BACKUP_PAGES per step, then a pause
+        "BACKUP_DIR": os.getenv("BACKUP_DIR"),  # default: <database>-backups/ next to the db file
+        "BACKUP_PAGES": int(os.getenv("BACKUP_PAGES", 256)),
+        "BACKUP_PAUSE_MS": float(os.getenv("BACKUP_PAUSE_MS", 5)),
+        "BACKUP_CHECK": os.getenv("BACKUP_CHECK", "integrity"),  # integrity | quick | none
+        "BACKUP_KEEP": int(os.getenv("BACKUP_KEEP", 7)),
+        "BACKUP_KEEP_WEEKLY": int(os.getenv("BACKUP_KEEP_WEEKLY", 4)),
+
+        # customer activity events, queued and written in batches (see activity.py)
+        "ACTIVITY_LOG": os.getenv("ACTIVITY_LOG", "1").lower() in ("1", "true", "yes"),
+        "ACTIVITY_QUEUE_SIZE": int(os.getenv("ACTIVITY_QUEUE_SIZE", 10000)),
+        "ACTIVITY_BATCH": int(os.getenv("ACTIVITY_BATCH", 500)),
+        "ACTIVITY_FLUSH_MS": float(os.getenv("ACTIVITY_FLUSH_MS", 200)),
+        "ACTIVITY_BLOCK_MS": float(os.getenv("ACTIVITY_BLOCK_MS", 0)),  # 0: drop when full
+
+        # in-memory sales cube behind the reports and the assistant (see analytics.py)
+        "ANALYTICS_CUBE": os.getenv("ANALYTICS_CUBE", "1").lower() in ("1", "true", "yes"),
+        "ANALYTICS_CUBE_MAX_MB": float(os.getenv("ANALYTICS_CUBE_MAX_MB", 256)),  # per store
+        "ANALYTICS_CUBE_RELOAD_SECONDS": float(os.getenv("ANALYTICS_CUBE_RELOAD_SECONDS", 0)),  # 0: never
+        # load on a thread, answering from SQL meanwhile (0: the first query waits)
+        "ANALYTICS_CUBE_BACKGROUND": os.getenv("ANALYTICS_CUBE_BACKGROUND", "1").lower() in ("1", "true", "yes"),
+        "ANALYTICS_CUBE_REVISIONS": os.getenv("ANALYTICS_CUBE_REVISIONS"),  # default: <instance>/analytics.rev
+
+        # stores (see tenancy.py): TENANT_DATABASES=1 gives each store but the main one its own SQLite file
+        "TENANT_DATABASES": os.getenv("TENANT_DATABASES", "0").lower() in ("1", "true", "yes"),
+        "TENANT_DATABASE_DIR": os.getenv("TENANT_DATABASE_DIR"),  # default: <database>-tenants/ next to the db file
+
+        # rendered bill pages, in memory then spilled to disk (see render_cache.py)
+        "RENDER_CACHE": os.getenv("RENDER_CACHE", "1").lower() in ("1", "true", "yes"),
+        "RENDER_CACHE_MB": float(os.getenv("RENDER_CACHE_MB", 16)),  # per worker
+        "RENDER_CACHE_DISK_MB": float(os.getenv("RENDER_CACHE_DISK_MB", 256)),  # 0: no spill
+        "RENDER_CACHE_DIR": os.getenv("RENDER_CACHE_DIR"),  # default: <instance>/render-cache
+        # compiled templates shared by the workers
+        "JINJA_BYTECODE_CACHE": os.getenv("JINJA_BYTECODE_CACHE", "1").lower() in ("1", "true", "yes"),
+        "JINJA_BYTECODE_CACHE_DIR": os.getenv("JINJA_BYTECODE_CACHE_DIR"),  # default: <instance>/jinja-bytecode
+    }
 
 
 # ==========================
-# Routes
+# App Factory
 # ==========================
-@app.route("/")
-def index():
-     return redirect(url_for("auth.login_page"))
+def create_app(config=None):
+    """Build the app. ``config`` is a mapping or object of overrides."""
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
 
+    # Pool overrides: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    # DB_POOL_RECYCLE, DB_POOL_PRE_PING
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"],
+        app.config["SQLITE_PROFILE"],
+        pool_settings_from_env(),
+    ))
 
-@app.route("/init-db", methods=["GET"])
-def init_db():
-    """Create database tables (run once during setup)."""
-    with app.app_context():
-        db.create_all()
-    return jsonify({"message": "Database initialized (tables created)"}), 201
-
-
-@app.route("/add-sample-product", methods=["GET"])
-def add_sample_product():
-    """Add a sample product for testing."""
-    product = Product(
-        name="Sample Item",
-        price=99.0,
-        stock=10,
-        category="Test"
+    init_json(app)
+
+    # ---- Extensions ----
+    db.init_app(app)
+    init_database(app, db)
+    _dispose_engines_after_fork(app)
+
+    # batch mode so ALTERs work on SQLite (table copy-and-move)
+    migrate.init_app(
+        app,
+        db,
+        directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"),
+        render_as_batch=True,
     )
-    db.session.add(product)
-    db.session.commit()
 
-    return jsonify(
-        {"message": "Sample product added", "product_id": product.id}
-    ), 201
+    configure_user_cache(app)
+    crm.configure_crm_summary(app)
+    configure_password_hashing(app)
+    login_manager.init_app(app)
+    init_tenancy(app, db)
+    init_instrumentation(app, db)
+    init_profiling(app)
+    init_http_cache(app, db)
+    init_stock_alerts(app, db)
+    init_archive(app, db)
+    init_backup(app, db)
+    init_activity(app, db)
+    init_analytics(app, db)
+    init_render_cache(app, db)
+    # registered last so it runs first among after_request hooks and the
+    # instrumentation sees the size actually sent
+    init_compression(app)
+
+    # ---- Blueprints ----
+    app.register_blueprint(auth.bp)
+    app.register_blueprint(billing.bp)
+    app.register_blueprint(reports.reports_bp)
+    app.register_blueprint(ai_module.ai_bp)
+    app.register_blueprint(settings.settings_bp)
+    app.register_blueprint(product_bp)
+    app.register_blueprint(dashboard_bp)
+    app.register_blueprint(crm.crm_bp)
+
+    register_routes(app)
+    register_cli(app)
+    return app
+
+
+def _dispose_engines_after_fork(app):
+    """Pooled connections must not be shared across processes: forked
+    children (gunicorn preload_app, multiprocessing) drop the inherited
+    pool without closing the parent's connections."""
+    if not hasattr(os, "register_at_fork"):  # Windows: no fork
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    def _reset():
+        for engine in engines:
+            engine.dispose(close=False)
+
+    os.register_at_fork(after_in_child=_reset)
+
+
+# ==========================
+# Routes
+# ==========================
+def register_routes(app):
+    @app.route("/")
+    def index():
+        return redirect(url_for("auth.login_page"))
+
+    @app.route("/init-db", methods=["GET"])
+    def init_db():
+        """Create / migrate database tables (same as `flask db upgrade`)."""
+        upgrade_database(app, db)
+        return jsonify({"message": "Database initialized (migrations applied)"}), 201
+
+    @app.route("/add-sample-product", methods=["GET"])
+    def add_sample_product():
+        """Add a sample product for testing."""
+        product = Product(
+            name="Sample Item",
+            price=99.0,
+            stock=10,
+            category="Test"
+        )
+        db.session.add(product)
+        db.session.flush()
+        record_movements([(product.id, product.stock)], "adjustment")
+        db.session.commit()
+
+        return jsonify(
+            {"message": "Sample product added", "product_id": product.id}
+        ), 201
+
+    @app.route("/dashboard")
+    @login_required
+    def dashboard_home():
+        return render_template("dashboard.html", user=current_user)
+
+    @app.route("/ai-dashboard")
+    def ai_dashboard():
+        return render_template("ai_assistant.html")
+
+    @app.route("/reports")
+    @login_required
+    def reports_home():
+        return render_template("reports.html")
+
+    @app.route("/settings")
+    @login_required
+    def settings_home():
+        return render_template("profile.html")
+
+
+# ==========================
+# CLI
+# ==========================
+def register_cli(app):
+    import click
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans():
+        """EXPLAIN the hot endpoints' queries; fail on unexpected full scans."""
+        plans = collect_query_plans(app, db)
+        for name, statements in plans.items():
+            click.echo(f"== {name}")
+            for sql, lines in statements:
+                click.echo("   " + " ".join(sql.split())[:100])
+                for line in lines:
+                    click.echo(f"      {line}")
+
+        problems = find_full_scans(plans)
+        for name, table, sql in problems:
+            click.echo(f"FULL SCAN: {name} -> {table}", err=True)
+        if problems:
+            raise SystemExit(1)
+        click.echo("OK: hot queries use indexes")
+
+    @app.cli.command("stock-snapshot")
+    @click.option("--full", is_flag=True, help="Checkpoint every product (e.g. weekly).")
+    def stock_snapshot(full):
+        """Checkpoint stock for as-of queries (run from cron, e.g. nightly)."""
+        from database import current_tenant
+        from inventory import take_snapshot
+        from models import Tenant
+        from tenancy import tenant_context
+
+        # one run per store; under `flask tenants each` only that store
+        tenant = current_tenant.get()
+        stores = [tenant] if tenant is not None else db.session.execute(
+            db.select(Tenant.id).order_by(Tenant.id)).scalars().all()
+        for store in stores:
+            with tenant_context(store):
+                result = take_snapshot(full=full)
+            kind = "full" if result["full"] else "incremental"
+            click.echo(f"store {store}: {kind} snapshot of {result['products']} products"
+                       f" at movement {result['movement_id']}")
 
+    @app.cli.command("low-stock-rebuild")
+    def low_stock_rebuild():
+        """Recompute the low_stock table (after stock changes made outside the app)."""
+        from stock_alerts import alerts, rebuild_low_stock
 
-@app.route("/dashboard")
-@login_required
-def dashboard_home():
-    return render_template("dashboard.html", user=current_user)
+        events = rebuild_low_stock()
+        db.session.commit()
+        alerts.publish(events)
+        click.echo(f"{len(events)} products changed state")
 
+    @app.cli.command("archive-bills")
+    @click.option("--months", type=int, default=None, help="Keep this many months hot (default ARCHIVE_MONTHS).")
+    @click.option("--vacuum", is_flag=True, help="Then VACUUM to shrink the database file (SQLite).")
+    def archive_bills_command(months, vacuum):
+        """Move bills older than ARCHIVE_MONTHS into per-year archive partitions."""
+        from archive import archive_bills, compact
 
-@app.route("/ai-dashboard")
-def ai_dashboard():
-    return render_template("ai_assistant.html")
+        result = archive_bills(months or app.config["ARCHIVE_MONTHS"])
+        for month in result["months"]:
+            click.echo(f"{month['month']}: {month['bills']} bills, {month['items']} items")
+        click.echo(f"archived {result['bills']} bills before {result['cutoff']}")
+        if vacuum and compact():
+            click.echo("database compacted")
 
+    @app.cli.command("backup")
+    @click.option("--dir", "directory", default=None, help="Backup folder (default BACKUP_DIR).")
+    @click.option("--check", type=click.Choice(["integrity", "quick", "none"]), default=None,
+                  help="Check to run on the copy (default BACKUP_CHECK).")
+    def backup_command(directory, check):
+        """Online backup of the SQLite database and its archive, then rotate old backups."""
+        from backup import backup_database
 
-@app.route("/reports")
-@login_required
-def reports_home():
-    return render_template("reports.html")
+        result = backup_database(directory=directory, check=check)
+        click.echo(f"{result['name']}: {len(result['files'])} files, {result['bytes'] / 2**20:.1f} MiB"
+                   f" in {result['seconds']}s, check {result['check']}")
+        for name in result["pruned"]:
+            click.echo(f"pruned {name}")
 
+    @app.cli.command("reorder-suggestions")
+    @click.option("--lead-days", default=7, show_default=True, help="Supplier lead time.")
+    @click.option("--cover-days", default=30, show_default=True, help="Demand to cover after delivery.")
+    def reorder_suggestions(lead_days, cover_days):
+        """Recompute demand-driven reorder suggestions (run nightly from cron)."""
+        from reorder import compute_reorder_suggestions
 
-@app.route("/settings")
-@login_required
-def settings_home():
-    return render_template("profile.html")
+        result = compute_reorder_suggestions(lead_days=lead_days, cover_days=cover_days)
+        click.echo(f"{result['suggested']} of {result['products']} products to reorder")
 
 
 # ==========================
@@ -130,4 +402,5 @@ if __name__ == "__main__":
     if os.path.exists(".env"):
         load_dotenv()
 
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    # development server only; production: gunicorn -c gunicorn.conf.py (see wsgi.py)
+    create_app().run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,412 @@
+# archive.py
+"""
+Hot / cold partitioning of bill history.
+
+``archive_bills`` (``flask archive-bills``, e.g. monthly from cron) moves
+whole months older than ARCHIVE_MONTHS out of bill / bill_item into one
+partition per year: an attached database file ``bills_<year>.db`` in
+ARCHIVE_DIR on SQLite, a schema ``archive_<year>`` on PostgreSQL. Both
+are addressed as schema ``archive_<year>``, so the same Table objects
+work on either backend. The hot tables, their indexes and the main file
+shrink to the recent months every till and dashboard works on.
+
+Nothing else changes: customer rollups (total_spent, total_orders,
+last_purchase) are left as they are, archive_daily_sales keeps the
+per-store, per-day bill count and revenue of archived bills for all-time totals and
+charts, and queries that may reach back further read through
+``bill_sources(start, end)`` (an ORM alias over hot + overlapping
+partitions, UNION ALL, in place of Bill / BillItem) or, for bill-item
+joins, ``bill_partitions(start, end)`` (one pair per partition, results
+combined by the caller). With no partition in range both give Bill and
+BillItem themselves, so recent queries run exactly as before.
+
+Each month is copied first (INSERT OR IGNORE, committed), then checked,
+registered in archive_partitions and deleted from the hot tables in one
+transaction. Partition rows count only below their ``until``, so a copy
+that was never registered (a crash between the two steps) stays
+invisible and is picked up again by the next run.
+"""
+import glob
+import os
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import (
+    Column, DateTime, Index, MetaData, Table, and_, event, func, select, text, union_all,
+)
+from sqlalchemy.orm import aliased
+
+from database import current_tenant, day_bucket
+from models import db, ArchiveDailySales, ArchivePartition, Bill, BillItem
+
+ARCHIVE_MONTHS = 18
+FILE_PATTERN = "bills_{year}.db"
+SCHEMA_PATTERN = "archive_{year}"
+
+_metadata = MetaData()
+_tables = {}
+
+
+# ==========================
+# Partitions
+# ==========================
+def partition_tables(year):
+    """(bill, bill_item) Tables of ``year``'s partition.
+
+    Same columns as the hot tables, without foreign keys; archived items
+    also carry their bill's date so they can be filtered without a join.
+    """
+    if year not in _tables:
+        schema = SCHEMA_PATTERN.format(year=year)
+
+        def columns(table):
+            return [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False) for c in table.columns]
+
+        bill = Table(
+            "bill", _metadata, *columns(Bill.__table__),
+            Index("ix_bill_bill_date", "bill_date"),
+            Index("ix_bill_customer_id_bill_date", "customer_id", "bill_date"),
+            Index("ix_bill_tenant_id_bill_date", "tenant_id", "bill_date"),
+            schema=schema,
+        )
+        item = Table(
+            "bill_item", _metadata, *columns(BillItem.__table__),
+            Column("bill_date", DateTime, nullable=False),
+            Index("ix_bill_item_bill_id", "bill_id"),
+            Index("ix_bill_item_product_id", "product_id"),
+            Index("ix_bill_item_bill_date", "bill_date"),
+            schema=schema,
+        )
+        _tables[year] = (bill, item)
+    return _tables[year]
+
+
+def archive_dir():
+    # a store with its own database file has its own archive (see tenancy.py)
+    databases = current_app.extensions.get("tenant_databases")
+    directory = databases.archive_dir(current_tenant.get()) if databases is not None else None
+    return directory or current_app.extensions["archive_dir"]
+
+
+def _attach(connection, years):
+    """ATTACH the partition files of ``years`` to this connection (SQLite).
+
+    Connections attach every existing file when they open; this catches
+    partitions created since. SQLite refuses ATTACH inside a write
+    transaction, which a read path never is.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    attached = connection.connection.info.setdefault("archive_attached", set())
+    missing = [y for y in years if y not in attached]
+    if not missing:
+        return
+    names = {row[1] for row in connection.exec_driver_sql("PRAGMA database_list")}
+    for year in missing:
+        schema = SCHEMA_PATTERN.format(year=year)
+        if schema not in names:
+            path = os.path.join(archive_dir(), FILE_PATTERN.format(year=year))
+            connection.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (path,))
+        attached.add(year)
+
+
+def _create_partition(session, year):
+    connection = session.connection()
+    if connection.dialect.name == "sqlite":
+        os.makedirs(archive_dir(), exist_ok=True)
+        _attach(connection, [year])
+    else:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_PATTERN.format(year=year)}"))
+    _metadata.create_all(connection, tables=partition_tables(year))
+
+
+def archived_partitions(start=None, end=None):
+    """Partitions holding bills dated in [start, end), oldest first."""
+    query = ArchivePartition.query
+    if end is not None:
+        query = query.filter(ArchivePartition.first_bill_date < end)
+    if start is not None:
+        query = query.filter(ArchivePartition.until > start)
+    return query.order_by(ArchivePartition.year).all()
+
+
+# ==========================
+# Reading across partitions
+# ==========================
+def _in_range(query, column, start, end):
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column < end)
+    return query
+
+
+def bill_sources(start=None, end=None):
+    """(bills, items) to query in place of (Bill, BillItem) for bills
+    dated in [start, end) (``None``: unbounded).
+
+    Hot rows are always included (a bill can be backdated into an archived
+    month); partitions only when they overlap the range.
+    """
+    partitions = archived_partitions(start, end)
+    if not partitions:
+        return Bill, BillItem
+    _attach(db.session.connection(), [p.year for p in partitions])
+
+    hot_bill, hot_item = Bill.__table__, BillItem.__table__
+    bills = [_in_range(select(hot_bill), hot_bill.c.bill_date, start, end)]
+    items = [select(hot_item)]
+    if start is not None or end is not None:
+        # keep the hot side small: joined union branches cannot use the
+        # outer query's bill filter
+        items[0] = items[0].where(hot_item.c.bill_id.in_(
+            _in_range(select(hot_bill.c.id), hot_bill.c.bill_date, start, end)))
+    for p in partitions:
+        bill, item = partition_tables(p.year)
+        bills.append(_in_range(
+            select(*[bill.c[c.name] for c in hot_bill.columns]).where(bill.c.bill_date < p.until),
+            bill.c.bill_date, start, end,
+        ))
+        items.append(_in_range(
+            select(*[item.c[c.name] for c in hot_item.columns]).where(item.c.bill_date < p.until),
+            item.c.bill_date, start, end,
+        ))
+    return (
+        aliased(Bill, union_all(*bills).subquery("bills"), adapt_on_names=True),
+        aliased(BillItem, union_all(*items).subquery("bill_items"), adapt_on_names=True),
+    )
+
+
+def bill_partitions(start=None, end=None):
+    """[(bills, items)] for each partition holding bills dated in
+    [start, end): the hot tables first, then each overlapping year.
+
+    For joins of bills with their items: a bill and its items are always
+    in the same partition, so run the query once per pair and combine the
+    results. Each join then stays on one partition's indexes, which a join
+    of two UNION ALLs (``bill_sources``) cannot.
+    """
+    pairs = [(Bill, BillItem)]
+    partitions = archived_partitions(start, end)
+    if partitions:
+        _attach(db.session.connection(), [p.year for p in partitions])
+    hot_bill, hot_item = Bill.__table__, BillItem.__table__
+    for p in partitions:
+        bill, item = partition_tables(p.year)
+        bills = select(*[bill.c[c.name] for c in hot_bill.columns]).where(bill.c.bill_date < p.until)
+        items = select(*[item.c[c.name] for c in hot_item.columns]).where(item.c.bill_date < p.until)
+        pairs.append((
+            aliased(Bill, bills.subquery(f"bills_{p.year}"), adapt_on_names=True),
+            aliased(BillItem, items.subquery(f"bill_items_{p.year}"), adapt_on_names=True),
+        ))
+    return pairs
+
+
+def find_archived_bill(bill_id):
+    """(bill, items) of an archived bill, or (None, []).
+
+    The objects are read-only copies: they map to the hot tables, so
+    never modify them.
+    """
+    # only the years whose bill ids span it, newest first (sorted here: an
+    # ORDER BY year makes SQLite walk the primary key instead of the index)
+    partitions = sorted(ArchivePartition.query.filter(
+        ArchivePartition.last_bill_id >= bill_id, ArchivePartition.first_bill_id <= bill_id,
+    ), key=lambda p: p.year, reverse=True)
+    if not partitions:
+        return None, []
+    _attach(db.session.connection(), [p.year for p in partitions])
+    for p in partitions:
+        bill_table, item_table = partition_tables(p.year)
+        bills = aliased(Bill, bill_table, adapt_on_names=True)
+        bill = db.session.query(bills).filter(bills.id == bill_id, bills.bill_date < p.until).first()
+        if bill is not None:
+            items = aliased(BillItem, item_table, adapt_on_names=True)
+            return bill, db.session.query(items).filter(items.bill_id == bill_id).order_by(items.id).all()
+    return None, []
+
+
+def archived_daily_sales():
+    """(day, bills, revenue) rows of archived bills, by day (the current
+    store's in a request, every store's outside one)."""
+    return db.session.query(
+        ArchiveDailySales.day,
+        func.sum(ArchiveDailySales.bills).label("bills"),
+        func.sum(ArchiveDailySales.revenue).label("revenue"),
+    ).group_by(ArchiveDailySales.day).order_by(ArchiveDailySales.day).all()
+
+
+def archived_totals():
+    """(bills, revenue) of all archived bills."""
+    bills, revenue = db.session.query(
+        func.coalesce(func.sum(ArchiveDailySales.bills), 0),
+        func.coalesce(func.sum(ArchiveDailySales.revenue), 0),
+    ).one()
+    return int(bills), float(revenue)
+
+
+# ==========================
+# Archiving
+# ==========================
+def _month_start(moment, months=0):
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _insert_ignore(session, table, columns, query):
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+
+        return session.execute(insert(table).from_select(columns, query).on_conflict_do_nothing())
+    return session.execute(table.insert().from_select(columns, query).prefix_with("OR IGNORE"))
+
+
+def _archive_month(session, lo, hi, now):
+    """Move bills dated in [lo, hi) (one month) to their year's partition."""
+    hot_bill, hot_item = Bill.__table__, BillItem.__table__
+    in_month = and_(hot_bill.c.bill_date >= lo, hot_bill.c.bill_date < hi)
+    month_ids = select(hot_bill.c.id).where(in_month)
+
+    bills, first, first_id, last_id = session.execute(
+        select(func.count(), func.min(hot_bill.c.bill_date), func.min(hot_bill.c.id), func.max(hot_bill.c.id))
+        .where(in_month)
+    ).one()
+    if not bills:
+        return {"month": lo.strftime("%Y-%m"), "bills": 0, "items": 0}
+
+    _create_partition(session, lo.year)
+    bill, item = partition_tables(lo.year)
+
+    # 1. copy; re-running after an interrupted move ignores what is there
+    columns = [c.name for c in hot_bill.columns]
+    _insert_ignore(session, bill, columns, select(hot_bill).where(in_month))
+    item_columns = [c.name for c in hot_item.columns]
+    _insert_ignore(
+        session, item, item_columns + ["bill_date"],
+        select(hot_item, hot_bill.c.bill_date).join(hot_bill, hot_bill.c.id == hot_item.c.bill_id).where(in_month),
+    )
+    session.commit()
+
+    # 2. check, register and delete, atomically on the main database
+    _attach(session.connection(), [lo.year])  # the commit may have changed connections
+    copied = session.execute(select(func.count()).select_from(bill).where(bill.c.id.in_(month_ids))).scalar()
+    if copied != bills:
+        raise RuntimeError(f"archive copy of {lo:%Y-%m} has {copied} of {bills} bills; nothing deleted")
+
+    day = day_bucket(hot_bill.c.bill_date)
+    daily = session.execute(
+        select(hot_bill.c.tenant_id, day, func.count(), func.coalesce(func.sum(hot_bill.c.total), 0))
+        .where(in_month).group_by(hot_bill.c.tenant_id, day)
+    ).all()
+    existing = {
+        (r.tenant_id, r.day): r
+        for r in ArchiveDailySales.query.filter(ArchiveDailySales.day.in_({d for _, d, _, _ in daily}))
+    }
+    for tenant_id, d, n, revenue in daily:
+        if (tenant_id, d) in existing:
+            existing[tenant_id, d].bills += n
+            existing[tenant_id, d].revenue += revenue
+        else:
+            session.add(ArchiveDailySales(tenant_id=tenant_id, day=d, bills=n, revenue=revenue))
+
+    items = session.execute(hot_item.delete().where(hot_item.c.bill_id.in_(month_ids))).rowcount
+    session.execute(hot_bill.delete().where(in_month))
+
+    partition = session.get(ArchivePartition, lo.year)
+    if partition is None:
+        partition = ArchivePartition(year=lo.year, bills=0, items=0, first_bill_date=first, until=hi)
+        session.add(partition)
+    partition.bills += bills
+    partition.items += items
+    partition.first_bill_date = min(partition.first_bill_date, first)
+    partition.until = max(partition.until, hi)
+    partition.first_bill_id = min(partition.first_bill_id or first_id, first_id)
+    partition.last_bill_id = max(partition.last_bill_id or last_id, last_id)
+    partition.archived_at = now
+    session.commit()
+    return {"month": lo.strftime("%Y-%m"), "bills": bills, "items": items}
+
+
+def archive_bills(months=ARCHIVE_MONTHS, now=None):
+    """Archive every whole month that ended more than ``months`` months ago."""
+    if months < 1:
+        raise ValueError("months must be at least 1")
+    now = now or datetime.utcnow()
+    cutoff = _month_start(now, -months)
+    session = db.session
+    first = session.query(func.min(Bill.bill_date)).filter(Bill.bill_date < cutoff).scalar()
+    session.commit()  # no open transaction: SQLite only ATTACHes outside one
+
+    moved = []
+    month = _month_start(first) if first else cutoff
+    while month < cutoff:
+        result = _archive_month(session, month, _month_start(month, 1), now)
+        if result["bills"]:
+            moved.append(result)
+        month = _month_start(month, 1)
+    return {
+        "cutoff": cutoff.isoformat(),
+        "bills": sum(m["bills"] for m in moved),
+        "items": sum(m["items"] for m in moved),
+        "months": moved,
+    }
+
+
+def compact():
+    """Give the space freed by archiving back to the filesystem (SQLite).
+
+    VACUUM rewrites the whole main file and blocks writers meanwhile; run
+    it in a quiet hour.
+    """
+    engine = db.session.get_bind()  # the current store's file, when it has one
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("VACUUM")
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return True
+
+
+def archive_directory(app, engine):
+    """ARCHIVE_DIR, or a folder next to ``engine``'s database file."""
+    directory = app.config.get("ARCHIVE_DIR")
+    if not directory:
+        # next to the database file, so each database has its own archive
+        path = engine.url.database if engine.dialect.name == "sqlite" else None
+        if path and path != ":memory:":
+            stem = os.path.splitext(os.path.basename(path))[0]
+            directory = os.path.join(os.path.dirname(os.path.abspath(path)), f"{stem}-archive")
+        else:
+            directory = os.path.join(app.instance_path, "archive")
+    return directory
+
+
+def init_archive(app, db):
+    """Attach existing partition files to every new SQLite connection.
+
+    SQLite attaches at most 10 databases per connection by default, i.e.
+    ten archived years.
+    """
+    with app.app_context():
+        engine = db.engine
+    directory = archive_directory(app, engine)
+    app.extensions["archive_dir"] = directory
+    attach_archive(engine, directory)
+
+
+def attach_archive(engine, directory):
+    """Attach the partition files in ``directory`` to ``engine``'s new connections."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pattern = re.compile(r"bills_(\d{4})\.db$")
+
+    @event.listens_for(engine, "connect")
+    def _attach_partitions(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for path in sorted(glob.glob(os.path.join(directory, FILE_PATTERN.format(year="*")))):
+            match = pattern.search(path)
+            if match:
+                cursor.execute(f"ATTACH DATABASE ? AS {SCHEMA_PATTERN.format(year=match.group(1))}", (path,))
+        cursor.close()
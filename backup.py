@@ -0,0 +1,318 @@
+# backup.py
+"""
+Online backups of the SQLite database, taken while the tills keep posting.
+
+``backup_database`` (``flask backup`` from cron, or POST /admin/backups)
+copies the database with SQLite's online backup API, BACKUP_PAGES pages
+per step with a BACKUP_PAUSE_MS pause between steps, into a new folder
+under BACKUP_DIR:
+
+    <BACKUP_DIR>/20261019T020000Z/database.db
+                                  archive/bills_2023.db ...
+                                  manifest.json
+
+Under WAL (the tuned profile) the copy reads from one snapshot opened
+before the first step: writers are never blocked and the result is the
+database exactly as of that moment (manifest ``taken_at`` and
+``last_bill_id``). Under the rollback journal each step holds a shared
+lock only for its own few pages, so a checkout waits at most one step;
+a commit in between makes SQLite restart the copy, and after
+MAX_RESTARTS the backup gives up.
+
+The archive partition files (archive.py) are copied after the main
+file, so every month the copy's registry lists is in its partitions.
+Each file is checked (PRAGMA integrity_check, or quick_check with
+BACKUP_CHECK=quick) before the folder is renamed into place; a failed
+backup leaves nothing behind. Retention keeps the newest BACKUP_KEEP
+backups plus the newest one of each of the last BACKUP_KEEP_WEEKLY
+weeks.
+
+To restore, stop the app and copy the folder's files back over the
+database file and the archive directory.
+
+/admin/backups is for the main store's users (tenancy.admin_required):
+with one database for every store, a backup holds them all.
+"""
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+
+from archive import archive_dir
+from database import current_tenant
+from models import db, Bill
+from tenancy import admin_required
+
+MAX_RESTARTS = 20
+CHECKS = {"integrity": "integrity_check", "quick": "quick_check", "none": None}
+
+NAME_FORMAT = "%Y%m%dT%H%M%SZ"
+PARTIAL = ".partial"
+STALE_PARTIAL = timedelta(days=1)
+MANIFEST = "manifest.json"
+
+
+class BackupError(Exception):
+    pass
+
+
+# ==========================
+# Copying
+# ==========================
+def _copy(source, path, pages, pause_ms, stats):
+    """Copy ``source`` (an open sqlite3 connection) into a new file at ``path``."""
+    restarts = [0]
+    last = [None]
+
+    def _step(status, remaining, total):
+        stats["steps"] += 1
+        # remaining only grows when SQLite started over
+        if last[0] is not None and remaining > last[0]:
+            restarts[0] += 1
+            if restarts[0] > MAX_RESTARTS:
+                raise BackupError(f"copy restarted {restarts[0]} times; the database is too busy")
+        last[0] = remaining
+        if remaining and pause_ms:
+            time.sleep(pause_ms / 1000)  # lets writers (and the GIL) in between steps
+
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=pages, progress=_step)
+        # a self-contained file, whatever the source's journal mode
+        target.execute("PRAGMA journal_mode=DELETE")
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+    stats["restarts"] += restarts[0]
+    return page_count
+
+
+def _check(path, pragma):
+    if pragma is None:
+        return "skipped"
+    connection = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in connection.execute(f"PRAGMA {pragma}")]
+    except sqlite3.DatabaseError as exc:  # too damaged to check at all
+        result = [str(exc)]
+    finally:
+        connection.close()
+    if result != ["ok"]:
+        raise BackupError(f"{os.path.basename(path)} failed {pragma}: {'; '.join(result[:5])}")
+    return "ok"
+
+
+def _source(path):
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA busy_timeout = 5000")
+    return connection
+
+
+def _database_path():
+    engine = db.session.get_bind()  # the current store's file, when it has one
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    if not path or path == ":memory:":
+        raise BackupError("online backup needs a SQLite database file; use pg_dump for server databases")
+    return os.path.abspath(path)
+
+
+def backup_directory(app=None):
+    app = app or current_app
+    databases = app.extensions.get("tenant_databases")
+    directory = databases.backup_dir(current_tenant.get()) if databases is not None else None
+    return directory or app.extensions["backup_dir"]
+
+
+def backup_database(directory=None, pages=None, pause_ms=None, check=None, keep=None, keep_weekly=None, now=None):
+    """Take one backup into ``directory`` (BACKUP_DIR), check it and rotate.
+
+    Returns the manifest of the new backup, plus the names it pruned.
+    """
+    config = current_app.config
+    directory = directory or backup_directory()
+    pages = pages or config["BACKUP_PAGES"]
+    pause_ms = config["BACKUP_PAUSE_MS"] if pause_ms is None else pause_ms
+    check = check or config["BACKUP_CHECK"]
+    if check not in CHECKS:
+        raise BackupError(f"BACKUP_CHECK must be one of {', '.join(CHECKS)}")
+
+    database = _database_path()
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    name = now.strftime(NAME_FORMAT)
+    final = os.path.join(directory, name)
+    work = final + PARTIAL
+    os.makedirs(work)
+
+    stats = {"steps": 0, "restarts": 0}
+    files = []
+    try:
+        source = _source(database)
+        try:
+            wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+            if wal:
+                # pin one read snapshot for the whole copy; WAL readers never block writers
+                source.execute("BEGIN")
+            last_bill_id = source.execute(f"SELECT max(id) FROM {Bill.__table__.name}").fetchone()[0]
+            target = os.path.join(work, os.path.basename(database))
+            files.append((target, _copy(source, target, pages, pause_ms, stats)))
+            if wal:
+                source.execute("COMMIT")
+        finally:
+            source.close()
+
+        # after the main file: its registry never lists a month the copies lack
+        partitions = sorted(glob.glob(os.path.join(archive_dir(), "bills_*.db")))
+        if partitions:
+            os.makedirs(os.path.join(work, "archive"))
+        for path in partitions:
+            source = _source(path)
+            try:
+                target = os.path.join(work, "archive", os.path.basename(path))
+                files.append((target, _copy(source, target, pages, pause_ms, stats)))
+            finally:
+                source.close()
+
+        for target, _ in files:
+            _check(target, CHECKS[check])
+
+        manifest = {
+            "name": name,
+            "taken_at": now.isoformat(),
+            "last_bill_id": last_bill_id,
+            "snapshot": wal,
+            "check": check,
+            "files": [
+                {"path": os.path.relpath(target, work).replace(os.sep, "/"),
+                 "pages": page_count, "bytes": os.path.getsize(target)}
+                for target, page_count in files
+            ],
+            "bytes": sum(os.path.getsize(target) for target, _ in files),
+            "steps": stats["steps"],
+            "restarts": stats["restarts"],
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+        with open(os.path.join(work, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(work, final)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+
+    manifest["pruned"] = prune_backups(
+        directory,
+        config["BACKUP_KEEP"] if keep is None else keep,
+        config["BACKUP_KEEP_WEEKLY"] if keep_weekly is None else keep_weekly,
+        now,
+    )
+    return manifest
+
+
+# ==========================
+# Retention
+# ==========================
+def list_backups(directory=None):
+    """Finished backups, newest first, as their manifests."""
+    directory = directory or backup_directory()
+    backups = []
+    for path in glob.glob(os.path.join(directory, "*", MANIFEST)):
+        try:
+            with open(path) as f:
+                backups.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    backups.sort(key=lambda b: b["name"], reverse=True)
+    return backups
+
+
+def prune_backups(directory, keep, keep_weekly, now=None):
+    """Delete backups outside the retention; returns the deleted names.
+
+    Kept: the newest ``keep``, and the newest of each of the last
+    ``keep_weekly`` ISO weeks. Unfinished folders older than a day
+    (a crashed run) go too.
+    """
+    now = now or datetime.utcnow()
+    names = [b["name"] for b in list_backups(directory)]
+    kept = set(names[:keep])
+    weeks = {}
+    for name in names:
+        week = datetime.strptime(name, NAME_FORMAT).isocalendar()[:2]
+        weeks.setdefault(week, name)  # names are newest first
+    kept.update(sorted(weeks.values(), reverse=True)[:keep_weekly])
+
+    pruned = [name for name in names if name not in kept]
+    for name in pruned:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    for path in glob.glob(os.path.join(directory, "*" + PARTIAL)):
+        if now - datetime.utcfromtimestamp(os.path.getmtime(path)) > STALE_PARTIAL:
+            shutil.rmtree(path, ignore_errors=True)
+    return pruned
+
+
+# ==========================
+# Background job
+# ==========================
+_lock = threading.Lock()
+_status = {"running": False, "last": None, "error": None}
+
+
+def _run(app, tenant):
+    current_tenant.set(tenant)  # threads start with a fresh context
+    with app.app_context():
+        try:
+            _status["last"] = backup_database()
+            _status["error"] = None
+        except Exception as exc:
+            app.logger.exception("backup failed")
+            _status["error"] = str(exc)
+        finally:
+            _status["running"] = False
+            _lock.release()
+
+
+def start_backup(app=None):
+    """Start a backup on a background thread; False if one is running here."""
+    app = app or current_app._get_current_object()
+    if not _lock.acquire(blocking=False):
+        return False
+    _status["running"] = True
+    threading.Thread(target=_run, args=(app, current_tenant.get()), name="backup", daemon=True).start()
+    return True
+
+
+@admin_required
+def list_backups_view():
+    return jsonify({**_status, "backups": list_backups()})
+
+
+@admin_required
+def start_backup_view():
+    if not start_backup():
+        return jsonify({"error": "a backup is already running"}), 409
+    return jsonify({"message": "backup started"}), 202
+
+
+def init_backup(app, db):
+    """Resolve BACKUP_DIR and add the /admin/backups endpoints."""
+    directory = app.config.get("BACKUP_DIR")
+    if not directory:
+        with app.app_context():
+            engine = db.engine
+        # next to the database file, like the archive
+        path = engine.url.database if engine.dialect.name == "sqlite" else None
+        if path and path != ":memory:":
+            stem = os.path.splitext(os.path.basename(path))[0]
+            directory = os.path.join(os.path.dirname(os.path.abspath(path)), f"{stem}-backups")
+        else:
+            directory = os.path.join(app.instance_path, "backups")
+    app.extensions["backup_dir"] = directory
+
+    app.add_url_rule("/admin/backups", "list_backups", list_backups_view)
+    app.add_url_rule("/admin/backups", "start_backup", start_backup_view, methods=["POST"])
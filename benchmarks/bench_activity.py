@@ -0,0 +1,130 @@
+# benchmarks/bench_activity.py
+"""
+Cost of customer activity logging on the request path.
+
+    python benchmarks/bench_activity.py --bills 100000 --requests 2000
+
+Times customer profile views (/crm/api/customer/<id>) and create_bill
+for a customer with activity logging
+
+* off,
+* synchronous: one INSERT + commit per event in the request,
+* queued: activity.ActivityLog, written in batches by its thread,
+
+then floods the queue from --threads threads to show what backpressure
+does (events dropped vs requests slowed) at a small --queue-size;
+"wait s" is summed over the flooding threads.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_activity.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+
+import datagen  # noqa: E402
+from activity import ActivityLog  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Customer, CustomerActivity, Product  # noqa: E402
+
+
+class SyncLog:
+    """The naive version: INSERT + commit inside the request."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def log(self, customer_id, action, reference_id=None):
+        with self.engine.begin() as connection:
+            connection.execute(CustomerActivity.__table__.insert(), [{
+                "customer_id": customer_id, "action": action,
+                "reference_id": reference_id, "created_at": datetime.utcnow()}])
+        return True
+
+
+def run(client, requests, customers, products, rng):
+    views = bills = 0.0
+    for _ in range(requests):
+        customer_id = int(rng.choice(customers))
+        t0 = time.perf_counter()
+        assert client.get(f"/crm/api/customer/{customer_id}").status_code == 200
+        views += time.perf_counter() - t0
+        items = [{"id": int(i), "quantity": 1} for i in rng.choice(products, 2)]
+        t0 = time.perf_counter()
+        assert client.post("/billing/create", json={"items": items, "customer_id": customer_id}).status_code == 201
+        bills += time.perf_counter() - t0
+    return views * 1000 / requests, bills * 1000 / requests
+
+
+def flood(activity_log, threads, events):
+    def produce(offset):
+        for i in range(events):
+            activity_log.log(1 + (offset + i) % 1000, "profile_viewed")
+
+    workers = [threading.Thread(target=produce, args=(n * events,)) for n in range(threads)]
+    t0 = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    produced = time.perf_counter() - t0
+    activity_log.flush(timeout=120)
+    return produced, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--events", type=int, default=50_000, help="per flooding thread")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False, "GPT_INSIGHTS": False})
+    datagen.generate(app, args.bills, args.seed, progress=False)
+    with app.app_context():
+        engine = db.engine
+        customers = np.array(db.session.execute(db.select(Customer.id)).scalars().all())
+        products = np.array(db.session.execute(
+            db.select(Product.id).where(Product.stock >= 100)).scalars().all())
+        db.session.remove()
+
+    client = app.test_client()
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+    queued = app.extensions["activity_log"]
+    modes = (("off", None), ("synchronous", SyncLog(engine)), ("queued", queued))
+
+    print(f"{args.bills:,} bills, {args.requests:,} requests per mode\n")
+    print(f"{'activity log':<14} {'view ms':>8} {'bill ms':>8}")
+    for label, activity_log in modes * 2:  # twice, interleaved, for noise
+        if activity_log is None:
+            app.extensions.pop("activity_log", None)
+        else:
+            app.extensions["activity_log"] = activity_log
+        view, bill = run(client, args.requests, customers, products, np.random.default_rng(args.seed))
+        print(f"{label:<14} {view:>8.3f} {bill:>8.3f}")
+    queued.flush()
+    with app.app_context():
+        rows = db.session.query(func.count(CustomerActivity.id)).scalar()
+    print(f"\n{rows:,} activity rows, queued writer: {queued.stats()}")
+
+    print(f"\nflood: {args.threads} threads x {args.events:,} events, queue {args.queue_size:,}")
+    print(f"{'block ms':<10} {'produce s':>10} {'drained s':>10} {'written':>9} {'dropped':>9} {'wait s':>9}")
+    for block_ms in (0, 50):
+        activity_log = ActivityLog(engine, maxsize=args.queue_size, batch=500, flush_ms=200, block_ms=block_ms)
+        produced, drained = flood(activity_log, args.threads, args.events)
+        stats = activity_log.stats()
+        print(f"{block_ms:<10} {produced:>10.2f} {drained:>10.2f} {stats['written']:>9,}"
+              f" {stats['dropped']:>9,} {stats['blocked_seconds']:>9.2f}")
+        activity_log.close()
@@ -0,0 +1,151 @@
+# benchmarks/bench_archive.py
+"""
+Hot-path latency and database size before and after archiving bills.
+
+    python benchmarks/bench_archive.py --bills 1000000 --months 18
+
+Generates --bills bills over datagen's two years, times the endpoints
+tills and dashboards hit (plus create_bill) and reports that reach back
+over the whole history, then runs archive.archive_bills(--months) and
+VACUUM and times them again. Read responses must be the same before and
+after (money rounded to paise). Sizes are the main database file and the
+per-year archive files.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp()
+DB_PATH = os.path.join(WORKDIR, "bench_archive.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import func, text  # noqa: E402
+
+import datagen  # noqa: E402
+from app import create_app  # noqa: E402
+from archive import archive_bills, compact  # noqa: E402
+from models import db, Bill  # noqa: E402
+
+
+def size_mb(*patterns):
+    return sum(os.path.getsize(p) for pattern in patterns for p in glob.glob(pattern)) / 2**20
+
+
+def checkpoint():
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def rounded(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rounded(v) for v in value]
+    return value
+
+
+def measure(client, urls, repeat):
+    results = {}
+    for label, url in urls:
+        client.get(url)  # warm the page cache
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            r = client.get(url)
+            times.append(time.perf_counter() - t0)
+            assert r.status_code == 200, (url, r.status_code)
+        body = r.get_json() if r.is_json else r.get_data(as_text=True)
+        results[label] = (statistics.median(times) * 1000, rounded(body))
+    return results
+
+
+def create_bills(client, product_ids, n, rng):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        items = [{"id": int(i), "quantity": 1} for i in rng.choice(product_ids, 3)]
+        assert client.post("/billing/create", json={"items": items}).status_code == 201
+    return (time.perf_counter() - t0) * 1000 / n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=1_000_000)
+    parser.add_argument("--months", type=int, default=18, help="months kept hot")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--creates", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False, "GPT_INSIGHTS": False})
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.bills, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    with app.app_context():
+        recent_bill, oldest_bill = db.session.query(func.max(Bill.id), func.min(Bill.id)).one()
+        customer = db.session.query(Bill.customer_id).filter(Bill.customer_id.isnot(None)) \
+            .order_by(Bill.id.desc()).limit(1).scalar()
+        product_ids = np.array([pid for pid, in db.session.execute(
+            text("SELECT id FROM product WHERE stock >= 50 ORDER BY id"))])
+        checkpoint()
+    today = date.today()
+    month_ago, two_years_ago = today - timedelta(days=30), today - timedelta(days=730)
+    hot = [
+        ("dashboard metrics", "/dashboard/api/metrics"),
+        ("billing data", "/billing/data"),
+        ("view recent bill", f"/billing/view/{recent_bill}"),
+        ("customer details", f"/crm/api/customer/{customer}"),
+        ("gst last 30 days", f"/reports/gst?from={month_ago}&to={today}&by=day"),
+    ]
+    history = [
+        ("reports data", "/reports/data"),
+        ("gst two years", f"/reports/gst?from={two_years_ago}&to={today}&by=month"),
+        ("view oldest bill", f"/billing/view/{oldest_bill}"),
+    ]
+
+    client = app.test_client()
+    client.post("/login", json={"email": datagen.BENCH_EMAIL, "password": datagen.BENCH_PASSWORD})
+    rng = np.random.default_rng(args.seed)
+    create_before = create_bills(client, product_ids, args.creates, rng)
+    before = measure(client, hot + history, args.repeat)
+    with app.app_context():
+        checkpoint()
+    size_before = size_mb(DB_PATH)
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        moved = archive_bills(args.months)
+        archived_in = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        compact()
+        vacuumed_in = time.perf_counter() - t0
+    after = measure(client, hot + history, args.repeat)
+    create_after = create_bills(client, product_ids, args.creates, rng)
+    with app.app_context():
+        checkpoint()
+    size_after = size_mb(DB_PATH)
+    size_archive = size_mb(os.path.join(WORKDIR, "bench_archive-archive", "*.db"))
+
+    print(f"archived {moved['bills']:,} bills / {moved['items']:,} items before {moved['cutoff'][:10]}"
+          f" in {archived_in:.1f}s, VACUUM {vacuumed_in:.1f}s\n")
+    print(f"{'database':<22} {'MB':>9}")
+    print(f"{'main before':<22} {size_before:>9.1f}")
+    print(f"{'main after':<22} {size_after:>9.1f}")
+    print(f"{'archive files':<22} {size_archive:>9.1f}\n")
+
+    print(f"{'request':<22} {'before ms':>10} {'after ms':>10} {'same':>5}")
+    for label, _ in hot + history:
+        (ms_before, body_before), (ms_after, body_after) = before[label], after[label]
+        print(f"{label:<22} {ms_before:>10.2f} {ms_after:>10.2f} {str(body_before == body_after):>5}")
+    print(f"{'create_bill':<22} {create_before:>10.2f} {create_after:>10.2f}")
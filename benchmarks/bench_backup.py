@@ -0,0 +1,140 @@
+# benchmarks/bench_backup.py
+"""
+create_bill latency while an online backup runs.
+
+    python benchmarks/bench_backup.py --bills 10000000
+
+Generates a shop with datagen (10M bills is about 3 GiB), then posts bills
+from --writers threads and reports create_bill latency percentiles
+
+* with no backup running,
+* during backup.backup_database with the configured steps (--pages per
+  step, --pause-ms between them),
+* during a one-step backup (the whole file in a single backup_step),
+
+and how long each backup took. --profile default switches the database
+to the rollback journal, where steps are what keeps writers moving.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(WORKDIR, "bench_backup.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import datagen  # noqa: E402
+from app import create_app  # noqa: E402
+from backup import backup_database  # noqa: E402
+from models import db, Product  # noqa: E402
+
+
+def post_bills(app, sellable, stop, latencies, seed):
+    client = app.test_client()
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+    rng = np.random.default_rng(seed)
+    while not stop.is_set():
+        items = [{"id": int(i), "quantity": 1} for i in rng.choice(sellable, 3)]
+        t0 = time.perf_counter()
+        response = client.post("/billing/create", json={"items": items})
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def measure(app, sellable, writers, seconds, backup=None, seed=0):
+    """Latencies (ms) of create_bill from ``writers`` threads while ``backup`` runs
+    (or for ``seconds`` without one); returns (latencies, backup result, backup seconds)."""
+    stop = threading.Event()
+    latencies = []
+    threads = [
+        threading.Thread(target=post_bills, args=(app, sellable, stop, latencies, seed + i))
+        for i in range(writers)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)  # warm up
+    del latencies[:]
+    result, elapsed = None, 0.0
+    if backup is None:
+        time.sleep(seconds)
+    else:
+        t0 = time.perf_counter()
+        with app.app_context():
+            try:
+                result = backup()
+            except Exception as exc:
+                result = exc
+        elapsed = time.perf_counter() - t0
+    stop.set()
+    for t in threads:
+        t.join()
+    return np.array(latencies), result, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=10_000_000)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10, help="baseline duration")
+    parser.add_argument("--pages", type=int, default=256)
+    parser.add_argument("--pause-ms", type=float, default=5)
+    parser.add_argument("--check", default="quick", choices=("integrity", "quick", "none"))
+    parser.add_argument("--profile", default="tuned", choices=("tuned", "default"))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    generator = create_app({"HTTP_CACHE": False})
+    datagen.generate(generator, args.bills, args.seed, progress=False)
+    with generator.app_context():
+        db.engine.dispose()  # WAL -> DELETE needs the only connection
+    path = os.path.join(WORKDIR, "bench_backup.db")
+    if args.profile == "default":
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=DELETE")
+        connection.close()
+    size = os.path.getsize(path)
+    print(f"{args.bills:,} bills, {size / 2**30:.2f} GiB, built in {time.perf_counter() - t0:.0f}s,"
+          f" profile {args.profile}, {args.writers} writers\n")
+
+    app = create_app({"HTTP_CACHE": False, "SQLITE_PROFILE": args.profile, "GPT_INSIGHTS": False})
+    with app.app_context():
+        sellable = np.array(db.session.execute(
+            db.select(Product.id).where(Product.stock >= 10_000)).scalars().all())
+        if len(sellable) < 50:
+            # enough stock that the run never sells out
+            db.session.execute(text("UPDATE product SET stock = stock + 1000000"))
+            db.session.commit()
+            sellable = np.array(db.session.execute(db.select(Product.id)).scalars().all())
+        db.session.remove()
+
+    target = os.path.join(WORKDIR, "backups")
+    cases = (
+        ("no backup", None),
+        (f"stepped {args.pages}p/{args.pause_ms:g}ms",
+         lambda: backup_database(target, pages=args.pages, pause_ms=args.pause_ms, check=args.check)),
+        ("one step", lambda: backup_database(target, pages=-1, pause_ms=0, check=args.check)),
+    )
+    print(f"{'backup':<22} {'bills':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+          f" {'backup s':>9} {'restarts':>9}")
+    for i, (label, backup) in enumerate(cases):
+        latencies, result, elapsed = measure(app, sellable, args.writers, args.seconds, backup, args.seed + 10 * i)
+        p50, p99 = np.percentile(latencies, [50, 99])
+        if isinstance(result, Exception):
+            extra = f"  failed: {result}"
+        elif result:
+            extra = f" {elapsed:>9.1f} {result['restarts']:>9}"
+        else:
+            extra = ""
+        print(f"{label:<22} {len(latencies):>7} {p50:>8.2f} {p99:>8.2f} {latencies.max():>8.2f}{extra}")
+        shutil.rmtree(target, ignore_errors=True)
@@ -0,0 +1,128 @@
+# benchmarks/bench_cube.py
+"""
+In-memory sales cube (analytics.py) vs the SQL it replaces.
+
+    python benchmarks/bench_cube.py --bills 1000000
+
+Generates --bills bills, then
+
+* loads the cube and reports its size,
+* times each report query (the /reports/data summary, totals, today's
+  sales, top products) against SQL and
+  checks both agree,
+* posts --new bills through /billing/create and times the catch-up,
+* rebuilds the cube capped at 3/4, 1/4 and 1/100 of its size to show
+  the oldest days rolled up (customers dropped, then products by month)
+  before the cube gives up.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_cube.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import numpy as np  # noqa: E402
+
+import datagen  # noqa: E402
+from analytics import SalesCube  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Product  # noqa: E402
+from routes.dashboard import _sales_metrics_sql  # noqa: E402
+from routes.reports import _sales_summary_sql  # noqa: E402
+
+
+def best_ms(fn, repeat):
+    """(fastest ms of ``repeat`` runs, last result)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, result
+
+
+def close(a, b):
+    return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+
+
+def same_summary(cube, sql):
+    return (
+        [d.date for d in cube["daily_sales"]] == [d.date for d in sql["daily_sales"]]
+        and all(close(a.revenue, float(b.revenue)) for a, b in zip(cube["daily_sales"], sql["daily_sales"]))
+        and [(m.month, m.bills) for m in cube["monthly_stats"]] == [(m.month, m.bills) for m in sql["monthly_stats"]]
+        and [int(p.sold) for p in cube["top_products"]] == [int(p.sold) for p in sql["top_products"]]
+        and cube["total_bills"] == sql["total_bills"] and close(cube["total_sales"], sql["total_sales"])
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=1_000_000)
+    parser.add_argument("--new", type=int, default=500, help="bills posted after the load")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # the first refresh below loads in the foreground, to be timed
+    app = create_app({"HTTP_CACHE": False, "GPT_INSIGHTS": False, "ACTIVITY_LOG": False,
+                      "ANALYTICS_CUBE_BACKGROUND": False})
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.bills, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    cube = app.extensions["sales_cubes"].get(None)  # every store
+    since = date.today() - timedelta(days=90)
+    with app.app_context():
+        t0 = time.perf_counter()
+        cube.refresh()
+        stats = cube.stats()
+        full = stats["bytes"]
+        print(f"cube load {time.perf_counter() - t0:.1f}s: {stats['line_rows']:,} line rows,"
+              f" {stats['bill_rows']:,} bill rows, {stats['bytes'] / 2**20:.1f} MB\n")
+
+        queries = (
+            ("reports summary", cube.summary, _sales_summary_sql, same_summary),
+            ("dashboard", lambda: (cube.totals()[1], *cube.day_totals(date.today())), _sales_metrics_sql,
+             lambda a, b: close(a[0], float(b[0])) and a[1] == b[1] and close(a[2], float(b[2]))),
+        )
+        print(f"{'query':<20} {'SQL ms':>10} {'cube ms':>10} {'speedup':>8}  same")
+        for label, with_cube, with_sql, same in queries:
+            sql_ms, expected = best_ms(with_sql, args.repeat)
+            cube_ms, got = best_ms(with_cube, args.repeat)
+            print(f"{label:<20} {sql_ms:>10.1f} {cube_ms:>10.2f} {sql_ms / cube_ms:>7.0f}x  {same(got, expected)}")
+
+        products = np.array(db.session.execute(
+            db.select(Product.id).where(Product.stock >= 100)).scalars().all())
+        db.session.remove()
+
+    client = app.test_client()
+    client.post("/login", json={"email": datagen.BENCH_EMAIL, "password": datagen.BENCH_PASSWORD})
+    rng = np.random.default_rng(args.seed)
+    for _ in range(args.new):
+        items = [{"id": int(i), "quantity": 1} for i in rng.choice(products, 3)]
+        assert client.post("/billing/create", json={"items": items}).status_code == 201
+    with app.app_context():
+        t0 = time.perf_counter()
+        cube.refresh()
+        caught_up = time.perf_counter() - t0
+        refresh_ms, _ = best_ms(cube.refresh, args.repeat)
+        fresh = same_summary(cube.summary(), _sales_summary_sql())
+    print(f"\ncatch-up after {args.new} new bills: {caught_up * 1000:.1f} ms"
+          f" (nothing new: {refresh_ms:.2f} ms), matches SQL: {fresh}")
+
+    print(f"\n{'cap MB':>8} {'MB':>8} {'load s':>7} {'customers from':>15} {'daily from':>11} {'enabled':>8}")
+    for cap in (full * 3 // 4, full // 4, full // 100):
+        small = SalesCube(cap)
+        with app.app_context():
+            small.refresh()
+            stats = small.stats()
+            top = small.top_products(5, since)
+        print(f"{cap / 2**20:>8.1f} {stats['bytes'] / 2**20:>8.1f} {stats['load_seconds']:>7.1f}"
+              f" {str(stats['customers_from']):>15} {str(stats['daily_products_from']):>11}"
+              f" {str(stats['enabled']):>8}  top products 90d: {'SQL fallback' if top is None else 'cube'}")
@@ -0,0 +1,114 @@
+# benchmarks/bench_export.py
+"""
+Streaming sales export (/reports/export) of ~10M line items.
+
+    python benchmarks/bench_export.py --items 10000000
+
+Generates about --items line items (datagen makes ~3 per bill), then
+
+* streams the whole history as CSV, NDJSON and Parquet (line items) and
+  as CSV bills, timing each and counting rows and bytes,
+* shows the Python heap peak of a CSV export over 30 days, a year and
+  everything, next to loading the same rows with .all() first,
+* pages through everything with ?limit=<--page> bills and checks the
+  pages add up to the full export.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_export.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import datagen  # noqa: E402
+import export  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def stream(client, url):
+    """(seconds, bytes, lines, headers) of one export, consumed chunk by chunk."""
+    t0 = time.perf_counter()
+    r = client.get(url, buffered=False)
+    assert r.status_code == 200, r.status_code
+    size = lines = 0
+    for chunk in r.response:
+        size += len(chunk)
+        lines += chunk.count(b"\n") if isinstance(chunk, bytes) else chunk.count("\n")
+    r.close()
+    return time.perf_counter() - t0, size, lines, r.headers
+
+
+def peak_mb(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def load_all(app, start, end):
+    """The non-streaming way: every row in memory, then written out."""
+    with app.test_request_context():
+        parts, _, _ = export.plan_export(start, end)
+        rows = []
+        for part in parts:
+            rows += db.session.execute(export._query(part, "items", start, end)).all()
+        return sum(1 for _ in export.csv_stream([rows], export.COLUMNS["items"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000_000)
+    parser.add_argument("--page", type=int, default=500_000, help="bills per page")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False})
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.items // 3, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    client = app.test_client()
+    client.post("/login", json={"email": datagen.BENCH_EMAIL, "password": datagen.BENCH_PASSWORD})
+    today = date.today()
+    everything = f"/reports/export?from={today - timedelta(days=datagen.DAYS)}&to={today}"
+
+    print(f"{'rows':<6} {'format':<8} {'rows out':>11} {'seconds':>8} {'MB':>8} {'rows/s':>10}")
+    lines = {}
+    for level, fmt in (("items", "csv"), ("items", "ndjson"), ("items", "parquet"), ("bills", "csv")):
+        elapsed, size, n, _ = stream(client, f"{everything}&rows={level}&format={fmt}")
+        n = None if fmt == "parquet" else n - (fmt == "csv")  # minus the header
+        lines[level, fmt] = n
+        shown = f"{n:>11,}" if n is not None else f"{'-':>11}"
+        rate = f"{n / elapsed:>10,.0f}" if n is not None else f"{'-':>10}"
+        print(f"{level:<6} {fmt:<8} {shown} {elapsed:>8.1f} {size / 2**20:>8.1f} {rate}")
+
+    print(f"\n{'range':<10} {'stream peak MB':>15} {'.all() peak MB':>15}")
+    end = datetime.combine(today, datetime.min.time()) + timedelta(days=1)
+    for label, days in (("30 days", 30), ("90 days", 90), ("365 days", 365), ("all", datagen.DAYS + 1)):
+        start = end - timedelta(days=days)
+        url = f"/reports/export?from={start:%Y-%m-%d}&to={today}"
+        streamed = peak_mb(lambda: stream(client, url))
+        # ~1.1 KB per loaded row: a year of 10M items would need ~5 GB
+        loaded = f"{peak_mb(lambda: load_all(app, start, end)):.1f}" if days <= 90 else "-"
+        print(f"{label:<10} {streamed:>15.1f} {loaded:>15}")
+
+    after, pages, total = 0, 0, 0
+    t0 = time.perf_counter()
+    while True:
+        _, _, n, headers = stream(client, f"{everything}&after={after}&limit={args.page}")
+        pages += 1
+        total += n - 1
+        if "X-Export-Next" not in headers:
+            break
+        after = int(headers["X-Export-Next"])
+    assert total == lines["items", "csv"], (total, lines["items", "csv"])
+    print(f"\npaged by {args.page:,} bills: {pages} pages, {total:,} items,"
+          f" {time.perf_counter() - t0:.1f}s, same rows as one export")
@@ -0,0 +1,70 @@
+# benchmarks/bench_gst_report.py
+"""
+GST summary report over a year of a busy store.
+
+    python benchmarks/bench_gst_report.py --bills 1000000
+
+Generates --bills bills over datagen's two years (about half in the last
+year), then times /reports/gst for the last 365 days by day and by month,
+as JSON and streamed CSV, with the Python heap peak of each request. A
+second table varies the scan window (reports.GST_SCAN_DAYS) to show the
+cost of bounding memory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_gst.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import datagen  # noqa: E402
+from app import create_app  # noqa: E402
+from routes import reports  # noqa: E402
+
+
+def run(client, url):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    r = client.get(url)
+    size = sum(len(chunk) for chunk in r.response)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert r.status_code == 200, r.status_code
+    return elapsed, peak, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False})
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.bills, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    client = app.test_client()
+    client.post("/login", json={"email": datagen.BENCH_EMAIL, "password": datagen.BENCH_PASSWORD})
+    last = date.today()
+    first = last - timedelta(days=364)
+    base = f"/reports/gst?from={first}&to={last}"
+
+    print(f"{'by':<6} {'format':<7} {'seconds':>8} {'peak MB':>8} {'bytes':>10}")
+    for by in ("day", "month"):
+        for fmt in ("json", "csv"):
+            elapsed, peak, size = run(client, f"{base}&by={by}&format={fmt}")
+            print(f"{by:<6} {fmt:<7} {elapsed:>8.2f} {peak / 2**20:>8.2f} {size:>10,}")
+
+    print(f"\n{'window days':>11} {'seconds':>8} {'peak MB':>8}")
+    for window in (7, 31, 92, 366):
+        reports.GST_SCAN_DAYS = window
+        elapsed, peak, _ = run(client, f"{base}&by=day&format=csv")
+        print(f"{window:>11} {elapsed:>8.2f} {peak / 2**20:>8.2f}")
@@ -0,0 +1,93 @@
+# benchmarks/bench_instrumentation.py
+"""
+Overhead of INSTRUMENTATION=1 on typical endpoints.
+
+    python benchmarks/bench_instrumentation.py --requests 2000 [--rows]
+
+One instrumented app on a seeded SQLite file; the hooks are detached and
+re-attached between interleaved batches so both modes share the same
+engine, caches and disk state (two separate apps differ by more than the
+hooks cost).
+Rows counting (--rows, INSTRUMENTATION_ROWS) is left out unless asked for.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_instr.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import event  # noqa: E402
+
+import instrumentation  # noqa: E402
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from models import db, User, Product, Bill  # noqa: E402
+from passwords import hash_password  # noqa: E402
+
+ENDPOINTS = ("/billing/data", "/dashboard/api/metrics", "/products/api?q=item", "/crm/api/customers")
+BATCH = 50
+
+
+def seed(app):
+    upgrade_database(app, db)
+    with app.test_request_context():
+        db.session.add(User(name="Bench", email="bench@example.com", password=hash_password("benchpass")))
+        db.session.add_all(Product(name=f"Item {i}", price=10, stock=i % 20) for i in range(500))
+        db.session.add_all(Bill(customer_name="seed", total=100) for _ in range(2000))
+        db.session.commit()
+
+
+def set_hooks(app, on, rows):
+    with app.app_context():
+        engine = db.engine
+    hooks = [
+        (engine, "before_cursor_execute", instrumentation._before_cursor_execute),
+        (engine, "after_cursor_execute", instrumentation._after_cursor_execute),
+    ]
+    if rows:
+        hooks.append((db.Model, "load", instrumentation._on_load))
+    for target, name, fn in hooks:
+        if on and not event.contains(target, name, fn):
+            event.listen(target, name, fn, propagate=target is db.Model)
+        elif not on and event.contains(target, name, fn):
+            event.remove(target, name, fn)
+    before, after = app.before_request_funcs[None], app.after_request_funcs[None]
+    if on and instrumentation._start_request not in before:
+        before.append(instrumentation._start_request)
+        after.append(instrumentation._finish_request)
+    elif not on and instrumentation._start_request in before:
+        before.remove(instrumentation._start_request)
+        after.remove(instrumentation._finish_request)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", action="store_true", help="include INSTRUMENTATION_ROWS")
+    args = parser.parse_args()
+
+    app = create_app({"INSTRUMENTATION": True})
+    seed(app)
+    client = app.test_client()
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+
+    for url in ENDPOINTS:
+        totals = {"off": 0.0, "on": 0.0}
+        for i in range(max(1, args.requests // BATCH)):
+            # alternate which mode goes first; the second batch of a pair
+            # is measurably faster on some endpoints regardless of mode
+            for mode in (("off", "on") if i % 2 == 0 else ("on", "off")):
+                set_hooks(app, mode == "on", args.rows)
+                t0 = time.perf_counter()
+                for _ in range(BATCH):
+                    client.get(url)
+                totals[mode] += time.perf_counter() - t0
+        n = max(1, args.requests // BATCH) * BATCH
+        overhead = (totals["on"] - totals["off"]) / totals["off"] * 100
+        print(f"{url:<28} off {totals['off'] / n * 1000:6.3f} ms   on {totals['on'] / n * 1000:6.3f} ms"
+              f"   overhead {overhead:+5.2f}%")
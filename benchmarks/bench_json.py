@@ -0,0 +1,99 @@
+# benchmarks/bench_json.py
+"""
+Serialization time and payload size for a large product list.
+
+    python benchmarks/bench_json.py --products 50000
+
+Part 1 serializes the /products/api payload in-process: ORM instances
+turned into dicts (the old view) vs labelled row tuples, each through the
+stdlib and the fast (orjson) provider. Part 2 measures the full request
+and bytes on the wire for identity, gzip and (if installed) brotli.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_json.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import func  # noqa: E402
+
+import compression  # noqa: E402
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from json_provider import FastJSONProvider, StdlibJSONProvider, orjson  # noqa: E402
+from models import db, User, Product  # noqa: E402
+from passwords import hash_password  # noqa: E402
+from routes.product import _to_dict  # noqa: E402
+
+
+def seed(app, n):
+    upgrade_database(app, db)
+    with app.app_context():
+        db.session.add(User(name="Bench", email="bench@example.com", password=hash_password("benchpass")))
+        db.session.execute(Product.__table__.insert(), [
+            {"name": f"Product {i} — शुद्ध", "category": f"Category {i % 40}", "price": 10 + i % 997 * 0.75,
+             "stock": i % 300, "gst": (5.0, 12.0, 18.0, 28.0)[i % 4]}
+            for i in range(n)
+        ])
+        db.session.commit()
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000, result
+
+
+def serialization(app, repeat):
+    def orm_dicts():
+        return {"products": [_to_dict(p) for p in Product.query.order_by(Product.name).all()]}
+
+    def rows():
+        return {"products": db.session.query(
+            Product.id, Product.name, func.coalesce(Product.category, "").label("category"),
+            Product.price, Product.stock, Product.gst,
+        ).order_by(Product.name).all()}
+
+    print(f"{'payload':<12} {'provider':<8} {'query+build ms':>15} {'serialize ms':>13} {'bytes':>11}")
+    for label, build in (("orm dicts", orm_dicts), ("row tuples", rows)):
+        with app.app_context():
+            build_ms, payload = best(build, repeat)
+            for name, provider in (("stdlib", StdlibJSONProvider(app)), ("fast", FastJSONProvider(app))):
+                dump_ms, body = best(lambda: provider.response(payload).get_data(), repeat)
+                print(f"{label:<12} {name:<8} {build_ms:>15.1f} {dump_ms:>13.1f} {len(body):>11,}")
+            db.session.remove()
+
+
+def requests(n_requests):
+    encodings = ["identity", "gzip"] + (["br"] if compression.brotli is not None else [])
+    print(f"\n{'provider':<8} {'encoding':<9} {'request ms':>11} {'bytes':>11}")
+    for provider in ("stdlib", "fast"):
+        app = create_app({"JSON_PROVIDER": provider})
+        client = app.test_client()
+        client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+        for encoding in encodings:
+            ms, r = best(lambda: client.get("/products/api", headers={"Accept-Encoding": encoding}), n_requests)
+            assert r.status_code == 200
+            print(f"{provider:<8} {encoding:<9} {ms:>11.1f} {len(r.data):>11,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    seed(app, args.products)
+    print(f"{args.products:,} products, orjson {'available' if orjson else 'missing'},"
+          f" brotli {'available' if compression.brotli else 'missing'}\n")
+    serialization(app, args.repeat)
+    requests(args.repeat)
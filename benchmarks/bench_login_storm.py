@@ -0,0 +1,100 @@
+# benchmarks/bench_login_storm.py
+"""
+Billing latency during a login storm (shift change).
+
+    python benchmarks/bench_login_storm.py --storm 16 --seconds 10
+
+One till posts bills back to back while --storm threads log in as fast as
+they can. Runs twice: hashing inline with no limits (the old behaviour),
+then on the bounded pool with the default limits.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_login.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from models import db, User, Product  # noqa: E402
+from passwords import hashing_pool, hash_password  # noqa: E402
+
+app = create_app()
+
+STAFF = 20
+
+
+def setup():
+    upgrade_database(app, db)
+    with app.test_request_context():
+        db.session.add_all(
+            User(name=f"Staff {i}", email=f"staff{i}@example.com", password=hash_password("shiftpass"))
+            for i in range(STAFF)
+        )
+        db.session.add_all(Product(name=f"Item {i}", price=10 + i, stock=10 ** 6) for i in range(50))
+        db.session.commit()
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float("nan")
+
+
+def run(label, storm, seconds):
+    stop = threading.Event()
+    bill_latency, logins, throttled = [], [], []
+
+    def till():
+        client = app.test_client()
+        client.post("/login", json={"email": "staff0@example.com", "password": "shiftpass"})
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            r = client.post("/billing/create", json={"items": [{"id": 1, "quantity": 1}, {"id": 2, "quantity": 2}]})
+            assert r.status_code == 201, r.get_data(as_text=True)
+            bill_latency.append(time.perf_counter() - t0)
+
+    def login_loop(n):
+        client = app.test_client()
+        email = f"staff{1 + n % (STAFF - 1)}@example.com"
+        while not stop.is_set():
+            r = client.post("/login", json={"email": email, "password": "shiftpass"},
+                            environ_base={"REMOTE_ADDR": f"10.0.0.{n}"})
+            (throttled if r.status_code == 429 else logins).append(1)
+            client.get("/logout")
+
+    threads = [threading.Thread(target=till)] + [
+        threading.Thread(target=login_loop, args=(n,)) for n in range(storm)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"[{label}]")
+    print(f"  create_bill  n={len(bill_latency):<6} p50 {pct(bill_latency, .5):8.2f} ms"
+          f"   p99 {pct(bill_latency, .99):8.2f} ms")
+    print(f"  logins       ok={len(logins)} throttled={len(throttled)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--storm", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    setup()
+
+    workers, max_pending, per_key = hashing_pool.workers, hashing_pool.max_pending, hashing_pool.per_key
+    hashing_pool.workers, hashing_pool.max_pending, hashing_pool.per_key = 0, 10 ** 6, 10 ** 6
+    run("inline, unbounded", args.storm, args.seconds)
+
+    hashing_pool.workers, hashing_pool.max_pending, hashing_pool.per_key = workers, max_pending, per_key
+    run(f"pool: {workers} workers, {max_pending} pending, {per_key} per key", args.storm, args.seconds)
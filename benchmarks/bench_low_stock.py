@@ -0,0 +1,114 @@
+# benchmarks/bench_low_stock.py
+"""
+Low-stock reads from the maintained set vs scanning the catalogue.
+
+    python benchmarks/bench_low_stock.py --products 200000
+
+Seeds --products products (about 1 % below their reorder level), then
+times the low-stock part of /dashboard/api/metrics the old way (count
+and list with ``stock < 5`` over Product) and from the low_stock table,
+and the cost the commit-time evaluation adds to a create_bill.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_low_stock.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import event, func  # noqa: E402
+
+import stock_alerts  # noqa: E402
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from models import db, User, Product, LowStock  # noqa: E402
+from passwords import hash_password  # noqa: E402
+
+HOOKS = ("after_flush", "do_orm_execute", "before_commit", "after_commit", "after_rollback")
+
+
+def seed(app, n, seed):
+    rng = np.random.default_rng(seed)
+    stock = np.where(rng.random(n) < 0.01, rng.integers(0, 5, n), rng.integers(5, 500, n))
+    upgrade_database(app, db)
+    with app.app_context():
+        db.session.add(User(name="Bench", email="bench@example.com", password=hash_password("benchpass")))
+        for i in range(0, n, 50_000):
+            db.session.execute(Product.__table__.insert(), [
+                {"name": f"Product {j}", "price": 10 + j % 500, "stock": int(stock[j]), "gst": 18.0}
+                for j in range(i, min(i + 50_000, n))
+            ])
+        stock_alerts.rebuild_low_stock()
+        db.session.commit()
+    return stock
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+
+def scan():
+    count = Product.query.filter(Product.stock < 5).count()
+    items = Product.query.filter(Product.stock < 5).all()
+    return count, [{"name": p.name, "stock": p.stock} for p in items]
+
+
+def maintained():
+    count = db.session.query(func.count(LowStock.product_id)).scalar()
+    items = stock_alerts.low_stock_query().all()
+    return count, [{"name": r.name, "stock": r.stock} for r in items]
+
+
+def hooks(on):
+    for name in HOOKS:
+        fn = getattr(stock_alerts, "_" + name)
+        if on and not event.contains(db.session, name, fn):
+            event.listen(db.session, name, fn)
+        elif not on and event.contains(db.session, name, fn):
+            event.remove(db.session, name, fn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--bills", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False})
+    stock = seed(app, args.products, args.seed)
+    with app.app_context():
+        low = db.session.query(func.count(LowStock.product_id)).scalar()
+        old, new = scan(), maintained()
+        assert old[0] == new[0] == low and sorted(old[1], key=str) == sorted(new[1], key=str)
+        print(f"{args.products:,} products, {low:,} low\n")
+        print(f"{'low-stock read':<16} {'ms':>8}")
+        print(f"{'catalogue scan':<16} {best(scan, args.repeat):>8.2f}")
+        print(f"{'low_stock table':<16} {best(maintained, args.repeat):>8.2f}")
+        db.session.remove()
+
+    client = app.test_client()
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+    rng = np.random.default_rng(args.seed + 1)
+    # products with enough stock for every bill; a few still cross their level
+    sellable = np.flatnonzero(stock >= 5) + 1
+    print(f"\n{'create_bill':<16} {'mean ms':>8}")
+    for label, on in (("hooks off", False), ("hooks on", True), ("hooks off", False), ("hooks on", True)):
+        hooks(on)
+        t0 = time.perf_counter()
+        for _ in range(args.bills):
+            items = [{"id": int(i), "quantity": 1} for i in rng.choice(sellable, 3)]
+            assert client.post("/billing/create", json={"items": items}).status_code == 201
+        print(f"{label:<16} {(time.perf_counter() - t0) * 1000 / args.bills:>8.2f}")
+    hooks(True)
@@ -0,0 +1,119 @@
+# benchmarks/bench_render.py
+"""
+Bill page rendering (/billing/view, /billing/print) cold vs warm (render_cache.py).
+
+    python benchmarks/bench_render.py --bills 100000 --pages 500
+
+Generates --bills bills, picks --pages of them and requests each page
+through the test client:
+
+* without the render cache (queries + Jinja on every view),
+* cold: first view with the cache on (rendered, then kept),
+* warm: the same pages again, from memory,
+* warm from disk: memory capped at 0 so every page is read back from
+  the spill directory,
+
+printing mean / p50 / p99 ms per request. Then times compiling the two
+templates from source against loading them from the Jinja bytecode
+cache, as a newly started worker would.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+DATA = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(DATA, "bench_render.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import datagen  # noqa: E402
+from app import create_app  # noqa: E402
+
+TEMPLATES = ("view_bill.html", "print_bill.html")
+
+
+def timed(client, urls):
+    """ms per request, in order."""
+    out = []
+    for url in urls:
+        t0 = time.perf_counter()
+        r = client.get(url)
+        out.append((time.perf_counter() - t0) * 1000)
+        assert r.status_code == 200, (url, r.status_code)
+    return out
+
+
+def summary(ms):
+    ms = sorted(ms)
+    return statistics.fmean(ms), ms[len(ms) // 2], ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+
+
+def compile_ms(app, bytecode, repeat):
+    """Best ms to load both templates in a fresh environment (a new worker)."""
+    best = float("inf")
+    for _ in range(repeat):
+        env = app.create_jinja_environment()
+        env.bytecode_cache = bytecode
+        t0 = time.perf_counter()
+        for name in TEMPLATES:
+            env.get_template(name)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=100_000)
+    parser.add_argument("--pages", type=int, default=500, help="bills whose pages are requested")
+    parser.add_argument("--repeat", type=int, default=20, help="template loads per compile timing")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({
+        "HTTP_CACHE": False, "GPT_INSIGHTS": False, "ACTIVITY_LOG": False, "COMPRESSION": False,
+        "RENDER_CACHE_DIR": os.path.join(DATA, "render-cache"),
+        "JINJA_BYTECODE_CACHE_DIR": os.path.join(DATA, "jinja-bytecode"),
+    })
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.bills, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    client = app.test_client()
+    client.post("/login", json={"email": datagen.BENCH_EMAIL, "password": datagen.BENCH_PASSWORD})
+    ids = random.Random(args.seed).sample(range(1, args.bills + 1), min(args.pages, args.bills))
+    cache = app.extensions["render_cache"]
+
+    print(f"{'page':<11} {'run':<16} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for template in ("view", "print"):
+        urls = [f"/billing/{template}/{i}" for i in ids]
+        runs = []
+
+        del app.extensions["render_cache"]
+        timed(client, urls[:20])  # warm up the connection pool, templates and code paths
+        runs.append(("no cache", timed(client, urls)))
+        app.extensions["render_cache"] = cache
+
+        runs.append(("cold", timed(client, urls)))
+        runs.append(("warm (memory)", timed(client, urls)))
+
+        max_bytes = cache.max_bytes
+        cache._reset()
+        cache.max_bytes = 0  # every page goes to disk
+        timed(client, urls)
+        runs.append(("warm (disk)", timed(client, urls)))
+        cache.max_bytes = max_bytes
+        cache._reset()
+
+        for label, ms in runs:
+            mean, p50, p99 = summary(ms)
+            print(f"{template + '_bill':<11} {label:<16} {mean:>8.2f} {p50:>8.2f} {p99:>8.2f}")
+
+    source = compile_ms(app, None, args.repeat)
+    bytecode = compile_ms(app, app.jinja_env.bytecode_cache, args.repeat)
+    print(f"\nloading {' + '.join(TEMPLATES)} in a new worker: compiled {source:.2f} ms,"
+          f" from the bytecode cache {bytecode:.2f} ms ({source / bytecode:.1f}x)")
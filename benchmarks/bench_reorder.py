@@ -0,0 +1,105 @@
+# benchmarks/bench_reorder.py
+"""
+Nightly reorder-suggestion job over a large catalogue.
+
+    python benchmarks/bench_reorder.py --bills 1000000
+
+Generates --bills bills over datagen's two years (1M bills -> 50k SKUs,
+about 3M line items), then times reorder.compute_reorder_suggestions by
+phase: the one GROUP BY of daily units, the vectorized scoring of every
+SKU, and rewriting the table. For comparison, the same numbers computed
+one product at a time (a query per SKU, scored in Python) on a sample,
+extrapolated to the catalogue; the sample's answers must match.
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_reorder.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import func  # noqa: E402
+
+import datagen  # noqa: E402
+import reorder  # noqa: E402
+from app import create_app  # noqa: E402
+from database import day_bucket  # noqa: E402
+from models import db, Bill, BillItem, Product, ReorderSuggestion  # noqa: E402
+
+
+def per_product(product, since):
+    """One SKU's suggestion the straightforward way."""
+    day = day_bucket(Bill.bill_date).label("day")
+    sold = dict(
+        db.session.query(day, func.sum(BillItem.quantity))
+        .join(Bill, Bill.id == BillItem.bill_id)
+        .filter(BillItem.product_id == product.id, Bill.bill_date >= since,
+                Bill.bill_date < since + timedelta(days=reorder.HISTORY_DAYS))
+        .group_by(day)
+    )
+    daily = [sold.get(str((since + timedelta(days=d)).date()), 0) for d in range(reorder.HISTORY_DAYS)]
+    velocity = sum(weight * sum(daily[-w:]) / w for w, weight in zip(reorder.WINDOWS, reorder.VELOCITY_WEIGHTS))
+    recent = daily[-reorder.STD_DAYS:]
+    mean = sum(recent) / len(recent)
+    std = math.sqrt(sum((u - mean) ** 2 for u in recent) / len(recent))
+    safety = reorder.SERVICE_Z * std * math.sqrt(reorder.LEAD_DAYS)
+    point = math.ceil(velocity * reorder.LEAD_DAYS + safety)
+    target = max(math.ceil(velocity * (reorder.LEAD_DAYS + reorder.COVER_DAYS) + safety), product.reorder_level)
+    due = (velocity > 0 and product.stock <= point) or product.stock < product.reorder_level
+    return max(target - product.stock, 0) if due else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bills", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=500, help="SKUs for the per-product baseline")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({"HTTP_CACHE": False})
+    t0 = time.perf_counter()
+    stats = datagen.generate(app, args.bills, args.seed, progress=False)
+    print(f"generated {stats} in {time.perf_counter() - t0:.0f}s\n")
+
+    with app.app_context():
+        now = datetime.utcnow()
+        since = datetime.combine(now.date(), dtime.min) - timedelta(days=reorder.HISTORY_DAYS)
+        products = db.session.query(Product.id, Product.stock, Product.reorder_level).order_by(Product.id).all()
+        ids, stock, level = (np.array(c, dtype=np.int64) for c in zip(*products))
+
+        t0 = time.perf_counter()
+        units = reorder.load_daily_units(ids, since)
+        t1 = time.perf_counter()
+        scores = reorder.suggest(stock, level, units)
+        t2 = time.perf_counter()
+        reorder._write(ids, stock, scores, now)
+        db.session.commit()
+        t3 = time.perf_counter()
+        result = reorder.compute_reorder_suggestions(now=now)
+        total = time.perf_counter() - t3
+
+        print(f"{len(ids):,} SKUs, {int(units.sum()):,} units sold in {reorder.HISTORY_DAYS} days,"
+              f" {result['suggested']:,} to reorder\n")
+        print(f"{'phase':<22} {'seconds':>8}")
+        print(f"{'load daily units':<22} {t1 - t0:>8.3f}")
+        print(f"{'score (vectorized)':<22} {t2 - t1:>8.3f}")
+        print(f"{'write table':<22} {t3 - t2:>8.3f}")
+        print(f"{'whole job':<22} {total:>8.3f}")
+
+        rng = np.random.default_rng(args.seed)
+        sample = Product.query.filter(Product.id.in_(rng.choice(ids, args.sample, replace=False).tolist())).all()
+        stored = dict(db.session.query(ReorderSuggestion.product_id, ReorderSuggestion.suggested_qty))
+        t0 = time.perf_counter()
+        for p in sample:
+            assert per_product(p, since) == stored[p.id], p.id
+        each = (time.perf_counter() - t0) / len(sample)
+        print(f"\nper-SKU baseline: {each * 1000:.2f} ms/SKU -> {each * len(ids):.1f}s for {len(ids):,} SKUs"
+              f" ({each * len(ids) / total:.0f}x the batch job)")
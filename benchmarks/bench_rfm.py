@@ -0,0 +1,89 @@
+# benchmarks/bench_rfm.py
+"""
+Benchmark RFM segmentation.
+
+    python benchmarks/bench_rfm.py                 # 1M customers, scoring only
+    python benchmarks/bench_rfm.py --db -n 200000  # end-to-end full recompute on SQLite
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmentation import score_rfm  # noqa: E402
+
+
+def bench_scoring(n, seed=42):
+    rng = np.random.default_rng(seed)
+    recency = rng.integers(0, 720, n)
+    frequency = rng.geometric(0.35, n)
+    monetary = rng.gamma(2.0, 900.0, n) * frequency
+
+    t0 = time.perf_counter()
+    scores, _ = score_rfm(recency, frequency, monetary)
+    elapsed = time.perf_counter() - t0
+
+    labels, counts = np.unique(scores["segment"], return_counts=True)
+    print(f"score_rfm: {n:,} customers in {elapsed * 1000:.1f} ms")
+    for label, count in zip(labels, counts):
+        print(f"  {label:<16}{count:>10,}")
+
+
+def bench_database(n, bills_per_customer=3, seed=42):
+    from flask import Flask
+    from models import db, Customer, Bill
+    from segmentation import recompute_segments
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_rfm.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(
+            Customer.__table__.insert(),
+            [{"id": i, "name": f"Customer {i}", "total_spent": 0, "total_orders": 0}
+             for i in range(1, n + 1)],
+        )
+        ages = rng.integers(0, 720, n * bills_per_customer).tolist()
+        totals = rng.gamma(2.0, 900.0, n * bills_per_customer).round(2).tolist()
+        owners = rng.integers(1, n + 1, n * bills_per_customer).tolist()
+        db.session.execute(
+            Bill.__table__.insert(),
+            [{"customer_name": "bench", "customer_id": cid,
+              "bill_date": now - timedelta(days=age), "total": total}
+             for cid, age, total in zip(owners, ages, totals)],
+        )
+        db.session.commit()
+
+        t0 = time.perf_counter()
+        result = recompute_segments(full=True)
+        elapsed = time.perf_counter() - t0
+        print(f"full recompute: {result['customers_scored']:,} customers "
+              f"({n * bills_per_customer:,} bills) in {elapsed:.2f} s")
+
+        t0 = time.perf_counter()
+        result = recompute_segments()
+        elapsed = time.perf_counter() - t0
+        print(f"incremental (no changes): {result['customers_scored']:,} in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--customers", type=int, default=1_000_000)
+    parser.add_argument("--db", action="store_true", help="run end-to-end against SQLite")
+    args = parser.parse_args()
+
+    bench_scoring(args.customers)
+    if args.db:
+        bench_database(args.customers)
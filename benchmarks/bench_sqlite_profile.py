@@ -0,0 +1,142 @@
+# benchmarks/bench_sqlite_profile.py
+"""
+Mixed read/write SQLite benchmark: tills posting bills while dashboards poll.
+
+    python benchmarks/bench_sqlite_profile.py --tills 4 --dashboards 8 --seconds 10
+
+Runs once per profile (default, tuned) on a fresh database file and
+reports throughput, latency percentiles and lock errors.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from database import init_database, engine_options  # noqa: E402
+from models import db, Product, Bill, BillItem  # noqa: E402
+
+PRODUCTS = 2000
+SEED_BILLS = 20000
+
+
+def make_app(profile, uri=None):
+    """Fresh, seeded app. ``uri`` defaults to a new SQLite file; any other
+    database passed in is dropped and recreated."""
+    if uri is None:
+        uri = "sqlite:///" + os.path.join(tempfile.mkdtemp(), f"bench_{profile}.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLITE_PROFILE"] = profile
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(uri, profile)
+    db.init_app(app)
+    init_database(app, db)
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            {"id": i, "name": f"Product {i}", "price": rng.uniform(5, 500),
+             "stock": 10 ** 6, "gst": 18.0, "category": "Bench"}
+            for i in range(1, PRODUCTS + 1)
+        ])
+        db.session.execute(Bill.__table__.insert(), [
+            {"customer_name": "seed", "bill_date": datetime.utcnow(), "total": rng.uniform(10, 5000)}
+            for _ in range(SEED_BILLS)
+        ])
+        db.session.commit()
+    return app
+
+
+def post_bill(rng):
+    lines = [(rng.randint(1, PRODUCTS), rng.randint(1, 3)) for _ in range(rng.randint(1, 6))]
+    bill = Bill(customer_name="till", bill_date=datetime.utcnow(), total=0)
+    db.session.add(bill)
+    db.session.flush()
+    total = 0.0
+    for pid, qty in lines:
+        product = db.session.get(Product, pid)
+        product.stock -= qty
+        line = product.price * qty
+        total += line
+        db.session.add(BillItem(bill_id=bill.id, product_id=pid, quantity=qty, subtotal=line))
+    bill.total = total
+    db.session.commit()
+
+
+def poll_dashboard(rng):
+    db.session.query(func.count(Product.id)).scalar()
+    db.session.query(func.count(Product.id)).filter(Product.stock < 5).scalar()
+    db.session.query(func.coalesce(func.sum(Bill.total), 0)).scalar()
+    db.session.query(Bill).order_by(Bill.id.desc()).limit(10).all()
+    db.session.rollback()
+
+
+def worker(app, fn, stop, samples, errors, seed):
+    rng = random.Random(seed)
+    with app.app_context():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                fn(rng)
+            except OperationalError:
+                db.session.rollback()
+                errors.append(1)
+                continue
+            samples.append(time.perf_counter() - t0)
+        db.session.remove()
+
+
+def pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def run(profile, tills, dashboards, seconds, uri=None, label=None):
+    app = make_app(profile, uri)
+    stop = threading.Event()
+    writes, reads, errors = [], [], []
+    threads = [
+        threading.Thread(target=worker, args=(app, post_bill, stop, writes, errors, i))
+        for i in range(tills)
+    ] + [
+        threading.Thread(target=worker, args=(app, poll_dashboard, stop, reads, errors, 100 + i))
+        for i in range(dashboards)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        db.engine.dispose()
+
+    print(f"[{label or profile}]")
+    print(f"  bills posted   {len(writes) / seconds:9.1f}/s   p50 {pct(writes, .5):7.2f} ms   p99 {pct(writes, .99):7.2f} ms")
+    print(f"  dashboard polls{len(reads) / seconds:9.1f}/s   p50 {pct(reads, .5):7.2f} ms   p99 {pct(reads, .99):7.2f} ms")
+    print(f"  lock errors    {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tills", type=int, default=4)
+    parser.add_argument("--dashboards", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    for profile in ("default", "tuned"):
+        run(profile, args.tills, args.dashboards, args.seconds)
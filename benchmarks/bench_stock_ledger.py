@@ -0,0 +1,124 @@
+# benchmarks/bench_stock_ledger.py
+"""
+Point-in-time stock queries on a large movement ledger.
+
+    python benchmarks/bench_stock_ledger.py --movements 10000000
+
+Fills stock_movement with --movements rows over two years (Zipf-popular
+products, mostly sales with periodic restocks) and checkpoints with
+inventory.take_snapshot every --snapshot-days (a full one every
+--full-every runs). Then times "stock at a
+random moment" answered from snapshot + tail (inventory.stock_as_of)
+against a full replay (SUM over every movement up to then), for one
+product and for all products, and checks both give the same answer.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_ledger.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import func  # noqa: E402
+
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from inventory import stock_as_of, take_snapshot  # noqa: E402
+from models import db, StockMovement, StockSnapshot  # noqa: E402
+
+DAYS = 730
+CHUNK = 200_000
+
+
+def fill(app, movements, products, snapshot_days, full_every, seed):
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, products + 1) ** 0.8
+    weights /= weights.sum()
+    start = datetime(2024, 1, 1)
+    per_period = movements * snapshot_days // DAYS
+    table = StockMovement.__table__
+    written = 0
+    with app.app_context():
+        period = 0
+        while written < movements:
+            n = min(per_period, movements - written)
+            lo = period * snapshot_days * 86400
+            seconds = np.sort(rng.uniform(lo, lo + snapshot_days * 86400, n))
+            product = rng.choice(products, n, p=weights) + 1
+            restock = rng.random(n) < 0.05
+            quantity = np.where(restock, rng.integers(20, 200, n), -rng.geometric(0.5, n))
+            for i in range(0, n, CHUNK):
+                s = slice(i, i + CHUNK)
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert(), [
+                        {"product_id": p, "kind": "adjustment" if r else "sale",
+                         "quantity": q, "created_at": start + timedelta(seconds=t)}
+                        for p, r, q, t in zip(product[s].tolist(), restock[s].tolist(),
+                                              quantity[s].tolist(), seconds[s].tolist())
+                    ])
+            written += n
+            period += 1
+            take_snapshot(full=period % full_every == 0, now=start + timedelta(days=period * snapshot_days))
+            print(f"  movements {written:>12,}/{movements:,}", file=sys.stderr)
+    return start
+
+
+def replay(at, product_ids=None):
+    query = db.session.query(StockMovement.product_id, func.sum(StockMovement.quantity)).filter(
+        StockMovement.created_at <= at)
+    if product_ids is not None:
+        query = query.filter(StockMovement.product_id.in_(product_ids))
+    return {p: int(q) for p, q in query.group_by(StockMovement.product_id) if q}
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - t0) * 1000, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movements", type=int, default=10_000_000)
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--snapshot-days", type=int, default=1)
+    parser.add_argument("--full-every", type=int, default=7, help="every Nth snapshot is a full one")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app()
+    upgrade_database(app, db)
+    t0 = time.perf_counter()
+    start = fill(app, args.movements, args.products, args.snapshot_days, args.full_every, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    with app.app_context():
+        snapshots = db.session.query(func.count(StockSnapshot.id)).scalar()
+        print(f"{args.movements:,} movements, {snapshots:,} snapshot rows,"
+              f" built in {time.perf_counter() - t0:.0f}s\n")
+
+        moments = [start + timedelta(seconds=float(s)) for s in rng.uniform(0, DAYS * 86400, args.queries)]
+        cases = (
+            ("top product", [1]),
+            ("random product", None),
+            ("all products", "all"),
+        )
+        print(f"{'query':<16} {'snapshot+tail ms':>17} {'replay ms':>10} {'speedup':>8}")
+        for label, ids in cases:
+            fast = slow = 0.0
+            for at in moments:
+                chosen = None if ids == "all" else ids or [int(rng.integers(1, args.products + 1))]
+                ms, got = timed(stock_as_of, at, chosen)
+                fast += ms
+                ms, expected = timed(replay, at, chosen)
+                slow += ms
+                assert got == expected, (label, at)
+            fast, slow = fast / len(moments), slow / len(moments)
+            print(f"{label:<16} {fast:>17.2f} {slow:>10.2f} {slow / fast:>7.1f}x")
@@ -0,0 +1,108 @@
+# benchmarks/bench_tax.py
+"""
+GST computation: per-item float loop vs the vectorized paise engine.
+
+    python benchmarks/bench_tax.py --lines 1000000
+
+Generates --lines bill lines (1-10 lines per bill, datagen's price and
+slab mix) and computes line tax, bill totals and per-slab sums twice: the
+old create_bill arithmetic (float rupees, one Python iteration per line,
+GST rounded once per bill) and tax.compute_tax over whole --batch sized batches.
+Then reports how many bills the two charge differently (float drift plus
+the move from per-bill to per-line rounding), and by how much.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tax import compute_tax, rate_to_bp, to_paise  # noqa: E402
+
+GST_SLABS = (0.0, 5.0, 12.0, 18.0, 28.0)  # percent
+GST_WEIGHTS = (0.10, 0.25, 0.20, 0.35, 0.10)
+
+
+def make_lines(n, seed):
+    rng = np.random.default_rng(seed)
+    per_bill = np.minimum(1 + rng.poisson(2.0, n), 10)
+    bill = np.repeat(np.arange(n), per_bill)[:n]
+    price = np.round(np.clip(rng.lognormal(4.6, 0.9, n), 5, 20_000), 2)
+    quantity = np.minimum(rng.geometric(0.55, n), 20)
+    rate = rng.choice(GST_SLABS, n, p=GST_WEIGHTS)
+    return bill, price, quantity, rate
+
+
+def float_loop(bill, price, quantity, rate):
+    """The old create_bill arithmetic, one bill at a time."""
+    totals, taxes = {}, {}
+    subtotal = gst_amount = 0.0
+    current = None
+    for b, p, q, r in zip(bill.tolist(), price.tolist(), quantity.tolist(), rate.tolist()):
+        if b != current:
+            if current is not None:
+                taxes[current] = round(gst_amount, 2)
+                totals[current] = round(subtotal + taxes[current], 2)
+            current, subtotal, gst_amount = b, 0.0, 0.0
+        line = float(p) * q
+        subtotal += line
+        gst_amount += line * r / 100
+    taxes[current] = round(gst_amount, 2)
+    totals[current] = round(subtotal + taxes[current], 2)
+    return totals
+
+
+def vectorized(bill, price, quantity, rate, batch):
+    """compute_tax over --batch lines at a time, batches cut on bill boundaries."""
+    price_paise = to_paise(price)
+    bp_of = {g: rate_to_bp(g) for g in GST_SLABS}
+    rate_bp = np.array([bp_of[g] for g in GST_SLABS])[np.searchsorted(GST_SLABS, rate)]
+    totals = []
+    start = 0
+    while start < len(bill):
+        end = min(start + batch, len(bill))
+        if end < len(bill):
+            # don't split a bill: back up to the first line of the last bill
+            end = start + int(np.searchsorted(bill[start:end], bill[end - 1]))
+        first = bill[start]
+        taxed = compute_tax(price_paise[start:end], quantity[start:end], rate_bp[start:end],
+                            bill[start:end] - first)
+        totals.append(taxed["bill_total"])
+        start = end
+    return np.concatenate(totals)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    bill, price, quantity, rate = make_lines(args.lines, args.seed)
+    n_bills = int(bill[-1]) + 1
+    print(f"{args.lines:,} lines in {n_bills:,} bills\n")
+
+    t0 = time.perf_counter()
+    float_totals = float_loop(bill, price, quantity, rate)
+    loop_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    exact = vectorized(bill, price, quantity, rate, args.batch)
+    vec_s = time.perf_counter() - t0
+
+    print(f"{'engine':<22} {'seconds':>8} {'lines/s':>14}")
+    print(f"{'float loop':<22} {loop_s:>8.2f} {args.lines / loop_s:>14,.0f}")
+    print(f"{'compute_tax (paise)':<22} {vec_s:>8.2f} {args.lines / vec_s:>14,.0f}")
+    print(f"speedup {loop_s / vec_s:.1f}x\n")
+
+    charged = to_paise(np.array([float_totals[b] for b in range(n_bills)]))
+    diff = charged - exact
+    off = np.count_nonzero(diff)
+    print(f"bills where float total != per-line rounded paise total: {off:,} ({off / n_bills:.2%})")
+    if off:
+        print(f"max difference {np.abs(diff).max()} paise, net {diff.sum() / 100:+.2f} rupees over all bills")
@@ -0,0 +1,116 @@
+# benchmarks/bench_tenants.py
+"""
+One store's page latency while another store grows (tenancy.py).
+
+    python benchmarks/bench_tenants.py --small 20000 --big 0,100000,1000000
+    python benchmarks/bench_tenants.py --files      # TENANT_DATABASES=1
+
+Store A gets --small bills. Store B is then grown to each --big size in
+turn, and after every step A's pages are timed through the test client,
+logged in as A's user: dashboard metrics, the reports summary, a month's
+GST report, product search, the customer list and low stock.
+
+In one shared database A's queries use the indexes that lead on
+tenant_id, so they read A's rows only and stay flat while B grows; with
+--files B's rows are in another file altogether. The HTTP cache and the
+sales cube are off so every request runs its SQL.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_tenants.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import datagen  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db, Bill, Tenant, User  # noqa: E402
+from passwords import hash_password  # noqa: E402
+from tenancy import tenant_context  # noqa: E402
+
+PASSWORD = "benchpass"
+PAGES = (
+    ("dashboard metrics", "/dashboard/api/metrics"),
+    ("reports summary", "/reports/data"),
+    ("GST this month", "/reports/gst?format=json"),
+    ("product search", "/products/api?q=Rice"),
+    ("customers", "/crm/api/customers"),
+    ("low stock", "/products/api/low-stock"),
+)
+
+
+def best_ms(client, url, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.get(url)
+        best = min(best, time.perf_counter() - t0)
+        assert r.status_code == 200, (url, r.status_code)
+    return best * 1000
+
+
+def add_store(app, name):
+    """New store with one user; returns its id."""
+    with app.app_context():
+        store = Tenant(name=name, slug=name.lower())
+        db.session.add(store)
+        db.session.commit()
+        db.session.add(User(name=name, email=f"{store.slug}@example.com",
+                            password=hash_password(PASSWORD), tenant_id=store.id))
+        db.session.commit()
+        databases = app.extensions.get("tenant_databases")
+        if databases is not None:
+            databases.engine(store.id)  # creates and migrates its file
+        return store.id
+
+
+def bill_count(app, tenant_id):
+    with app.app_context(), tenant_context(tenant_id):
+        count = db.session.query(db.func.count(Bill.id)).scalar()
+        db.session.remove()
+        return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=20_000, help="store A's bills")
+    parser.add_argument("--big", default="0,100000,1000000", help="store B's bill counts, in increasing order")
+    parser.add_argument("--files", action="store_true", help="each store in its own database file")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    steps = [int(n) for n in args.big.split(",")]
+
+    app = create_app({
+        "HTTP_CACHE": False, "GPT_INSIGHTS": False, "ACTIVITY_LOG": False,
+        "ANALYTICS_CUBE": False, "TENANT_DATABASES": args.files,
+    })
+    datagen.generate(app, 1000, args.seed, progress=False)  # the main store, and the schema
+    small, big = add_store(app, "Small"), add_store(app, "Big")
+    datagen.generate(app, args.small, args.seed, progress=False, tenant_id=small)
+
+    client = app.test_client()
+    assert client.post("/login", json={"email": "small@example.com", "password": PASSWORD}).status_code == 200
+    where = "own database files" if args.files else "one shared database"
+    print(f"store A: {bill_count(app, small):,} bills; stores in {where}\n")
+
+    print(f"{'B bills':>10} " + " ".join(f"{label:>17}" for label, _ in PAGES))
+    baseline = None
+    generated = 0
+    for target in steps:
+        if target > generated:
+            t0 = time.perf_counter()
+            datagen.generate(app, target - generated, args.seed + target, progress=False, tenant_id=big)
+            generated = target
+            print(f"  (B grown to {bill_count(app, big):,} bills in {time.perf_counter() - t0:.0f}s)")
+            gc.collect()  # the generator's garbage, not B's rows, would show up in A's timings
+        timings = [best_ms(client, url, args.repeat) for _, url in PAGES]
+        baseline = baseline or timings
+        print(f"{target:>10,} " + " ".join(
+            f"{ms:>9.2f} ({ms / base:>4.2f}x)" for ms, base in zip(timings, baseline)))
+    print(f"\nms: best of {args.repeat}; (x): against B with {steps[0]:,} bills")
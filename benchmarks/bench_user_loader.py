@@ -0,0 +1,76 @@
+# benchmarks/bench_user_loader.py
+"""
+SQL statements per request with and without the user loader cache.
+
+    python benchmarks/bench_user_loader.py
+
+Runs the real app against a throwaway SQLite file (DATABASE_URL is
+overridden before import).
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_users.db")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import event  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from database import upgrade_database  # noqa: E402
+from models import db, User, Product  # noqa: E402
+from user_cache import user_cache  # noqa: E402
+
+app = create_app()
+
+ENDPOINTS = ("/dashboard/api/metrics", "/products/api?q=rice", "/billing/data", "/crm/api/metrics")
+REQUESTS = 200
+
+
+def setup():
+    upgrade_database(app, db)
+    with app.app_context():
+        db.session.add(User(name="Bench", email="bench@example.com",
+                            password=generate_password_hash("benchpass")))
+        db.session.add_all(Product(name=f"Rice {i}", price=50, stock=i, category="Grocery")
+                           for i in range(200))
+        db.session.commit()
+
+
+def measure(label, client, statements):
+    print(f"[{label}]")
+    for url in ENDPOINTS:
+        statements.clear()
+        t0 = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get(url)
+        elapsed = time.perf_counter() - t0
+        print(f"  {url:<28} {len(statements) / REQUESTS:5.2f} queries/request"
+              f"   {elapsed / REQUESTS * 1000:6.2f} ms/request")
+
+
+if __name__ == "__main__":
+    setup()
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+    client = app.test_client()
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+
+    user_cache.ttl = 0
+    measure("no cache (User query per request)", client, statements)
+
+    user_cache.ttl = 60
+    measure("user cache", client, statements)
+
+    user_cache.ttl = 0
+    app.config["USER_SESSION_IDENTITY"] = True
+    client.get("/logout")
+    client.post("/login", json={"email": "bench@example.com", "password": "benchpass"})
+    measure("session identity", client, statements)
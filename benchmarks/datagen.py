@@ -0,0 +1,279 @@
+# benchmarks/datagen.py
+"""
+Deterministic synthetic shop data.
+
+    python benchmarks/datagen.py --bills 100000 --db /tmp/shop.db
+    python benchmarks/datagen.py --bills 10000000 --database-url postgresql://...
+
+Scale is driven by the bill count (10k -> 10M); products, customers and
+items follow from it. The same --bills/--seed/--end always produce the same
+rows. Bills are generated and inserted in fixed-size chunks, so memory stays
+flat at any scale, and ids increase with bill_date like a real shop.
+
+Shape:
+    products   bills / 20, clamped to [200, 50000]; Zipf-ish popularity,
+               lognormal prices, GST slabs 0/5/12/18/28 %, some low stock
+    customers  bills / 8 (min 100); 30 % of bills are walk-ins
+    items      1 + Poisson(2) lines per bill (max 10), quantity 1 + Geometric
+    users      one login (bench@example.com / benchpass) + a few staff
+
+Customer aggregates (total_spent, total_orders, last_purchase) and bill
+totals are consistent with the generated bills and items.
+
+``generate(..., tenant_id=n)`` fills store n instead (no users); ids
+continue after the rows already there, so stores can share one database.
+A store with its own database file (TENANT_DATABASES) is filled there.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+from sqlalchemy import bindparam  # noqa: E402
+
+from models import db, User, Product, Customer, Bill, BillItem, StockMovement  # noqa: E402
+from stock_alerts import rebuild_low_stock  # noqa: E402
+from tax import compute_tax, rate_to_bp, to_paise  # noqa: E402
+from tenancy import tenant_context  # noqa: E402
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "benchpass"
+
+CHUNK = 100_000  # bills per chunk; part of the output's identity, don't tune per run
+DAYS = 730
+FORMAT = 5  # bump when the generated rows or schema change; keys cached datasets
+
+CATEGORIES = ("Grocery", "Dairy", "Bakery", "Beverages", "Snacks", "Personal Care", "Household",
+              "Stationery", "Electronics", "Frozen", "Fruits", "Vegetables")
+ADJECTIVES = ("Fresh", "Classic", "Premium", "Organic", "Daily", "Super", "Golden", "Royal", "Mini", "Family")
+NOUNS = ("Rice", "Atta", "Milk", "Bread", "Tea", "Coffee", "Biscuits", "Soap", "Shampoo", "Oil",
+         "Sugar", "Salt", "Juice", "Chips", "Paneer", "Butter", "Notebook", "Pen", "Battery", "Detergent")
+GST_SLABS = (0.0, 5.0, 12.0, 18.0, 28.0)  # percent
+GST_WEIGHTS = (0.10, 0.25, 0.20, 0.35, 0.10)
+WALK_IN = "Walk-in Customer"
+
+
+def scale_for(bills):
+    return {
+        "bills": bills,
+        "products": int(min(max(bills // 20, 200), 50_000)),
+        "customers": int(max(bills // 8, 100)),
+    }
+
+
+def _insert(conn, table, rows):
+    if rows:
+        conn.execute(table.insert(), rows)
+
+
+def _advance_sequences(engine, models):
+    """PostgreSQL: move the id sequences past the explicit ids inserted here."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for model in models:
+            table = model.__table__
+            conn.execute(db.select(db.func.setval(
+                db.func.pg_get_serial_sequence(table.name, "id"),
+                db.select(db.func.max(table.c.id)).scalar_subquery(),
+            )))
+
+
+def _columns_to_rows(columns):
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*(columns[k] for k in keys))]
+
+
+def _products(rng, n, first_id=1):
+    adjective = rng.integers(0, len(ADJECTIVES), n)
+    noun = rng.integers(0, len(NOUNS), n)
+    category = rng.integers(0, len(CATEGORIES), n)
+    price = np.round(np.clip(rng.lognormal(4.6, 0.9, n), 5, 20_000), 2)
+    gst = rng.choice(GST_SLABS, n, p=GST_WEIGHTS)
+    # mostly healthy stock, a tail near or below the reorder line
+    stock = np.where(rng.random(n) < 0.08, rng.integers(0, 6, n), rng.integers(10, 500, n))
+    rows = _columns_to_rows({
+        "id": (np.arange(n) + first_id).tolist(),
+        "name": [f"{ADJECTIVES[a]} {NOUNS[b]} {i + 1}" for i, (a, b) in enumerate(zip(adjective, noun))],
+        "category": [CATEGORIES[c] for c in category],
+        "price": price.tolist(),
+        "gst": gst.tolist(),
+        "stock": stock.tolist(),
+    })
+    return rows, to_paise(price), np.array([rate_to_bp(g) for g in GST_SLABS])[np.searchsorted(GST_SLABS, gst)]
+
+
+def _customers(first, n, start, id_base=0):
+    return [
+        {"id": id_base + i + 1, "name": f"Customer {i + 1}", "phone": f"9{id_base + i + 1:09d}",
+         "email": f"customer{i + 1}@example.com", "total_spent": 0.0, "total_orders": 0,
+         "created_at": start}
+        for i in range(first, first + n)
+    ]
+
+
+def _zipf_weights(n, s):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def generate(app, bills=10_000, seed=42, end=None, progress=True, tenant_id=None):
+    """Create the schema (via migrations) and fill it. Returns the scale dict."""
+    with tenant_context(tenant_id):
+        return _generate(app, bills, seed, end, progress, tenant_id)
+
+
+def _generate(app, bills, seed, end, progress, tenant_id):
+    from database import upgrade_database
+    from passwords import hash_password
+
+    scale = scale_for(bills)
+    end = datetime.combine(end or date.today(), dtime.min) + timedelta(days=1)
+    start = end - timedelta(days=DAYS)
+    span = (end - start).total_seconds()
+
+    upgrade_database(app, db)
+    with app.app_context():
+        # the main database, or the store's own file
+        engine = db.session.get_bind()
+        # 0 in a new database; after the existing rows (of every store) when adding a store
+        with engine.connect() as conn:
+            base = {
+                model: conn.execute(db.select(db.func.coalesce(db.func.max(model.__table__.c.id), 0))).scalar()
+                for model in (Product, Customer, Bill, BillItem)
+            }
+    tenant = {} if tenant_id is None else {"tenant_id": tenant_id}
+
+    rng = np.random.default_rng(seed)
+    product_rows, price_paise, rate_bp = _products(rng, scale["products"], base[Product] + 1)
+    product_p = _zipf_weights(scale["products"], 0.8)
+    customer_p = _zipf_weights(scale["customers"], 0.6)
+    rng.shuffle(customer_p)  # heavy buyers aren't just the lowest ids
+
+    spent = np.zeros(scale["customers"] + 1)
+    orders = np.zeros(scale["customers"] + 1, dtype=np.int64)
+    last = np.zeros(scale["customers"] + 1)  # seconds since start, 0 = never
+
+    with app.app_context():
+        with engine.begin() as conn:
+            if tenant_id is None:
+                _insert(conn, User.__table__, [
+                    {"name": "Bench", "email": BENCH_EMAIL, "password": hash_password(BENCH_PASSWORD)},
+                ] + [
+                    {"name": f"Staff {i}", "email": f"staff{i}@example.com", "password": hash_password(BENCH_PASSWORD)}
+                    for i in range(1, 4)
+                ])
+            _insert(conn, Product.__table__, [{**p, **tenant} for p in product_rows])
+            # the ledger opens at today's stock (sales history predates it)
+            _insert(conn, StockMovement.__table__, [
+                {"product_id": p["id"], "kind": "opening", "quantity": p["stock"], "created_at": end, **tenant}
+                for p in product_rows if p["stock"]
+            ])
+            for i in range(0, scale["customers"], CHUNK):
+                _insert(conn, Customer.__table__,
+                        [{**c, **tenant} for c in _customers(i, min(CHUNK, scale["customers"] - i), start, base[Customer])])
+        # Core inserts bypass the session hooks that keep low_stock current
+        rebuild_low_stock()
+        db.session.commit()
+
+        item_id = base[BillItem]
+        t0 = time.perf_counter()
+        chunks = -(-bills // CHUNK)
+        for k in range(chunks):
+            first = k * CHUNK
+            n = min(CHUNK, bills - first)
+            chunk_rng = np.random.default_rng([seed, k])
+
+            # bill dates: sorted within this chunk's slice of the time range
+            lo, hi = span * first / bills, span * (first + n) / bills
+            offsets = np.sort(chunk_rng.uniform(lo, hi, n))
+            walk_in = chunk_rng.random(n) < 0.30
+            customer = np.where(walk_in, 0, chunk_rng.choice(scale["customers"], n, p=customer_p) + 1)
+
+            lines = np.minimum(1 + chunk_rng.poisson(2.0, n), 10)
+            bill_of_item = np.repeat(np.arange(n), lines)
+            product = chunk_rng.choice(scale["products"], len(bill_of_item), p=product_p)
+            quantity = np.minimum(chunk_rng.geometric(0.55, len(bill_of_item)), 20)
+            taxed = compute_tax(price_paise[product], quantity, rate_bp[product], bill_of_item, n)
+            total = taxed["bill_total"] / 100
+
+            np.add.at(spent, customer, total)
+            np.add.at(orders, customer, 1)
+            np.maximum.at(last, customer, offsets)
+
+            bill_ids = np.arange(first, first + n) + base[Bill] + 1
+            bill_dates = [start + timedelta(seconds=float(s)) for s in offsets]
+            names = [WALK_IN if c == 0 else f"Customer {c}" for c in customer.tolist()]
+            with engine.begin() as conn:
+                _insert(conn, Bill.__table__, _columns_to_rows({
+                    **{k: [v] * n for k, v in tenant.items()},
+                    "id": bill_ids.tolist(),
+                    "customer_name": names,
+                    "bill_date": bill_dates,
+                    "total": total.tolist(),
+                    "taxable_paise": taxed["bill_taxable"].tolist(),
+                    "tax_paise": taxed["bill_tax"].tolist(),
+                    "customer_id": [c + base[Customer] if c else None for c in customer.tolist()],
+                }))
+                _insert(conn, BillItem.__table__, _columns_to_rows({
+                    **{k: [v] * len(bill_of_item) for k, v in tenant.items()},
+                    "id": (np.arange(len(bill_of_item)) + item_id + 1).tolist(),
+                    "bill_id": bill_ids[bill_of_item].tolist(),
+                    "product_id": (product + base[Product] + 1).tolist(),
+                    "quantity": quantity.tolist(),
+                    "subtotal": (taxed["taxable"] / 100).tolist(),
+                    "unit_price_paise": price_paise[product].tolist(),
+                    "gst_rate_bp": rate_bp[product].tolist(),
+                    "taxable_paise": taxed["taxable"].tolist(),
+                    "tax_paise": taxed["tax"].tolist(),
+                }))
+            item_id += len(bill_of_item)
+            if progress:
+                print(f"  bills {first + n:>12,}/{bills:,}  items {item_id - base[BillItem]:>12,}"
+                      f"  {time.perf_counter() - t0:7.1f}s", file=sys.stderr)
+
+        # customer aggregates, consistent with the bills above
+        table = Customer.__table__
+        stmt = table.update().where(table.c.id == bindparam("cid")).values(
+            total_spent=bindparam("spent"), total_orders=bindparam("orders"),
+            last_purchase=bindparam("last"))
+        buyers = np.nonzero(orders[1:])[0] + 1
+        for i in range(0, len(buyers), CHUNK):
+            ids = buyers[i:i + CHUNK]
+            with engine.begin() as conn:
+                conn.execute(stmt, [
+                    {"cid": int(c) + base[Customer], "spent": round(float(spent[c]), 2), "orders": int(orders[c]),
+                     "last": start + timedelta(seconds=float(last[c]))}
+                    for c in ids
+                ])
+        _advance_sequences(engine, (Product, Customer, Bill, BillItem))
+
+    scale["items"] = item_id - base[BillItem]
+    return scale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last bill day (default today)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db", help="SQLite file to create")
+    target.add_argument("--database-url")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    if args.db and os.path.exists(args.db):
+        parser.error(f"{args.db} exists")
+    uri = args.database_url or "sqlite:///" + os.path.abspath(args.db)
+    t0 = time.perf_counter()
+    result = generate(create_app({"SQLALCHEMY_DATABASE_URI": uri}), args.bills, args.seed, args.end)
+    print(f"generated {result} in {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,157 @@
+# benchmarks/load_test.py
+"""
+Throughput vs. gunicorn worker count for billing and reports.
+
+    python benchmarks/load_test.py --workers 1 2 4 --clients 16 --seconds 15
+
+For each worker count a gunicorn server (gunicorn.conf.py) is started on a
+seeded throwaway SQLite database, then --clients keep-alive connections
+split between POST /billing/create and GET /reports/data (GPT insights
+off) for --seconds.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PORT = 5077
+PRODUCTS = 500
+SEED_BILLS = 20000
+
+
+def seed(env):
+    """Create and seed the database in a child process using the app's env."""
+    code = f"""
+import random
+from datetime import datetime, timedelta
+from app import create_app
+from database import upgrade_database
+from models import db, User, Product, Bill
+from passwords import hash_password
+app = create_app()
+upgrade_database(app, db)
+rng = random.Random(7)
+with app.test_request_context():
+    db.session.add(User(name="Load", email="load@example.com", password=hash_password("loadpass")))
+    db.session.execute(Product.__table__.insert(), [
+        {{"name": f"Item {{i}}", "price": rng.uniform(5, 500), "stock": 10 ** 7, "gst": 18.0}}
+        for i in range({PRODUCTS})
+    ])
+    now = datetime.utcnow()
+    db.session.execute(Bill.__table__.insert(), [
+        {{"customer_name": "seed", "total": rng.uniform(10, 5000),
+          "bill_date": now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))}}
+        for _ in range({SEED_BILLS})
+    ])
+    db.session.commit()
+"""
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+def start_server(workers, env):
+    env = dict(env, WEB_CONCURRENCY=str(workers), PORT=str(PORT), WEB_ACCESS_LOG="/dev/null")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def login():
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    conn.request("POST", "/login", json.dumps({"email": "load@example.com", "password": "loadpass"}),
+                 {"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    resp.read()
+    return resp.getheader("Set-Cookie").split(";", 1)[0]
+
+
+def client_loop(kind, cookie, stop, samples, seed_):
+    rng = random.Random(seed_)
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=60)
+    headers = {"Cookie": cookie, "Content-Type": "application/json"}
+    while not stop.is_set():
+        if kind == "billing":
+            body = json.dumps({"items": [{"id": rng.randint(1, PRODUCTS), "quantity": rng.randint(1, 3)}
+                                         for _ in range(rng.randint(1, 5))]})
+            method, url = "POST", "/billing/create"
+        else:
+            body, method, url = None, "GET", "/reports/data"
+        t0 = time.perf_counter()
+        conn.request(method, url, body, headers)
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status < 400:
+            samples.append(time.perf_counter() - t0)
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float("nan")
+
+
+def run(workers, clients, seconds, env):
+    proc = start_server(workers, env)
+    try:
+        cookie = login()
+        stop = threading.Event()
+        results = {"billing": [], "reports": []}
+        threads = [
+            threading.Thread(target=client_loop,
+                             args=("billing" if i % 2 == 0 else "reports", cookie, stop,
+                                   results["billing" if i % 2 == 0 else "reports"], i))
+            for i in range(clients)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+    row = {"workers": workers}
+    for kind, samples in results.items():
+        row[kind] = {"rps": round(len(samples) / seconds, 1),
+                     "p50_ms": round(pct(samples, .5), 2), "p99_ms": round(pct(samples, .99), 2)}
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               DATABASE_URL="sqlite:///" + os.path.join(tempfile.mkdtemp(), "load.db"),
+               GPT_INSIGHTS="0", OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "unused"))
+    seed(env)
+
+    print(f"{'workers':>8} {'billing rps':>12} {'p99 ms':>9} {'reports rps':>12} {'p99 ms':>9}")
+    for w in args.workers:
+        row = run(w, args.clients, args.seconds, env)
+        print(f"{w:>8} {row['billing']['rps']:>12} {row['billing']['p99_ms']:>9}"
+              f" {row['reports']['rps']:>12} {row['reports']['p99_ms']:>9}")
@@ -0,0 +1,421 @@
+# benchmarks/suite.py
+"""
+End-to-end benchmark suite on synthetic shop data (see datagen.py).
+
+    python benchmarks/suite.py --bills 100000 --output before.json
+    python benchmarks/suite.py --bills 100000 --output after.json --compare before.json
+    python benchmarks/suite.py --only reports_data dashboard_metrics --skip-macro
+
+The dataset for a given --bills/--seed is generated once a day (bills end
+today, so "today" endpoints have data) into benchmarks/.data/ and copied
+for every run, so each run starts from the same rows. --database-url runs
+against an existing (or empty, then seeded) database instead; writes made
+by the run are not undone there.
+
+micro   one endpoint at a time from one client: mean / p50 / p95 / p99 ms
+macro   mixed concurrent traffic for --seconds: ops/s and p50 / p99 per op
+
+Results are JSON (stdout or --output). --compare prints the change against
+an earlier result and exits 1 when a latency metric regressed by more than
+--threshold percent.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import datagen  # noqa: E402
+from datagen import BENCH_EMAIL, BENCH_PASSWORD  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data")
+
+CHAT_MESSAGES = ("today's sales", "total sales", "average bill", "top product", "low stock items", "help")
+
+
+# ==========================
+# Benchmarks
+# ==========================
+class Context:
+    """What a benchmark needs: a logged-in client and the dataset's shape."""
+
+    def __init__(self, app, scale, seed):
+        self.app = app
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.client = login(app)
+        self.workbook = None  # xlsx bytes for api_import_excel, set by main()
+        self.etag = None
+
+    def bill_id(self):
+        return self.rng.randint(1, self.scale["bills"])
+
+    def customer_id(self):
+        return self.rng.randint(1, self.scale["customers"])
+
+    def bill_items(self):
+        # products 1..100 are restocked by prepare(); ids are Zipf-popular
+        return [{"id": self.rng.randint(1, 100), "quantity": self.rng.randint(1, 3)}
+                for _ in range(self.rng.randint(1, 6))]
+
+
+MICRO = {}
+
+
+def micro(name, iterations):
+    def register(fn):
+        MICRO[name] = (fn, iterations)
+        return fn
+    return register
+
+
+@micro("create_bill", 200)
+def bench_create_bill(ctx):
+    customer = ctx.customer_id() if ctx.rng.random() < 0.7 else None
+    return ctx.client.post("/billing/create", json={"items": ctx.bill_items(), "customer_id": customer})
+
+
+@micro("invoice_pdf", 100)
+def bench_invoice_pdf(ctx):
+    return ctx.client.get(f"/billing/invoice/{ctx.bill_id()}/pdf")
+
+
+@micro("view_bill", 200)
+def bench_view_bill(ctx):
+    return ctx.client.get(f"/billing/view/{ctx.bill_id()}")
+
+
+@micro("billing_data", 30)
+def bench_billing_data(ctx):
+    return ctx.client.get("/billing/data")
+
+
+@micro("billing_data_revalidate", 200)
+def bench_billing_data_revalidate(ctx):
+    # a till polling with the ETag it already has (304 while nothing changed)
+    if ctx.etag is None:
+        ctx.etag = ctx.client.get("/billing/data").headers.get("ETag")
+    return ctx.client.get("/billing/data", headers={"If-None-Match": ctx.etag or ""})
+
+
+@micro("api_list", 30)
+def bench_api_list(ctx):
+    return ctx.client.get("/products/api")
+
+
+@micro("api_list_search", 100)
+def bench_api_list_search(ctx):
+    return ctx.client.get("/products/api", query_string={"q": ctx.rng.choice(datagen.NOUNS)})
+
+
+@micro("api_import_excel", 5)
+def bench_api_import_excel(ctx):
+    return ctx.client.post("/products/api/import", data={"file": (io.BytesIO(ctx.workbook), "products.xlsx")},
+                           content_type="multipart/form-data")
+
+
+@micro("reports_data", 10)
+def bench_reports_data(ctx):
+    return ctx.client.get("/reports/data")
+
+
+@micro("dashboard_metrics", 100)
+def bench_dashboard_metrics(ctx):
+    return ctx.client.get("/dashboard/api/metrics")
+
+
+@micro("ai_chat", 30)
+def bench_ai_chat(ctx):
+    return ctx.client.post("/ai/chat", json={"message": ctx.rng.choice(CHAT_MESSAGES)})
+
+
+@micro("crm_customers", 20)
+def bench_crm_customers(ctx):
+    return ctx.client.get("/crm/api/customers")
+
+
+@micro("crm_metrics", 100)
+def bench_crm_metrics(ctx):
+    return ctx.client.get("/crm/api/metrics")
+
+
+@micro("crm_customer_details", 200)
+def bench_crm_customer_details(ctx):
+    return ctx.client.get(f"/crm/api/customer/{ctx.customer_id()}")
+
+
+@micro("crm_ai_insight", 100)
+def bench_crm_ai_insight(ctx):
+    return ctx.client.get("/crm/api/ai-insight")
+
+
+# macro scenarios: {op: (weight, benchmark)} mixed over --threads clients
+MACRO = {
+    "checkout_rush": {
+        "create_bill": (8, bench_create_bill),
+        "view_bill": (2, bench_view_bill),
+        "dashboard_metrics": (1, bench_dashboard_metrics),
+    },
+    "back_office": {
+        "create_bill": (4, bench_create_bill),
+        "dashboard_metrics": (3, bench_dashboard_metrics),
+        "api_list_search": (3, bench_api_list_search),
+        "crm_customer_details": (3, bench_crm_customer_details),
+        "crm_metrics": (2, bench_crm_metrics),
+        "ai_chat": (2, bench_ai_chat),
+        "reports_data": (1, bench_reports_data),
+    },
+}
+
+
+# ==========================
+# Harness
+# ==========================
+def login(app):
+    client = app.test_client()
+    r = client.post("/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    if r.status_code != 200:
+        raise RuntimeError(f"login failed: {r.status_code} {r.get_data(as_text=True)[:200]}")
+    return client
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"n": 0}
+
+    def pct(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+    return {"n": len(samples), "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p50_ms": pct(.5), "p95_ms": pct(.95), "p99_ms": pct(.99)}
+
+
+def timed(fn, ctx):
+    t0 = time.perf_counter()
+    r = fn(ctx)
+    elapsed = time.perf_counter() - t0
+    if r.status_code >= 400:
+        raise RuntimeError(f"{fn.__name__}: HTTP {r.status_code} {r.get_data(as_text=True)[:200]}")
+    return elapsed
+
+
+def run_micro(ctx, names, factor):
+    results = {}
+    for name in names:
+        fn, iterations = MICRO[name]
+        n = max(1, int(iterations * factor))
+        for _ in range(min(3, n)):  # warm-up
+            timed(fn, ctx)
+        results[name] = summarize([timed(fn, ctx) for _ in range(n)])
+        print(f"  {name:<22} {results[name]['p50_ms']:>10.2f} ms p50  {results[name]['p95_ms']:>10.2f} ms p95",
+              file=sys.stderr)
+    return results
+
+
+def run_macro(app, scale, seed, name, threads, seconds):
+    ops = MACRO[name]
+    names = list(ops)
+    weights = [ops[op][0] for op in names]
+    samples = {op: [] for op in names}
+    errors = []
+    stop = threading.Event()
+
+    def worker(ctx):
+        try:
+            while not stop.is_set():
+                op = ctx.rng.choices(names, weights)[0]
+                samples[op].append(timed(ops[op][1], ctx))
+        except Exception as exc:  # surface in the results, don't hang the run
+            errors.append(repr(exc))
+
+    # log in up front: concurrent logins as one user trip the login throttle
+    contexts = [Context(app, scale, seed + i) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(ctx,)) for ctx in contexts]
+    for t in pool:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+
+    result = {"threads": threads, "seconds": seconds,
+              "ops_per_s": round(sum(len(s) for s in samples.values()) / seconds, 1),
+              "ops": {op: summarize(s) for op, s in samples.items()}}
+    if errors:
+        result["errors"] = errors
+    print(f"  {name:<22} {result['ops_per_s']:>10.1f} ops/s", file=sys.stderr)
+    return result
+
+
+def prepare(app, scale):
+    """Restock the products bills are drawn from and build the import workbook."""
+    import openpyxl
+    from models import db, Product
+
+    with app.app_context():
+        db.session.query(Product).filter(Product.id <= 100).update({Product.stock: 10 ** 9})
+        db.session.commit()
+        names = [name for (name,) in db.session.query(Product.name).filter(Product.id <= 250)]
+
+    # 500 rows: half update existing products, half are new
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "category", "price", "stock", "gst"])
+    for i, name in enumerate(names + [f"Imported Item {i}" for i in range(500 - len(names))]):
+        sheet.append([name, "Imported", 10 + i % 90, 50 + i % 20, 18])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def dataset(bills, seed):
+    """Path of a cached pristine SQLite dataset, generating it on first use."""
+    from app import create_app
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"shop-v{datagen.FORMAT}-{bills}-{seed}-{datetime.now():%Y%m%d}.db")
+    if not os.path.exists(path):
+        print(f"generating {bills:,} bills -> {path}", file=sys.stderr)
+        tmp = path + ".partial"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + tmp, "SQLITE_PROFILE": "default"})
+        datagen.generate(app, bills, seed)
+        with app.app_context():
+            from models import db
+            db.engine.dispose()
+        os.replace(tmp, path)
+    return path
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Print per-metric changes; return the list of regressions."""
+    rows, regressions = [], []
+
+    def check(label, before, after, lower_is_better=True):
+        if not before or after is None:
+            return
+        change = (after - before) / before * 100
+        worse = change > threshold if lower_is_better else change < -threshold
+        rows.append(f"  {label:<40} {before:>10.2f} -> {after:>10.2f}  {change:+7.1f}%{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(label)
+
+    for name, stats in new.get("micro", {}).items():
+        before = old.get("micro", {}).get(name, {})
+        check(f"micro {name} p50_ms", before.get("p50_ms"), stats.get("p50_ms"))
+        check(f"micro {name} p95_ms", before.get("p95_ms"), stats.get("p95_ms"))
+    for name, result in new.get("macro", {}).items():
+        before = old.get("macro", {}).get(name, {})
+        check(f"macro {name} ops_per_s", before.get("ops_per_s"), result.get("ops_per_s"), lower_is_better=False)
+        for op, stats in result["ops"].items():
+            check(f"macro {name}/{op} p99_ms", before.get("ops", {}).get(op, {}).get("p99_ms"), stats.get("p99_ms"))
+
+    print(f"compared with {old['meta'].get('revision')} ({old['meta'].get('timestamp')})", file=sys.stderr)
+    print("\n".join(rows), file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="run against this database instead of a cached SQLite copy")
+    parser.add_argument("--only", nargs="+", choices=sorted(MICRO), help="micro benchmarks to run")
+    parser.add_argument("--iterations", type=float, default=1.0, help="multiply micro iteration counts")
+    parser.add_argument("--skip-macro", action="store_true")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold, percent")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    config = {"GPT_INSIGHTS": False}
+    if args.database_url:
+        config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+        app = create_app(config)
+        from models import db, Bill
+        from database import upgrade_database
+        upgrade_database(app, db)
+        with app.app_context():
+            empty = db.session.query(Bill.id).first() is None
+        scale = datagen.generate(app, args.bills, args.seed) if empty else datagen.scale_for(args.bills)
+    else:
+        workdir = tempfile.mkdtemp(prefix="smartbill-bench-")
+        path = os.path.join(workdir, "shop.db")
+        shutil.copyfile(dataset(args.bills, args.seed), path)
+        config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+        app = create_app(config)
+        scale = datagen.scale_for(args.bills)
+
+    workbook = prepare(app, scale)
+    ctx = Context(app, scale, args.seed)
+    ctx.workbook = workbook
+
+    # reads before writes, so read benchmarks see the pristine dataset
+    names = [n for n in MICRO if not args.only or n in args.only]
+    names.sort(key=lambda n: n in ("create_bill", "api_import_excel"))
+
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": app.config["SQLALCHEMY_DATABASE_URI"].split(":", 1)[0],
+            "seed": args.seed,
+            "scale": scale,
+        },
+        "micro": {},
+        "macro": {},
+    }
+    print("micro", file=sys.stderr)
+    result["micro"] = run_micro(ctx, names, args.iterations)
+    if not args.skip_macro:
+        print("macro", file=sys.stderr)
+        for name in MACRO:
+            result["macro"][name] = run_macro(app, scale, args.seed, name, args.threads, args.seconds)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(json.load(fh), result, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
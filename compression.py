@@ -0,0 +1,102 @@
+# compression.py
+"""
+Negotiated response compression (COMPRESSION=1, the default).
+
+Responses of at least COMPRESS_MIN_SIZE bytes with a compressible mimetype
+are encoded with brotli (when the ``brotli`` package is installed) or gzip,
+whichever the client's Accept-Encoding prefers; ties go to brotli. Small
+bodies are left alone: below about a kilobyte the headers and CPU cost
+more than the bytes saved.
+
+Streamed responses, responses that already have a Content-Encoding and
+partial content are passed through. When a reverse proxy already
+compresses, set COMPRESSION=0.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _accepted(header):
+    """Accept-Encoding -> {coding: q}; codings with q=0 are dropped."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = _accepted(header or "")
+    candidates = [(accepted.get(c, accepted.get("*", 0)), c == "br", c)
+                  for c in (("br", "gzip") if brotli is not None else ("gzip",))]
+    q, _, coding = max(candidates)
+    return coding if q > 0 else None
+
+
+def make_compressor(app):
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+    levels = {"gzip": app.config["COMPRESS_GZIP_LEVEL"], "br": app.config["COMPRESS_BROTLI_QUALITY"]}
+    encoders = {"gzip": _gzip, "br": _brotli}
+
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE)
+            or (response.content_length or 0) < min_size
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        coding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if coding is None:
+            return response
+
+        response.set_data(encoders[coding](response.get_data(), levels[coding]))
+        response.headers["Content-Encoding"] = coding
+        etag, weak = response.get_etag()
+        if etag and not weak:  # the bytes differ from the identity representation
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
+
+
+def init_compression(app):
+    """Compress large responses when COMPRESSION is on."""
+    if not app.config.get("COMPRESSION"):
+        return
+    app.after_request(make_compressor(app))
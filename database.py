@@ -0,0 +1,325 @@
+# database.py
+"""
+Engine-level database settings.
+
+The database URL and pool come from config / env (DATABASE_URL, DB_POOL_*).
+SQLite profiles are applied as PRAGMAs on every new DBAPI connection,
+selected with the SQLITE_PROFILE config key / env var.
+
+``current_tenant`` is the store (tenant) the code runs for, None meaning
+all of them; ``TenantSession`` sends a tenant's queries to its own
+database file when tenancy.py keeps tenants apart.
+"""
+import os
+import re
+from contextvars import ContextVar
+
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+DEFAULT_DATABASE_URL = "sqlite:///database.db"
+
+SQLITE_PROFILES = {
+    # pysqlite defaults: rollback journal, synchronous=FULL, 5 s busy wait
+    "default": {},
+
+    # WAL lets dashboards keep reading while tills post bills; NORMAL sync
+    # is still crash-safe in WAL (only the last commits can be lost on
+    # power failure) and drops the fsync per checkout.
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,              # ms
+        "mmap_size": 256 * 1024 * 1024,    # bytes
+        "cache_size": -64 * 1024,          # negative = KiB, i.e. 64 MiB
+        "temp_store": "MEMORY",
+    },
+}
+
+# Pool for file databases under the tuned profile. WAL allows many readers
+# next to one writer, so keep enough connections for threaded workers
+# instead of serialising on the 5 + 10 QueuePool default.
+TUNED_POOL = {
+    "pool_size": 10,
+    "max_overflow": 10,
+    "pool_timeout": 10,
+}
+
+# Pool for server databases (PostgreSQL, MySQL). pre_ping drops connections
+# the server closed while idle; recycle stays under typical idle timeouts.
+SERVER_POOL = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 30,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+_POOL_ENV = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", int),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda v: v.lower() in ("1", "true", "yes")),
+}
+
+
+# ==========================
+# Configuration
+# ==========================
+def database_url_from_env():
+    """DATABASE_URL, accepting the legacy ``postgres://`` scheme."""
+    return normalise_database_url(os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL)
+
+
+def normalise_database_url(url):
+    """``url`` with ``postgres://`` and driverless ``postgresql://`` on psycopg2.
+
+    psycopg2 is the driver in requirements.txt; SQLAlchemy 2.1 would pick
+    psycopg (3) for a bare ``postgresql://``.
+    """
+    for scheme in ("postgres://", "postgresql://"):
+        if url.startswith(scheme):
+            return "postgresql+psycopg2://" + url[len(scheme):]
+    return url
+
+
+def pool_settings_from_env():
+    """Pool overrides from DB_POOL_SIZE, DB_MAX_OVERFLOW, ... (unset keys omitted)."""
+    settings = {}
+    for key, (name, cast) in _POOL_ENV.items():
+        value = os.getenv(name)
+        if value:
+            settings[key] = cast(value)
+    return settings
+
+
+def _is_memory_uri(uri):
+    return uri in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in uri
+
+
+def sqlite_engine_options(uri, profile="tuned"):
+    """SQLALCHEMY_ENGINE_OPTIONS for a SQLite ``uri`` under ``profile``.
+
+    In-memory databases are left alone: Flask-SQLAlchemy already gives
+    them a StaticPool so every session shares the one connection.
+    """
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE: {profile}")
+
+    if not uri.startswith("sqlite") or _is_memory_uri(uri) or profile == "default":
+        return {}
+
+    return {
+        **TUNED_POOL,
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def engine_options(uri, sqlite_profile="tuned", pool=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for any backend, with ``pool`` overrides."""
+    if uri.startswith("sqlite"):
+        options = sqlite_engine_options(uri, sqlite_profile)
+        # pool overrides only make sense where a QueuePool is in use
+        return {**options, **(pool or {})} if options else options
+    return {**SERVER_POOL, **(pool or {})}
+
+
+# ==========================
+# Tenants
+# ==========================
+# set per request from the user's store (see tenancy.py); None outside
+# requests, i.e. CLI commands and batch jobs see every tenant
+current_tenant = ContextVar("current_tenant", default=None)
+
+# tables every tenant shares, always in the main database
+SHARED_TABLES = ("user", "tenant", "alembic_version")
+
+
+class TenantSession(Session):
+    """Flask-SQLAlchemy session that binds to the current tenant's own
+    database, when it has one (TENANT_DATABASES, see tenancy.py)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = current_tenant.get()
+        if bind is None and tenant is not None and has_app_context():
+            databases = current_app.extensions.get("tenant_databases")
+            table = inspect(mapper).local_table if mapper is not None else None
+            if databases is not None and getattr(table, "name", None) not in SHARED_TABLES:
+                engine = databases.engine(tenant)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# ==========================
+# Dialect-neutral date bucketing
+# ==========================
+class _date_bucket(FunctionElement):
+    type = String()
+    inherit_cache = True
+    unit = None
+
+
+class day_bucket(_date_bucket):
+    """A datetime as 'YYYY-MM-DD' text on any backend."""
+    inherit_cache = True
+    unit = "day"
+
+
+class month_bucket(_date_bucket):
+    """A datetime as 'YYYY-MM' text on any backend."""
+    inherit_cache = True
+    unit = "month"
+
+
+_STRFTIME = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+_TO_CHAR = {"day": "YYYY-MM-DD", "month": "YYYY-MM"}
+
+
+@compiles(_date_bucket)
+def _compile_bucket_sqlite(element, compiler, **kw):
+    return "strftime('%s', %s)" % (
+        _STRFTIME[element.unit], compiler.process(element.clauses, **kw)
+    )
+
+
+@compiles(_date_bucket, "postgresql")
+def _compile_bucket_postgresql(element, compiler, **kw):
+    return "to_char(%s, '%s')" % (
+        compiler.process(element.clauses, **kw), _TO_CHAR[element.unit]
+    )
+
+
+def apply_sqlite_profile(engine, profile="tuned"):
+    """Register a connect hook that applies ``profile``'s PRAGMAs."""
+    pragmas = SQLITE_PROFILES[profile]
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def init_database(app, db):
+    """Apply the configured engine profile to ``db``'s engine for ``app``."""
+    with app.app_context():
+        apply_sqlite_profile(db.engine, app.config.get("SQLITE_PROFILE", "tuned"))
+
+
+# ==========================
+# Migrations
+# ==========================
+def upgrade_database(app, db):
+    """Migrate the schema to the latest revision.
+
+    Pre-migration databases (made by the old create_all-based /init-db,
+    no alembic_version) are adopted by the first revision: it creates
+    only the tables they lack, as of that revision, and the remaining
+    migrations run as usual.
+    """
+    from flask_migrate import upgrade
+
+    with app.app_context():
+        upgrade()
+
+
+# ==========================
+# Query plan checks
+# ==========================
+# GET endpoints polled or hit per keystroke. reports.reports_data is left
+# out: it calls the OpenAI API and aggregates the full history by design.
+HOT_ENDPOINTS = (
+    ("billing.billing_data", "/billing/data"),
+    ("billing.view_bill", "/billing/view/{bill_id}"),
+    ("dashboard.dashboard_metrics", "/dashboard/api/metrics"),
+    ("product.api_list", "/products/api"),
+    ("product.api_list (search)", "/products/api?q=milk&sort=-stock"),
+    ("crm.get_customers", "/crm/api/customers"),
+    ("crm.crm_metrics", "/crm/api/metrics"),
+    ("crm.customer_details", "/crm/api/customer/{customer_id}"),
+    ("crm.customer_activity", "/crm/api/customer/{customer_id}/activity"),
+)
+
+# (endpoint, table) pairs whose full scans are inherent to the query:
+# all-time totals and whole-table counts touch every row whatever the index.
+ALLOWED_FULL_SCANS = {
+    ("dashboard.dashboard_metrics", "bill"),        # SUM(total) over all bills
+    ("crm.crm_metrics", "customers"),               # single-pass aggregate
+    # archive registries: one row per archived day / year (see archive.py)
+    ("dashboard.dashboard_metrics", "archive_daily_sales"),
+    ("crm.customer_details", "archive_partitions"),
+}
+
+_FULL_SCAN = re.compile(r"\bSCAN (?:TABLE )?(\w+)\b(?! USING)")
+
+
+def collect_query_plans(app, db, endpoints=HOT_ENDPOINTS):
+    """Hit each endpoint and EXPLAIN QUERY PLAN every SELECT it issues.
+
+    Returns ``{endpoint: [(sql, [plan lines]), ...]}``. Endpoints are
+    called with LOGIN_DISABLED, they are read-only GETs. The sales cubes
+    are loaded first, as gunicorn's master does before forking: their
+    one-off load reads every bill and is not what a request runs.
+    """
+    from analytics import warm_sales_cubes
+
+    captured = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    plans = {}
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != "sqlite":
+            raise RuntimeError("Query plan checks use EXPLAIN QUERY PLAN (SQLite only)")
+        bill_id = db.session.execute(text("SELECT MAX(id) FROM bill")).scalar() or 1
+        customer_id = db.session.execute(text("SELECT MAX(id) FROM customers")).scalar() or 1
+        db.session.remove()
+    warm_sales_cubes(app)
+
+    previous = app.config.get("LOGIN_DISABLED", False)
+    app.config["LOGIN_DISABLED"] = True
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        client = app.test_client()
+        for name, url in endpoints:
+            captured.clear()
+            client.get(url.format(bill_id=bill_id, customer_id=customer_id))
+            statements = list(captured)
+
+            with engine.connect() as conn:
+                plans[name] = [
+                    (sql, [row[-1] for row in conn.exec_driver_sql(
+                        "EXPLAIN QUERY PLAN " + sql, params
+                    )])
+                    for sql, params in statements
+                ]
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+        app.config["LOGIN_DISABLED"] = previous
+
+    return plans
+
+
+def find_full_scans(plans, allowed=ALLOWED_FULL_SCANS):
+    """``[(endpoint, table, sql)]`` for every unexpected full table scan."""
+    problems = []
+    for name, statements in plans.items():
+        for sql, lines in statements:
+            for line in lines:
+                match = _FULL_SCAN.search(line)
+                if not match or match.group(1) in ("CONSTANT", "SUBQUERY"):
+                    continue
+                if (name, match.group(1)) not in allowed:
+                    problems.append((name, match.group(1), sql))
+    return problems
@@ -0,0 +1,306 @@
+# export.py
+"""
+Raw sales export for BI tools (/reports/export).
+
+Bills, or their line items flattened with the bill's fields, for a date
+range as CSV, NDJSON or Parquet, in bill id order. Rows come from one
+query per partition (archive.py) read with ``yield_per``: SQLite steps
+its cursor, PostgreSQL uses a server-side cursor, so the app holds one
+chunk of rows at a time and memory stays flat whatever the range.
+
+Bill ids make exports resumable. ``plan_export`` turns the date range
+and an ``after`` bill id into id bounds per partition (the date index
+finds them, the rows are then read by primary key), optionally cut off
+after ``limit`` bills; the response says up to which bill it goes and
+where the next page starts. A client whose download broke drops the
+rows of the last bill it got, which may be incomplete, and asks again
+with ``after`` = the bill before it.
+
+Only the current store's bills are exported (see tenancy.py).
+
+Amounts are rupees, from the stored paise (tax.py); items billed before
+the GST engine have their subtotal as taxable and no tax.
+"""
+import csv
+import heapq
+import io
+import json
+from datetime import datetime
+from operator import itemgetter
+
+from sqlalchemy import Float, String, cast, func, select, type_coerce
+
+from archive import bill_partitions
+from models import db, Product
+from tenancy import current_tenant, tenant_context, tenant_criteria
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is used instead
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CHUNK = 10_000        # rows per yield_per batch and per write
+ROW_GROUP = 200_000   # rows per Parquet row group
+
+COLUMNS = {
+    "items": ("bill_id", "bill_date", "customer_id", "customer_name", "product_id", "product_name",
+              "quantity", "unit_price", "gst_rate", "taxable", "tax", "line_total"),
+    "bills": ("bill_id", "bill_date", "customer_id", "customer_name", "taxable", "tax", "total"),
+}
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+# ==========================
+# Planning
+# ==========================
+class ExportPart:
+    """One partition's share of an export: bills with lo < id <= hi."""
+
+    def __init__(self, bills, items, lo, hi):
+        self.bills, self.items, self.lo, self.hi = bills, items, lo, hi
+
+
+def _in_range(bills, start, end):
+    # the store's filter spelled out: rows are streamed with Core (see _stream)
+    return (bills.bill_date >= start, bills.bill_date < end, *tenant_criteria(bills.tenant_id))
+
+
+def plan_export(start, end, after=0, limit=None):
+    """([ExportPart], until, next_after) for bills dated in [start, end) with id > ``after``.
+
+    ``until`` is the last bill id the export covers (None when empty);
+    ``next_after`` is where the next page starts when ``limit`` cut it short.
+    """
+    parts = []
+    for bills, items in bill_partitions(start, end):
+        first, last = db.session.execute(
+            select(func.min(bills.id), func.max(bills.id)).where(*_in_range(bills, start, end))
+        ).one()
+        if first is not None and last > after:
+            parts.append(ExportPart(bills, items, max(first - 1, after), last))
+    if not parts:
+        return [], None, None
+
+    until = max(p.hi for p in parts)
+    next_after = None
+    if limit:
+        # the limit-th bill of each partition; the page ends at the lowest
+        # (exact with one partition, at most limit bills per partition otherwise)
+        cut = until
+        for p in parts:
+            nth = db.session.execute(
+                select(p.bills.id)
+                .where(p.bills.id > p.lo, p.bills.id <= p.hi, *_in_range(p.bills, start, end))
+                .order_by(p.bills.id)
+                .offset(limit - 1)
+                .limit(1)
+            ).scalar()
+            if nth is not None:
+                cut = min(cut, nth)
+        if cut < until:
+            until = next_after = cut
+            parts = [p for p in parts if p.lo < cut]
+            for p in parts:
+                p.hi = min(p.hi, cut)
+    return parts, until, next_after
+
+
+# ==========================
+# Rows
+# ==========================
+def _rupees(paise):
+    return cast(paise / 100.0, Float)
+
+
+def _date(bills):
+    # SQLite hands back the stored "YYYY-MM-DD HH:MM:SS.ffffff" text as is:
+    # what CSV would print anyway, minus a datetime per row (PostgreSQL
+    # still returns datetimes)
+    return type_coerce(bills.bill_date, String)
+
+
+def _query(part, level, start, end):
+    bills, items = part.bills, part.items
+    where = (bills.id > part.lo, bills.id <= part.hi, *_in_range(bills, start, end))
+    if level == "bills":
+        return (
+            select(
+                bills.id, _date(bills), bills.customer_id, bills.customer_name,
+                _rupees(bills.taxable_paise), _rupees(bills.tax_paise), bills.total,
+            )
+            .where(*where)
+            .order_by(bills.id)
+        )
+    return (
+        select(
+            bills.id, _date(bills), bills.customer_id, bills.customer_name,
+            items.product_id, Product.name, items.quantity,
+            _rupees(items.unit_price_paise),
+            cast(items.gst_rate_bp / 100.0, Float),
+            func.coalesce(_rupees(items.taxable_paise), items.subtotal),
+            _rupees(items.tax_paise),
+            _rupees(items.taxable_paise + items.tax_paise),
+        )
+        # primary key range on bills, then each bill's items by ix_bill_item_bill_id
+        .join(items, items.bill_id == bills.id)
+        .outerjoin(Product, Product.id == items.product_id)
+        .where(*where)
+        .order_by(bills.id, items.id)
+    )
+
+
+def _stream(part, level, start, end, chunk):
+    # Core execution on the session's connection: plain tuples, no ORM row loading
+    statement = _query(part, level, start, end).execution_options(yield_per=chunk)
+    result = db.session.connection().execute(statement)
+    for rows in result.partitions():
+        yield rows
+
+
+def _for_tenant(chunks, tenant):
+    # the response body is read after the view returned, where the request's
+    # store is no longer set: read it for the store the export was planned for
+    with tenant_context(tenant):
+        yield from chunks
+
+
+def export_chunks(parts, level, start, end, chunk=CHUNK):
+    """Lists of up to ``chunk`` row tuples (COLUMNS[level]), in bill id order."""
+    parts = sorted(parts, key=lambda p: p.lo)
+    if all(a.hi <= b.lo for a, b in zip(parts, parts[1:])):
+        # the usual case: archived years hold older ids, so one after the other
+        for part in parts:
+            yield from _stream(part, level, start, end, chunk)
+        return
+    merged = heapq.merge(
+        *[(row for rows in _stream(part, level, start, end, chunk) for row in rows) for part in parts],
+        key=itemgetter(0),
+    )
+    rows = []
+    for row in merged:
+        rows.append(row)
+        if len(rows) == chunk:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+# ==========================
+# Formats
+# ==========================
+def csv_stream(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header of an empty export
+
+
+def _json_default(o):  # PostgreSQL datetimes
+    if isinstance(o, datetime):
+        return o.isoformat()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def ndjson_stream(chunks, columns):
+    if orjson is not None:
+        dumps = orjson.dumps
+    else:
+        def dumps(obj):
+            return json.dumps(obj, default=_json_default, ensure_ascii=False).encode()
+    for rows in chunks:
+        yield b"".join([dumps(dict(zip(columns, row))) + b"\n" for row in rows])
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file for ParquetWriter whose bytes are taken as they come.
+
+    tell() counts every byte ever written: the footer records column chunk
+    offsets from it, so it must not restart when the buffer is drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _parquet_schema(level):
+    money = pa.float64()
+    fields = {
+        "bill_id": pa.int64(), "bill_date": pa.timestamp("us"), "customer_id": pa.int64(),
+        "customer_name": pa.string(), "product_id": pa.int64(), "product_name": pa.string(),
+        "quantity": pa.int64(), "unit_price": money, "gst_rate": pa.float64(),
+        "taxable": money, "tax": money, "line_total": money, "total": money,
+    }
+    return pa.schema([(name, fields[name]) for name in COLUMNS[level]])
+
+
+def _arrow(values, type):
+    if pa.types.is_timestamp(type) and isinstance(values[0], str):
+        return pa.array(values, pa.string()).cast(type)  # SQLite's stored text
+    return pa.array(values, type=type)
+
+
+def parquet_stream(chunks, level, row_group=ROW_GROUP):
+    schema = _parquet_schema(level)
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write(rows):
+        arrays = [_arrow(values, field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    pending = []
+    for rows in chunks:
+        pending.extend(rows)
+        if len(pending) >= row_group:
+            write(pending)
+            pending = []
+            yield sink.drain()
+    if pending:
+        write(pending)
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(fmt, parts, level, start, end):
+    """Encoded chunks of the export, ready to send."""
+    chunks = _for_tenant(export_chunks(parts, level, start, end), current_tenant.get())
+    if fmt == "parquet":
+        return parquet_stream(chunks, level)
+    if fmt == "ndjson":
+        return ndjson_stream(chunks, COLUMNS[level])
+    return csv_stream(chunks, COLUMNS[level])
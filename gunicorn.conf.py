@@ -0,0 +1,55 @@
+# gunicorn.conf.py
+"""
+gunicorn -c gunicorn.conf.py
+
+Defaults: 2 x cores + 1 gthread workers with 4 threads each. SQLite takes
+one writer at a time, so on SQLite prefer fewer workers with more threads
+(WEB_CONCURRENCY=<cores>) and raise WEB_THREADS instead.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+workers = int(os.getenv("WEB_CONCURRENCY", cores * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 4))
+
+# Build the app once in the master and fork it into workers. Each worker's
+# inherited DB pool is dropped after fork (see app._dispose_engines_after_fork).
+preload_app = True
+
+timeout = int(os.getenv("WEB_TIMEOUT", 60))  # /reports/data waits on OpenAI
+graceful_timeout = 30
+keepalive = 5
+
+# recycle workers now and then to cap memory growth of in-process caches
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 5000))
+max_requests_jitter = 500
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+
+
+def when_ready(server):
+    # load the sales cubes once, before the workers are forked: they (and the
+    # workers that replace them after max_requests) inherit them instead of
+    # each reading every bill again (see analytics.py). ANALYTICS_CUBE_PRELOAD=0
+    # starts the workers at once and leaves the load to each of them.
+    if os.getenv("ANALYTICS_CUBE_PRELOAD", "1").lower() not in ("1", "true", "yes"):
+        return
+    from analytics import warm_sales_cubes
+
+    timings = warm_sales_cubes(server.app.wsgi())
+    if timings:
+        server.log.info("sales cubes loaded: %s", ", ".join(
+            f"store {store} in {seconds:.1f}s" for store, seconds in timings.items()))
+
+
+def worker_exit(server, worker):
+    # write the activity events still queued in this worker (see activity.py)
+    activity_log = getattr(getattr(worker, "wsgi", None), "extensions", {}).get("activity_log")
+    if activity_log is not None:
+        activity_log.close()
@@ -0,0 +1,259 @@
+# http_cache.py
+"""
+Conditional GET for read-mostly JSON endpoints (HTTP_CACHE=1, the default).
+
+Every committed write bumps a revision counter for each table it touched
+(ORM flushes and ORM-enabled insert/update/delete through db.session; raw
+connection / text() SQL is not seen). A view decorated with
+``@conditional("product", "bill")`` gets a weak ETag and Last-Modified
+built from those tables' revisions, and a matching If-None-Match (or
+If-Modified-Since when no ETag is sent) is answered with 304 before the
+view runs, so no query is made. A view whose payload also depends on
+something else, e.g. a date range that defaults to today, passes
+``vary=`` a function returning that as a string; it goes into the ETag,
+and If-Modified-Since alone is then never enough for a 304.
+
+Revisions are kept per store (tenancy.py): a write made for one store
+bumps ``<table>@<tenant>`` and only that store's ETags change; writes
+made outside a store (CLI, batch jobs) bump the table for everyone.
+
+Revisions live in a small memory-mapped file (HTTP_CACHE_REVISIONS,
+default <instance>/http_cache.rev) so all worker processes on a host see
+each other's writes. Deployments with app servers on several hosts need
+HTTP_CACHE=0. The ETag also carries HTTP_CACHE_SALT (random per app unless
+set, e.g. to a release id) so a deploy that changes a payload's shape
+never revalidates old copies; set it when workers aren't forked from one
+preloaded app, or each worker's ETags will differ.
+
+Hits and misses per endpoint are on /admin/http-cache and, with
+INSTRUMENTATION on, in /metrics.
+"""
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_app_context, jsonify, request
+from flask_login import login_required
+from sqlalchemy import event
+from werkzeug.http import http_date, parse_date
+
+from database import current_tenant
+from instrumentation import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process servers only
+    fcntl = None
+
+SLOTS = 256  # tables (per store) hash into slots; a collision only costs an extra miss
+_HEADER = struct.Struct("<8sQd")  # magic, epoch, created (unix time)
+_SLOT = struct.Struct("<Qd")  # revision, last modified (unix time)
+_MAGIC = b"SBREV002"
+_SIZE = _HEADER.size + SLOTS * _SLOT.size
+
+
+class RevisionStore:
+    """Per-table revision counters in a shared file (or in memory)."""
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._fd = None
+        header = _HEADER.pack(_MAGIC, secrets.randbits(63), time.time())
+        if path is None:
+            self._buf = bytearray(_SIZE)
+            self._buf[:len(header)] = header
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            with self._file_lock():
+                if os.fstat(self._fd).st_size < _SIZE:
+                    os.ftruncate(self._fd, _SIZE)
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    os.write(self._fd, header)
+            self._buf = mmap.mmap(self._fd, _SIZE)
+        magic, self.epoch, self.created = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC:
+            raise RuntimeError(f"{path} is not a revision file")
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None or self._fd is None:
+            yield
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _offset(table):
+        return _HEADER.size + (zlib.crc32(table.encode()) % SLOTS) * _SLOT.size
+
+    def get(self, table):
+        return _SLOT.unpack_from(self._buf, self._offset(table))
+
+    def bump(self, tables):
+        now = time.time()
+        with self._lock, self._file_lock():
+            for offset in {self._offset(t) for t in tables}:
+                revision, _ = _SLOT.unpack_from(self._buf, offset)
+                _SLOT.pack_into(self._buf, offset, revision + 1, now)
+
+
+# ==========================
+# Write tracking
+# ==========================
+_TOUCHED = "_http_cache_touched"
+
+
+def _key(table, tenant):
+    return table if tenant is None else f"{table}@{tenant}"
+
+
+def _after_flush(session, flush_context):
+    touched = session.info.setdefault(_TOUCHED, set())
+    tenant = current_tenant.get()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            # the row's own store when it has one (read without a lazy load)
+            touched.add(_key(table.name, obj.__dict__.get("tenant_id") or tenant))
+
+
+def _do_orm_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None and hasattr(table, "name"):
+            state.session.info.setdefault(_TOUCHED, set()).add(_key(table.name, current_tenant.get()))
+
+
+def _after_commit(session):
+    touched = session.info.pop(_TOUCHED, None)
+    if touched and has_app_context():
+        store = current_app.extensions.get("http_cache")
+        if store is not None:
+            store.bump(touched)
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED, None)
+
+
+# ==========================
+# Conditional views
+# ==========================
+class HitCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, hit):
+        with self._lock:
+            counts = self.endpoints.setdefault(endpoint, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {"hits": hits, "misses": misses,
+                       "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None}
+                for name, (hits, misses) in sorted(self.endpoints.items())
+            }
+
+    def render_prometheus(self):
+        lines = ["# HELP smartbill_http_cache_requests_total Conditional GETs by result.",
+                 "# TYPE smartbill_http_cache_requests_total counter"]
+        for name, stats in self.snapshot().items():
+            lines.append(f'smartbill_http_cache_requests_total{{endpoint="{name}",result="hit"}} {stats["hits"]}')
+            lines.append(f'smartbill_http_cache_requests_total{{endpoint="{name}",result="miss"}} {stats["misses"]}')
+        return lines
+
+
+hit_counter = HitCounter()
+metrics.collectors.append(hit_counter.render_prometheus)
+
+
+def _not_modified(etag, last_modified, dated=True):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return dated and since is not None and parse_date(http_date(last_modified)) <= since
+
+
+def conditional(*tables, vary=None):
+    """Answer GETs with 304 while none of ``tables`` has changed (nor ``vary()``)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = current_app.extensions.get("http_cache")
+            if store is None or request.method != "GET":
+                return view(*args, **kwargs)
+
+            # read revisions *before* the view queries: a write landing in
+            # between gives new data under the old tag, i.e. one extra miss
+            tenant = current_tenant.get()
+            keys = tables if tenant is None else [k for t in tables for k in (t, _key(t, tenant))]
+            revisions = [store.get(k) for k in keys]
+            # the store is part of the tag: another store's copy never revalidates
+            etag = "-".join([current_app.config["HTTP_CACHE_SALT"], format(store.epoch, "x"), f"t{tenant}"]
+                            + [str(rev) for rev, _ in revisions]
+                            + ([vary()] if vary is not None else []))
+            last_modified = max([store.created] + [modified for _, modified in revisions])
+
+            if _not_modified(etag, last_modified, dated=vary is None):
+                hit_counter.record(request.endpoint, True)
+                response = current_app.response_class(status=304)
+            else:
+                hit_counter.record(request.endpoint, False)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            # revalidate every time; private because responses need a login
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+    return decorator
+
+
+@login_required
+def cache_stats():
+    return jsonify(hit_counter.snapshot())
+
+
+_events_installed = False
+
+
+def init_http_cache(app, db):
+    """Track table revisions and enable @conditional views when HTTP_CACHE is on."""
+    global _events_installed
+
+    if not app.config.get("HTTP_CACHE"):
+        return
+
+    path = app.config.get("HTTP_CACHE_REVISIONS") or os.path.join(app.instance_path, "http_cache.rev")
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    app.extensions["http_cache"] = RevisionStore(None if path == ":memory:" else path)
+    app.config.setdefault("HTTP_CACHE_SALT", None)
+    if not app.config["HTTP_CACHE_SALT"]:
+        app.config["HTTP_CACHE_SALT"] = secrets.token_hex(4)
+
+    if not _events_installed:
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "do_orm_execute", _do_orm_execute)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_rollback", _after_rollback)
+        _events_installed = True
+
+    app.add_url_rule("/admin/http-cache", "http_cache_stats", cache_stats)
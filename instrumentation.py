@@ -0,0 +1,197 @@
+# instrumentation.py
+"""
+Opt-in request / SQL instrumentation (INSTRUMENTATION=1).
+
+Per endpoint it records wall time, SQL statement count and time, rows and
+response size. Exposed as Prometheus text on /metrics (optionally guarded
+by METRICS_TOKEN) and per response in a Server-Timing header.
+
+"rows" counts rows affected by INSERT/UPDATE/DELETE, plus ORM instances
+loaded when INSTRUMENTATION_ROWS is also on; DBAPI cursors don't report
+how many rows a SELECT fetched, and the per-instance load hook costs about
+a microsecond a row (~15% on /billing/data), so it is off by default.
+
+Metrics are per process: with several gunicorn workers each scrape sees
+the worker that served it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import Response, request, current_app
+from sqlalchemy import event
+
+# request duration histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# per-request counters; a ContextVar rather than flask.g because the SQL and
+# ORM-load hooks run per statement / per row and g's proxy lookup adds up
+_request_stats = ContextVar("request_stats", default=None)
+
+
+class EndpointStats:
+    __slots__ = ("count", "wall", "sql_count", "sql_time", "rows", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        # callables returning extra exposition lines (e.g. http_cache hit counts)
+        self.collectors = []
+
+    def record(self, endpoint, wall, stats, size):
+        with self._lock:
+            ep = self.endpoints.get(endpoint)
+            if ep is None:
+                ep = self.endpoints[endpoint] = EndpointStats()
+            ep.count += 1
+            ep.wall += wall
+            ep.sql_count += stats["sql_count"]
+            ep.sql_time += stats["sql_time"]
+            ep.rows += stats["rows"]
+            ep.bytes += size
+            ep.buckets[bisect_left(BUCKETS, wall)] += 1
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            snapshot = {name: _copy(ep) for name, ep in self.endpoints.items()}
+
+        lines = [
+            "# HELP smartbill_request_duration_seconds Request wall time.",
+            "# TYPE smartbill_request_duration_seconds histogram",
+        ]
+        for name, ep in sorted(snapshot.items()):
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), ep.buckets):
+                cumulative += n
+                lines.append(f'smartbill_request_duration_seconds_bucket{{endpoint="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'smartbill_request_duration_seconds_sum{{endpoint="{name}"}} {ep.wall:.6f}')
+            lines.append(f'smartbill_request_duration_seconds_count{{endpoint="{name}"}} {ep.count}')
+
+        counters = (
+            ("smartbill_sql_statements_total", "SQL statements executed.", "sql_count"),
+            ("smartbill_sql_duration_seconds_total", "Time spent executing SQL.", "sql_time"),
+            ("smartbill_sql_rows_total", "DML rows affected plus ORM rows loaded (INSTRUMENTATION_ROWS).", "rows"),
+            ("smartbill_response_bytes_total", "Response body bytes.", "bytes"),
+        )
+        for metric, help_text, attr in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, ep in sorted(snapshot.items()):
+                lines.append(f'{metric}{{endpoint="{name}"}} {getattr(ep, attr)}')
+
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def _copy(ep):
+    clone = EndpointStats()
+    for slot in EndpointStats.__slots__:
+        value = getattr(ep, slot)
+        setattr(clone, slot, list(value) if isinstance(value, list) else value)
+    return clone
+
+
+metrics = Metrics()
+
+
+# ==========================
+# Hooks
+# ==========================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats.get() is not None:
+        conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    starts = conn.info.get("_query_start")
+    if starts:
+        stats["sql_time"] += time.perf_counter() - starts.pop()
+    stats["sql_count"] += 1
+    if cursor.rowcount > 0 and statement.lstrip()[:6].upper() != "SELECT":
+        stats["rows"] += cursor.rowcount
+
+
+def _on_load(target, context):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["rows"] += 1
+
+
+def _start_request():
+    _request_stats.set({"start": time.perf_counter(), "sql_count": 0, "sql_time": 0.0, "rows": 0})
+
+
+def _finish_request(response):
+    stats = _request_stats.get()
+    if stats is None:
+        return response
+    _request_stats.set(None)
+
+    wall = time.perf_counter() - stats["start"]
+    size = 0 if response.is_streamed else (response.content_length or 0)
+    metrics.record(request.endpoint or "unmatched", wall, stats, size)
+
+    response.headers.add(
+        "Server-Timing",
+        f'app;dur={wall * 1000:.1f}, db;dur={stats["sql_time"] * 1000:.1f};desc="{stats["sql_count"]} queries"',
+    )
+    return response
+
+
+def metrics_view():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+_model_hook_installed = False
+
+
+def _instrument(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def init_instrumentation(app, db):
+    """Wire hooks into ``app`` and its engine when INSTRUMENTATION is on."""
+    global _model_hook_installed
+
+    if not app.config.get("INSTRUMENTATION"):
+        return
+
+    with app.app_context():
+        _instrument(db.engine)
+    # stores in their own database files (TENANT_DATABASES): hooked as they are opened
+    databases = app.extensions.get("tenant_databases")
+    if databases is not None:
+        databases.on_open.append(_instrument)
+    if app.config.get("INSTRUMENTATION_ROWS") and not _model_hook_installed:
+        event.listen(db.Model, "load", _on_load, propagate=True)
+        _model_hook_installed = True
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    # after_request is skipped on unhandled errors; don't leak into the next request
+    app.teardown_request(lambda exc: _request_stats.set(None))
+    app.add_url_rule("/metrics", "metrics", metrics_view)
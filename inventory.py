@@ -0,0 +1,195 @@
+# inventory.py
+"""
+Stock movement ledger with snapshot checkpoints.
+
+Every change to Product.stock also appends a StockMovement row in the
+same transaction (``record_movements``, one bulk insert per request), so
+the ledger is the stock history: a product's stock at any time is the sum
+of its movements up to then. History starts at migration 0004, which
+opens the ledger with each product's stock at that moment.
+
+Replaying millions of rows per question is too slow, so ``take_snapshot``
+(run it periodically: ``flask stock-snapshot`` from cron, or the admin
+endpoint) checkpoints the stock of every product that moved since the
+previous run, or of every product on a full run. All rows of one run
+share its movement-id boundary, so "stock at T" is each product's latest
+snapshot as of the last run taken by T plus the movements after that
+run's boundary and created by T (``stock_as_of``).
+
+Ids, not timestamps, order the ledger: a movement stamped before a run
+but committed after it has a larger id than the run's boundary and is
+counted in the tail, never lost.
+
+Movements, snapshots and runs belong to a store (tenancy.py): each store
+keeps its own run sequence over its own slice of the ledger, so take
+snapshots inside a store's context (``flask stock-snapshot`` goes through
+every store).
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func
+
+from models import db, StockMovement, StockSnapshot, StockSnapshotRun
+
+KINDS = ("opening", "sale", "return", "adjustment", "import")
+
+WRITE_CHUNK = 5000
+ID_CHUNK = 500
+# a movement is committed within this long of its created_at (one request),
+# so tails can stop at the first run taken this long after the as-of time
+SETTLE = timedelta(minutes=5)
+
+
+# ==========================
+# Writing
+# ==========================
+def record_movements(changes, kind, bill_id=None, at=None):
+    """Append ``(product_id, quantity)`` changes to the current transaction.
+
+    Zero quantities are skipped. The caller commits, together with the
+    Product.stock updates the rows describe.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown stock movement kind: {kind}")
+    at = at or datetime.utcnow()
+    rows = [
+        {"product_id": product_id, "kind": kind, "quantity": quantity, "bill_id": bill_id, "created_at": at}
+        for product_id, quantity in changes
+        if quantity
+    ]
+    for i in range(0, len(rows), WRITE_CHUNK):
+        db.session.execute(StockMovement.__table__.insert(), rows[i:i + WRITE_CHUNK])
+    return len(rows)
+
+
+def _latest_snapshots(product_ids, run):
+    """{product_id: stock} of each product's newest snapshot as of ``run``.
+
+    Only rows since the last full run at or before ``run`` are considered,
+    so the lookup is bounded by one full run plus the deltas after it.
+    """
+    full = (
+        StockSnapshotRun.query
+        .filter(StockSnapshotRun.full.is_(True), StockSnapshotRun.movement_id <= run.movement_id)
+        .order_by(StockSnapshotRun.movement_id.desc())
+        .first()
+    )
+    window = [StockSnapshot.movement_id <= run.movement_id]
+    if full is not None:
+        window.append(StockSnapshot.movement_id >= full.movement_id)
+    if product_ids is not None:
+        window.append(StockSnapshot.product_id.in_(product_ids))
+
+    latest = (
+        db.session.query(StockSnapshot.product_id, func.max(StockSnapshot.movement_id).label("movement_id"))
+        .filter(*window)
+        .group_by(StockSnapshot.product_id)
+        .subquery()
+    )
+    rows = db.session.query(StockSnapshot.product_id, StockSnapshot.stock).join(
+        latest,
+        and_(StockSnapshot.product_id == latest.c.product_id, StockSnapshot.movement_id == latest.c.movement_id),
+    )
+    return dict(rows.all())
+
+
+def take_snapshot(full=False, now=None):
+    """Checkpoint stock for as-of queries.
+
+    Incremental runs write the products that moved since the previous run;
+    a full run (the first one always is) writes every product in stock and
+    bounds how far back later lookups search. Run incrementally often and
+    full now and then, e.g. nightly and weekly.
+    """
+    now = now or datetime.utcnow()
+    boundary = db.session.query(func.max(StockMovement.id)).scalar() or 0
+    last_run = StockSnapshotRun.query.order_by(StockSnapshotRun.movement_id.desc()).first()
+    previous = last_run.movement_id if last_run else 0
+    if StockSnapshotRun.query.filter_by(full=True).first() is None:
+        full = True
+    if boundary <= previous and not full:
+        return {"full": False, "products": 0, "movement_id": previous}
+
+    moved = dict(
+        db.session.query(StockMovement.product_id, func.sum(StockMovement.quantity))
+        .filter(StockMovement.id > previous, StockMovement.id <= boundary)
+        .group_by(StockMovement.product_id)
+    )
+    if full:
+        stock = _latest_snapshots(None, last_run) if last_run else {}
+    else:
+        ids = list(moved)
+        stock = {}
+        for i in range(0, len(ids), ID_CHUNK):
+            stock.update(_latest_snapshots(ids[i:i + ID_CHUNK], last_run))
+    for product_id, quantity in moved.items():
+        stock[product_id] = stock.get(product_id, 0) + int(quantity)
+
+    # a full run only needs products in stock; a delta run must also
+    # record products that dropped to zero
+    rows = [
+        {"product_id": product_id, "movement_id": boundary, "stock": s, "taken_at": now}
+        for product_id, s in stock.items()
+        if (s if full else product_id in moved)
+    ]
+    for i in range(0, len(rows), WRITE_CHUNK):
+        db.session.execute(StockSnapshot.__table__.insert(), rows[i:i + WRITE_CHUNK])
+    db.session.add(StockSnapshotRun(taken_at=now, movement_id=boundary, full=full, products=len(rows)))
+    db.session.commit()
+    return {"full": full, "products": len(rows), "movement_id": boundary}
+
+
+# ==========================
+# Point-in-time queries
+# ==========================
+def stock_as_of(at, product_ids=None):
+    """{product_id: stock} at ``at`` for ``product_ids`` (default: all).
+
+    The last run taken by ``at`` gives each product's base stock; the tail
+    is the movements after its boundary created by ``at``, stopping at the
+    first run taken SETTLE after ``at``. Products at zero are omitted.
+    """
+    run = (
+        StockSnapshotRun.query
+        .filter(StockSnapshotRun.taken_at <= at)
+        .order_by(StockSnapshotRun.taken_at.desc())
+        .first()
+    )
+    stop = (
+        db.session.query(StockSnapshotRun.movement_id)
+        .filter(StockSnapshotRun.taken_at > at + SETTLE)
+        .order_by(StockSnapshotRun.taken_at)
+        .limit(1)
+        .scalar()
+    )
+    start = run.movement_id if run else 0
+
+    stock = {}
+    for chunk in _chunks(product_ids):
+        if run is not None:
+            stock.update(_latest_snapshots(chunk, run))
+        tail = db.session.query(StockMovement.product_id, func.sum(StockMovement.quantity)).filter(
+            StockMovement.id > start, StockMovement.created_at <= at
+        )
+        if stop is not None:
+            tail = tail.filter(StockMovement.id <= stop)
+        if chunk is not None:
+            tail = tail.filter(StockMovement.product_id.in_(chunk))
+        for product_id, quantity in tail.group_by(StockMovement.product_id):
+            stock[product_id] = stock.get(product_id, 0) + int(quantity)
+
+    return {product_id: s for product_id, s in stock.items() if s}
+
+
+def product_stock_as_of(product_id, at):
+    """One product's stock at ``at`` (0 before its first movement)."""
+    return stock_as_of(at, [product_id]).get(product_id, 0)
+
+
+def _chunks(product_ids):
+    if product_ids is None:
+        yield None
+        return
+    product_ids = list(product_ids)
+    for i in range(0, len(product_ids), ID_CHUNK):
+        yield product_ids[i:i + ID_CHUNK]
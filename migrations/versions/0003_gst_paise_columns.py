@@ -0,0 +1,69 @@
+"""gst paise columns
+
+Stored GST per bill line and bill (integer paise, rate in basis points),
+backfilled from existing rows. Product.gst is read as the fraction the
+billing code charged with; its one conversion, to a percentage, is 0010.
+
+Line tax is backfilled from the product's current rate. A bill's tax is
+what it was charged, bill.total less its lines' subtotals, so
+taxable_paise + tax_paise still adds up to bill.total; its lines' tax
+then need not add up to it.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 04:05:12.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bill', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('taxable_paise', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('tax_paise', sa.BigInteger(), nullable=True))
+
+    with op.batch_alter_table('bill_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unit_price_paise', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('gst_rate_bp', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('taxable_paise', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('tax_paise', sa.BigInteger(), nullable=True))
+
+    # same rules as tax.rate_to_bp / compute_tax, in portable SQL
+    op.execute("""
+        UPDATE bill_item SET
+            taxable_paise = CAST(ROUND(subtotal * 100) AS BIGINT),
+            unit_price_paise = CAST(ROUND(subtotal * 100 / quantity) AS BIGINT),
+            gst_rate_bp = COALESCE(
+                (SELECT CAST(ROUND(product.gst * 10000) AS INTEGER)
+                 FROM product WHERE product.id = bill_item.product_id AND product.gst IS NOT NULL),
+                1800)
+        WHERE quantity > 0
+    """)
+    op.execute("UPDATE bill_item SET tax_paise = (taxable_paise * gst_rate_bp + 5000) / 10000"
+               " WHERE taxable_paise IS NOT NULL")
+    op.execute("""
+        UPDATE bill SET
+            taxable_paise = (SELECT SUM(taxable_paise) FROM bill_item WHERE bill_item.bill_id = bill.id)
+    """)
+    op.execute("UPDATE bill SET tax_paise = CAST(ROUND(total * 100) AS BIGINT) - taxable_paise"
+               " WHERE taxable_paise IS NOT NULL AND total IS NOT NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('bill_item', schema=None) as batch_op:
+        batch_op.drop_column('tax_paise')
+        batch_op.drop_column('taxable_paise')
+        batch_op.drop_column('gst_rate_bp')
+        batch_op.drop_column('unit_price_paise')
+
+    with op.batch_alter_table('bill', schema=None) as batch_op:
+        batch_op.drop_column('tax_paise')
+        batch_op.drop_column('taxable_paise')
@@ -0,0 +1,80 @@
+"""stock ledger
+
+Append-only stock movements, snapshot checkpoints and their runs (see
+inventory.py).
+The ledger opens with one 'opening' movement per product holding its
+current stock, so movements sum to Product.stock from here on.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 05:12:40.551903
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_movement',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('bill_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_movement', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_movement_product_id_id', ['product_id', 'id'], unique=False)
+
+    op.create_table('stock_snapshot',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('movement_id', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_snapshot_product_id_movement_id', ['product_id', 'movement_id'], unique=False)
+
+    op.create_table('stock_snapshot_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('movement_id', sa.Integer(), nullable=False),
+    sa.Column('full', sa.Boolean(), nullable=True),
+    sa.Column('products', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_snapshot_runs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_snapshot_runs_taken_at'), ['taken_at'], unique=False)
+
+    op.get_bind().execute(
+        sa.text("INSERT INTO stock_movement (product_id, kind, quantity, created_at)"
+                " SELECT id, 'opening', stock, :now FROM product WHERE stock != 0 ORDER BY id"),
+        {"now": datetime.utcnow()},
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('stock_snapshot_runs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_snapshot_runs_taken_at'))
+
+    op.drop_table('stock_snapshot_runs')
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_snapshot_product_id_movement_id')
+
+    op.drop_table('stock_snapshot')
+    with op.batch_alter_table('stock_movement', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_movement_product_id_id')
+
+    op.drop_table('stock_movement')
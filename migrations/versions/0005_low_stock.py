@@ -0,0 +1,53 @@
+"""low stock
+
+Per-product reorder level (default 5, i.e. the old hard-coded `stock < 5`)
+and the low_stock table maintained by stock_alerts.py, filled from the
+current stock.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 06:01:27.902114
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reorder_level', sa.Integer(), server_default='5', nullable=False))
+
+    op.create_table('low_stock',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('reorder_level', sa.Integer(), nullable=False),
+    sa.Column('since', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    with op.batch_alter_table('low_stock', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_low_stock_stock'), ['stock'], unique=False)
+
+    op.get_bind().execute(
+        sa.text("INSERT INTO low_stock (product_id, name, stock, reorder_level, since)"
+                " SELECT id, name, stock, reorder_level, :now FROM product WHERE stock < reorder_level"),
+        {"now": datetime.utcnow()},
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('low_stock', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_low_stock_stock'))
+
+    op.drop_table('low_stock')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('reorder_level')
@@ -0,0 +1,57 @@
+"""reorder suggestions
+
+Per-product demand and reorder quantities written by the nightly batch
+(see reorder.py), and one row per run.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 07:14:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reorder_suggestion',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('units_7d', sa.Integer(), nullable=True),
+    sa.Column('units_28d', sa.Integer(), nullable=True),
+    sa.Column('units_90d', sa.Integer(), nullable=True),
+    sa.Column('velocity', sa.Float(), nullable=True),
+    sa.Column('demand_std', sa.Float(), nullable=True),
+    sa.Column('days_of_cover', sa.Float(), nullable=True),
+    sa.Column('reorder_point', sa.Integer(), nullable=False),
+    sa.Column('target_stock', sa.Integer(), nullable=False),
+    sa.Column('suggested_qty', sa.Integer(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    with op.batch_alter_table('reorder_suggestion', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reorder_suggestion_suggested_qty'), ['suggested_qty'], unique=False)
+
+    op.create_table('reorder_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('lead_days', sa.Integer(), nullable=True),
+    sa.Column('cover_days', sa.Integer(), nullable=True),
+    sa.Column('products', sa.Integer(), nullable=True),
+    sa.Column('suggested', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('reorder_runs')
+    with op.batch_alter_table('reorder_suggestion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reorder_suggestion_suggested_qty'))
+
+    op.drop_table('reorder_suggestion')
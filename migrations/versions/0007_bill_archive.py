@@ -0,0 +1,44 @@
+"""bill archive
+
+Registry of archived bill partitions (one per year, see archive.py) and
+the daily sales rollup of archived bills. The partitions themselves are
+created by the archiver: attached files on SQLite, schemas elsewhere.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 08:02:17.640931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archive_partitions',
+    sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('bills', sa.Integer(), nullable=True),
+    sa.Column('items', sa.Integer(), nullable=True),
+    sa.Column('first_bill_date', sa.DateTime(), nullable=False),
+    sa.Column('until', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('year')
+    )
+    op.create_table('archive_daily_sales',
+    sa.Column('day', sa.String(length=10), nullable=False),
+    sa.Column('bills', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade():
+    # archived rows are not moved back; restore them before downgrading
+    op.drop_table('archive_daily_sales')
+    op.drop_table('archive_partitions')
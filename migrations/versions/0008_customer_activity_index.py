@@ -0,0 +1,29 @@
+"""customer activity index
+
+(customer_id, created_at) for the per-customer activity timeline
+(activity.py writes the rows, /crm/api/customer/<id>/activity reads them).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customer_activity', schema=None) as batch_op:
+        batch_op.create_index('ix_customer_activity_customer_id_created_at', ['customer_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('customer_activity', schema=None) as batch_op:
+        batch_op.drop_index('ix_customer_activity_customer_id_created_at')
@@ -0,0 +1,155 @@
+"""tenants
+
+Stores (tenants) and a tenant_id on every store-owned table: products,
+bills, bill items, customers and the rollups built from them. Existing
+rows go to tenant 1, the main store. Indexes the app filters per store
+now lead on tenant_id; phone numbers are unique per store.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 10:31:05.442817
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+# (table, [old single-column indexes], [(new index, columns)])
+INDEXES = (
+    ('product', ['ix_product_name', 'ix_product_stock'],
+     [('ix_product_tenant_id_name', ['tenant_id', 'name']),
+      ('ix_product_tenant_id_stock', ['tenant_id', 'stock'])]),
+    ('bill', [],
+     [('ix_bill_tenant_id_bill_date', ['tenant_id', 'bill_date'])]),
+    ('bill_item', ['ix_bill_item_product_id'],
+     [('ix_bill_item_tenant_id_product_id', ['tenant_id', 'product_id'])]),
+    ('customers', ['ix_customers_total_spent', 'ix_customers_last_purchase'],
+     [('ix_customers_tenant_id_total_spent', ['tenant_id', 'total_spent']),
+      ('ix_customers_tenant_id_last_purchase', ['tenant_id', 'last_purchase'])]),
+    ('customer_segments', ['ix_customer_segments_segment', 'ix_customer_segments_cohort'],
+     [('ix_customer_segments_tenant_id_segment', ['tenant_id', 'segment']),
+      ('ix_customer_segments_tenant_id_cohort', ['tenant_id', 'cohort'])]),
+    ('low_stock', ['ix_low_stock_stock'],
+     [('ix_low_stock_tenant_id_stock', ['tenant_id', 'stock'])]),
+    ('reorder_suggestion', ['ix_reorder_suggestion_suggested_qty'],
+     [('ix_reorder_suggestion_tenant_id_suggested_qty', ['tenant_id', 'suggested_qty'])]),
+)
+
+# 0001 left the phone unique constraint unnamed: give SQLite's reflected
+# copy a name to drop it by; PostgreSQL named it itself
+PHONE_UNIQUE = {'sqlite': 'uq_customers_phone', 'postgresql': 'customers_phone_key'}
+NAMING = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _tenant_id(table):
+    return sa.Column('tenant_id', sa.Integer(), sa.ForeignKey('tenant.id', name=f'fk_{table}_tenant_id_tenant'),
+                     server_default='1', nullable=False)
+
+
+def _archive_schemas():
+    """Archived year partitions (see archive.py): attached files on SQLite."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        return [row[1] for row in bind.exec_driver_sql('PRAGMA database_list') if row[1].startswith('archive_')]
+    return [row[0] for row in bind.execute(sa.text(
+        "SELECT schema_name FROM information_schema.schemata WHERE schema_name LIKE 'archive\\_%'"))]
+
+
+def upgrade():
+    tenant = op.create_table('tenant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('slug', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slug')
+    )
+    op.bulk_insert(tenant, [{'id': 1, 'name': 'Main store', 'slug': 'main', 'created_at': datetime.utcnow()}])
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(_tenant_id('user'))
+
+    # batch runs made for one store; NULL for runs over every store
+    for table in ('segment_runs', 'reorder_runs'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('tenant_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f'fk_{table}_tenant_id_tenant', 'tenant', ['tenant_id'], ['id'])
+
+    dialect = op.get_bind().dialect.name
+    for table, old, new in INDEXES:
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING) as batch_op:
+            batch_op.add_column(_tenant_id(table))
+            if table == 'customers' and dialect in PHONE_UNIQUE:
+                batch_op.drop_constraint(PHONE_UNIQUE[dialect], type_='unique')
+                batch_op.create_unique_constraint('uq_customers_tenant_id_phone', ['tenant_id', 'phone'])
+            for name in old:
+                batch_op.drop_index(name)
+            for name, columns in new:
+                batch_op.create_index(name, columns, unique=False)
+
+    # the archive rollup gets (tenant_id, day) as its key: copy it over
+    op.create_table('archive_daily_sales_new',
+    sa.Column('tenant_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('day', sa.String(length=10), nullable=False),
+    sa.Column('bills', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenant.id'], ),
+    sa.PrimaryKeyConstraint('tenant_id', 'day')
+    )
+    op.execute('INSERT INTO archive_daily_sales_new (tenant_id, day, bills, revenue) '
+               'SELECT 1, day, bills, revenue FROM archive_daily_sales')
+    op.drop_table('archive_daily_sales')
+    op.rename_table('archive_daily_sales_new', 'archive_daily_sales')
+
+    # partitions copy every hot column, so they need tenant_id as well
+    for schema in _archive_schemas():
+        for table in ('bill', 'bill_item'):
+            op.add_column(table, sa.Column('tenant_id', sa.Integer(), server_default='1', nullable=False),
+                          schema=schema)
+        op.create_index('ix_bill_tenant_id_bill_date', 'bill', ['tenant_id', 'bill_date'], unique=False,
+                        schema=schema)
+
+
+def downgrade():
+    # rows of every store are kept and merged: phone numbers must be unique
+    # across stores again before downgrading
+    for schema in _archive_schemas():
+        op.drop_index('ix_bill_tenant_id_bill_date', table_name='bill', schema=schema)
+        for table in ('bill', 'bill_item'):
+            op.drop_column(table, 'tenant_id', schema=schema)
+
+    op.create_table('archive_daily_sales_old',
+    sa.Column('day', sa.String(length=10), nullable=False),
+    sa.Column('bills', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.execute('INSERT INTO archive_daily_sales_old (day, bills, revenue) '
+               'SELECT day, SUM(bills), SUM(revenue) FROM archive_daily_sales GROUP BY day')
+    op.drop_table('archive_daily_sales')
+    op.rename_table('archive_daily_sales_old', 'archive_daily_sales')
+
+    for table, old, new in reversed(INDEXES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, _ in new:
+                batch_op.drop_index(name)
+            for name in old:
+                batch_op.create_index(name, [name.split(f'ix_{table}_', 1)[1]], unique=False)
+            if table == 'customers':
+                batch_op.drop_constraint('uq_customers_tenant_id_phone', type_='unique')
+                batch_op.create_unique_constraint('uq_customers_phone', ['phone'])
+            batch_op.drop_column('tenant_id')
+
+    for table in ('reorder_runs', 'segment_runs', 'user'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('tenant_id')
+
+    op.drop_table('tenant')
@@ -0,0 +1,31 @@
+"""gst percent
+
+Product.gst holds a percentage (18.0) instead of a fraction (0.18), the
+one form tax.rate_to_bp reads. Every stored rate is converted the same
+way, whatever its value: a rate the old Excel import saved as 18 (and
+billing charged as 1800 %) becomes 1800, which rate_to_bp rejects, so
+billing that product fails with a 400 naming it until its rate is fixed.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 14:02:31.552170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # stored as the fraction billing charged with, 100 % being 1.0
+    op.execute("UPDATE product SET gst = gst * 100 WHERE gst IS NOT NULL")
+
+
+def downgrade():
+    op.execute("UPDATE product SET gst = gst / 100.0 WHERE gst IS NOT NULL")
@@ -0,0 +1,74 @@
+"""tenant activity and stock
+
+customer_activity and the stock ledger (stock_movement, stock_snapshot,
+stock_snapshot_runs) get a tenant_id too. Rows take their customer's or
+product's store; ledger rows of deleted products and the snapshot runs
+go to the database's one store, tenant 1 when it holds several. Their
+indexes lead on tenant_id.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 16:47:12.308915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+# (table, [(old index, columns)], [(new index, columns)])
+INDEXES = (
+    ('customer_activity',
+     [('ix_customer_activity_customer_id_created_at', ['customer_id', 'created_at'])],
+     [('ix_customer_activity_tenant_id_customer_id_created_at', ['tenant_id', 'customer_id', 'created_at'])]),
+    ('stock_movement',
+     [('ix_stock_movement_product_id_id', ['product_id', 'id'])],
+     [('ix_stock_movement_tenant_id_product_id_id', ['tenant_id', 'product_id', 'id'])]),
+    ('stock_snapshot',
+     [('ix_stock_snapshot_product_id_movement_id', ['product_id', 'movement_id'])],
+     [('ix_stock_snapshot_tenant_id_product_id_movement_id', ['tenant_id', 'product_id', 'movement_id'])]),
+    ('stock_snapshot_runs',
+     [('ix_stock_snapshot_runs_taken_at', ['taken_at'])],
+     [('ix_stock_snapshot_runs_tenant_id_taken_at', ['tenant_id', 'taken_at'])]),
+)
+
+# a store database's own tenant (TENANT_DATABASES), 1 for the main one
+DATABASE_TENANT = ('(SELECT CASE WHEN COUNT(DISTINCT tenant_id) = 1 THEN MIN(tenant_id) ELSE 1 END '
+                   'FROM product)')
+
+
+def _tenant_id(table):
+    return sa.Column('tenant_id', sa.Integer(), sa.ForeignKey('tenant.id', name=f'fk_{table}_tenant_id_tenant'),
+                     server_default='1', nullable=False)
+
+
+def upgrade():
+    for table, old, new in INDEXES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(_tenant_id(table))
+            for name, _ in old:
+                batch_op.drop_index(name)
+            for name, columns in new:
+                batch_op.create_index(name, columns, unique=False)
+
+    op.execute('UPDATE customer_activity SET tenant_id = COALESCE((SELECT customers.tenant_id FROM customers '
+               'WHERE customers.id = customer_activity.customer_id), 1)')
+    for table in ('stock_movement', 'stock_snapshot'):
+        op.execute(f'UPDATE {table} SET tenant_id = COALESCE((SELECT product.tenant_id FROM product '
+                   f'WHERE product.id = {table}.product_id), {DATABASE_TENANT})')
+    op.execute(f'UPDATE stock_snapshot_runs SET tenant_id = {DATABASE_TENANT}')
+
+
+def downgrade():
+    for table, old, new in reversed(INDEXES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name, _ in new:
+                batch_op.drop_index(name)
+            for name, columns in old:
+                batch_op.create_index(name, columns, unique=False)
+            batch_op.drop_column('tenant_id')
@@ -0,0 +1,50 @@
+"""archive bill ids
+
+archive_partitions records the lowest and highest bill id of each year,
+so a bill missing from the hot table is looked up in the partitions
+whose range holds its id (ix_archive_partitions_last_bill_id) instead of
+in every year. Existing rows get the ids of their partition's registered
+bills; a partition whose file or schema is gone keeps NULLs and is never
+searched.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 18:21:40.117305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('archive_partitions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('first_bill_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_bill_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_archive_partitions_last_bill_id', ['last_bill_id'], unique=False)
+
+    # partitions are attached (SQLite) or schemas (PostgreSQL), see archive.py
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for year, until in bind.execute(sa.text('SELECT year, until FROM archive_partitions')).all():
+        schema = f'archive_{year}'
+        if not inspector.has_table('bill', schema=schema):
+            continue
+        first, last = bind.execute(
+            sa.text(f'SELECT MIN(id), MAX(id) FROM {schema}.bill WHERE bill_date < :until'), {'until': until}
+        ).one()
+        bind.execute(sa.text('UPDATE archive_partitions SET first_bill_id = :first, last_bill_id = :last '
+                             'WHERE year = :year'), {'first': first, 'last': last, 'year': year})
+
+
+def downgrade():
+    with op.batch_alter_table('archive_partitions', schema=None) as batch_op:
+        batch_op.drop_index('ix_archive_partitions_last_bill_id')
+        batch_op.drop_column('last_bill_id')
+        batch_op.drop_column('first_bill_id')
@@ -0,0 +1,32 @@
+"""tenant id sequence
+
+0009 inserts the main store with an explicit id 1, which leaves
+PostgreSQL's tenant id sequence at its start: the first store created
+afterwards (``flask tenants create``) was given id 1 again and failed on
+the primary key. The sequence is moved past the existing ids. SQLite
+picks max(id) + 1 by itself.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 19:05:12.480316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("SELECT setval(pg_get_serial_sequence('tenant', 'id'), (SELECT MAX(id) FROM tenant))")
+
+
+def downgrade():
+    pass
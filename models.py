@@ -2,7 +2,39 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+from database import TenantSession, current_tenant
+
+db = SQLAlchemy(session_options={"class_": TenantSession})
+
+DEFAULT_TENANT_ID = 1  # the store every pre-tenant row belongs to
+
+
+def _tenant_id():
+    return current_tenant.get() or DEFAULT_TENANT_ID
+
+
+def tenant_column():
+    """tenant_id for tenant-scoped tables (see tenancy.py)."""
+    return db.Column(
+        db.Integer,
+        db.ForeignKey("tenant.id"),
+        nullable=False,
+        default=_tenant_id,
+        server_default=str(DEFAULT_TENANT_ID),
+    )
+
+
+# ==========================
+# Tenant (store / outlet)
+# ==========================
+class Tenant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Tenant {self.slug}>"
 
 
 # ==========================
@@ -13,6 +45,9 @@ class User(db.Model, UserMixin):
     name = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    # the store this user works for; their requests only see its rows
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenant.id"), nullable=False,
+                          default=DEFAULT_TENANT_ID, server_default=str(DEFAULT_TENANT_ID))
 
     def __repr__(self):
         return f"<User {self.name}>"
@@ -23,11 +58,20 @@ class User(db.Model, UserMixin):
 # ==========================
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False, default=0.0)
-    gst = db.Column(db.Float, default=0.18)
+    gst = db.Column(db.Float, default=18.0)  # percent
     stock = db.Column(db.Integer, nullable=False, default=0)
     category = db.Column(db.String(50), default="Uncategorized")
+    # low stock below this (see stock_alerts.py)
+    reorder_level = db.Column(db.Integer, nullable=False, default=5, server_default="5")
+
+    # every product query is one store's: search by name, sort by stock
+    __table_args__ = (
+        db.Index("ix_product_tenant_id_name", "tenant_id", "name"),
+        db.Index("ix_product_tenant_id_stock", "tenant_id", "stock"),
+    )
 
     def __repr__(self):
         return f"<Product {self.name}>"
@@ -38,10 +82,18 @@ class Product(db.Model):
 # ==========================
 class Bill(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
     customer_name = db.Column(db.String(100), nullable=False)
-    bill_date = db.Column(db.DateTime, default=datetime.utcnow)
+    bill_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total = db.Column(db.Float, default=0.0)
 
+    # GST in integer paise, from tax.compute_tax (NULL on pre-engine bills
+    # with no items); total == (taxable_paise + tax_paise) / 100. Bills from
+    # before migration 0003 carry the tax they were charged, which their
+    # lines' tax_paise (backfilled at current rates) need not add up to
+    taxable_paise = db.Column(db.BigInteger)
+    tax_paise = db.Column(db.BigInteger)
+
     customer_id = db.Column(
     db.Integer,
     db.ForeignKey("customers.id"),
@@ -50,6 +102,13 @@ class Bill(db.Model):
     
     customer = db.relationship("Customer", backref="bills")
 
+    # customer history: filter by customer, newest first; a store's bills
+    # by date (ix_bill_bill_date stays for the all-store batch jobs)
+    __table_args__ = (
+        db.Index("ix_bill_customer_id_bill_date", "customer_id", "bill_date"),
+        db.Index("ix_bill_tenant_id_bill_date", "tenant_id", "bill_date"),
+    )
+
     def __repr__(self):
         return f"<Bill {self.id}>"
 
@@ -59,11 +118,13 @@ class Bill(db.Model):
 # ==========================
 class BillItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
 
     bill_id = db.Column(
         db.Integer,
         db.ForeignKey("bill.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     product_id = db.Column(
@@ -73,7 +134,13 @@ class BillItem(db.Model):
     )
 
     quantity = db.Column(db.Integer, nullable=False)
-    subtotal = db.Column(db.Float, nullable=False)
+    subtotal = db.Column(db.Float, nullable=False)  # pre-tax, == taxable_paise / 100
+
+    # GST as charged, so invoices and reports never recompute it (see tax.py)
+    unit_price_paise = db.Column(db.BigInteger)
+    gst_rate_bp = db.Column(db.Integer)  # basis points, 18 % == 1800
+    taxable_paise = db.Column(db.BigInteger)
+    tax_paise = db.Column(db.BigInteger)
 
     product = db.relationship("Product")
     bill = db.relationship(
@@ -81,6 +148,11 @@ class BillItem(db.Model):
         backref=db.backref("items", lazy=True)
     )
 
+    # a store's sales per product
+    __table_args__ = (
+        db.Index("ix_bill_item_tenant_id_product_id", "tenant_id", "product_id"),
+    )
+
     def __repr__(self):
         return f"<BillItem bill={self.bill_id} product={self.product_id}>"
     
@@ -89,9 +161,10 @@ class Customer(db.Model):
     __tablename__ = "customers"
 
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
 
     name = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(20), unique=True)
+    phone = db.Column(db.String(20))  # unique per store
     email = db.Column(db.String(120))
     address = db.Column(db.Text)
 
@@ -103,6 +176,12 @@ class Customer(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "phone", name="uq_customers_tenant_id_phone"),
+        db.Index("ix_customers_tenant_id_total_spent", "tenant_id", "total_spent"),
+        db.Index("ix_customers_tenant_id_last_purchase", "tenant_id", "last_purchase"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -117,9 +196,207 @@ class Customer(db.Model):
 
 class CustomerActivity(db.Model):
     __tablename__ = "customer_activity"
+    __table_args__ = (
+        # per-customer timeline, newest first
+        db.Index("ix_customer_activity_tenant_id_customer_id_created_at", "tenant_id", "customer_id", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
     customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"))
     action = db.Column(db.String(100))
     reference_id = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ==========================
+# Customer Segmentation (RFM)
+# ==========================
+class CustomerSegment(db.Model):
+    __tablename__ = "customer_segments"
+
+    customer_id = db.Column(
+        db.Integer,
+        db.ForeignKey("customers.id"),
+        primary_key=True
+    )
+    tenant_id = tenant_column()
+
+    recency_days = db.Column(db.Integer)
+    frequency = db.Column(db.Integer, default=0)
+    monetary = db.Column(db.Float, default=0)
+
+    r_score = db.Column(db.Integer)
+    f_score = db.Column(db.Integer)
+    m_score = db.Column(db.Integer)
+
+    segment = db.Column(db.String(30))
+    cohort = db.Column(db.String(7))  # first purchase month, YYYY-MM
+
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_customer_segments_tenant_id_segment", "tenant_id", "segment"),
+        db.Index("ix_customer_segments_tenant_id_cohort", "tenant_id", "cohort"),
+    )
+
+
+class SegmentRun(db.Model):
+    __tablename__ = "segment_runs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    full = db.Column(db.Boolean, default=True)
+    customers_scored = db.Column(db.Integer, default=0)
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenant.id"))  # NULL: every store
+
+    # quantile edges from the last full run (JSON), reused by incremental runs
+    edges = db.Column(db.Text)
+
+
+# ==========================
+# Inventory ledger
+# ==========================
+class StockMovement(db.Model):
+    """Append-only stock change; Product.stock == sum(quantity) per product."""
+    __tablename__ = "stock_movement"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
+    # no foreign key: history outlives deleted products
+    product_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # see inventory.KINDS
+    quantity = db.Column(db.Integer, nullable=False)  # signed: sales are negative
+    bill_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # one product's tail after a snapshot
+    __table_args__ = (
+        db.Index("ix_stock_movement_tenant_id_product_id_id", "tenant_id", "product_id", "id"),
+    )
+
+
+class StockSnapshot(db.Model):
+    """Stock of a product after every movement up to movement_id (inclusive)."""
+    __tablename__ = "stock_snapshot"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
+    product_id = db.Column(db.Integer, nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_stock_snapshot_tenant_id_product_id_movement_id", "tenant_id", "product_id", "movement_id"),
+    )
+
+
+class StockSnapshotRun(db.Model):
+    """One take_snapshot call for one store: full runs cover every product,
+    others only the products that moved since the previous run."""
+    __tablename__ = "stock_snapshot_runs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
+    taken_at = db.Column(db.DateTime, nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    full = db.Column(db.Boolean, default=False)
+    products = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index("ix_stock_snapshot_runs_tenant_id_taken_at", "tenant_id", "taken_at"),
+    )
+
+
+# ==========================
+# Low stock set
+# ==========================
+class LowStock(db.Model):
+    """Products with stock < reorder_level, kept in step at commit time."""
+    __tablename__ = "low_stock"
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
+    name = db.Column(db.String(100), nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    reorder_level = db.Column(db.Integer, nullable=False)
+    since = db.Column(db.DateTime, default=datetime.utcnow)  # when it went low
+
+    __table_args__ = (
+        db.Index("ix_low_stock_tenant_id_stock", "tenant_id", "stock"),
+    )
+
+
+# ==========================
+# Reorder suggestions
+# ==========================
+class ReorderSuggestion(db.Model):
+    """One product's demand and reorder numbers from the last batch run
+    (see reorder.py); stock and quantities are as of that run."""
+    __tablename__ = "reorder_suggestion"
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    tenant_id = tenant_column()
+    stock = db.Column(db.Integer, nullable=False)
+    units_7d = db.Column(db.Integer, default=0)
+    units_28d = db.Column(db.Integer, default=0)
+    units_90d = db.Column(db.Integer, default=0)
+    velocity = db.Column(db.Float, default=0)  # units / day, blended
+    demand_std = db.Column(db.Float, default=0)  # daily units, last 28 days
+    days_of_cover = db.Column(db.Float)  # NULL: no recent sales
+    reorder_point = db.Column(db.Integer, nullable=False)
+    target_stock = db.Column(db.Integer, nullable=False)
+    suggested_qty = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_reorder_suggestion_tenant_id_suggested_qty", "tenant_id", "suggested_qty"),
+    )
+
+
+class ReorderRun(db.Model):
+    __tablename__ = "reorder_runs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    lead_days = db.Column(db.Integer)
+    cover_days = db.Column(db.Integer)
+    products = db.Column(db.Integer, default=0)
+    suggested = db.Column(db.Integer, default=0)
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenant.id"))  # NULL: every store
+
+
+# ==========================
+# Bill archive
+# ==========================
+class ArchivePartition(db.Model):
+    """One year of archived bills (see archive.py): rows dated before
+    ``until`` live in the year's partition, not in bill / bill_item."""
+    __tablename__ = "archive_partitions"
+
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bills = db.Column(db.Integer, default=0)
+    items = db.Column(db.Integer, default=0)
+    first_bill_date = db.Column(db.DateTime, nullable=False)
+    until = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bill ids in the partition (NULL: unknown, never searched); years can
+    # overlap, a bill backdated into an archived month keeps its later id
+    first_bill_id = db.Column(db.Integer)
+    last_bill_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index("ix_archive_partitions_last_bill_id", "last_bill_id"),
+    )
+
+
+class ArchiveDailySales(db.Model):
+    """Per-store, per-day bill count and revenue of archived bills, kept at archive time."""
+    __tablename__ = "archive_daily_sales"
+
+    tenant_id = db.Column(db.Integer, db.ForeignKey("tenant.id"), primary_key=True, autoincrement=False,
+                          default=_tenant_id)
+    day = db.Column(db.String(10), primary_key=True)  # YYYY-MM-DD, like day_bucket
+    bills = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
@@ -0,0 +1,123 @@
+# passwords.py
+"""
+Password hashing policy and bounded verification.
+
+PASSWORD_HASH_METHOD is a werkzeug method string, e.g. "scrypt:32768:8:1"
+or "pbkdf2:sha256:600000". Hashes stored with another method are upgraded
+transparently on the next successful login. Parameters the setting leaves
+out match any stored value: with "pbkdf2:sha256" a stored
+"pbkdf2:sha256:600000" hash is kept, rather than rehashed at werkzeug's
+current default iteration count.
+
+Hashing runs on a small worker pool (PASSWORD_WORKERS threads; hashlib
+releases the GIL) so a login burst can use at most that many cores. At
+most PASSWORD_MAX_PENDING verifications wait at once, and at most
+PASSWORD_PER_KEY_LIMIT per account / client IP; beyond that callers get
+LoginThrottled instead of queueing behind everyone else.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class LoginThrottled(Exception):
+    """Too many password checks in flight (globally or for this account/IP)."""
+
+
+class HashingPool:
+    def __init__(self, workers=2, max_pending=32, per_key=2):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.per_key = per_key
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = {}
+        self._executor = None
+        self._pid = None
+        self.rejected = 0
+
+    def _get_executor(self):
+        # threads don't survive fork: build the executor per process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="pwhash"
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def _acquire(self, keys):
+        with self._lock:
+            if self._pending >= self.max_pending or any(
+                self._in_flight.get(k, 0) >= self.per_key for k in keys
+            ):
+                self.rejected += 1
+                raise LoginThrottled()
+            self._pending += 1
+            for k in keys:
+                self._in_flight[k] = self._in_flight.get(k, 0) + 1
+
+    def _release(self, keys):
+        with self._lock:
+            self._pending -= 1
+            for k in keys:
+                if self._in_flight[k] <= 1:
+                    del self._in_flight[k]
+                else:
+                    self._in_flight[k] -= 1
+
+    def run(self, fn, *args, keys=()):
+        """Run ``fn(*args)`` on the pool, enforcing the limits for ``keys``."""
+        keys = tuple(k for k in keys if k)
+        self._acquire(keys)
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._release(keys)
+
+
+hashing_pool = HashingPool()
+
+
+def configure_password_hashing(app):
+    app.config.setdefault("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+    hashing_pool.workers = app.config.setdefault("PASSWORD_WORKERS", 2)
+    hashing_pool.max_pending = app.config.setdefault("PASSWORD_MAX_PENDING", 32)
+    hashing_pool.per_key = app.config.setdefault("PASSWORD_PER_KEY_LIMIT", 2)
+
+
+def _method():
+    return current_app.config.get("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+
+
+def hash_password(password, keys=()):
+    return hashing_pool.run(generate_password_hash, password, _method(), keys=keys)
+
+
+def needs_rehash(pwhash):
+    """True if ``pwhash`` was not made with PASSWORD_HASH_METHOD's parameters."""
+    wanted = _method().split(":")
+    stored = pwhash.split("$", 1)[0].split(":")
+    return stored[:len(wanted)] != wanted
+
+
+def verify_password(user, password, keys=()):
+    """Check ``password`` for ``user`` on the hashing pool.
+
+    Returns True/False, raises LoginThrottled when over the limits. On
+    success, a hash made with an outdated method is replaced in place;
+    the caller commits.
+    """
+    keys = keys or (f"user:{user.id}",)
+    if not hashing_pool.run(check_password_hash, user.password, password, keys=keys):
+        return False
+
+    if needs_rehash(user.password):
+        user.password = hash_password(password, keys=keys)
+    return True
@@ -0,0 +1,284 @@
+# profiling.py
+"""
+On-demand profiling of slow requests (PROFILING=1).
+
+A request is profiled when
+
+* it asks for it: ``X-Profile: collapsed|pstats`` header or
+  ``?_profile=collapsed|pstats`` from an admin (a user of the main store,
+  see tenancy.admin_required) or with ``Authorization: Bearer
+  <PROFILE_TOKEN>``, or
+* PROFILE_SLOW_MS > 0 and it took longer than that; every request is
+  sampled and the samples are kept only if it turned out slow.
+
+"collapsed" uses a sampling thread (sys._current_frames every
+PROFILE_INTERVAL_MS) and writes flamegraph-compatible collapsed stacks
+(``flamegraph.pl`` / speedscope); "pstats" runs cProfile on the request
+thread (exact, but several times slower) and writes a pstats dump.
+
+Files go to PROFILE_DIR (default <instance>/profiles), which is a ring
+buffer of the newest PROFILE_KEEP files. /admin/profiles lists them and
+/admin/profiles/<name> downloads one, for the same admins or token.
+"""
+import cProfile
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, jsonify, request, send_from_directory
+from flask_login import current_user
+
+from tenancy import is_admin
+
+MODES = ("collapsed", "pstats")
+EXTENSIONS = {"collapsed": ".folded", "pstats": ".pstats"}
+
+_ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+_request_profile = ContextVar("request_profile", default=None)
+
+
+# ==========================
+# Sampler
+# ==========================
+class Sampler:
+    """Samples the stacks of registered threads from one daemon thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, ident):
+        counter = Counter()
+        with self._lock:
+            self._targets[ident] = counter
+            self._ensure_running()
+        self._wakeup.set()
+        return counter
+
+    def remove(self, ident):
+        with self._lock:
+            return self._targets.pop(ident, None)
+
+    def _ensure_running(self):
+        # threads don't survive fork; restart in gunicorn workers
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                targets = list(self._targets.items())
+                if not targets:
+                    self._wakeup.clear()
+            if not targets:
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            for ident, counter in targets:
+                frame = frames.get(ident)
+                if frame is not None:
+                    counter[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(_ROOT):
+            filename = filename[len(_ROOT):]
+        stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+sampler = Sampler(0.005)
+
+
+# ==========================
+# Ring buffer
+# ==========================
+class ProfileStore:
+    """Newest ``keep`` profile files in ``directory``; older ones are deleted."""
+
+    _seq = itertools.count()
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path_for(self, endpoint, elapsed, mode):
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        endpoint = re.sub(r"[^\w.]", "_", endpoint)
+        name = f"{stamp}-{os.getpid()}-{next(self._seq)}-{endpoint}-{int(elapsed * 1000)}ms{EXTENSIONS[mode]}"
+        return os.path.join(self.directory, name)
+
+    def write_collapsed(self, path, counter):
+        with open(path + ".tmp", "w", encoding="utf-8") as fh:
+            for stack, count in counter.most_common():
+                fh.write(f"{stack} {count}\n")
+        os.replace(path + ".tmp", path)
+        self.prune()
+
+    def write_pstats(self, path, profiler):
+        profiler.dump_stats(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.prune()
+
+    def list(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(tuple(EXTENSIONS.values())):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:  # pruned by another worker
+                continue
+            entries.append({
+                "name": name,
+                "bytes": st.st_size,
+                "created": datetime.utcfromtimestamp(st.st_mtime).isoformat(),
+            })
+        entries.sort(key=lambda e: e["created"], reverse=True)
+        return entries
+
+    def prune(self):
+        with self._lock:
+            for entry in self.list()[self.keep:]:
+                try:
+                    os.remove(os.path.join(self.directory, entry["name"]))
+                except FileNotFoundError:
+                    pass
+
+
+# ==========================
+# Hooks
+# ==========================
+def _allowed():
+    """Profiles expose code paths and queries: admins and PROFILE_TOKEN only."""
+    token = current_app.config.get("PROFILE_TOKEN")
+    if token and request.headers.get("Authorization") == f"Bearer {token}":
+        return True
+    return is_admin()
+
+
+def _requested_mode():
+    mode = request.headers.get("X-Profile") or request.args.get("_profile")
+    if not mode:
+        return None
+    mode = mode.lower()
+    if mode in ("1", "true", "yes"):
+        mode = "collapsed"
+    if mode not in MODES or not _allowed():
+        return None
+    return mode
+
+
+def _start_profile():
+    mode = _requested_mode()
+    if mode is None and not current_app.config.get("PROFILE_SLOW_MS"):
+        return
+
+    if mode == "pstats":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = sampler.add(threading.get_ident())
+    _request_profile.set((mode, time.perf_counter(), profiler))
+
+
+def _stop_profile():
+    state = _request_profile.get()
+    if state is None:
+        return None
+    _request_profile.set(None)
+    mode, start, profiler = state
+    if mode == "pstats":
+        profiler.disable()
+    else:
+        sampler.remove(threading.get_ident())
+    return mode, time.perf_counter() - start, profiler
+
+
+def _finish_profile(response):
+    stopped = _stop_profile()
+    if stopped is None:
+        return response
+    mode, elapsed, profiler = stopped
+
+    if mode is None:  # threshold sampling
+        if elapsed * 1000 < current_app.config["PROFILE_SLOW_MS"] or not profiler:
+            return response
+        mode = "collapsed"
+
+    store = current_app.extensions["profile_store"]
+    path = store.path_for(request.endpoint or "unmatched", elapsed, mode)
+    try:
+        if mode == "pstats":
+            store.write_pstats(path, profiler)
+        else:
+            store.write_collapsed(path, profiler)
+    except OSError:
+        current_app.logger.exception("could not write profile %s", path)
+        return response
+
+    response.headers["X-Profile-Id"] = os.path.basename(path)
+    return response
+
+
+def _admin_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _allowed():
+            if not current_user.is_authenticated:
+                return current_app.login_manager.unauthorized()
+            return jsonify({"error": "only the main store's users can do this"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@_admin_only
+def list_profiles():
+    return jsonify(current_app.extensions["profile_store"].list())
+
+
+@_admin_only
+def download_profile(name):
+    store = current_app.extensions["profile_store"]
+    return send_from_directory(store.directory, name, as_attachment=True)
+
+
+def init_profiling(app):
+    """Wire profiling hooks and admin routes into ``app`` when PROFILING is on."""
+    if not app.config.get("PROFILING"):
+        return
+
+    directory = app.config.get("PROFILE_DIR") or os.path.join(app.instance_path, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    app.extensions["profile_store"] = ProfileStore(directory, app.config["PROFILE_KEEP"])
+    sampler.interval = app.config["PROFILE_INTERVAL_MS"] / 1000
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    # after_request is skipped on unhandled errors; stop the profiler anyway
+    app.teardown_request(lambda exc: _stop_profile())
+    app.add_url_rule("/admin/profiles", "list_profiles", list_profiles)
+    app.add_url_rule("/admin/profiles/<path:name>", "download_profile", download_profile)
@@ -0,0 +1,315 @@
+# render_cache.py
+"""
+Rendered bill pages and compiled templates.
+
+Bill pages (RENDER_CACHE=1, the default): a posted bill does not change,
+so /billing/view and /billing/print render it once and serve the stored
+HTML afterwards, with no query and no Jinja. Pages are keyed by store
+(tenancy.py), bill id, template and the template's version (a hash of its
+source, so an edited or deployed template renders afresh) and by the
+product-name revision: pages show product names, and renaming a product
+bumps a counter shared by the workers (a RevisionStore, http_cache.py)
+so older pages are rendered again on their next view. A bill without
+items is still being posted (create_bill commits the bill first) and is
+not kept.
+
+Each worker keeps the most recently viewed pages up to RENDER_CACHE_MB
+in memory; pages pushed out spill to RENDER_CACHE_DIR (default
+<instance>/render-cache), which every worker on the host reads and which
+is trimmed, least recently used first, to RENDER_CACHE_DISK_MB (0: no
+spill). Counts are on /admin/render-cache and, with INSTRUMENTATION on,
+in /metrics.
+
+Templates: with JINJA_BYTECODE_CACHE=1 (the default) compiled templates
+are kept in JINJA_BYTECODE_CACHE_DIR (default <instance>/jinja-bytecode),
+so a new worker loads them instead of compiling each one again. Jinja
+checks the source's checksum, so an edited template is recompiled.
+"""
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, jsonify, render_template
+from flask_login import current_user, login_required
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event, inspect
+
+from database import current_tenant
+from http_cache import RevisionStore
+from instrumentation import metrics
+from models import Product
+
+log = logging.getLogger(__name__)
+
+NAMES = "product.name"  # revision key; per store as "product.name@<tenant>"
+TRIM_TO = 0.9  # the disk is trimmed to this share of its cap
+
+
+class RenderCache:
+    """Pages in memory up to ``max_bytes``, the least recently used spilled
+    to ``directory`` (shared with the other workers) up to ``disk_bytes``."""
+
+    def __init__(self, max_bytes, directory, disk_bytes):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.names = RevisionStore(os.path.join(directory, "names.rev"))
+        self._versions = {}
+        self._disk_used = self._scan_disk()[1]
+        self._reset()
+
+    def _reset(self):
+        # also the fork handler: each worker fills its own memory
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self.counts = {"memory": 0, "disk": 0, "rendered": 0, "spilled": 0}
+
+    # ---- keys ----
+    def version(self, template_name):
+        """Hash of the template's source, recomputed when Jinja reloads it."""
+        env = current_app.jinja_env
+        template = env.get_template(template_name)
+        known = self._versions.get(template_name)
+        if known is None or known[0] is not template:
+            source = env.loader.get_source(env, template_name)[0]
+            known = (template, format(zlib.crc32(source.encode()), "08x"))
+            self._versions[template_name] = known
+        return known[1]
+
+    def key(self, template_name, bill_id):
+        tenant = current_tenant.get()
+        names = self.names.get(NAMES)[0]
+        if tenant is not None:
+            names = f"{names}.{self.names.get(_names_key(tenant))[0]}"
+        stem = os.path.splitext(os.path.basename(template_name))[0]
+        return f"{stem}-{tenant or 0}-{bill_id}-{self.version(template_name)}-{names}"
+
+    # ---- memory, then disk ----
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.counts["memory"] += 1
+                return page
+        page = self._read(key)
+        if page is not None:
+            self._remember(key, page, "disk")
+        return page
+
+    def put(self, key, page):
+        self._remember(key, page, "rendered")
+
+    def _remember(self, key, page, source):
+        with self._lock:
+            self.counts[source] += 1
+        if len(page) > self.max_bytes:
+            self._spill([(key, page)])
+            return
+        evicted = []
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._pages[key] = page
+            self._bytes += len(page)
+            while self._bytes > self.max_bytes:
+                evicted.append(self._pages.popitem(last=False))
+                self._bytes -= len(evicted[-1][1])
+        self._spill(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".html")
+
+    def _read(self, key):
+        if not self.disk_bytes:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                page = f.read()
+            os.utime(path)  # recently used: trimmed last
+        except OSError:
+            return None
+        return page
+
+    def _spill(self, pages):
+        if not self.disk_bytes or not pages:
+            return
+        for key, page in pages:
+            path = self._path(key)
+            if os.path.exists(path):
+                continue
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(page)
+                os.replace(tmp, path)  # readers never see half a page
+            except OSError:
+                log.warning("could not spill %s to %s", key, self.directory, exc_info=True)
+                continue
+            with self._lock:
+                self.counts["spilled"] += 1
+                self._disk_used += len(page)
+        if self._disk_used > self.disk_bytes:
+            self._trim()
+
+    def _scan_disk(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".html"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # trimmed by another worker
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files, sum(size for _, size, _ in files)
+
+    def _trim(self):
+        # the other workers spill here too: size it up from the files themselves
+        files, used = self._scan_disk()
+        for _, size, path in sorted(files):
+            if used <= self.disk_bytes * TRIM_TO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            used -= size
+        self._disk_used = used
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pages": len(self._pages),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_used,
+                "max_disk_bytes": self.disk_bytes,
+                **self.counts,
+            }
+
+
+def render_bill_page(template_name, bill_id, load):
+    """HTML of bill ``bill_id`` rendered with ``template_name``; ``load(bill_id)``
+    gives (bill, items) when the page is not cached."""
+    cache = current_app.extensions.get("render_cache")
+    if cache is None:
+        bill, items = load(bill_id)
+        return render_template(template_name, bill=bill, items=items, user=current_user)
+    key = cache.key(template_name, bill_id)
+    page = cache.get(key)
+    if page is None:
+        bill, items = load(bill_id)
+        page = render_template(template_name, bill=bill, items=items, user=current_user).encode()
+        if items:
+            cache.put(key, page)
+    return page
+
+
+# ==========================
+# Product renames
+# ==========================
+_RENAMED = "_render_cache_renamed"
+
+
+def _names_key(tenant):
+    return NAMES if tenant is None else f"{NAMES}@{tenant}"
+
+
+def _after_flush(session, flush_context):
+    tenant = current_tenant.get()
+    for obj in session.dirty:
+        if isinstance(obj, Product) and inspect(obj).attrs.name.history.has_changes():
+            session.info.setdefault(_RENAMED, set()).add(_names_key(obj.__dict__.get("tenant_id") or tenant))
+
+
+def _do_orm_execute(state):
+    # bulk UPDATE product ...: may rename, so count it as one
+    if state.is_update and getattr(state.statement, "table", None) is Product.__table__:
+        state.session.info.setdefault(_RENAMED, set()).add(_names_key(current_tenant.get()))
+
+
+def _after_commit(session):
+    renamed = session.info.pop(_RENAMED, None)
+    if renamed and has_app_context():
+        cache = current_app.extensions.get("render_cache")
+        if cache is not None:
+            cache.names.bump(renamed)
+
+
+def _after_rollback(session):
+    session.info.pop(_RENAMED, None)
+
+
+# ==========================
+# Stats
+# ==========================
+@login_required
+def render_cache_stats():
+    cache = current_app.extensions.get("render_cache")
+    return jsonify(cache.stats() if cache is not None else {"enabled": False})
+
+
+# the process's cache for /metrics (the last app created, i.e. the only one outside benchmarks)
+_cache = None
+
+
+def _render_prometheus():
+    if _cache is None:
+        return []
+    stats = _cache.stats()
+    lines = ["# HELP smartbill_render_cache_pages_total Bill pages served, by where they came from.",
+             "# TYPE smartbill_render_cache_pages_total counter"]
+    for source in ("memory", "disk", "rendered"):
+        lines.append(f'smartbill_render_cache_pages_total{{source="{source}"}} {stats[source]}')
+    lines += ["# TYPE smartbill_render_cache_bytes gauge",
+              f'smartbill_render_cache_bytes{{tier="memory"}} {stats["bytes"]}',
+              f'smartbill_render_cache_bytes{{tier="disk"}} {stats["disk_bytes"]}']
+    return lines
+
+
+metrics.collectors.append(_render_prometheus)
+
+
+# ==========================
+# Setup
+# ==========================
+_events_installed = False
+
+
+def init_render_cache(app, db):
+    """Share compiled templates between workers (JINJA_BYTECODE_CACHE) and
+    cache rendered bill pages (RENDER_CACHE)."""
+    global _cache, _events_installed
+
+    if app.config.get("JINJA_BYTECODE_CACHE"):
+        directory = app.config.get("JINJA_BYTECODE_CACHE_DIR") or os.path.join(app.instance_path, "jinja-bytecode")
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    if not app.config.get("RENDER_CACHE"):
+        return
+    directory = app.config.get("RENDER_CACHE_DIR") or os.path.join(app.instance_path, "render-cache")
+    os.makedirs(directory, exist_ok=True)
+    _cache = RenderCache(
+        int(app.config["RENDER_CACHE_MB"] * 2**20),
+        directory,
+        int(app.config["RENDER_CACHE_DISK_MB"] * 2**20),
+    )
+    app.extensions["render_cache"] = _cache
+
+    if not _events_installed:
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "do_orm_execute", _do_orm_execute)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_rollback", _after_rollback)
+        _events_installed = True
+
+    app.add_url_rule("/admin/render-cache", "render_cache_stats", render_cache_stats)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_cache._reset)
@@ -0,0 +1,242 @@
+# reorder.py
+"""
+Demand-driven reorder suggestions, computed in batch.
+
+``compute_reorder_suggestions`` (nightly: ``flask reorder-suggestions``
+from cron, or the admin endpoint) pulls the units sold per product per
+day over the last HISTORY_DAYS in one GROUP BY, lays them out as a
+products x days NumPy matrix and scores every SKU in one vectorized
+pass. The results replace the reorder_suggestion table.
+
+Velocity blends the 7 / 28 / 90-day average daily units, so a recent
+surge counts without one odd week taking over. A product is due when
+its stock will not outlast the supplier lead time plus safety stock for
+the demand's day-to-day variation:
+
+    reorder_point = velocity * lead_days + SERVICE_Z * std * sqrt(lead_days)
+
+and the suggestion tops it up to ``lead_days + cover_days`` of demand
+plus the safety stock, never below its reorder_level. Products already
+below their reorder level are always due, sales or not.
+
+Run from a request it covers the current store's products only and
+replaces just their rows (see tenancy.py).
+"""
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from sqlalchemy import func
+
+from archive import bill_partitions
+from database import day_bucket
+from models import db, Product, ReorderRun, ReorderSuggestion
+from tenancy import current_tenant, tenant_criteria, tenant_runs
+
+WINDOWS = (7, 28, 90)
+VELOCITY_WEIGHTS = (0.2, 0.5, 0.3)
+HISTORY_DAYS = max(WINDOWS)
+STD_DAYS = 28
+SERVICE_Z = 1.65  # safety stock for ~95 % of lead-time demand
+
+LEAD_DAYS = 7
+COVER_DAYS = 30
+
+WRITE_CHUNK = 5000
+
+
+# ==========================
+# Loading
+# ==========================
+def load_daily_units(product_ids, since, days=HISTORY_DAYS):
+    """Units sold as a ``len(product_ids) x days`` matrix, column 0 = ``since``.
+
+    ``product_ids`` must be sorted; sales of products not in it (deleted
+    since) are dropped.
+    """
+    until = since + timedelta(days=days)
+    rows = []
+    # normally just the hot tables; archived years only if the history reaches them
+    for bills, items in bill_partitions(since, until):
+        day = day_bucket(bills.bill_date).label("day")
+        rows += (
+            db.session.query(items.product_id, day, func.sum(items.quantity))
+            .join(bills, bills.id == items.bill_id)
+            .filter(
+                bills.bill_date >= since,
+                bills.bill_date < until,
+                items.product_id.isnot(None),
+            )
+            .group_by(items.product_id, day)
+            .all()
+        )
+
+    units = np.zeros((len(product_ids), days))
+    if not rows or not len(product_ids):
+        return units
+    pid, day, quantity = zip(*rows)
+    pid = np.array(pid, dtype=np.int64)
+    row = np.minimum(np.searchsorted(product_ids, pid), len(product_ids) - 1)
+    col = (np.array(day, dtype="datetime64[D]") - np.datetime64(since.date(), "D")).astype(np.int64)
+    known = product_ids[row] == pid
+    # a (product, day) can come from two partitions, so accumulate
+    np.add.at(units, (row[known], col[known]), np.array(quantity, dtype=np.float64)[known])
+    return units
+
+
+# ==========================
+# Scoring
+# ==========================
+def suggest(stock, reorder_level, units, lead_days=LEAD_DAYS, cover_days=COVER_DAYS):
+    """Reorder numbers for every product (row of ``units``) at once."""
+    sums = {w: units[:, -w:].sum(axis=1) for w in WINDOWS}
+    velocity = sum(weight * sums[w] / w for w, weight in zip(WINDOWS, VELOCITY_WEIGHTS))
+    std = units[:, -STD_DAYS:].std(axis=1)
+    safety = SERVICE_Z * std * np.sqrt(lead_days)
+
+    reorder_point = np.ceil(velocity * lead_days + safety).astype(np.int64)
+    target = np.maximum(
+        np.ceil(velocity * (lead_days + cover_days) + safety).astype(np.int64), reorder_level
+    )
+    selling = velocity > 0
+    cover = np.full(len(stock), np.nan)
+    np.divide(stock, velocity, out=cover, where=selling)
+
+    due = (selling & (stock <= reorder_point)) | (stock < reorder_level)
+    return {
+        "units": sums,
+        "velocity": velocity,
+        "demand_std": std,
+        "days_of_cover": cover,
+        "reorder_point": reorder_point,
+        "target_stock": target,
+        "suggested_qty": np.where(due, np.maximum(target - stock, 0), 0),
+    }
+
+
+# ==========================
+# Runs
+# ==========================
+def _write(ids, tenants, stock, scores, computed_at):
+    cover = scores["days_of_cover"]
+    records = [
+        {
+            "product_id": pid,
+            "tenant_id": tenant,
+            "stock": s,
+            "units_7d": u7,
+            "units_28d": u28,
+            "units_90d": u90,
+            "velocity": v,
+            "demand_std": sd,
+            "days_of_cover": c,
+            "reorder_point": rp,
+            "target_stock": t,
+            "suggested_qty": q,
+            "computed_at": computed_at,
+        }
+        for pid, tenant, s, u7, u28, u90, v, sd, c, rp, t, q in zip(
+            ids.tolist(),
+            tenants.tolist(),
+            stock.tolist(),
+            scores["units"][7].astype(np.int64).tolist(),
+            scores["units"][28].astype(np.int64).tolist(),
+            scores["units"][90].astype(np.int64).tolist(),
+            scores["velocity"].round(4).tolist(),
+            scores["demand_std"].round(4).tolist(),
+            # NaN (no sales) -> NULL
+            np.where(np.isnan(cover), None, cover.round(2)).tolist(),
+            scores["reorder_point"].tolist(),
+            scores["target_stock"].tolist(),
+            scores["suggested_qty"].tolist(),
+        )
+    ]
+
+    table = ReorderSuggestion.__table__
+    db.session.execute(table.delete().where(*tenant_criteria(table.c.tenant_id)))
+    for i in range(0, len(records), WRITE_CHUNK):
+        db.session.execute(table.insert(), records[i:i + WRITE_CHUNK])
+
+
+def compute_reorder_suggestions(lead_days=LEAD_DAYS, cover_days=COVER_DAYS, now=None):
+    """Recompute every product's suggestion from the sales history.
+
+    Only whole days count: the history ends at midnight before ``now``,
+    so a run at 02:00 sees the same days as one at 23:00.
+    """
+    now = now or datetime.utcnow()
+    until = datetime.combine(now.date(), time.min)
+    since = until - timedelta(days=HISTORY_DAYS)
+
+    products = (
+        db.session.query(Product.id, Product.tenant_id, Product.stock, Product.reorder_level)
+        .order_by(Product.id)
+        .all()
+    )
+    if products:
+        ids, tenants, stock, level = (np.array(column, dtype=np.int64) for column in zip(*products))
+    else:
+        ids = tenants = stock = level = np.zeros(0, dtype=np.int64)
+
+    units = load_daily_units(ids, since)
+    scores = suggest(stock, level, units, lead_days, cover_days)
+    _write(ids, tenants, stock, scores, now)
+
+    suggested = int(np.count_nonzero(scores["suggested_qty"]))
+    db.session.add(ReorderRun(
+        started_at=now,
+        tenant_id=current_tenant.get(),
+        lead_days=lead_days,
+        cover_days=cover_days,
+        products=len(ids),
+        suggested=suggested,
+    ))
+    db.session.commit()
+    return {"products": len(ids), "suggested": suggested}
+
+
+# ==========================
+# Reads
+# ==========================
+def reorder_suggestions(limit=None):
+    """What to order now, most urgent (fewest days of cover) first.
+
+    The last run decides which products are candidates; their quantity and
+    cover are re-evaluated against live stock, so products restocked since
+    drop out. Products that turned low since the run are in low_stock
+    (stock_alerts.py) until the next run picks them up.
+    """
+    rows = (
+        db.session.query(
+            ReorderSuggestion.product_id.label("id"),
+            Product.name,
+            Product.stock,
+            Product.reorder_level,
+            ReorderSuggestion.velocity,
+            ReorderSuggestion.reorder_point,
+            ReorderSuggestion.target_stock,
+        )
+        .join(Product, Product.id == ReorderSuggestion.product_id)
+        .filter(ReorderSuggestion.suggested_qty > 0)
+        .all()
+    )
+
+    items = []
+    for r in rows:
+        selling = r.velocity > 0
+        if not ((selling and r.stock <= r.reorder_point) or r.stock < r.reorder_level):
+            continue
+        items.append({
+            "id": r.id,
+            "name": r.name,
+            "stock": r.stock,
+            "velocity": round(r.velocity, 2),
+            "days_of_cover": round(r.stock / r.velocity, 1) if selling else None,
+            "reorder_point": r.reorder_point,
+            "suggested_qty": max(r.target_stock - r.stock, 0),
+        })
+    items.sort(key=lambda i: (i["days_of_cover"] is None, i["days_of_cover"] or 0, -i["velocity"], i["id"]))
+    return items[:limit] if limit else items
+
+
+def last_run():
+    return tenant_runs(ReorderRun).order_by(ReorderRun.id.desc()).first()
@@ -4,7 +4,11 @@ from flask_login import login_required
 from textblob import TextBlob
 from sklearn.linear_model import LinearRegression
 from sqlalchemy import func
-from models import db, Product, Bill, BillItem
+from models import db, Product, Bill
+from stock_alerts import low_stock_query
+from reorder import reorder_suggestions
+from archive import archived_totals, bill_sources
+from analytics import sales_cube
 import numpy as np
 import pandas as pd
 import random
@@ -87,30 +91,49 @@ def ai_chat():
     user_msg = request.json.get("message", "").lower()
 
     # ---- BASIC METRICS ----
-    total_sales = float(db.session.query(func.sum(Bill.total)).scalar() or 0)
-    total_bills = int(db.session.query(func.count(Bill.id)).scalar() or 0)
+    cube = sales_cube()
+    totals = cube.totals() if cube else None
+    if totals:
+        total_bills, total_sales = totals
+    else:
+        archived_bills, archived_sales = archived_totals()
+        total_sales = float(db.session.query(func.sum(Bill.total)).scalar() or 0) + archived_sales
+        total_bills = int(db.session.query(func.count(Bill.id)).scalar() or 0) + archived_bills
     avg_bill = (total_sales / total_bills) if total_bills else 0
 
     # ---- TODAY SALES ----
-    today = datetime.date.today()
-    today_sales = float(
-        db.session.query(func.sum(Bill.total))
-        .filter(func.date(Bill.bill_date) == today)
-        .scalar() or 0
-    )
+    today = cube.day_totals(datetime.date.today()) if cube else None
+    if today:
+        today_sales = today[1]
+    else:
+        # range filter: portable across backends and uses ix_bill_bill_date
+        today_start = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+        today_sales = float(
+            db.session.query(func.sum(Bill.total))
+            .filter(
+                Bill.bill_date >= today_start,
+                Bill.bill_date < today_start + datetime.timedelta(days=1),
+            )
+            .scalar() or 0
+        )
 
     # ---- TOP PRODUCT ----
-    top_product = db.session.query(
-        Product.name,
-        func.sum(BillItem.quantity).label("qty")
-    ).join(BillItem, BillItem.product_id == Product.id) \
-     .group_by(Product.id) \
-     .order_by(func.sum(BillItem.quantity).desc()) \
-     .first()
+    top_products = cube.top_products(1) if cube else None
+    if top_products is not None:
+        top_product = top_products[0] if top_products else None
+    else:
+        _, items = bill_sources()
+        sold = db.session.query(
+            items.product_id,
+            func.sum(items.quantity).label("sold")
+        ).group_by(items.product_id).subquery()
+        top_product = db.session.query(Product.name, sold.c.sold) \
+            .join(sold, sold.c.product_id == Product.id) \
+            .order_by(sold.c.sold.desc()) \
+            .first()
 
     # ---- LOW STOCK ----
-    low_stock_products = db.session.query(Product.name, Product.stock) \
-        .filter(Product.stock <= 5).all()
+    low_stock_products = low_stock_query().all()
 
     # ==========================
     # 🎯 INTENT HANDLING
@@ -133,16 +156,27 @@ def ai_chat():
     if "top" in user_msg or "best" in user_msg:
         if top_product:
             return jsonify({
-                "response": f"Your top-selling product is '{top_product.name}' with {top_product.qty} units sold."
+                "response": f"Your top-selling product is '{top_product.name}' with {top_product.sold} units sold."
             })
         return jsonify({"response": "Top product data is not available yet."})
 
-    if "low stock" in user_msg or "out of stock" in user_msg:
-        if not low_stock_products:
+    if "low stock" in user_msg or "out of stock" in user_msg or "reorder" in user_msg:
+        reorders = reorder_suggestions(limit=5)
+        if not low_stock_products and not reorders:
             return jsonify({"response": "All products have sufficient stock."})
-        names = ", ".join(f"{p.name} ({p.stock})" for p in low_stock_products)
+        parts = []
+        if low_stock_products:
+            names = ", ".join(f"{p.name} ({p.stock})" for p in low_stock_products)
+            parts.append(f"Low stock items: {names}.")
+        if reorders:
+            orders = ", ".join(
+                f"{r['name']}: order {r['suggested_qty']}"
+                + (f" ({r['days_of_cover']} days left)" if r["days_of_cover"] is not None else "")
+                for r in reorders
+            )
+            parts.append(f"Suggested reorders: {orders}.")
         return jsonify({
-            "response": f"Low stock items: {names}."
+            "response": " ".join(parts)
         })
 
     if "predict" in user_msg or "future" in user_msg:
@@ -155,7 +189,7 @@ def ai_chat():
         return jsonify({
             "response": (
                 "I can help with sales summary, top products, low stock alerts, "
-                "average bills, trends, and future predictions."
+                "reorder suggestions, average bills, trends, and future predictions."
             )
         })
 
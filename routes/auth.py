@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 import re
 
 from models import db, User
+from passwords import hash_password, verify_password, LoginThrottled
+from user_cache import remember_identity, forget_identity, invalidate_user
 
 bp = Blueprint("auth", __name__)
 
@@ -37,9 +38,27 @@ def login_page():
 
         user = User.query.filter_by(email=email).first()
 
-        # ---- Authentication ----
-        if user and check_password_hash(user.password, password):
+        # ---- Authentication (bounded hashing pool, see passwords.py) ----
+        try:
+            authenticated = user is not None and verify_password(
+                user, password, keys=(f"user:{email.lower()}", f"ip:{request.remote_addr}")
+            )
+        except LoginThrottled:
+            return _auth_error(
+                "Too many login attempts right now. Please try again in a moment.",
+                is_ajax,
+                redirect_to="auth.login_page",
+                status=429,
+            )
+
+        if authenticated:
+            # hash upgraded to the current policy during verification
+            if db.session.is_modified(user):
+                db.session.commit()
+                invalidate_user(user)
+
             login_user(user)
+            remember_identity(user)
 
             if is_ajax:
                 return jsonify(
@@ -99,7 +118,7 @@ def register_page():
             return redirect(url_for("auth.login_page"))
 
         # ---- Create User ----
-        hashed_pw = generate_password_hash(password, method="pbkdf2:sha256")
+        hashed_pw = hash_password(password)
         new_user = User(name=name, email=email, password=hashed_pw)
 
         db.session.add(new_user)
@@ -118,6 +137,7 @@ def register_page():
 @login_required
 def logout():
     logout_user()
+    forget_identity()
     flash("You have been logged out.", "info")
     return redirect(url_for("auth.login_page"))
 
@@ -1,9 +1,16 @@
 # routes/billing.py
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, send_file, abort
 from flask_login import login_required, current_user
 from models import db, Product, Bill, BillItem, Customer
+from routes.crm import invalidate_crm_summary
+from activity import log_activity
+from http_cache import conditional
+from inventory import record_movements
+from stock_alerts import low_stock_query
+from archive import find_archived_bill
+from render_cache import render_bill_page
+from tax import compute_tax, rate_to_bp, slab_summary, to_paise, DEFAULT_RATE_BP
 from datetime import datetime
-from sqlalchemy import func
 from io import BytesIO
 
 # optional: reportlab for PDF
@@ -17,12 +24,12 @@ except Exception:
 
 bp = Blueprint("billing", __name__, url_prefix="/billing")
 
-DEFAULT_GST = 0.18 
+DEFAULT_GST = DEFAULT_RATE_BP / 100  # percent, like Product.gst
 
 # ---------------------------------------------------
 # CRM HELPER (Billing → CRM integration)
 # ---------------------------------------------------
-def update_customer_after_bill(customer_id, bill_total):
+def update_customer_after_bill(customer_id, bill_total, bill_id=None):
     if not customer_id:
         return
 
@@ -35,6 +42,8 @@ def update_customer_after_bill(customer_id, bill_total):
     customer.last_purchase = datetime.utcnow()
 
     db.session.commit()
+    invalidate_crm_summary()
+    log_activity(customer.id, "bill_created", bill_id)
 
 # ---------------- Billing page (render) ----------------
 @bp.route("/", methods=["GET"])
@@ -82,8 +91,7 @@ def create_bill():
     if not isinstance(items, list) or len(items) == 0:
         return jsonify({"error": "No items provided"}), 400
 
-    # validate & compute subtotal (use DB price & gst)
-    subtotal = 0.0
+    # validate (use DB price & gst)
     validated = []
     for it in items:
         try:
@@ -98,86 +106,124 @@ def create_bill():
             return jsonify({"error": f"Product not found: {pid}"}), 404
         if product.stock < qty:
             return jsonify({"error": f"Insufficient stock for {product.name} (available {product.stock})"}), 400
+        validated.append((product, qty))
 
-        # product-level GST if present, else default (we will compute gst on whole subtotal)
-        line = float(product.price) * qty
-        subtotal += line
-        validated.append((product, qty, line))
-
-    # compute GST overall as weighted average if product gst present
-    # Approach: compute gst per item if product.gst exists, else use DEFAULT_GST.
-    gst_amount = 0.0
-    for product, qty, line in validated:
-        prod_gst = getattr(product, "gst", None)
-        rate = float(prod_gst) if prod_gst is not None else DEFAULT_GST
-        gst_amount += line * rate
-
-    # round
-    gst_amount = round(gst_amount, 2)
-    total = round(subtotal + gst_amount, 2)
+    # GST per line in integer paise (product rate, else DEFAULT_GST)
+    prices = to_paise([float(product.price) for product, _ in validated])
+    rates = []
+    for product, _ in validated:
+        try:
+            rates.append(rate_to_bp(product.gst))
+        except ValueError as e:
+            return jsonify({"error": f"{product.name}: {e}"}), 400
+    taxed = compute_tax(prices, [qty for _, qty in validated], rates)
+    subtotal = int(taxed["bill_taxable"][0]) / 100
+    gst_amount = int(taxed["bill_tax"][0]) / 100
+    total = int(taxed["bill_total"][0]) / 100
 
     # create bill
     bill = Bill(customer_name=data.get("customer_name", "Walk-in Customer"), customer_id=customer_id,
                 bill_date=datetime.utcnow(),
-                total=total)
+                total=total,
+                taxable_paise=int(taxed["bill_taxable"][0]),
+                tax_paise=int(taxed["bill_tax"][0]))
     db.session.add(bill)
     db.session.commit() # get id
 
     # create bill items and update stock
-    for product, qty, line in validated:
+    lines = zip(validated, prices.tolist(), rates, taxed["taxable"].tolist(), taxed["tax"].tolist())
+    for (product, qty), price, rate, taxable, tax in lines:
         bi = BillItem(bill_id=bill.id,
                       product_id=product.id,
                       quantity=qty,
-                      subtotal=line)
+                      subtotal=taxable / 100,
+                      unit_price_paise=price,
+                      gst_rate_bp=rate,
+                      taxable_paise=taxable,
+                      tax_paise=tax)
         product.stock -= qty
         db.session.add(bi)
+    record_movements([(product.id, -qty) for product, qty in validated], "sale", bill_id=bill.id)
     db.session.commit()
 
      # 🔥 CRM UPDATE
-    update_customer_after_bill(customer_id, total)
+    update_customer_after_bill(customer_id, total, bill.id)
 
     return jsonify({
         "message": "Bill created",
         "bill_id": bill.id,
-        "subtotal": round(subtotal, 2),
+        "subtotal": subtotal,
         "gst": gst_amount,
+        "gst_breakdown": slab_summary(taxed),
         "total": total
     }), 201
 
 
+def _bill_with_items(bill_id):
+    """(bill, items) from the hot tables, else from the archive; 404 if neither."""
+    bill = db.session.get(Bill, bill_id)
+    if bill is not None:
+        return bill, BillItem.query.filter_by(bill_id=bill.id).all()
+    bill, items = find_archived_bill(bill_id)
+    if bill is None:
+        abort(404)
+    return bill, items
+
+
 # ---------------- View bill (HTML printable) ----------------
 @bp.route("/view/<int:bill_id>", methods=["GET"])
 @login_required
 def view_bill(bill_id):
-    bill = Bill.query.get_or_404(bill_id)
-    items = BillItem.query.filter_by(bill_id=bill.id).all()
-    # ensure product relationships accessible in template
-    return render_template("view_bill.html", bill=bill, items=items, user=current_user)
+    # posted bills don't change: rendered once, then served from render_cache
+    return render_bill_page("view_bill.html", bill_id, _bill_with_items)
 
 
 # ---------------- Billing data (products + recent + low-stock) ----------------
 @bp.route("/data", methods=["GET"])
 @login_required
+@conditional("product", "bill")
 def billing_data():
-    products = Product.query.order_by(Product.name).all()
-    product_list = [{"id": p.id, "name": p.name, "price": float(p.price), "stock": int(p.stock)} for p in products]
+    product_list = (
+        db.session.query(Product.id, Product.name, Product.price, Product.stock)
+        .order_by(Product.name)
+        .all()
+    )
     bills = Bill.query.order_by(Bill.bill_date.desc()).limit(10).all()
     recent = [{"id": b.id, "customer_name": b.customer_name, "date": b.bill_date.strftime("%Y-%m-%d %H:%M"), "total": float(b.total)} for b in bills]
     # low stock
-    low = Product.query.filter(Product.stock < 5).order_by(Product.stock.asc()).all()
-    low_stock = [{"id": p.id, "name": p.name, "stock": int(p.stock)} for p in low]
+    low_stock = low_stock_query().all()
     return jsonify({"products": product_list, "recent_bills": recent, "low_stock": low_stock})
 
 
 # ---------------- Invoice PDF (server) ----------------
+def _invoice_amounts(bill, items, subtotal):
+    """(subtotal, gst, total, [(rate_bp, tax_paise)]) printed on the invoice.
+
+    The total is always what the bill was charged. Slabs are listed only
+    when the lines' stored tax adds up to the bill's (not on bills whose
+    line tax was backfilled at later rates, see migration 0003).
+    """
+    total_amount = round(bill.total, 2) if bill.total else None
+    if bill.tax_paise is not None:
+        by_rate = {}
+        for it in items:
+            by_rate[it.gst_rate_bp] = by_rate.get(it.gst_rate_bp, 0) + (it.tax_paise or 0)
+        slabs = sorted(by_rate.items()) if sum(by_rate.values()) == bill.tax_paise else []
+        subtotal = bill.taxable_paise / 100
+        gst_amount = bill.tax_paise / 100
+        return subtotal, gst_amount, total_amount or round(subtotal + gst_amount, 2), slabs
+    # bills from before stored tax: compute as total - subtotal if possible
+    gst_amount = round(bill.total - subtotal, 2) if bill.total else round(subtotal * DEFAULT_GST / 100, 2)
+    return subtotal, gst_amount, total_amount or round(subtotal + gst_amount, 2), None
+
+
 @bp.route("/invoice/<int:bill_id>/pdf", methods=["GET"])
 @login_required
 def invoice_pdf(bill_id):
     if not REPORTLAB_AVAILABLE:
         return jsonify({"error": "reportlab not installed on server"}), 500
 
-    bill = Bill.query.get_or_404(bill_id)
-    items = BillItem.query.filter_by(bill_id=bill.id).all()
+    bill, items = _bill_with_items(bill_id)
 
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
@@ -205,8 +251,7 @@ def invoice_pdf(bill_id):
     c.setFont("Helvetica", 10)
     subtotal = 0.0
     for it in items:
-        prod = Product.query.get(it.product_id)
-        text = f"{prod.name} x {it.quantity}"
+        text = f"{it.product.name} x {it.quantity}"
         c.drawString(inch, y, text)
         c.drawRightString(width - inch, y, f"{it.subtotal:.2f}")
         subtotal += it.subtotal
@@ -215,9 +260,7 @@ def invoice_pdf(bill_id):
             c.showPage()
             y = height - inch
 
-    # GST: compute as total - subtotal if possible
-    gst_amount = round(bill.total - subtotal, 2) if bill.total else round(subtotal * DEFAULT_GST, 2)
-    total_amount = round(bill.total, 2) if bill.total else round(subtotal + gst_amount, 2)
+    subtotal, gst_amount, total_amount, slabs = _invoice_amounts(bill, items, subtotal)
 
     y -= 0.12 * inch
     c.line(inch, y, width - inch, y)
@@ -225,8 +268,13 @@ def invoice_pdf(bill_id):
     c.drawString(inch, y, "Subtotal:")
     c.drawRightString(width - inch, y, f"Rs. {subtotal:.2f}")
     y -= 0.22 * inch
-    c.drawString(inch, y, "GST (approx):")
+    c.drawString(inch, y, "GST:" if slabs is not None else "GST (approx):")
     c.drawRightString(width - inch, y, f"Rs. {gst_amount:.2f}")
+    if slabs and len(slabs) > 1:
+        for rate_bp, tax in slabs:
+            y -= 0.2 * inch
+            c.drawString(1.2 * inch, y, f"@ {rate_bp / 100:g}%")
+            c.drawRightString(width - inch, y, f"Rs. {tax / 100:.2f}")
     y -= 0.22 * inch
     c.setFont("Helvetica-Bold", 12)
     c.drawString(inch, y, "Total:")
@@ -240,12 +288,5 @@ def invoice_pdf(bill_id):
 @bp.route("/print/<int:bill_id>")
 @login_required
 def print_bill(bill_id):
-    bill = Bill.query.get_or_404(bill_id)
-    items = BillItem.query.filter_by(bill_id=bill.id).all()
-    return render_template(
-        "print_bill.html",
-        bill=bill,
-        items=items,
-        user=current_user
-    )
+    return render_bill_page("print_bill.html", bill_id, _bill_with_items)
 
@@ -1,12 +1,100 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request, jsonify
 from flask_login import login_required
 from datetime import datetime, timedelta
-from sqlalchemy import func
-
-from models import db, Customer, Bill
+from sqlalchemy import func, case, tuple_
+import os
+import time
+
+from database import current_tenant
+from models import db, Customer, Bill, CustomerSegment, CustomerActivity
+from segmentation import recompute_segments, SEGMENTS
+from http_cache import RevisionStore, conditional
+from archive import bill_sources
+from activity import log_activity
+from analytics import invalidate_sales_cube
 
 crm_bp = Blueprint("crm", __name__, url_prefix="/crm")
 
+INACTIVE_DAYS = 30
+# Upper bound on staleness; rollup writes invalidate immediately,
+# the TTL only covers customers ageing past the inactive cutoff.
+CRM_SUMMARY_TTL = 60
+
+# One entry per store (see tenancy.py), each holding the store's revision
+# as of its read. Revisions live in a RevisionStore file shared by the
+# host's workers (CRM_SUMMARY_REVISIONS, default <instance>/crm_summary.rev),
+# so a rollup write in one worker expires the summary in all of them.
+_summary_cache = {}
+_revisions = RevisionStore()
+
+
+def configure_crm_summary(app):
+    global _revisions
+
+    path = app.config.get("CRM_SUMMARY_REVISIONS") or os.path.join(app.instance_path, "crm_summary.rev")
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _revisions = RevisionStore(None if path == ":memory:" else path)
+    _summary_cache.clear()
+
+
+# ========================
+# CRM SUMMARY (shared by metrics + AI insight)
+# ========================
+def _summary_revision():
+    """(revision of every store's summaries, revision of the store's)"""
+    tenant = current_tenant.get()
+    return _revisions.get("summary")[0], _revisions.get(f"summary@{tenant}")[0] if tenant is not None else 0
+
+
+def invalidate_crm_summary():
+    """Expire the store's cached CRM summary (every store's outside a
+    request) in every worker. Call after any Customer rollup change."""
+    tenant = current_tenant.get()
+    _revisions.bump(["summary" if tenant is None else f"summary@{tenant}"])
+
+
+def _query_crm_summary():
+    inactive_cutoff = datetime.utcnow() - timedelta(days=INACTIVE_DAYS)
+
+    top_customer = (
+        db.session.query(Customer.name)
+        .filter(Customer.total_spent > 0)
+        .order_by(Customer.total_spent.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    row = db.session.query(
+        func.count(Customer.id).label("total"),
+        func.coalesce(func.sum(case((Customer.total_orders > 1, 1), else_=0)), 0).label("repeat"),
+        func.coalesce(func.sum(case(
+            ((Customer.last_purchase == None) | (Customer.last_purchase < inactive_cutoff), 1),
+            else_=0,
+        )), 0).label("inactive"),
+        top_customer.label("top_customer"),
+    ).one()
+
+    return {
+        "total_customers": int(row.total or 0),
+        "repeat_customers": int(row.repeat or 0),
+        "inactive_customers": int(row.inactive or 0),
+        "top_customer": row.top_customer,
+    }
+
+
+def get_crm_summary():
+    """Single-pass CRM aggregate, cached until the next rollup write or TTL."""
+    now = time.monotonic()
+    revision = _summary_revision()  # before the read: a write meanwhile expires it
+    entry = _summary_cache.get(current_tenant.get())
+    if entry is not None and entry["revision"] == revision and now < entry["expires"]:
+        return entry["data"]
+
+    data = _query_crm_summary()
+    _summary_cache[current_tenant.get()] = {"data": data, "expires": now + CRM_SUMMARY_TTL, "revision": revision}
+    return data
+
 
 # ========================
 # CRM MAIN PAGE
@@ -24,11 +112,14 @@ def crm_page():
 @login_required
 def customer_profile(customer_id):
     customer = Customer.query.get_or_404(customer_id)
+    log_activity(customer.id, "profile_viewed")
 
+    # full history, archived years included
+    history, _ = bill_sources()
     bills = (
-    Bill.query
-    .filter_by(customer_id=customer_id)
-    .order_by(Bill.bill_date.desc())
+    db.session.query(history)
+    .filter(history.customer_id == customer_id)
+    .order_by(history.bill_date.desc())
     .all()
     )
 
@@ -59,9 +150,51 @@ def customer_profile(customer_id):
 # ========================
 @crm_bp.route("/api/customers")
 @login_required
+@conditional("customers", "customer_segments")
 def get_customers():
-    customers = Customer.query.order_by(Customer.total_spent.desc()).all()
-    return jsonify([c.to_dict() for c in customers])
+    # optional filters: ?segment=champions,loyal  ?cohort=2025-01
+    segments = [s for s in request.args.get("segment", "").split(",") if s]
+    cohort = request.args.get("cohort", "").strip()
+
+    unknown = [s for s in segments if s not in SEGMENTS]
+    if unknown:
+        return jsonify({"error": f"Unknown segment: {', '.join(unknown)}"}), 400
+
+    # columns rather than Customer instances: this list is the whole table
+    query = (
+        db.session.query(
+            Customer.id,
+            Customer.name,
+            Customer.phone,
+            Customer.email,
+            Customer.total_spent,
+            Customer.total_orders,
+            Customer.last_purchase,
+            CustomerSegment.segment,
+            CustomerSegment.cohort,
+        )
+        .outerjoin(CustomerSegment, CustomerSegment.customer_id == Customer.id)
+    )
+    if segments:
+        query = query.filter(CustomerSegment.segment.in_(segments))
+    if cohort:
+        query = query.filter(CustomerSegment.cohort == cohort)
+
+    rows = query.order_by(Customer.total_spent.desc()).all()
+    return jsonify([
+        {
+            "id": r.id,
+            "name": r.name,
+            "phone": r.phone,
+            "email": r.email,
+            "total_spent": r.total_spent,
+            "total_orders": r.total_orders,
+            "last_purchase": r.last_purchase.isoformat() if r.last_purchase else None,
+            "segment": r.segment,
+            "cohort": r.cohort,
+        }
+        for r in rows
+    ])
 
 
 # ========================
@@ -82,6 +215,8 @@ def add_customer():
 
     db.session.add(customer)
     db.session.commit()
+    invalidate_crm_summary()
+    log_activity(customer.id, "customer_created")
 
     return jsonify({"success": True, "customer_id": customer.id})
 
@@ -93,11 +228,13 @@ def add_customer():
 @login_required
 def customer_details(customer_id):
     customer = Customer.query.get_or_404(customer_id)
+    log_activity(customer.id, "profile_viewed")
 
+    history, _ = bill_sources()
     bills = (
-        Bill.query
-        .filter_by(customer_id=customer_id)
-        .order_by(Bill.bill_date.desc())
+        db.session.query(history)
+        .filter(history.customer_id == customer_id)
+        .order_by(history.bill_date.desc())
         .all()
     )
 
@@ -124,49 +261,74 @@ def update_customer(customer_id):
     customer.address = data.get("address", customer.address)
 
     db.session.commit()
+    invalidate_crm_summary()
+    log_activity(customer.id, "profile_updated")
     return jsonify({"success": True})
 
+
 # ========================
-# CRM METRICS
+# API: ACTIVITY TIMELINE
 # ========================
-@crm_bp.route("/api/metrics")
+@crm_bp.route("/api/customer/<int:customer_id>/activity")
 @login_required
-def crm_metrics():
-    now = datetime.utcnow()
-    inactive_cutoff = now - timedelta(days=30)
-
-    total_customers = Customer.query.count()
+def customer_activity(customer_id):
+    # newest first; page with ?before=<"next" of the previous page>
+    Customer.query.get_or_404(customer_id)  # another store's customer is not found
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    query = CustomerActivity.query.filter(CustomerActivity.customer_id == customer_id)
+    before = request.args.get("before")
+    if before:
+        try:
+            created_at, activity_id = before.rsplit(",", 1)
+            created_at, activity_id = datetime.fromisoformat(created_at), int(activity_id)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        # (created_at, id) keyset: the index walk resumes where the page ended
+        query = query.filter(tuple_(CustomerActivity.created_at, CustomerActivity.id) < (created_at, activity_id))
+    rows = (
+        query.order_by(CustomerActivity.created_at.desc(), CustomerActivity.id.desc())
+        .limit(limit)
+        .all()
+    )
+    last = rows[-1] if len(rows) == limit else None
+    return jsonify({
+        "activity": [
+            {"id": a.id, "action": a.action, "reference_id": a.reference_id,
+             "created_at": a.created_at.isoformat()}
+            for a in rows
+        ],
+        "next": f"{last.created_at.isoformat()},{last.id}" if last else None,
+    })
 
-    repeat_customers = Customer.query.filter(
-        Customer.total_orders > 1
-    ).count()
 
-    # 🔥 TOP CUSTOMER
-    top_customer = (
-        Customer.query
-        .filter(Customer.total_spent > 0)
-        .order_by(Customer.total_spent.desc())
-        .first()
-    )
+@crm_bp.route("/api/activity/metrics")
+@login_required
+def activity_metrics():
+    # queue depth, drops and batch timings of this worker's activity writer
+    activity_log = current_app.extensions.get("activity_log")
+    return jsonify(activity_log.stats() if activity_log else {"enabled": False})
 
-    # 🔥 INACTIVE CUSTOMERS
-    inactive_customers = Customer.query.filter(
-        (Customer.last_purchase == None) |
-        (Customer.last_purchase < inactive_cutoff)
-    ).count()
+# ========================
+# CRM METRICS
+# ========================
+@crm_bp.route("/api/metrics")
+@login_required
+def crm_metrics():
+    summary = get_crm_summary()
 
     return jsonify({
-        "total_customers": total_customers,
-        "repeat_customers": repeat_customers,
-        "top_customer": top_customer.name if top_customer else "—",
-        "inactive_customers": inactive_customers
+        "total_customers": summary["total_customers"],
+        "repeat_customers": summary["repeat_customers"],
+        "top_customer": summary["top_customer"] or "—",
+        "inactive_customers": summary["inactive_customers"]
     })
 
 @crm_bp.route("/api/ai-insight")
 @login_required
 def ai_crm_insight():
-    total = Customer.query.count()
-    repeat = Customer.query.filter(Customer.total_orders > 1).count()
+    summary = get_crm_summary()
+    total = summary["total_customers"]
+    repeat = summary["repeat_customers"]
 
     if total == 0:
         insight = "No customer data available yet."
@@ -185,6 +347,20 @@ def ai_crm_insight():
 
 # ⚠️ ADMIN ONLY — one-time migration / maintenance
 
+def _with_archived(bills, name):
+    """``bills`` (hot, just linked) plus archived bills under ``name``.
+
+    Archived bills keep the customer_id they were archived with; they only
+    count towards the rollups here.
+    """
+    history, _ = bill_sources()
+    if history is Bill:
+        return bills
+    return db.session.query(history).filter(
+        func.lower(history.customer_name) == func.lower(name)
+    ).all()
+
+
 @crm_bp.route("/admin/rebuild-crm", methods=["GET", "POST"])
 @login_required
 def rebuild_crm():
@@ -200,6 +376,7 @@ def rebuild_crm():
         for bill in bills:
             bill.customer_id = customer.id
 
+        bills = _with_archived(bills, customer.name)
         customer.total_orders = len(bills)
         customer.total_spent = sum(b.total for b in bills)
         customer.last_purchase = (
@@ -207,6 +384,8 @@ def rebuild_crm():
         )
 
     db.session.commit()
+    invalidate_crm_summary()
+    invalidate_sales_cube()  # the cube holds each bill's customer
     return jsonify({"status": "CRM rebuilt successfully"})
 
 @crm_bp.route("/admin/bootstrap-customers", methods=["GET","POST"])
@@ -247,6 +426,7 @@ def bootstrap_customers():
             bill.customer_id = customer.id
 
         # calculate CRM metrics
+        bills = _with_archived(bills, name)
         customer.total_orders = len(bills)
         customer.total_spent = sum(b.total for b in bills)
         customer.last_purchase = (
@@ -254,8 +434,18 @@ def bootstrap_customers():
         )
 
     db.session.commit()
+    invalidate_crm_summary()
+    invalidate_sales_cube()
 
     return jsonify({
         "status": "customers bootstrapped",
         "created_customers": created
     })
+
+@crm_bp.route("/admin/recompute-segments", methods=["GET", "POST"])
+@login_required
+def recompute_customer_segments():
+    # incremental by default; ?full=1 rescores everyone (run nightly)
+    full = request.args.get("full") in ("1", "true", "yes")
+    result = recompute_segments(full=full)
+    return jsonify({"status": "segments recomputed", **result})
@@ -3,7 +3,10 @@ from flask_login import login_required
 from sqlalchemy import func
 from datetime import datetime, date, time
 
-from models import db, Product, Bill
+from models import db, Product, Bill, LowStock
+from stock_alerts import low_stock_query
+from archive import archived_totals
+from analytics import sales_cube
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/dashboard")
 
@@ -20,14 +23,37 @@ def dashboard_home():
 def dashboard_metrics():
     # Product metrics
     total_products = db.session.query(func.count(Product.id)).scalar() or 0
-    low_stock = Product.query.filter(Product.stock < 5).count()
-    low_stock_items = Product.query.filter(Product.stock <= 5).all()
+    low_stock = db.session.query(func.count(LowStock.product_id)).scalar() or 0
+    low_stock_items = low_stock_query().all()
 
-    # Sales metrics
+    cube = sales_cube()
+    totals = cube.totals() if cube else None
+    today = cube.day_totals(date.today()) if totals else None
+    if today:
+        total_sales = totals[1]
+        bills_today, today_sales = today
+    else:
+        total_sales, bills_today, today_sales = _sales_metrics_sql()
+
+    return jsonify({
+        "today_sales": float(today_sales),
+        "bills_today": bills_today,
+        "total_products": total_products,
+        "low_stock": low_stock,
+        "total_sales": float(total_sales),
+        "low_stock_items": [
+            {"name": p.name, "stock": p.stock} for p in low_stock_items
+        ]
+    })
+
+
+def _sales_metrics_sql():
+    """(total sales, bills today, sales today) without the cube."""
+    # Sales metrics: hot bills plus the archived months' rollup
     total_sales = (
         db.session.query(func.coalesce(func.sum(Bill.total), 0))
         .scalar()
-    )
+    ) + archived_totals()[1]
 
     # Today's date range
     today = date.today()
@@ -46,14 +72,4 @@ def dashboard_metrics():
         .filter(Bill.bill_date >= start, Bill.bill_date <= end)
         .scalar()
     )
-
-    return jsonify({
-        "today_sales": float(today_sales),
-        "bills_today": bills_today,
-        "total_products": total_products,
-        "low_stock": low_stock,
-        "total_sales": float(total_sales),
-        "low_stock_items": [
-            {"name": p.name, "stock": p.stock} for p in low_stock_items
-        ]
-    })
+    return total_sales, bills_today, today_sales
@@ -1,6 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
-from models import db, Product
+from models import db, Product, StockMovement
+from sqlalchemy import func
+from http_cache import conditional
+from tax import normalize_rate
+from inventory import record_movements, product_stock_as_of, take_snapshot
+from stock_alerts import low_stock_query, recent_alerts
+from reorder import compute_reorder_suggestions, last_run, reorder_suggestions
+from datetime import datetime, timedelta
 import io
 import openpyxl
 import re
@@ -19,8 +26,9 @@ def _to_dict(p: Product):
         "category": getattr(p, "category", "") or "",
         "price": float(p.price),
         "stock": int(p.stock),
+        "reorder_level": p.reorder_level,
         "gst": (
-            float(getattr(p, "gst", 0.18))
+            float(getattr(p, "gst", 18.0))
             if getattr(p, "gst", None) is not None
             else None
         ),
@@ -37,11 +45,21 @@ def page_products():
 # ---------- APIs ----------
 @bp.route("/api", methods=["GET"])
 @login_required
+@conditional("product")
 def api_list():
     q = request.args.get("q", "").strip()
     sort = request.args.get("sort", "name")
 
-    query = Product.query
+    # plain columns, serialized as-is by the JSON provider (same keys as _to_dict)
+    query = db.session.query(
+        Product.id,
+        Product.name,
+        func.coalesce(Product.category, "").label("category"),
+        Product.price,
+        Product.stock,
+        Product.gst,
+        Product.reorder_level,
+    )
 
     if q:
         q_like = f"%{q}%"
@@ -74,9 +92,7 @@ def api_list():
 
     products = query.order_by(order_col).all()
 
-    return jsonify({
-        "products": [_to_dict(p) for p in products]
-    })
+    return jsonify({"products": products})
 
 
 @bp.route("/api", methods=["POST"])
@@ -91,26 +107,30 @@ def api_create():
     try:
         price = float(data.get("price", 0))
         stock = int(data.get("stock", 0))
+        reorder_level = int(data.get("reorder_level", 5))
     except Exception:
         return jsonify({"error": "Invalid numeric values"}), 400
 
     category = data.get("category", "") or ""
-    gst = data.get("gst", None)
+    try:
+        gst = normalize_rate(data.get("gst"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     p = Product(
         name=name,
         price=price,
         stock=stock,
         category=category,
+        reorder_level=reorder_level,
     )
 
-    if hasattr(p, "gst") and gst is not None:
-        try:
-            p.gst = float(gst)
-        except Exception:
-            pass
+    if hasattr(p, "gst"):
+        p.gst = gst
 
     db.session.add(p)
+    db.session.flush()
+    record_movements([(p.id, p.stock)], "adjustment")
     db.session.commit()
 
     return jsonify({
@@ -139,15 +159,23 @@ def api_update(product_id):
 
     if "stock" in data:
         try:
-            p.stock = int(data["stock"])
+            stock = int(data["stock"])
         except Exception:
             return jsonify({"error": "Invalid stock"}), 400
+        record_movements([(p.id, stock - p.stock)], "adjustment")
+        p.stock = stock
 
-    if "gst" in data and hasattr(p, "gst"):
+    if "reorder_level" in data:
         try:
-            p.gst = float(data["gst"])
+            p.reorder_level = int(data["reorder_level"])
         except Exception:
-            pass
+            return jsonify({"error": "Invalid reorder level"}), 400
+
+    if "gst" in data and hasattr(p, "gst"):
+        try:
+            p.gst = normalize_rate(data["gst"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     db.session.commit()
 
@@ -162,11 +190,96 @@ def api_update(product_id):
 def api_delete(product_id):
     p = Product.query.get_or_404(product_id)
 
+    record_movements([(p.id, -p.stock)], "adjustment")
     db.session.delete(p)
     db.session.commit()
 
     return jsonify({"message": "Deleted"})
 
+@bp.route("/api/<int:product_id>/stock", methods=["GET"])
+@login_required
+def api_stock_as_of(product_id):
+    # ?at=2025-03-31 or 2025-03-31T18:00 (UTC, like bill dates); default now
+    p = Product.query.get_or_404(product_id)
+    value = request.args.get("at", "")
+    try:
+        at = datetime.fromisoformat(value) if value else datetime.utcnow()
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
+    if len(value) == 10:
+        at += timedelta(days=1, microseconds=-1)  # a bare date means its end
+    return jsonify({
+        "id": p.id,
+        "at": at.isoformat(),
+        "stock": product_stock_as_of(p.id, at),
+    })
+
+
+@bp.route("/api/<int:product_id>/movements", methods=["GET"])
+@login_required
+def api_movements(product_id):
+    # newest first; page with ?before=<id of the last movement shown>
+    Product.query.get_or_404(product_id)  # another store's product is not found
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    query = StockMovement.query.filter_by(product_id=product_id)
+    before = request.args.get("before", type=int)
+    if before:
+        query = query.filter(StockMovement.id < before)
+    movements = query.order_by(StockMovement.id.desc()).limit(limit).all()
+    return jsonify({"movements": [
+        {"id": m.id, "kind": m.kind, "quantity": m.quantity, "bill_id": m.bill_id,
+         "created_at": m.created_at.isoformat()}
+        for m in movements
+    ]})
+
+
+@bp.route("/api/low-stock", methods=["GET"])
+@login_required
+@conditional("product")
+def api_low_stock():
+    # the maintained below-reorder-level set, plus the latest threshold crossings
+    return jsonify({
+        "items": low_stock_query().all(),
+        "recent_alerts": recent_alerts(),
+    })
+
+
+@bp.route("/api/reorder-suggestions", methods=["GET"])
+@login_required
+@conditional("reorder_suggestion", "product")
+def api_reorder_suggestions():
+    # from the nightly run, re-checked against live stock; ?limit=20
+    limit = request.args.get("limit", type=int)
+    run = last_run()
+    return jsonify({
+        "computed_at": run.started_at.isoformat() if run else None,
+        "lead_days": run.lead_days if run else None,
+        "cover_days": run.cover_days if run else None,
+        "items": reorder_suggestions(limit),
+    })
+
+
+@bp.route("/admin/reorder-suggestions", methods=["GET", "POST"])
+@login_required
+def recompute_reorder_suggestions():
+    # normally nightly (`flask reorder-suggestions`); ?lead_days=7&cover_days=30
+    lead_days = request.args.get("lead_days", 7, type=int)
+    cover_days = request.args.get("cover_days", 30, type=int)
+    if lead_days < 0 or cover_days < 0:
+        return jsonify({"error": "Invalid lead or cover days"}), 400
+    result = compute_reorder_suggestions(lead_days=lead_days, cover_days=cover_days)
+    return jsonify({"status": "reorder suggestions computed", **result})
+
+
+@bp.route("/admin/stock-snapshot", methods=["GET", "POST"])
+@login_required
+def stock_snapshot():
+    # checkpoint for as-of queries; run periodically (or `flask stock-snapshot`),
+    # ?full=1 now and then (e.g. weekly) to bound lookups
+    full = request.args.get("full") in ("1", "true", "yes")
+    return jsonify({"status": "snapshot taken", **take_snapshot(full=full)})
+
+
 @bp.route("/api/import", methods=["POST"])
 @login_required
 def api_import_excel():
@@ -201,14 +314,16 @@ def api_import_excel():
         col_price = find_col(["price", "rate", "amount"])
         col_stock = find_col(["stock", "qty", "quantity"])
         col_gst = find_col(["gst", "tax"])
+        col_reorder = find_col(["reorder_level", "reorder level", "reorder", "min stock"])
 
         if col_name is None:
             return jsonify({"error": "Product name column not found"}), 400
 
         added = 0
         updated = 0
+        changes = []
 
-        for row in rows[1:]:
+        for line, row in enumerate(rows[1:], start=2):
             if not row[col_name]:
                 continue
 
@@ -249,12 +364,26 @@ def api_import_excel():
                 else 0
             )
 
-            gst = (
-                parse_float(row[col_gst])
-                if col_gst is not None
-                else 0
+            # a blank cell keeps the product's level (new ones get the default)
+            reorder_level = (
+                parse_int(row[col_reorder])
+                if col_reorder is not None and str(row[col_reorder] or "").strip()
+                else None
             )
 
+            # percent: "18", 18 and "18%" are 18 %; a cell formatted as
+            # a percentage holds 0.18 for 18 %
+            try:
+                gst = 0
+                if col_gst is not None:
+                    gst = row[col_gst]
+                    if type(gst) in (int, float) and "%" in sheet.cell(line, col_gst + 1).number_format:
+                        gst *= 100
+                    gst = normalize_rate(gst, default=0)
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({"error": f"Row {line}: {e}"}), 400
+
             # DUPLICATE CHECK (by name)
             existing = Product.query.filter(
                 Product.name.ilike(name)
@@ -263,7 +392,10 @@ def api_import_excel():
             if existing:
                 existing.category = category
                 existing.price = price
+                changes.append((existing, stock - existing.stock))
                 existing.stock = stock
+                if reorder_level is not None:
+                    existing.reorder_level = reorder_level
                 if hasattr(existing, "gst"):
                     existing.gst = gst
                 updated += 1
@@ -276,9 +408,15 @@ def api_import_excel():
                 )
                 if hasattr(new_product, "gst"):
                     new_product.gst = gst
+                if reorder_level is not None:
+                    new_product.reorder_level = reorder_level
                 db.session.add(new_product)
+                changes.append((new_product, stock))
                 added += 1
 
+        # the import replaces stock outright; the ledger keeps the difference
+        db.session.flush()
+        record_movements([(p.id, delta) for p, delta in changes], "import")
         db.session.commit()
 
         return jsonify({
@@ -297,8 +435,8 @@ def download_template():
     workbook = openpyxl.Workbook()
     sheet = workbook.active
 
-    sheet.append(["name", "category", "price", "stock", "gst"])
-    sheet.append(["Sample Product", "General", 100, 50, 18])
+    sheet.append(["name", "category", "price", "stock", "gst", "reorder_level"])
+    sheet.append(["Sample Product", "General", 100, 50, 18, 5])
 
     temp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
     workbook.save(temp.name)
@@ -1,8 +1,15 @@
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, current_app, request, Response, stream_with_context
 from flask_login import login_required
-from models import db, Bill, BillItem, Product
+from models import db, Bill, Product
 from sqlalchemy import func
-import os, json
+from database import day_bucket, month_bucket
+from http_cache import conditional
+from archive import archived_daily_sales, bill_partitions, bill_sources
+from tenancy import current_tenant, tenant_context
+from export import COLUMNS, FORMATS, PYARROW_AVAILABLE, export_stream, plan_export
+from analytics import DaySales, MonthSales, sales_cube
+from datetime import date, datetime, timedelta
+import os, json, csv, io
 from dotenv import load_dotenv   #type: ignore
 from openai import OpenAI
 
@@ -107,33 +114,14 @@ def reports_home():
 # ==========================
 @reports_bp.route("/data")
 @login_required
+@conditional("bill", "bill_item", "product", "archive_daily_sales")
 def reports_data():
-    # ---- Optimized Queries ----
-    # Daily Revenue
-    daily_sales = db.session.query(
-        func.strftime('%Y-%m-%d', Bill.bill_date).label('date'),
-        func.sum(Bill.total).label('revenue')
-    ).group_by('date').order_by('date').all()
-
-    # Top Products
-    top_products = db.session.query(
-        Product.name,
-        func.sum(BillItem.quantity).label('sold')
-    ).join(BillItem, BillItem.product_id == Product.id) \
-     .group_by(Product.id).order_by(func.sum(BillItem.quantity).desc()).limit(5).all()
-
-    # Monthly stats
-    monthly_stats = db.session.query(
-        func.strftime('%Y-%m', Bill.bill_date).label('month'),
-        func.sum(Bill.total).label('revenue'),
-        func.count(Bill.id).label('bills')
-    ).group_by('month').order_by('month').all()
-
-    # Totals
-    total_sales = float(db.session.query(func.sum(Bill.total)).scalar() or 0)
-    total_bills = int(db.session.query(func.count(Bill.id)).scalar() or 0)
+    cube = sales_cube()
+    summary = (cube.summary() if cube else None) or _sales_summary_sql()
+    daily_sales, monthly_stats = summary["daily_sales"], summary["monthly_stats"]
+    top_products = summary["top_products"]
+    total_sales, total_bills = summary["total_sales"], summary["total_bills"]
 
-    # ---- Daily / Monthly arrays ----
     daily_labels = [d.date for d in daily_sales]
     daily_revenue = [float(d.revenue or 0) for d in daily_sales]
 
@@ -158,7 +146,11 @@ def reports_data():
         "avg_bill": avg_bill,
         "top_product": top_products[0].name if top_products else "None"
     }
-    gpt_insights = generate_gpt_insights(metrics)
+    gpt_insights = (
+        generate_gpt_insights(metrics)
+        if current_app.config.get("GPT_INSIGHTS", True)
+        else None
+    )
 
     return jsonify({
         "daily_labels": daily_labels,
@@ -175,3 +167,290 @@ def reports_data():
         "current_month_bills": current_month_bills,
         "previous_month_bills": previous_month_bills
     })
+
+
+def _sales_summary_sql():
+    """The /reports/data figures straight from the tables (no cube)."""
+    # ---- Optimized Queries ----
+    # Daily Revenue
+    daily_sales = db.session.query(
+        day_bucket(Bill.bill_date).label('date'),
+        func.sum(Bill.total).label('revenue')
+    ).group_by('date').order_by('date').all()
+
+    # Top Products (all time, archived items included); summing per
+    # product before the join reads bill_item once instead of per product
+    _, items = bill_sources()
+    sold = db.session.query(
+        items.product_id,
+        func.sum(items.quantity).label('sold')
+    ).group_by(items.product_id).subquery()
+    top_products = db.session.query(Product.name, sold.c.sold) \
+        .join(sold, sold.c.product_id == Product.id) \
+        .order_by(sold.c.sold.desc()).limit(5).all()
+
+    # Monthly stats
+    monthly_stats = db.session.query(
+        month_bucket(Bill.bill_date).label('month'),
+        func.sum(Bill.total).label('revenue'),
+        func.count(Bill.id).label('bills')
+    ).group_by('month').order_by('month').all()
+
+    # Totals
+    total_sales = float(db.session.query(func.sum(Bill.total)).scalar() or 0)
+    total_bills = int(db.session.query(func.count(Bill.id)).scalar() or 0)
+
+    # archived months come from their daily rollup
+    archived = archived_daily_sales()
+    if archived:
+        daily_sales, monthly_stats = _with_archived(daily_sales, monthly_stats, archived)
+        total_sales += sum(r.revenue for r in archived)
+        total_bills += sum(r.bills for r in archived)
+
+    return {
+        "daily_sales": daily_sales,
+        "monthly_stats": monthly_stats,
+        "top_products": top_products,
+        "total_sales": total_sales,
+        "total_bills": total_bills,
+    }
+
+
+def _with_archived(daily_sales, monthly_stats, archived):
+    """Merge archived (day, bills, revenue) rollups into the hot day / month rows."""
+    days, months = {}, {}
+    for r in daily_sales:
+        days[r.date] = float(r.revenue or 0)
+    for r in monthly_stats:
+        months[r.month] = [float(r.revenue or 0), int(r.bills or 0)]
+    for day, bills, revenue in archived:
+        days[day] = days.get(day, 0) + revenue
+        month = months.setdefault(day[:7], [0, 0])
+        month[0] += revenue
+        month[1] += bills
+    return (
+        [DaySales(d, revenue) for d, revenue in sorted(days.items())],
+        [MonthSales(m, revenue, bills) for m, (revenue, bills) in sorted(months.items())],
+    )
+
+
+# ==========================
+# 🧾 GST SUMMARY (tax filing)
+# ==========================
+GST_SCAN_DAYS = 31  # bill dates per scan window; bounds what one query returns
+GST_COLUMNS = ("period", "rate", "bills", "taxable", "tax", "total")
+
+
+def scan_gst(start, end, window_days=None):
+    """(day, rate_bp, bills, taxable_paise, tax_paise) for bills in [start, end).
+
+    One GROUP BY per window of bill dates (ix_bill_bill_date), sums of the
+    stored per-line tax, in day then rate order. Memory is one window's
+    groups (days x slabs), whatever the range.
+    """
+    window_days = window_days or GST_SCAN_DAYS
+    # skip empty windows at either end of a wide range
+    bounds = [
+        db.session.query(func.min(bills.bill_date), func.max(bills.bill_date))
+        .filter(bills.bill_date >= start, bills.bill_date < end).one()
+        for bills, _ in bill_partitions(start, end)
+    ]
+    bounds = [b for b in bounds if b[0] is not None]
+    if not bounds:
+        return
+    first, last = min(b[0] for b in bounds), max(b[1] for b in bounds)
+    lo, end = max(start, first), min(end, last + timedelta(seconds=1))
+    while lo < end:
+        hi = min(lo + timedelta(days=window_days), end)
+        # one query per partition the window reaches (usually just one)
+        partitions = bill_partitions(lo, hi)
+        if len(partitions) == 1:
+            yield from db.session.execute(_gst_window(*partitions[0], lo, hi))
+        else:
+            yield from _merge_gst(db.session.execute(_gst_window(bills, items, lo, hi)) for bills, items in partitions)
+        lo = hi
+
+
+def _gst_window(bills, items, lo, hi):
+    day = day_bucket(bills.bill_date).label("day")
+    return (
+        db.select(
+            day,
+            items.gst_rate_bp,
+            func.count(func.distinct(bills.id)),
+            func.sum(items.taxable_paise),
+            func.sum(items.tax_paise),
+        )
+        .join(bills, bills.id == items.bill_id)
+        .where(bills.bill_date >= lo, bills.bill_date < hi, items.tax_paise.is_not(None))
+        .group_by(day, items.gst_rate_bp)
+        .order_by(day, items.gst_rate_bp)
+    )
+
+
+def _merge_gst(results):
+    """Add up one window's rows from several partitions; a bill is in one
+    partition only, so bill counts add too."""
+    merged = {}
+    for rows in results:
+        for day, rate_bp, bills, taxable, tax in rows:
+            totals = merged.setdefault((day, rate_bp), [0, 0, 0])
+            totals[0] += bills
+            totals[1] += taxable or 0
+            totals[2] += tax or 0
+    for (day, rate_bp), (bills, taxable, tax) in sorted(merged.items()):
+        yield day, rate_bp, bills, taxable, tax
+
+
+def _by_month(rows):
+    """Roll day rows up to months; a bill has one date, so bill counts add up."""
+    current, slabs = None, {}
+    for day, rate_bp, bills, taxable, tax in rows:
+        if day[:7] != current:
+            yield from ((current, r, *sums) for r, sums in sorted(slabs.items()))
+            current, slabs = day[:7], {}
+        sums = slabs.setdefault(rate_bp, [0, 0, 0])
+        sums[0] += bills
+        sums[1] += taxable
+        sums[2] += tax
+    yield from ((current, r, *sums) for r, sums in sorted(slabs.items()))
+
+
+def gst_summary(start, end, by="day"):
+    """(period, rate_bp, bills, taxable_paise, tax_paise) rows, ``by`` "day" or "month"."""
+    rows = scan_gst(start, end)
+    return _by_month(rows) if by == "month" else rows
+
+
+def _gst_row(period, rate_bp, bills, taxable, tax):
+    return {"period": period, "rate": rate_bp / 100, "bills": bills,
+            "taxable": taxable / 100, "tax": tax / 100, "total": (taxable + tax) / 100}
+
+
+def _with_totals(rows, totals):
+    """Pass rows through, summing bills / paise per rate into ``totals``."""
+    for row in rows:
+        sums = totals.setdefault(row[1], [0, 0, 0])
+        sums[0] += row[2]
+        sums[1] += row[3]
+        sums[2] += row[4]
+        yield row
+
+
+def _parse_day(value, default):
+    return datetime.strptime(value, "%Y-%m-%d") if value else default
+
+
+def _gst_params():
+    """(start, last, by, format) of a /reports/gst request; ValueError if invalid."""
+    today = datetime.combine(date.today(), datetime.min.time())
+    try:
+        start = _parse_day(request.args.get("from"), today.replace(day=1))
+        last = _parse_day(request.args.get("to"), today)
+    except ValueError:
+        raise ValueError("Dates must be YYYY-MM-DD") from None
+    by = request.args.get("by", "day")
+    fmt = request.args.get("format", "json")
+    if by not in ("day", "month") or fmt not in ("json", "csv") or last < start:
+        raise ValueError("Invalid report parameters")
+    return start, last, by, fmt
+
+
+def _gst_variant():
+    # the range is resolved against today: the same URL is another report tomorrow
+    try:
+        start, last, by, fmt = _gst_params()
+    except ValueError:
+        return "invalid"
+    return f"{start:%Y%m%d}.{last:%Y%m%d}.{by}.{fmt}"
+
+
+@reports_bp.route("/gst")
+@login_required
+@conditional("bill", "bill_item", vary=_gst_variant)
+def gst_report():
+    """GST by rate slab per day or month: ?from=YYYY-MM-DD&to=...&by=day|month&format=json|csv"""
+    try:
+        start, last, by, fmt = _gst_params()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    end = last + timedelta(days=1)
+
+    totals = {}
+    rows = _with_totals(gst_summary(start, end, by), totals)
+    if fmt == "json":
+        rows = [_gst_row(*row) for row in rows]
+        slabs = [_gst_row("TOTAL", rate_bp, *totals[rate_bp]) for rate_bp in sorted(totals)]
+        taxable = sum(t[1] for t in totals.values())
+        tax = sum(t[2] for t in totals.values())
+        return jsonify({
+            "from": start.date().isoformat(),
+            "to": last.date().isoformat(),
+            "by": by,
+            "rows": rows,
+            "slabs": slabs,
+            "taxable": taxable / 100,
+            "tax": tax / 100,
+            "total": (taxable + tax) / 100,
+        })
+
+    tenant = current_tenant.get()
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(GST_COLUMNS)
+        # rows are read while the response is sent, after the request's store was reset
+        with tenant_context(tenant):
+            for i, (period, rate_bp, bills, taxable, tax) in enumerate(rows, 1):
+                writer.writerow((period, f"{rate_bp / 100:g}", bills,
+                                 f"{taxable / 100:.2f}", f"{tax / 100:.2f}", f"{(taxable + tax) / 100:.2f}"))
+                if i % 1000 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        for rate_bp in sorted(totals):
+            bills, taxable, tax = totals[rate_bp]
+            writer.writerow(("TOTAL", f"{rate_bp / 100:g}", bills,
+                             f"{taxable / 100:.2f}", f"{tax / 100:.2f}", f"{(taxable + tax) / 100:.2f}"))
+        yield buffer.getvalue()
+
+    name = f"gst_{by}_{start:%Y%m%d}_{last:%Y%m%d}.csv"
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={name}"})
+
+
+# ==========================
+# 📤 RAW SALES EXPORT (BI tools)
+# ==========================
+@reports_bp.route("/export")
+@login_required
+def export_sales():
+    """Bills or line items, streamed in bill id order (see export.py):
+    ?from=YYYY-MM-DD&to=...&rows=items|bills&format=csv|ndjson|parquet&after=<bill id>&limit=<bills>"""
+    today = datetime.combine(date.today(), datetime.min.time())
+    try:
+        start = _parse_day(request.args.get("from"), today.replace(day=1))
+        last = _parse_day(request.args.get("to"), today)
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    level = request.args.get("rows", "items")
+    fmt = request.args.get("format", "csv")
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", type=int)
+    if level not in COLUMNS or fmt not in FORMATS or last < start or after < 0 or (limit is not None and limit < 1):
+        return jsonify({"error": "Invalid export parameters"}), 400
+    if fmt == "parquet" and not PYARROW_AVAILABLE:
+        return jsonify({"error": "pyarrow not installed on server"}), 500
+
+    parts, until, next_after = plan_export(start, last + timedelta(days=1), after, limit)
+    mimetype, extension = FORMATS[fmt]
+    name = f"sales_{level}_{start:%Y%m%d}_{last:%Y%m%d}" + (f"_after{after}" if after else "")
+    headers = {"Content-Disposition": f"attachment; filename={name}.{extension}"}
+    # X-Export-Until: last bill id in this response; X-Export-Next: ?after= of the next page
+    if until is not None:
+        headers["X-Export-Until"] = str(until)
+    if next_after is not None:
+        headers["X-Export-Next"] = str(next_after)
+    stream = export_stream(fmt, parts, level, start, last + timedelta(days=1))
+    return Response(stream_with_context(stream), mimetype=mimetype, headers=headers)
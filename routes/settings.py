@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
 from models import db  # Import your SQLAlchemy db object
 from models import User  # Import your User model
+from user_cache import invalidate_user
+from passwords import hash_password, verify_password, LoginThrottled
 
 # Create blueprint
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
@@ -41,6 +42,7 @@ def update_profile():
 
         # Commit changes
         db.session.commit()
+        invalidate_user(current_user)
         return jsonify({"message": "Profile updated successfully!"})
 
     except Exception as e:
@@ -57,8 +59,15 @@ def change_password():
         new_password = request.form.get('new_password')
         confirm_new_password = request.form.get('confirm_new_password')
 
+        # current_user may come from the user cache; check the stored hash
+        db.session.refresh(current_user._get_current_object())
+
         # Validate current password
-        if not check_password_hash(current_user.password, current_password):
+        try:
+            valid = verify_password(current_user, current_password or "")
+        except LoginThrottled:
+            return jsonify({"message": "Too many attempts right now. Please try again."}), 429
+        if not valid:
             return jsonify({"message": "Current password is incorrect."}), 400
 
         # Confirm new password matches
@@ -66,8 +75,9 @@ def change_password():
             return jsonify({"message": "New passwords do not match."}), 400
 
         # Update password
-        current_user.password = generate_password_hash(new_password)
+        current_user.password = hash_password(new_password)
         db.session.commit()
+        invalidate_user(current_user)
 
         return jsonify({"message": "Password updated successfully!"})
 
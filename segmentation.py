@@ -0,0 +1,240 @@
+# segmentation.py
+"""
+RFM / cohort segmentation for CRM customers.
+
+Bill history is aggregated per customer in a single query, pulled into
+NumPy columns and every customer is scored in one vectorized pass.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, or_
+
+from archive import bill_sources
+from models import db, Customer, CustomerSegment, SegmentRun
+from tenancy import current_tenant, tenant_criteria, tenant_runs
+
+SCORE_BINS = 5
+WRITE_CHUNK = 5000
+DELETE_CHUNK = 500
+
+# Evaluated top to bottom, first match wins (see _label_segments).
+SEGMENTS = [
+    "champions",
+    "loyal",
+    "new",
+    "promising",
+    "at_risk",
+    "hibernating",
+    "needs_attention",
+]
+
+
+# ==========================
+# Loading
+# ==========================
+def load_rfm_columns(customer_ids=None):
+    """Return per-customer RFM inputs as NumPy columns.
+
+    ``customer_ids`` may be a SQL selectable to restrict the scan
+    (used by incremental runs); ``None`` loads everyone with bills.
+    """
+    bills, _ = bill_sources()  # whole history, archived years included
+    query = (
+        db.session.query(
+            bills.customer_id,
+            bills.tenant_id,
+            func.max(bills.bill_date),
+            func.min(bills.bill_date),
+            func.count(bills.id),
+            func.coalesce(func.sum(bills.total), 0),
+        )
+        .filter(bills.customer_id.isnot(None), bills.bill_date.isnot(None))
+    )
+    if customer_ids is not None:
+        query = query.filter(bills.customer_id.in_(customer_ids))
+
+    # a customer's bills are all their store's
+    rows = query.group_by(bills.customer_id, bills.tenant_id).all()
+    if not rows:
+        return None
+
+    ids, tenants, last, first, orders, spent = zip(*rows)
+    return {
+        "customer_id": np.array(ids, dtype=np.int64),
+        "tenant_id": np.array(tenants, dtype=np.int64),
+        "last_purchase": np.array(last, dtype="datetime64[s]"),
+        "first_purchase": np.array(first, dtype="datetime64[s]"),
+        "frequency": np.array(orders, dtype=np.int64),
+        "monetary": np.array(spent, dtype=np.float64),
+    }
+
+
+# ==========================
+# Scoring
+# ==========================
+def quantile_edges(values):
+    """Interior quintile edges (4 values) for a score column."""
+    qs = np.linspace(0, 1, SCORE_BINS + 1)[1:-1]
+    return np.quantile(values, qs).tolist()
+
+
+def _label_segments(r, f, m):
+    conditions = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 4),
+        (r >= 4) & (f <= 1),
+        r >= 4,
+        (r <= 2) & (f >= 3),
+        r <= 2,
+    ]
+    return np.select(conditions, SEGMENTS[:-1], default=SEGMENTS[-1])
+
+
+def score_rfm(recency_days, frequency, monetary, edges=None):
+    """Score RFM columns 1..5 and label segments.
+
+    Pass ``edges`` from a previous full run to score a subset of
+    customers against the same population breakpoints.
+    """
+    if edges is None:
+        edges = {
+            "r": quantile_edges(recency_days),
+            "f": quantile_edges(frequency),
+            "m": quantile_edges(monetary),
+        }
+
+    # side="left" so ties on an edge fall into the lower bin; with most
+    # customers on a single order this keeps one-timers at f=1.
+    r = SCORE_BINS - np.searchsorted(edges["r"], recency_days, side="left")
+    f = np.searchsorted(edges["f"], frequency, side="left") + 1
+    m = np.searchsorted(edges["m"], monetary, side="left") + 1
+
+    return {
+        "r_score": r,
+        "f_score": f,
+        "m_score": m,
+        "segment": _label_segments(r, f, m),
+    }, edges
+
+
+# ==========================
+# Persistence
+# ==========================
+def _delete_segments(customer_ids):
+    table = CustomerSegment.__table__
+    for i in range(0, len(customer_ids), DELETE_CHUNK):
+        chunk = customer_ids[i:i + DELETE_CHUNK]
+        db.session.execute(table.delete().where(table.c.customer_id.in_(chunk)))
+
+
+def _write_segments(cols, scores, recency_days, computed_at):
+    cohorts = cols["first_purchase"].astype("datetime64[M]").astype(str)
+    records = [
+        {
+            "customer_id": cid,
+            "tenant_id": tenant,
+            "recency_days": rec,
+            "frequency": freq,
+            "monetary": mon,
+            "r_score": r,
+            "f_score": f,
+            "m_score": m,
+            "segment": seg,
+            "cohort": cohort,
+            "computed_at": computed_at,
+        }
+        for cid, tenant, rec, freq, mon, r, f, m, seg, cohort in zip(
+            cols["customer_id"].tolist(),
+            cols["tenant_id"].tolist(),
+            recency_days.tolist(),
+            cols["frequency"].tolist(),
+            cols["monetary"].tolist(),
+            scores["r_score"].tolist(),
+            scores["f_score"].tolist(),
+            scores["m_score"].tolist(),
+            scores["segment"].tolist(),
+            cohorts.tolist(),
+        )
+    ]
+
+    table = CustomerSegment.__table__
+    for i in range(0, len(records), WRITE_CHUNK):
+        db.session.execute(table.insert(), records[i:i + WRITE_CHUNK])
+
+
+# ==========================
+# Runs
+# ==========================
+def _touched_customer_ids(since):
+    """Customers with purchases since ``since`` or never segmented."""
+    return (
+        db.session.query(Customer.id)
+        .outerjoin(CustomerSegment, CustomerSegment.customer_id == Customer.id)
+        .filter(or_(
+            Customer.last_purchase >= since,
+            CustomerSegment.customer_id.is_(None),
+        ))
+    )
+
+
+def recompute_segments(full=False, now=None):
+    """Recompute RFM segments.
+
+    Incremental runs (the default once a full run exists) only rescore
+    customers touched since the previous run, against the quantile edges
+    of the last full run. Run a full recompute periodically so the edges
+    and everybody's recency stay current.
+    """
+    now = now or datetime.utcnow()
+
+    last_run = tenant_runs(SegmentRun).order_by(SegmentRun.id.desc()).first()
+    last_full = (
+        tenant_runs(SegmentRun)
+        .filter(SegmentRun.full.is_(True), SegmentRun.edges.isnot(None))
+        .order_by(SegmentRun.id.desc())
+        .first()
+    )
+    if last_full is None:
+        full = True
+
+    if full:
+        cols = load_rfm_columns()
+        edges = None
+    else:
+        touched = _touched_customer_ids(last_run.started_at)
+        cols = load_rfm_columns(touched.subquery().select())
+        edges = json.loads(last_full.edges)
+
+    scored = 0
+    if full:
+        # everybody's rows go, also those of customers with no bills left
+        table = CustomerSegment.__table__
+        db.session.execute(table.delete().where(*tenant_criteria(table.c.tenant_id)))
+    if cols is not None:
+        recency_days = (
+            (np.datetime64(now, "s") - cols["last_purchase"])
+            .astype("timedelta64[D]")
+            .astype(np.int64)
+        )
+        scores, edges = score_rfm(
+            recency_days, cols["frequency"], cols["monetary"], edges
+        )
+
+        if not full:
+            _delete_segments(cols["customer_id"].tolist())
+        _write_segments(cols, scores, recency_days, now)
+        scored = len(cols["customer_id"])
+
+    run = SegmentRun(
+        started_at=now,
+        tenant_id=current_tenant.get(),
+        full=full,
+        customers_scored=scored,
+        edges=json.dumps(edges) if full and edges else None,
+    )
+    db.session.add(run)
+    db.session.commit()
+
+    return {"full": full, "customers_scored": scored}
@@ -44,7 +44,7 @@ document.addEventListener("DOMContentLoaded", () => {
         <td>${p.category || ""}</td>
         <td>₹${Number(p.price).toFixed(2)}</td>
         <td>${p.stock}</td>
-        <td>${p.gst != null ? p.gst * 100 + "%" : "-"}</td>
+        <td>${p.gst != null ? p.gst + "%" : "-"}</td>
         <td class="actions">
           <button onclick="editProduct(${p.id})">Edit</button>
           <button onclick="deleteProduct(${p.id})" style="background:#ff6b6b;color:#fff">Delete</button>
@@ -123,14 +123,19 @@ document.addEventListener("DOMContentLoaded", () => {
       category: pCategory.value,
       price: parseFloat(pPrice.value),
       stock: parseInt(pStock.value),
-      gst: pGst.value ? parseFloat(pGst.value) / 100 : null,
+      gst: pGst.value ? parseFloat(pGst.value) : null,
     };
     const url = editingId ? `/products/api/${editingId}` : "/products/api";
-    await fetch(url, {
+    const res = await fetch(url, {
       method: editingId ? "PUT" : "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(payload),
     });
+    if (!res.ok) {
+      const data = await res.json().catch(() => ({}));
+      alert(data.error || "Save failed");
+      return;
+    }
     modal.classList.remove("open");
     loadProducts();
   };
@@ -143,7 +148,7 @@ document.addEventListener("DOMContentLoaded", () => {
     pCategory.value = p.category || "";
     pPrice.value = p.price;
     pStock.value = p.stock;
-    pGst.value = p.gst ? p.gst * 100 : "";
+    pGst.value = p.gst ?? "";
     modal.classList.add("open");
   };
 
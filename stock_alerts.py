@@ -0,0 +1,243 @@
+# stock_alerts.py
+"""
+Low-stock alerts maintained at commit time.
+
+A product is low when ``stock < reorder_level`` (Product.reorder_level,
+default 5). Instead of scanning the catalogue on every dashboard poll,
+the ``low_stock`` table holds exactly the products below their level:
+when a session commits, the products whose stock, reorder level or name
+it changed (ORM flushes, ORM bulk update/delete through db.session) are
+re-evaluated in the same transaction, and only those rows are
+inserted, updated or removed. Reads are then O(low products).
+
+Crossing the threshold in either direction publishes an event to the
+subscribers of ``alerts`` after the commit succeeds:
+
+    alerts.subscribe(lambda event: ...)   # {"event": "low" | "restocked", "tenant_id": ...}
+
+Rows and events carry the product's store; in a request the set is read
+and maintained for the current store only (see tenancy.py).
+
+Writes that bypass the session (raw SQL, Core inserts like the benchmark
+data generator) are not seen; ``rebuild_low_stock`` (``flask
+low-stock-rebuild``) recomputes the table from Product.
+"""
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from database import current_tenant
+from models import db, Product, LowStock
+
+log = logging.getLogger(__name__)
+
+ID_CHUNK = 500
+
+_TOUCHED = "_low_stock_touched"
+_EVENTS = "_low_stock_events"
+_ALL = "*"
+_WATCHED = ("stock", "reorder_level", "name")
+
+
+class AlertBus:
+    """In-process publish / subscribe, with the last few events kept."""
+
+    def __init__(self, keep=100):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.recent = deque(maxlen=keep)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def publish(self, events):
+        with self._lock:
+            self.recent.extend(events)
+            subscribers = list(self._subscribers)
+        for item in events:
+            for callback in subscribers:
+                try:
+                    callback(item)
+                except Exception:
+                    # a broken subscriber must not fail the request that committed
+                    log.exception("low-stock subscriber failed")
+
+
+alerts = AlertBus()
+
+
+# ==========================
+# Change tracking
+# ==========================
+def _after_flush(session, flush_context):
+    touched = session.info.setdefault(_TOUCHED, set())
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, Product):
+            touched.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _WATCHED):
+                touched.add(obj.id)
+
+
+def _do_orm_execute(state):
+    table = getattr(state.statement, "table", None)
+    if (state.is_update or state.is_delete) and getattr(table, "name", None) == Product.__tablename__:
+        state.session.info.setdefault(_TOUCHED, set()).add(_ALL)
+
+
+def _before_commit(session):
+    if not session.info.get(_TOUCHED) and not session.new and not session.dirty and not session.deleted:
+        return
+    session.flush()  # pending Product changes land in _TOUCHED
+    touched = session.info.pop(_TOUCHED, None)
+    if touched:
+        events = rebuild_low_stock(session) if _ALL in touched else _sync(session, touched)
+        session.info.setdefault(_EVENTS, []).extend(events)
+
+
+def _after_commit(session):
+    events = session.info.pop(_EVENTS, None)
+    if events:
+        alerts.publish(events)
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED, None)
+    session.info.pop(_EVENTS, None)
+
+
+# ==========================
+# Maintaining the set
+# ==========================
+def _event(kind, product_id, name, stock, reorder_level, tenant_id, now):
+    return {"event": kind, "product_id": product_id, "name": name, "stock": stock,
+            "reorder_level": reorder_level, "tenant_id": tenant_id, "at": now.isoformat()}
+
+
+def _select_products():
+    return db.select(Product.id, Product.name, Product.stock, Product.reorder_level, Product.tenant_id)
+
+
+def _select_low():
+    return db.select(LowStock.product_id, LowStock.name, LowStock.stock, LowStock.reorder_level,
+                     LowStock.tenant_id)
+
+
+def _apply(session, current, low, now):
+    """Bring low_stock rows for the products in ``current`` (their existing
+    rows) in line with ``low`` ({id: (name, stock, level, tenant)}); return events."""
+    table = LowStock.__table__
+    events = []
+    inserts, updates = [], []
+    for product_id, (name, stock, level, tenant_id) in low.items():
+        row = {"product_id": product_id, "name": name, "stock": stock, "reorder_level": level,
+               "tenant_id": tenant_id}
+        if product_id in current:
+            if current[product_id] != (name, stock, level, tenant_id):
+                updates.append(row)
+        else:
+            inserts.append({**row, "since": now})
+            events.append(_event("low", product_id, name, stock, level, tenant_id, now))
+    gone = [product_id for product_id in current if product_id not in low]
+
+    if inserts:
+        session.execute(table.insert(), inserts)
+    for row in updates:
+        session.execute(table.update().where(table.c.product_id == row["product_id"]).values(**row))
+    for i in range(0, len(gone), ID_CHUNK):
+        chunk = gone[i:i + ID_CHUNK]
+        session.execute(table.delete().where(table.c.product_id.in_(chunk)))
+        now_at = {
+            product_id: (name, stock, level, tenant_id)
+            for product_id, name, stock, level, tenant_id in session.execute(
+                _select_products().where(Product.id.in_(chunk))
+            )
+        }
+        for product_id in chunk:
+            # deleted products keep their last known name, with no stock
+            name, _, level, tenant_id = current[product_id]
+            name, stock, level, tenant_id = now_at.get(product_id, (name, None, level, tenant_id))
+            events.append(_event("restocked", product_id, name, stock, level, tenant_id, now))
+    return events
+
+
+def _sync(session, product_ids):
+    """Re-evaluate just ``product_ids`` (deleted products drop out)."""
+    now = datetime.utcnow()
+    ids = sorted(product_ids)
+    events = []
+    for i in range(0, len(ids), ID_CHUNK):
+        chunk = ids[i:i + ID_CHUNK]
+        low = {
+            product_id: tuple(row)
+            for product_id, *row in session.execute(
+                _select_products().where(Product.id.in_(chunk), Product.stock < Product.reorder_level)
+            )
+        }
+        current = {
+            product_id: tuple(row)
+            for product_id, *row in session.execute(_select_low().where(LowStock.product_id.in_(chunk)))
+        }
+        events.extend(_apply(session, current, low, now))
+    return events
+
+
+def rebuild_low_stock(session=None):
+    """Recompute the whole low_stock table from Product (the current
+    store's part of it in a request); returns the events."""
+    session = session or db.session
+    now = datetime.utcnow()
+    low = {
+        product_id: tuple(row)
+        for product_id, *row in session.execute(
+            _select_products().where(Product.stock < Product.reorder_level)
+        )
+    }
+    current = {product_id: tuple(row) for product_id, *row in session.execute(_select_low())}
+    return _apply(session, current, low, now)
+
+
+# ==========================
+# Reads
+# ==========================
+def low_stock_query():
+    """Low products, lowest stock first, as (id, name, stock, reorder_level) rows."""
+    return db.session.query(
+        LowStock.product_id.label("id"),
+        LowStock.name,
+        LowStock.stock,
+        LowStock.reorder_level,
+    ).order_by(LowStock.stock, LowStock.product_id)
+
+
+def recent_alerts():
+    """The latest threshold crossings, newest first (the current store's in a request)."""
+    tenant = current_tenant.get()
+    return [e for e in list(alerts.recent)[::-1] if tenant is None or e["tenant_id"] == tenant]
+
+
+_events_installed = False
+
+
+def init_stock_alerts(app, db):
+    """Keep low_stock in step with Product on every db.session commit."""
+    global _events_installed
+
+    if not _events_installed:
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "do_orm_execute", _do_orm_execute)
+        event.listen(db.session, "before_commit", _before_commit)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_rollback", _after_rollback)
+        _events_installed = True
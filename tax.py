@@ -0,0 +1,129 @@
+# tax.py
+"""
+GST computation in integer paise.
+
+Rates are held as basis points (18 % = 1800) and money as integer paise,
+so a line's tax is ``round_half_up(taxable * rate_bp / 10000)`` in exact
+integer arithmetic and bill totals are plain sums: no float drift between
+the lines, the bill, the invoice and the reports.
+
+``compute_tax`` takes NumPy columns for any number of lines (one bill or a
+whole import / backfill batch, grouped by ``bill_index``) and returns the
+per-line tax, per-bill totals and the per-rate-slab breakdown in one
+vectorized pass.
+
+Product.gst is stored as a percentage (18.0). Rates are always read as
+percentages: 18, "18" and "18%" are 18 %, and 0.25 is a quarter of a
+percent, never 25 %.
+"""
+from numbers import Real
+
+import numpy as np
+
+DEFAULT_RATE_BP = 1800
+MAX_RATE_BP = 10000  # 100 %
+
+
+# ==========================
+# Rates and money
+# ==========================
+def rate_to_bp(percent, default=DEFAULT_RATE_BP):
+    """Basis points for a GST percentage (18, 1.5, "18", "18 %").
+
+    ``None`` / "" give ``default``. Raises ValueError for anything else
+    that is not a number from 0 to 100.
+    """
+    if percent is None:
+        return default
+    if isinstance(percent, str):
+        text = percent.strip().removesuffix("%").strip()
+        if not text:
+            return default
+        try:
+            percent = float(text)
+        except ValueError:
+            raise ValueError(f"GST rate is not a number: {percent!r}") from None
+    if isinstance(percent, bool) or not isinstance(percent, Real):
+        raise ValueError(f"GST rate is not a number: {percent!r}")
+    if not 0 <= percent <= MAX_RATE_BP / 100:  # also rejects NaN
+        raise ValueError(f"GST rate must be from 0 to 100 %, got {percent}")
+    return int(round(percent * 100))
+
+
+def normalize_rate(percent, default=DEFAULT_RATE_BP):
+    """The percentage stored in Product.gst, to the basis point."""
+    return rate_to_bp(percent, default) / 100
+
+
+def to_paise(amount):
+    """Rupees (float or array) -> integer paise, rounding half away from zero."""
+    amount = np.asarray(amount, dtype=np.float64)
+    # the epsilon keeps 0.285 (really 0.28499999...) rounding to 29 paise
+    paise = np.floor(np.abs(amount) * 100 + 0.5 + 1e-7) * np.sign(amount)
+    return paise.astype(np.int64) if paise.ndim else int(paise)
+
+
+def to_rupees(paise):
+    return None if paise is None else paise / 100
+
+
+# ==========================
+# Engine
+# ==========================
+def compute_tax(unit_price_paise, quantity, rate_bp, bill_index=None, n_bills=None):
+    """Tax for a batch of lines.
+
+    All inputs are equal-length integer columns. ``bill_index`` (0..n-1)
+    groups lines into bills; without it every line belongs to one bill.
+
+    Returns a dict of arrays:
+
+    ``taxable``, ``tax``         per line, paise
+    ``bill_taxable``, ``bill_tax``, ``bill_total``   per bill, paise
+    ``slab_bill``, ``slab_rate_bp``, ``slab_taxable``, ``slab_tax``
+        one row per (bill, rate) present, sorted by bill then rate
+    """
+    price = np.asarray(unit_price_paise, dtype=np.int64)
+    quantity = np.asarray(quantity, dtype=np.int64)
+    rate = np.asarray(rate_bp, dtype=np.int64)
+    if bill_index is None:
+        bill_index = np.zeros(len(price), dtype=np.int64)
+    else:
+        bill_index = np.asarray(bill_index, dtype=np.int64)
+    if n_bills is None:
+        n_bills = int(bill_index.max()) + 1 if len(bill_index) else 0
+
+    taxable = price * quantity
+    # round half up; taxable and rate are non-negative
+    tax = (taxable * rate + 5000) // 10000
+
+    # bincount sums in float64: exact below 2**53 paise per bill / slab
+    bill_taxable = np.bincount(bill_index, weights=taxable, minlength=n_bills).astype(np.int64)
+    bill_tax = np.bincount(bill_index, weights=tax, minlength=n_bills).astype(np.int64)
+
+    # (bill, rate) slabs: rates fit in 14 bits, so pack both into one key
+    key = bill_index * (MAX_RATE_BP + 1) + rate
+    slabs, inverse = np.unique(key, return_inverse=True)
+
+    return {
+        "taxable": taxable,
+        "tax": tax,
+        "bill_taxable": bill_taxable,
+        "bill_tax": bill_tax,
+        "bill_total": bill_taxable + bill_tax,
+        "slab_bill": slabs // (MAX_RATE_BP + 1),
+        "slab_rate_bp": slabs % (MAX_RATE_BP + 1),
+        "slab_taxable": np.bincount(inverse, weights=taxable, minlength=len(slabs)).astype(np.int64),
+        "slab_tax": np.bincount(inverse, weights=tax, minlength=len(slabs)).astype(np.int64),
+    }
+
+
+def slab_summary(result, bill=0):
+    """JSON-ready per-rate breakdown of one bill from ``compute_tax``."""
+    mask = result["slab_bill"] == bill
+    return [
+        {"rate": rate / 100, "taxable": taxable / 100, "tax": tax / 100}
+        for rate, taxable, tax in zip(result["slab_rate_bp"][mask].tolist(),
+                                      result["slab_taxable"][mask].tolist(),
+                                      result["slab_tax"][mask].tolist())
+    ]
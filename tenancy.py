@@ -0,0 +1,353 @@
+# tenancy.py
+"""
+Stores (tenants): several outlets on one app, each seeing only its own data.
+
+Products, bills, bill items, customers, their activity, the stock ledger
+and snapshots, and the rollups built from them (low_stock,
+reorder_suggestion, customer_segments, archive_daily_sales) carry a
+tenant_id; users belong to one store. Each request runs for its
+user's store (``current_tenant``, tenant 1 when nobody is logged in) and
+every ORM query it makes through db.session gets ``tenant_id = :tenant``
+added for those models, aliases and archive partitions included, so
+views need no changes and one store's rows never show up in another's.
+New rows default to the current store. The indexes the views use lead
+on tenant_id, so a store's queries read its own rows only, however many
+the other stores have.
+
+Outside requests (CLI commands, batch jobs, benchmarks) no tenant is set
+and queries see every store; ``tenant_context(id)`` scopes a block.
+Core statements are not rewritten: code that runs them filters with
+``tenant_criteria(table.c.tenant_id)``.
+
+Caches follow the store: HTTP revisions (http_cache.py), the sales cube
+(analytics.py) and low-stock events are kept per tenant.
+
+With TENANT_DATABASES=1 every store except the main one gets its own
+SQLite file in TENANT_DATABASE_DIR (default <database>-tenants/), with
+its own archive and backups folders next to it; db.session sends that
+store's queries there (database.TenantSession), while users and the
+store list stay in the main database. ``flask tenants create`` makes
+and migrates the file; run batch commands for every file with
+
+    flask tenants each archive-bills
+    flask tenants upgrade            # after deploying new migrations
+
+The main store's users administer the host: the /admin tools that act
+on the database as a whole (backups, profiles) are ``admin_required``.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import create_engine, event, or_
+from sqlalchemy.orm import with_loader_criteria
+
+from archive import attach_archive
+from database import apply_sqlite_profile, current_tenant, engine_options, pool_settings_from_env
+from models import (
+    db,
+    DEFAULT_TENANT_ID,
+    ArchiveDailySales,
+    Bill,
+    BillItem,
+    Customer,
+    CustomerActivity,
+    CustomerSegment,
+    LowStock,
+    Product,
+    ReorderSuggestion,
+    StockMovement,
+    StockSnapshot,
+    StockSnapshotRun,
+    Tenant,
+    User,
+)
+
+TENANT_MODELS = (
+    Product, Bill, BillItem, Customer, CustomerActivity,
+    StockMovement, StockSnapshot, StockSnapshotRun,
+    CustomerSegment, LowStock, ReorderSuggestion, ArchiveDailySales,
+)
+FILE_PATTERN = "tenant_{id}.db"
+
+
+# ==========================
+# Current tenant
+# ==========================
+@contextmanager
+def tenant_context(tenant_id):
+    """Run the block for store ``tenant_id`` (None: every store)."""
+    token = current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+def tenant_criteria(column):
+    """``(column == current tenant,)`` for Core statements; () outside a tenant."""
+    tenant = current_tenant.get()
+    return () if tenant is None else (column == tenant,)
+
+
+def tenant_runs(model):
+    """Query of a batch run log (SegmentRun, ReorderRun) limited to the runs
+    that covered the current store: its own and those over every store."""
+    tenant = current_tenant.get()
+    if tenant is None:
+        return model.query.filter(model.tenant_id.is_(None))
+    return model.query.filter(or_(model.tenant_id.is_(None), model.tenant_id == tenant))
+
+
+def _scope_to_tenant(state):
+    tenant = current_tenant.get()
+    if tenant is None:
+        return
+    if (state.is_select and not state.is_column_load and not state.is_relationship_load) \
+            or state.is_update or state.is_delete:
+        state.statement = state.statement.options(*[
+            with_loader_criteria(model, lambda cls: cls.tenant_id == tenant, include_aliases=True)
+            for model in TENANT_MODELS
+        ])
+
+
+def _enter_tenant():
+    if request.endpoint == "static":
+        return
+    tenant = getattr(current_user, "tenant_id", None) or DEFAULT_TENANT_ID
+    g._tenant_token = current_tenant.set(tenant)
+
+
+def _leave_tenant(exc=None):
+    token = g.pop("_tenant_token", None)
+    if token is not None:
+        current_tenant.reset(token)
+
+
+def is_admin():
+    """Whether the request's user is one of the main store's."""
+    if current_app.config.get("LOGIN_DISABLED"):
+        return True
+    return current_user.is_authenticated and current_user.tenant_id == DEFAULT_TENANT_ID
+
+
+def admin_required(view):
+    """login_required, and a 403 for the users of every other store."""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            return jsonify({"error": "only the main store's users can do this"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ==========================
+# Database per tenant
+# ==========================
+class TenantDatabases:
+    """Engines of the stores kept in their own SQLite file, opened on first use.
+
+    The main store (tenant 1) stays in the main database.
+    """
+
+    def __init__(self, app, directory):
+        self.app = app
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._engines = {}
+        # callables run on every engine as it is opened (e.g. instrumentation's SQL hooks)
+        self.on_open = []
+
+    def path(self, tenant_id):
+        return os.path.join(self.directory, FILE_PATTERN.format(id=tenant_id))
+
+    def _folder(self, tenant_id, key, suffix):
+        configured = self.app.config.get(key)
+        if configured:
+            return os.path.join(configured, f"tenant_{tenant_id}")
+        return os.path.join(self.directory, f"tenant_{tenant_id}-{suffix}")
+
+    def archive_dir(self, tenant_id):
+        """The store's archive folder; None for stores in the main database."""
+        if tenant_id is None or tenant_id == DEFAULT_TENANT_ID:
+            return None
+        return self._folder(tenant_id, "ARCHIVE_DIR", "archive")
+
+    def backup_dir(self, tenant_id):
+        if tenant_id is None or tenant_id == DEFAULT_TENANT_ID:
+            return None
+        return self._folder(tenant_id, "BACKUP_DIR", "backups")
+
+    def engine(self, tenant_id):
+        """The store's engine; None for stores in the main database."""
+        if tenant_id is None or tenant_id == DEFAULT_TENANT_ID:
+            return None
+        engine = self._engines.get(tenant_id)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(tenant_id) or self._open(tenant_id)
+        return engine
+
+    def _open(self, tenant_id):
+        path = self.path(tenant_id)
+        new = not os.path.exists(path)
+        os.makedirs(self.directory, exist_ok=True)
+        url = "sqlite:///" + path
+        profile = self.app.config["SQLITE_PROFILE"]
+        engine = create_engine(url, **engine_options(url, profile, pool_settings_from_env()))
+        apply_sqlite_profile(engine, profile)
+        attach_archive(engine, self.archive_dir(tenant_id))
+        for hook in self.on_open:
+            hook(engine)
+        if new:
+            self.upgrade(engine)
+        self._engines[tenant_id] = engine
+        return engine
+
+    def upgrade(self, engine):
+        """Migrate a store's file to the latest revision (migrations/env.py
+        takes the engine from the alembic config)."""
+        from alembic import command
+
+        config = self.app.extensions["migrate"].migrate.get_config()
+        config.attributes["engine"] = engine
+        with self.app.app_context():
+            command.upgrade(config, "head")
+
+    def tenants(self):
+        """Ids of the stores with a database file."""
+        with self.app.app_context():
+            ids = db.session.execute(db.select(Tenant.id).order_by(Tenant.id)).scalars().all()
+            db.session.remove()
+        return [t for t in ids if t != DEFAULT_TENANT_ID and os.path.exists(self.path(t))]
+
+    def dispose(self):
+        # fork handler: the child must not share the parent's pooled connections
+        for engine in list(self._engines.values()):
+            engine.dispose(close=False)
+
+
+def _database_directory(app):
+    directory = app.config.get("TENANT_DATABASE_DIR")
+    if directory:
+        return directory
+    with app.app_context():
+        engine = db.engine
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    if not path or path == ":memory:":
+        raise RuntimeError("TENANT_DATABASES needs a SQLite database file (or TENANT_DATABASE_DIR)")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), f"{stem}-tenants")
+
+
+# ==========================
+# CLI
+# ==========================
+def _register_cli(app):
+    import click
+
+    @app.cli.group("tenants")
+    def tenants_group():
+        """Stores (tenants) and their databases."""
+
+    @tenants_group.command("list")
+    def list_tenants():
+        databases = current_app.extensions.get("tenant_databases")
+        users = dict(db.session.execute(
+            db.select(User.tenant_id, db.func.count(User.id)).group_by(User.tenant_id)).all())
+        for tenant in Tenant.query.order_by(Tenant.id):
+            where = "main database"
+            if databases is not None and tenant.id != DEFAULT_TENANT_ID:
+                where = databases.path(tenant.id)
+            click.echo(f"{tenant.id:>4}  {tenant.slug:<20} {tenant.name:<30} {users.get(tenant.id, 0):>4} users  {where}")
+
+    @tenants_group.command("create")
+    @click.argument("name")
+    @click.option("--slug", default=None, help="Short unique name (default: from NAME).")
+    def create_tenant(name, slug):
+        """Add a store (and its database file with TENANT_DATABASES)."""
+        slug = slug or "-".join(name.lower().split())
+        tenant = Tenant(name=name, slug=slug)
+        db.session.add(tenant)
+        db.session.commit()
+        databases = current_app.extensions.get("tenant_databases")
+        if databases is not None:
+            databases.engine(tenant.id)
+            click.echo(f"database {databases.path(tenant.id)}")
+        click.echo(f"store {tenant.id} ({tenant.slug}) created")
+
+    @tenants_group.command("assign")
+    @click.argument("email")
+    @click.argument("tenant")
+    def assign_user(email, tenant):
+        """Move a user to a store (id or slug)."""
+        from user_cache import user_cache
+
+        store = db.session.get(Tenant, int(tenant)) if tenant.isdigit() else Tenant.query.filter_by(slug=tenant).first()
+        user = User.query.filter_by(email=email).first()
+        if store is None or user is None:
+            raise click.ClickException("no such store" if store is None else "no such user")
+        user.tenant_id = store.id
+        db.session.commit()
+        user_cache.expire_all()  # workers serving this user reload it on the next request
+        click.echo(f"{email} now works for {store.slug}")
+
+    @tenants_group.command("upgrade")
+    def upgrade_tenants():
+        """Migrate every store's database file (TENANT_DATABASES)."""
+        databases = current_app.extensions.get("tenant_databases")
+        for tenant in databases.tenants() if databases is not None else []:
+            databases.upgrade(databases.engine(tenant))
+            click.echo(f"store {tenant}: {databases.path(tenant)} upgraded")
+
+    @tenants_group.command("each", context_settings={"ignore_unknown_options": True})
+    @click.argument("command")
+    @click.argument("args", nargs=-1, type=click.UNPROCESSED)
+    @click.pass_context
+    def each_database(ctx, command, args):
+        """Run a flask command on the main database, then once per store file.
+
+        Without TENANT_DATABASES there is only the main database, and the
+        command runs once, over every store.
+        """
+        root = ctx.find_root()
+        cmd = root.command.get_command(root, command)
+        if cmd is None:
+            raise click.ClickException(f"no such command: {command}")
+        databases = current_app.extensions.get("tenant_databases")
+        for tenant in [None] + (databases.tenants() if databases is not None else []):
+            click.echo(f"== {'main database' if tenant is None else databases.path(tenant)}")
+            with tenant_context(tenant):
+                with cmd.make_context(command, list(args), parent=ctx) as sub:
+                    cmd.invoke(sub)
+                db.session.remove()
+
+
+# ==========================
+# Setup
+# ==========================
+_events_installed = False
+
+
+def init_tenancy(app, db):
+    """Scope requests to the user's store; open per-store databases when
+    TENANT_DATABASES is on."""
+    global _events_installed
+
+    if not _events_installed:
+        event.listen(db.session, "do_orm_execute", _scope_to_tenant)
+        _events_installed = True
+    app.before_request(_enter_tenant)
+    app.teardown_request(_leave_tenant)
+
+    if app.config.get("TENANT_DATABASES"):
+        databases = TenantDatabases(app, _database_directory(app))
+        app.extensions["tenant_databases"] = databases
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=databases.dispose)
+
+    _register_cli(app)
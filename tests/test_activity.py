@@ -0,0 +1,34 @@
+# tests/test_activity.py
+"""The customer activity writer (activity.py)."""
+from sqlalchemy import create_engine, select
+
+from activity import ActivityLog
+from models import CustomerActivity
+
+
+def test_writer_survives_a_failed_batch(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'activity.db'}")
+    CustomerActivity.__table__.create(engine)
+    calls = []
+
+    def tenant_engine(tenant_id):
+        calls.append(tenant_id)
+        if len(calls) == 1:
+            raise RuntimeError("store database unreachable")
+        return None
+
+    activity_log = ActivityLog(engine, flush_ms=1, tenant_engine=tenant_engine)
+    try:
+        assert activity_log.log(1, "profile_viewed")
+        assert activity_log.flush()
+        assert activity_log.log(2, "profile_viewed")
+        assert activity_log.flush()
+        assert activity_log._thread.is_alive()
+        stats = activity_log.stats()
+        assert (stats["failed"], stats["written"]) == (1, 1)
+        with engine.connect() as connection:
+            table = CustomerActivity.__table__
+            assert connection.execute(select(table.c.customer_id)).scalars().all() == [2]
+    finally:
+        activity_log.close()
+        engine.dispose()
@@ -0,0 +1,170 @@
+# tests/test_analytics.py
+"""The in-memory sales cube (analytics.py)."""
+import os
+import threading
+
+import pytest
+
+from analytics import WALK_IN, SalesCube, warm_sales_cubes
+from conftest import login, new_app, test_config
+from models import db, Bill, Customer, User
+from passwords import hash_password
+from routes.dashboard import _sales_metrics_sql
+from routes.reports import _sales_summary_sql
+from tenancy import tenant_context
+
+STORE = 1  # datagen's bills belong to the default store
+
+
+@pytest.fixture
+def slow_load(monkeypatch):
+    """Loads wait for ``release.set()``; ``started`` is set once one begins."""
+    started, release = threading.Event(), threading.Event()
+    load = SalesCube.load
+
+    def held(cube):
+        started.set()
+        assert release.wait(10), "load never released"
+        load(cube)
+
+    monkeypatch.setattr(SalesCube, "load", held)
+    yield started, release
+    release.set()
+
+
+def _cube(**options):
+    return SalesCube(256 * 2**20, tenant_id=STORE, **options)
+
+
+def _finish(cube):
+    cube._loader.join(10)
+    assert not cube._loader.is_alive()
+
+
+def test_cube_matches_sql(shop):
+    with shop.app_context(), tenant_context(STORE):
+        cube = _cube()
+        summary, sql = cube.summary(), _sales_summary_sql()
+        assert summary["total_bills"] == sql["total_bills"]
+        assert summary["total_sales"] == pytest.approx(float(sql["total_sales"]))
+        assert [d.date for d in summary["daily_sales"]] == [d.date for d in sql["daily_sales"]]
+        assert cube.totals()[1] == pytest.approx(float(_sales_metrics_sql()[0]))
+        db.session.remove()
+
+
+def test_background_load_answers_from_sql_meanwhile(shop, slow_load):
+    started, release = slow_load
+    with shop.app_context(), tenant_context(STORE):
+        cube = _cube(background=True)
+        assert cube.totals() is None  # returns at once: the caller uses SQL
+        assert started.wait(10)
+        assert cube.stats()["loading"] and not cube.stats()["loaded"]
+        assert cube.summary() is None
+
+        release.set()
+        _finish(cube)
+        assert cube.stats()["loaded"]
+        assert cube.totals()[1] == pytest.approx(float(_sales_metrics_sql()[0]))
+        db.session.remove()
+
+
+def test_reload_keeps_answering_from_the_old_cube(shop, slow_load):
+    started, release = slow_load
+    release.set()
+    with shop.app_context(), tenant_context(STORE):
+        cube = _cube(background=True)
+        cube.totals()
+        _finish(cube)
+        loaded_at = cube.loaded_at
+
+        release.clear()
+        started.clear()
+        cube.reload_seconds = 1e-9  # due at once
+        assert cube.totals() is not None  # the old cube, while the new one loads
+        assert started.wait(10)
+        release.set()
+        _finish(cube)
+        assert cube.loaded_at > loaded_at
+        db.session.remove()
+
+
+def test_dashboard_does_not_wait_for_the_load(shop, slow_load, tmp_path):
+    started, release = slow_load
+    app = new_app(test_config(str(tmp_path), ANALYTICS_CUBE_BACKGROUND=True,
+                              SQLALCHEMY_DATABASE_URI=shop.config["SQLALCHEMY_DATABASE_URI"]))
+    client = login(app.test_client())
+    while_loading = client.get("/dashboard/api/metrics")
+    assert while_loading.status_code == 200
+    assert started.wait(10)
+
+    release.set()
+    cube = app.extensions["sales_cubes"].get(STORE)
+    _finish(cube)
+    loaded = client.get("/dashboard/api/metrics")
+    assert loaded.get_json()["total_sales"] == pytest.approx(while_loading.get_json()["total_sales"])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_warmed_cubes_survive_fork(shop, tmp_path):
+    app = new_app(test_config(str(tmp_path), SQLALCHEMY_DATABASE_URI=shop.config["SQLALCHEMY_DATABASE_URI"]))
+    timings = warm_sales_cubes(app)
+    assert list(timings) == [STORE]
+    cube = app.extensions["sales_cubes"].get(STORE)
+    with app.app_context(), tenant_context(STORE):
+        expected = cube.totals()
+        db.session.remove()
+
+    pid = os.fork()
+    if pid == 0:  # a worker: answers from the inherited cube without loading it again
+        status = 1
+        try:
+            load_seconds = cube.load_seconds
+            with app.app_context():
+                db.engine.dispose(close=False)  # the parent's connections stay the parent's
+            with app.app_context(), tenant_context(STORE):
+                same = cube.totals() == expected and cube.load_seconds == load_seconds
+            status = 0 if same else 2
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def _spend(cube):
+    """{customer: total} over the cube's bills."""
+    spend = {}
+    for customer, total in zip(cube.bills["customer"].tolist(), cube.bills["total"].tolist()):
+        spend[customer] = spend.get(customer, 0.0) + total
+    return spend
+
+
+def test_crm_relink_reloads_every_workers_cube(make_app, tmp_path):
+    revisions = str(tmp_path / "analytics.rev")
+    app = make_app(ANALYTICS_CUBE_REVISIONS=revisions)
+    with app.app_context():
+        db.session.add_all([
+            User(name="Owner", email="owner@example.com", password=hash_password("secret")),
+            Customer(name="Asha", phone="1"),
+            Bill(customer_name="asha", total=50.0),
+            Bill(customer_name="Walk-in", total=20.0),
+        ])
+        db.session.commit()
+        customer_id = Customer.query.one().id
+        db.session.remove()
+    # another worker on the same database and revision file
+    other = new_app(test_config(str(tmp_path), ANALYTICS_CUBE_REVISIONS=revisions,
+                                SQLALCHEMY_DATABASE_URI=app.config["SQLALCHEMY_DATABASE_URI"]))
+    cubes = [a.extensions["sales_cubes"].get(STORE) for a in (app, other)]
+    for a, cube in zip((app, other), cubes):
+        with a.app_context(), tenant_context(STORE):
+            assert cube.totals() == (2, 70.0)
+            assert _spend(cube) == {WALK_IN: 70.0}
+            db.session.remove()
+
+    client = login(app.test_client(), "owner@example.com", "secret")
+    assert client.post("/crm/admin/rebuild-crm").status_code == 200
+    for a, cube in zip((app, other), cubes):
+        with a.app_context(), tenant_context(STORE):
+            assert cube.totals() == (2, 70.0)
+            assert _spend(cube) == {WALK_IN: 20.0, customer_id: 50.0}
+            db.session.remove()
@@ -0,0 +1,93 @@
+# tests/test_archive.py
+"""Hot / cold partitioning of bill history (archive.py)."""
+from datetime import datetime
+
+import pytest
+from flask_migrate import downgrade, upgrade
+
+import datagen
+from archive import _month_start, archive_bills, find_archived_bill
+from conftest import SHOP_BILLS, login
+from models import db, ArchivePartition, Bill, BillItem
+
+REPORT_COUNTS = ("daily_labels", "top_product_names", "top_product_sales", "total_bills", "months",
+                 "current_month_bills", "previous_month_bills")
+REPORT_AMOUNTS = ("daily_revenue", "total_sales", "current_month_revenue", "previous_month_revenue")
+
+
+def _figures(client):
+    """(/reports/data, /dashboard/api/metrics) figures that archiving must keep."""
+    report = client.get("/reports/data").get_json()
+    dashboard = client.get("/dashboard/api/metrics").get_json()
+    return (
+        {key: report[key] for key in REPORT_COUNTS},
+        {key: report[key] for key in REPORT_AMOUNTS},
+        (dashboard["bills_today"], dashboard["total_sales"], dashboard["today_sales"]),
+    )
+
+
+def _bill(bill, items):
+    return (bill.customer_name, bill.bill_date, bill.total,
+            sorted((i.product_id, i.quantity, i.subtotal, i.tax_paise) for i in items))
+
+
+def test_archiving_a_month_keeps_every_figure(make_app):
+    # the cube off: reports and dashboard read the tables and the archive
+    app = make_app(ANALYTICS_CUBE=False)
+    datagen.generate(app, SHOP_BILLS, seed=7, progress=False)
+    client = login(app.test_client())
+    with app.app_context():
+        oldest = Bill.query.order_by(Bill.bill_date).first()
+        expected = _bill(oldest, BillItem.query.filter_by(bill_id=oldest.id))
+        # archive the oldest bill's month and nothing after it
+        cutoff = _month_start(oldest.bill_date, 1)
+        now = datetime.utcnow()
+        months = now.year * 12 + now.month - (cutoff.year * 12 + cutoff.month)
+        in_month, hot = Bill.query.filter(Bill.bill_date < cutoff).count(), Bill.query.count()
+        oldest_id = oldest.id
+        db.session.remove()
+    counts, amounts, dashboard = _figures(client)
+
+    with app.app_context():
+        moved = archive_bills(months=months)
+        assert (moved["bills"], len(moved["months"])) == (in_month, 1)
+        assert Bill.query.count() == hot - in_month
+        assert _bill(*find_archived_bill(oldest_id)) == expected
+        partitions = [(p.year, p.bills, p.items, p.first_bill_id, p.last_bill_id) for p in ArchivePartition.query]
+        db.session.remove()
+
+    after = _figures(client)
+    assert after[0] == counts
+    assert after[1] == pytest.approx(amounts)
+    assert after[2] == pytest.approx(dashboard)
+    page = client.get(f"/billing/view/{oldest_id}")
+    assert page.status_code == 200
+    assert expected[0].encode() in page.data
+
+    with app.app_context():
+        again = archive_bills(months=months)
+        assert (again["bills"], again["months"]) == (0, [])
+        assert [(p.year, p.bills, p.items, p.first_bill_id, p.last_bill_id)
+                for p in ArchivePartition.query] == partitions
+        assert Bill.query.count() == hot - in_month
+        db.session.remove()
+    assert _figures(client)[0] == counts
+
+
+def test_migration_records_partition_bill_ids(make_app):
+    app = make_app()
+    with app.app_context():
+        db.session.add_all([Bill(customer_name="a", total=1.0, bill_date=datetime(2020, 3, 1)),
+                            Bill(customer_name="b", total=2.0, bill_date=datetime(2021, 5, 1)),
+                            Bill(customer_name="c", total=3.0, bill_date=datetime(2020, 7, 1))])
+        db.session.commit()
+        archive_bills(months=1)
+        expected = {p.year: (p.first_bill_id, p.last_bill_id) for p in ArchivePartition.query}
+        db.session.remove()
+
+        downgrade(revision="0011")
+        upgrade()
+        ids = {p.year: (p.first_bill_id, p.last_bill_id) for p in ArchivePartition.query}
+        db.session.remove()
+    assert expected == {2020: (1, 3), 2021: (2, 2)}
+    assert ids == expected
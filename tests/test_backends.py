@@ -0,0 +1,135 @@
+# tests/test_backends.py
+"""The app on each database backend (SQLite, PostgreSQL; see conftest.py)."""
+import os
+import re
+import shutil
+
+import pytest
+from alembic.script import ScriptDirectory
+from sqlalchemy import column, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from conftest import ROOT, login, new_app, test_config
+from database import (
+    SERVER_POOL, TUNED_POOL, day_bucket, engine_options, month_bucket, normalise_database_url,
+    upgrade_database,
+)
+from models import db, Bill, Product, StockMovement
+
+PAGES = (
+    "/dashboard/api/metrics",
+    "/reports/data",
+    "/reports/gst?format=json",
+    "/reports/gst?by=month&format=json",
+    "/billing/data",
+    "/billing/view/1",
+    "/billing/print/1",
+    "/products/api?q=Rice",
+    "/products/api/low-stock",
+    "/products/api/1/movements",
+    "/crm/api/customers",
+    "/crm/api/metrics",
+    "/crm/api/customer/1",
+    "/crm/api/customer/1/activity",
+)
+
+
+# ---- migrations ----
+def test_migrations_reach_head(make_app):
+    app = make_app()
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        current = db.session.execute(db.text("SELECT version_num FROM alembic_version")).scalar()
+        head = ScriptDirectory.from_config(app.extensions["migrate"].migrate.get_config()).get_current_head()
+    assert set(db.metadata.tables) <= tables
+    assert current == head
+
+
+def test_upgrade_is_repeatable(make_app):
+    app = make_app()
+    upgrade_database(app, db)  # already at head: nothing to do
+
+
+def test_pre_migration_database_is_adopted(tmp_path):
+    # instance/database.db predates migrations: no alembic_version, no
+    # customer_segments or segment_runs
+    path = tmp_path / "baseline.db"
+    shutil.copy(os.path.join(ROOT, "instance", "database.db"), path)
+    app = new_app(test_config(str(tmp_path), SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}"))
+    upgrade_database(app, db)
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        current = db.session.execute(db.text("SELECT version_num FROM alembic_version")).scalar()
+        head = ScriptDirectory.from_config(app.extensions["migrate"].migrate.get_config()).get_current_head()
+        gst = db.session.execute(db.text("SELECT gst FROM product WHERE id = 5")).scalar()
+        products = Product.query.count()
+        db.session.remove()
+    assert set(db.metadata.tables) <= tables
+    assert current == head
+    assert (products, gst) == (7, pytest.approx(18.0))  # rows kept and migrated
+
+
+# ---- pages ----
+@pytest.mark.parametrize("url", PAGES)
+def test_page(backend_shop, url):
+    client = login(backend_shop.test_client())
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data(as_text=True)[:500]
+
+
+def test_report_buckets(backend_shop):
+    data = login(backend_shop.test_client()).get("/reports/data").get_json()
+    assert data["daily_labels"] == sorted(data["daily_labels"])
+    assert all(re.fullmatch(r"\d{4}-\d{2}-\d{2}", d) for d in data["daily_labels"])
+    assert all(re.fullmatch(r"\d{4}-\d{2}", m) for m in data["months"])
+    assert sum(data["current_month_bills"]) == data["total_bills"]
+    assert sum(data["daily_revenue"]) == pytest.approx(data["total_sales"])
+
+
+def test_create_bill(backend_shop):
+    client = login(backend_shop.test_client())
+    with backend_shop.app_context():
+        product = Product.query.filter(Product.stock > 5).first()
+        product_id, stock = product.id, product.stock
+        db.session.remove()
+
+    response = client.post("/billing/create", json={"items": [{"id": product_id, "quantity": 2}]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    bill_id = response.get_json()["bill_id"]
+    assert client.get(f"/billing/view/{bill_id}").status_code == 200
+
+    with backend_shop.app_context():
+        assert db.session.get(Product, product_id).stock == stock - 2
+        assert db.session.get(Bill, bill_id).total == response.get_json()["total"]
+        moved = StockMovement.query.filter_by(product_id=product_id, bill_id=bill_id).one()
+        assert (moved.quantity, moved.kind) == (-2, "sale")
+        db.session.remove()
+
+
+# ---- dialects and settings ----
+@pytest.mark.parametrize("bucket, sqlite_sql, postgresql_sql", [
+    (day_bucket, "strftime('%Y-%m-%d', bill_date)", "to_char(bill_date, 'YYYY-MM-DD')"),
+    (month_bucket, "strftime('%Y-%m', bill_date)", "to_char(bill_date, 'YYYY-MM')"),
+])
+def test_date_buckets_compile(bucket, sqlite_sql, postgresql_sql):
+    expression = bucket(column("bill_date"))
+    assert str(expression.compile(dialect=sqlite.dialect())) == sqlite_sql
+    assert str(expression.compile(dialect=postgresql.dialect())) == postgresql_sql
+
+
+def test_engine_options():
+    assert engine_options("postgresql+psycopg2://u@h/db") == SERVER_POOL
+    assert engine_options("postgresql+psycopg2://u@h/db", pool={"pool_size": 3})["pool_size"] == 3
+    assert engine_options("sqlite:///shop.db")["pool_size"] == TUNED_POOL["pool_size"]
+    assert engine_options("sqlite:///shop.db", "default") == {}
+    assert engine_options("sqlite://") == {}  # in memory: Flask-SQLAlchemy's StaticPool
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("postgres://u:p@h/db", "postgresql+psycopg2://u:p@h/db"),
+    ("postgresql://u:p@h/db", "postgresql+psycopg2://u:p@h/db"),
+    ("postgresql+psycopg2://u:p@h/db", "postgresql+psycopg2://u:p@h/db"),
+    ("sqlite:///database.db", "sqlite:///database.db"),
+])
+def test_normalise_database_url(url, expected):
+    assert normalise_database_url(url) == expected
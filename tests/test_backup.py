@@ -0,0 +1,121 @@
+# tests/test_backup.py
+"""Online backups and their retention (backup.py)."""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import backup
+from archive import archive_bills
+from backup import MANIFEST, NAME_FORMAT, PARTIAL, BackupError, backup_database, list_backups, prune_backups
+from conftest import login
+from models import db, Bill, Tenant, User
+from passwords import hash_password
+
+EMAIL, PASSWORD = "owner@example.com", "secret"
+
+
+@pytest.fixture(scope="module")
+def database_backend():
+    return "sqlite"  # online backups use SQLite's backup API; pg_dump elsewhere
+
+
+@pytest.fixture
+def app(make_app):
+    """A store with a bill this year and one archived in 2020."""
+    app = make_app()
+    with app.app_context():
+        db.session.add_all([User(name="Owner", email=EMAIL, password=hash_password(PASSWORD)),
+                            Bill(customer_name="old", total=1.0, bill_date=datetime(2020, 3, 1)),
+                            Bill(customer_name="new", total=2.0)])
+        db.session.commit()
+        archive_bills(months=1)
+        db.session.remove()
+    return app
+
+
+def _count(path, table="bill"):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_backup_copies_the_database_and_its_archive(app):
+    with app.app_context():
+        manifest = backup_database()
+        directory = os.path.join(app.extensions["backup_dir"], manifest["name"])
+        assert list_backups() == [{k: v for k, v in manifest.items() if k != "pruned"}]
+        db.session.remove()
+    assert manifest["check"] == "integrity"
+    assert [f["path"] for f in manifest["files"]] == ["test.db", "archive/bills_2020.db"]
+    assert _count(os.path.join(directory, "test.db")) == 1
+    assert _count(os.path.join(directory, "archive", "bills_2020.db")) == 1
+    assert _count(os.path.join(directory, "test.db"), "archive_partitions") == 1
+
+
+def test_a_corrupt_copy_leaves_nothing_behind(app, monkeypatch):
+    copy = backup._copy
+
+    def corrupting(source, path, pages, pause_ms, stats):
+        page_count = copy(source, path, pages, pause_ms, stats)
+        with open(path, "r+b") as f:  # garble every page but the header's
+            page_size = int.from_bytes(f.read(18)[16:18], "big")
+            for page in range(1, page_count):
+                f.seek(page * page_size)
+                f.write(b"\xff" * 64)
+        return page_count
+
+    monkeypatch.setattr(backup, "_copy", corrupting)
+    with app.app_context():
+        with pytest.raises(BackupError, match="integrity_check"):
+            backup_database()
+        db.session.remove()
+    assert os.listdir(app.extensions["backup_dir"]) == []
+
+
+def _fake_backups(directory, times):
+    for moment in times:
+        name = moment.strftime(NAME_FORMAT)
+        os.makedirs(os.path.join(directory, name))
+        with open(os.path.join(directory, name, MANIFEST), "w") as f:
+            json.dump({"name": name}, f)
+
+
+def test_prune_keeps_the_newest_and_one_per_week(tmp_path):
+    now = datetime(2026, 10, 19, 2)  # a Monday
+    # two a day for the last three weeks, newest first
+    times = [now - timedelta(hours=12 * i) for i in range(42)]
+    _fake_backups(tmp_path, times)
+    os.makedirs(tmp_path / ("20261001T020000Z" + PARTIAL))  # a crashed run, a day old or more
+    os.utime(tmp_path / ("20261001T020000Z" + PARTIAL), (0, 0))
+    os.makedirs(tmp_path / ("20261019T010000Z" + PARTIAL))  # one still running
+
+    pruned = prune_backups(str(tmp_path), keep=3, keep_weekly=3, now=now)
+
+    kept = [b["name"] for b in list_backups(str(tmp_path))]
+    # this week's and last week's newest are among the newest three; the
+    # week before's is Sunday 11 October, 14:00
+    assert kept == [t.strftime(NAME_FORMAT) for t in times[:3]] + ["20261011T140000Z"]
+    assert sorted(pruned + kept) == sorted(t.strftime(NAME_FORMAT) for t in times)
+    assert sorted(os.listdir(tmp_path)) == sorted(kept + ["20261019T010000Z" + PARTIAL])
+
+
+def test_backups_are_for_the_main_store(app):
+    with app.app_context():
+        store = Tenant(name="Other store", slug="other")
+        db.session.add(store)
+        db.session.flush()
+        db.session.add(User(name="Other", email="other@example.com", password=hash_password(PASSWORD),
+                            tenant_id=store.id))
+        db.session.commit()
+        db.session.remove()
+
+    other = login(app.test_client(), "other@example.com", PASSWORD)
+    assert other.get("/admin/backups").status_code == 403
+    assert other.post("/admin/backups").status_code == 403
+    owner = login(app.test_client(), EMAIL, PASSWORD)
+    assert owner.get("/admin/backups").get_json()["backups"] == []
@@ -0,0 +1,38 @@
+# tests/test_crm.py
+"""CRM views (routes/crm.py)."""
+import os
+
+import pytest
+
+from conftest import login
+from models import db
+
+
+@pytest.fixture(scope="module")
+def client(shop):
+    return login(shop.test_client())
+
+
+def _total_customers(client):
+    return client.get("/crm/api/metrics").get_json()["total_customers"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_new_customer_reaches_every_workers_summary(shop, client):
+    before = _total_customers(client)
+    assert _total_customers(client) == before  # cached now
+
+    pid = os.fork()
+    if pid == 0:  # another worker adds a customer
+        status = 1
+        try:
+            with shop.app_context():
+                db.engine.dispose(close=False)  # the parent's connections stay the parent's
+            response = login(shop.test_client()).post("/crm/api/customer", json={"name": "Forked", "phone": "777"})
+            status = 0 if response.get_json().get("success") else 2
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    assert _total_customers(client) == before + 1
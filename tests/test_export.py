@@ -0,0 +1,37 @@
+# tests/test_export.py
+"""Resumable sales export (export.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import archive_bills
+from export import export_chunks, plan_export
+from models import db, Bill
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, None])
+def test_pages_cover_every_bill_once(make_app, limit):
+    app = make_app(ANALYTICS_CUBE=False)
+    recent = datetime.utcnow() - timedelta(hours=1)
+    # ids alternate between 2020, 2021 and this month: the partitions' id ranges overlap
+    dates = [datetime(2020, 3, 1), recent, datetime(2021, 5, 1), datetime(2020, 7, 1), recent,
+             datetime(2021, 6, 1), recent, datetime(2020, 9, 1)]
+    start, end = datetime(2020, 1, 1), recent + timedelta(days=1)
+    with app.app_context():
+        db.session.add_all([Bill(customer_name=f"c{n}", total=float(n), bill_date=d) for n, d in enumerate(dates)])
+        db.session.commit()
+        assert archive_bills(months=1)["bills"] == 5
+        assert len(plan_export(start, end)[0]) == 3  # the hot table, 2020 and 2021
+
+        pages, after = [], 0
+        while after is not None:
+            parts, until, after = plan_export(start, end, after=after, limit=limit)
+            pages.append([row[0] for rows in export_chunks(parts, "bills", start, end, chunk=2) for row in rows])
+            assert pages[-1][-1] == until
+            assert len(pages) <= len(dates)
+        db.session.remove()
+
+    exported = [bill_id for page in pages for bill_id in page]
+    assert exported == list(range(1, len(dates) + 1))
+    if limit:
+        assert all(len(page) <= limit * 3 for page in pages) and len(pages) > 1
@@ -0,0 +1,88 @@
+# tests/test_http_cache.py
+"""Conditional GETs (http_cache.py)."""
+from datetime import date, timedelta
+
+import pytest
+
+import routes.reports
+from conftest import login
+
+
+@pytest.fixture(scope="module")
+def client(shop):
+    return login(shop.test_client())
+
+
+def _today_is(monkeypatch, day):
+    class FixedDate(date):
+        @classmethod
+        def today(cls):
+            return cls(day.year, day.month, day.day)
+
+    monkeypatch.setattr(routes.reports, "date", FixedDate)
+
+
+def test_unchanged_tables_give_304(client):
+    first = client.get("/products/api")
+    assert first.status_code == 200
+    again = client.get("/products/api", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_write_changes_the_etag(client):
+    first = client.get("/products/api")
+    product_id = first.get_json()["products"][0]["id"]
+    assert client.put(f"/products/api/{product_id}", json={"reorder_level": 7}).status_code == 200
+    again = client.get("/products/api", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+
+
+def test_gst_report_tag_follows_the_resolved_range(client, monkeypatch):
+    _today_is(monkeypatch, date(2026, 3, 31))
+    march = client.get("/reports/gst")
+    assert march.status_code == 200
+    assert march.get_json()["from"] == "2026-03-01"
+    tag = march.headers["ETag"]
+    assert client.get("/reports/gst", headers={"If-None-Match": tag}).status_code == 304
+
+    # no write, but the same URL now means April
+    _today_is(monkeypatch, date(2026, 4, 1))
+    april = client.get("/reports/gst", headers={"If-None-Match": tag})
+    assert april.status_code == 200
+    assert (april.get_json()["from"], april.get_json()["to"]) == ("2026-04-01", "2026-04-01")
+    assert april.headers["ETag"] != tag
+
+
+def test_gst_report_tag_covers_the_parameters(client):
+    url = "/reports/gst?from=2026-01-01&to=2026-01-31"
+    by_day = client.get(url)
+    tags = {by_day.headers["ETag"]}
+    for extra in ("&by=month", "&format=csv"):
+        response = client.get(url + extra, headers={"If-None-Match": by_day.headers["ETag"]})
+        assert response.status_code == 200
+        tags.add(response.headers["ETag"])
+    assert len(tags) == 3
+
+
+def test_gst_report_ignores_if_modified_since(client, monkeypatch):
+    _today_is(monkeypatch, date(2026, 3, 31))
+    march = client.get("/reports/gst")
+    _today_is(monkeypatch, date(2026, 4, 1))
+    response = client.get("/reports/gst", headers={"If-Modified-Since": march.headers["Last-Modified"]})
+    assert response.status_code == 200
+
+    # views keyed on tables alone still use it
+    products = client.get("/products/api")
+    response = client.get("/products/api", headers={"If-Modified-Since": products.headers["Last-Modified"]})
+    assert response.status_code == 304
+
+
+def test_invalid_gst_parameters_are_not_tagged(client):
+    response = client.get("/reports/gst?from=2026-02-30")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Dates must be YYYY-MM-DD"
+    assert "ETag" not in response.headers
+
+    day = date(2026, 1, 2)
+    response = client.get(f"/reports/gst?from={day}&to={day - timedelta(days=1)}")
+    assert response.status_code == 400
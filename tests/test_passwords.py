@@ -0,0 +1,82 @@
+# tests/test_passwords.py
+"""Password hashing policy (passwords.py)."""
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from passwords import HashingPool, LoginThrottled, configure_password_hashing, needs_rehash, verify_password
+
+
+@pytest.fixture
+def policy():
+    """policy(method) -> an app context whose PASSWORD_HASH_METHOD is ``method``."""
+    contexts = []
+
+    def enter(method):
+        app = Flask(__name__)
+        app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_WORKERS=0)
+        configure_password_hashing(app)
+        contexts.append(app.app_context())
+        contexts[-1].push()
+
+    yield enter
+    for context in reversed(contexts):
+        context.pop()
+
+
+@pytest.mark.parametrize("method, stored, rehash", [
+    ("pbkdf2:sha256:600000", "pbkdf2:sha256:600000", False),
+    ("pbkdf2:sha256", "pbkdf2:sha256:600000", False),  # iterations left to the stored hash
+    ("pbkdf2", "pbkdf2:sha256:1000000", False),
+    ("pbkdf2:sha256:600000", "pbkdf2:sha256:260000", True),
+    ("pbkdf2:sha512", "pbkdf2:sha256:600000", True),
+    ("scrypt:32768:8:1", "scrypt:32768:8:1", False),
+    ("scrypt", "scrypt:16384:8:1", False),
+    ("scrypt:32768:8:1", "scrypt:16384:8:1", True),
+    ("scrypt:32768:8:1", "pbkdf2:sha256:600000", True),
+    ("pbkdf2:sha256:600000", "scrypt:32768:8:1", True),
+])
+def test_needs_rehash(policy, method, stored, rehash):
+    policy(method)
+    assert needs_rehash(f"{stored}$salt$hash") is rehash
+
+
+def test_fresh_hash_needs_no_rehash(policy):
+    # werkzeug fills in the defaults the setting leaves out
+    for method in ("pbkdf2:sha256", "pbkdf2:sha256:1000", "scrypt"):
+        policy(method)
+        assert not needs_rehash(generate_password_hash("secret", method))
+
+
+def test_login_upgrades_outdated_hash(policy):
+    policy("pbkdf2:sha256:2000")
+    user = SimpleNamespace(id=1, password=generate_password_hash("secret", "pbkdf2:sha256:1000"))
+    assert verify_password(user, "secret")
+    assert user.password.startswith("pbkdf2:sha256:2000$")
+    assert check_password_hash(user.password, "secret")
+
+
+def test_login_keeps_current_hash(policy):
+    policy("pbkdf2:sha256")
+    stored = generate_password_hash("secret", "pbkdf2:sha256:1000")
+    user = SimpleNamespace(id=1, password=stored)
+    assert verify_password(user, "secret")
+    assert user.password == stored
+    assert not verify_password(user, "wrong")
+
+
+def test_pool_throttles_per_key():
+    pool = HashingPool(workers=0, max_pending=8, per_key=1)
+    inner = []
+
+    def nested():
+        # a second check for the same account while the first is in flight
+        with pytest.raises(LoginThrottled):
+            pool.run(lambda: None, keys=("user:1",))
+        inner.append(pool.run(lambda: "other", keys=("user:2",)))
+
+    pool.run(nested, keys=("user:1",))
+    assert inner == ["other"]
+    assert pool.rejected == 1
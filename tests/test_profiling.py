@@ -0,0 +1,52 @@
+# tests/test_profiling.py
+"""On-demand request profiles (profiling.py)."""
+import pytest
+
+from conftest import login, new_app, test_config
+from models import db, Tenant, User
+from passwords import hash_password
+
+TOKEN = "profile-token"
+OTHER_EMAIL, OTHER_PASSWORD = "profiled@example.com", "otherpass"
+
+
+@pytest.fixture(scope="module")
+def app(shop, tmp_path_factory):
+    with shop.app_context():
+        store = Tenant(name="Profiled store", slug="profiled")
+        db.session.add(store)
+        db.session.flush()
+        db.session.add(User(name="Other", email=OTHER_EMAIL, password=hash_password(OTHER_PASSWORD),
+                            tenant_id=store.id))
+        db.session.commit()
+        db.session.remove()
+    return new_app(test_config(str(tmp_path_factory.mktemp("profiling")), PROFILING=True, PROFILE_TOKEN=TOKEN,
+                               SQLALCHEMY_DATABASE_URI=shop.config["SQLALCHEMY_DATABASE_URI"]))
+
+
+def test_admins_profile_requests(app):
+    client = login(app.test_client())
+    response = client.get("/products/api?_profile=pstats")
+    name = response.headers["X-Profile-Id"]
+    assert name.endswith(".pstats")
+    assert name in [p["name"] for p in client.get("/admin/profiles").get_json()]
+    assert client.get(f"/admin/profiles/{name}").status_code == 200
+
+
+def test_other_stores_cannot_profile(app):
+    client = login(app.test_client(), OTHER_EMAIL, OTHER_PASSWORD)
+    response = client.get("/products/api?_profile=pstats")
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert client.get("/admin/profiles").status_code == 403
+    assert app.test_client().get("/admin/profiles").status_code in (302, 401)  # nobody logged in
+
+
+def test_token_allows_profiling(app):
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {TOKEN}", "X-Profile": "collapsed"}
+    name = client.get("/login", headers=headers).headers["X-Profile-Id"]
+    assert name.endswith(".folded")
+    listed = client.get("/admin/profiles", headers={"Authorization": f"Bearer {TOKEN}"})
+    assert name in [p["name"] for p in listed.get_json()]
+    assert client.get("/admin/profiles", headers={"Authorization": "Bearer wrong"}).status_code in (302, 401)
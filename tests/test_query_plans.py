@@ -0,0 +1,81 @@
+# tests/test_query_plans.py
+"""Hot endpoints' queries use indexes (EXPLAIN QUERY PLAN, database.py)."""
+import pytest
+
+import datagen
+from archive import archive_bills
+from conftest import SHOP_BILLS, new_app, test_config
+from database import ALLOWED_FULL_SCANS, HOT_ENDPOINTS, collect_query_plans, find_full_scans
+from models import db
+
+ENDPOINTS = [name for name, _ in HOT_ENDPOINTS]
+
+
+def _scans(plans, endpoint):
+    return [(table, " ".join(sql.split())[:200]) for _, table, sql in find_full_scans({endpoint: plans[endpoint]})]
+
+
+@pytest.fixture(scope="module")
+def database_backend():
+    return "sqlite"  # EXPLAIN QUERY PLAN
+
+
+@pytest.fixture(scope="module")
+def plans(shop):
+    return collect_query_plans(shop, db)
+
+
+@pytest.fixture(scope="module")
+def archived_shop(tmp_path_factory):
+    # own shop: archiving moves its older bills into yearly partitions
+    app = new_app(test_config(str(tmp_path_factory.mktemp("archived"))))
+    datagen.generate(app, SHOP_BILLS, seed=7, progress=False)
+    with app.app_context():
+        moved = archive_bills(months=6)
+        db.session.remove()
+    assert moved["bills"], "nothing was archived"
+    return app
+
+
+@pytest.fixture(scope="module")
+def archived_plans(archived_shop):
+    return collect_query_plans(archived_shop, db)
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_hot_endpoint_uses_indexes(plans, endpoint):
+    assert plans[endpoint], "the endpoint ran no query"
+    assert _scans(plans, endpoint) == []
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_hot_endpoint_uses_indexes_with_archived_years(archived_plans, endpoint):
+    assert _scans(archived_plans, endpoint) == []
+
+
+def test_archived_bill_is_found_by_index(archived_shop):
+    # bill 1 is the oldest: /billing/view looks it up in its year's partition
+    plans = collect_query_plans(archived_shop, db, [("billing.view_bill", "/billing/view/1")])
+    assert any("archive_partitions" in sql for sql, _ in plans["billing.view_bill"])
+    assert _scans(plans, "billing.view_bill") == []
+
+
+def test_empty_database_uses_indexes(make_app):
+    # no bills yet: /billing/view looks for the bill in the archive
+    plans = collect_query_plans(make_app(), db)
+    assert find_full_scans(plans) == []
+
+
+def test_full_scans_are_reported():
+    plans = {
+        "billing.view_bill": [("SELECT ... FROM bill", ["SCAN bill"])],
+        "product.api_list": [("SELECT ... FROM product", ["SEARCH product USING INDEX ix_product_tenant_id_name (tenant_id=?)"])],
+        "crm.crm_metrics": [("SELECT ... FROM customers", ["SCAN customers"])],
+    }
+    assert [(name, table) for name, table, _ in find_full_scans(plans)] == [("billing.view_bill", "bill")]
+    assert ("crm.crm_metrics", "customers") in ALLOWED_FULL_SCANS
+
+
+def test_covering_index_scans_are_not_full_scans():
+    plans = {"product.api_list": [("SELECT ...", ["SCAN product USING COVERING INDEX ix_product_tenant_id_name"])]}
+    assert find_full_scans(plans) == []
@@ -0,0 +1,73 @@
+# tests/test_render_cache.py
+"""Rendered bill pages (render_cache.py)."""
+import os
+
+import pytest
+
+from conftest import login, new_app, test_config
+from models import db, BillItem
+from render_cache import RenderCache
+
+
+@pytest.fixture(scope="module")
+def client(shop):
+    return login(shop.test_client())
+
+
+def _counts(app):
+    return dict(app.extensions["render_cache"].counts)
+
+
+def test_second_view_is_served_from_memory(shop, client):
+    before = _counts(shop)
+    first = client.get("/billing/view/3")
+    again = client.get("/billing/view/3")
+    assert first.status_code == again.status_code == 200
+    assert again.data == first.data
+    after = _counts(shop)
+    assert (after["rendered"] - before["rendered"], after["memory"] - before["memory"]) == (1, 1)
+
+    client.get("/billing/print/3")  # another template: a page of its own
+    assert _counts(shop)["rendered"] == after["rendered"] + 1
+
+
+def test_pages_spill_to_disk(shop, tmp_path):
+    # a cache too small for any page: each one goes straight to disk
+    app = new_app(test_config(str(tmp_path), RENDER_CACHE_MB=0.001,
+                              SQLALCHEMY_DATABASE_URI=shop.config["SQLALCHEMY_DATABASE_URI"]))
+    client = login(app.test_client())
+    first = client.get("/billing/view/4")
+    cache = app.extensions["render_cache"]
+    assert cache.stats()["pages"] == 0
+    assert [name for name in os.listdir(tmp_path / "render-cache") if name.endswith(".html")]
+
+    cache._reset()  # another worker, with nothing in memory
+    again = client.get("/billing/view/4")
+    assert again.data == first.data
+    assert (cache.counts["disk"], cache.counts["rendered"]) == (1, 0)
+
+
+def test_disk_is_trimmed_least_recently_used_first(tmp_path):
+    cache = RenderCache(10, str(tmp_path), 250)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.encode() * 100)
+        os.utime(tmp_path / f"{key}.html", (ord(key), ord(key)))  # a is the oldest
+    # the third page took the disk over 250 bytes
+    assert sorted(os.listdir(tmp_path)) == ["b.html", "c.html", "names.rev"]
+    assert cache.stats()["disk_bytes"] == 200
+    assert cache.get("a") is None and cache.get("b") == b"b" * 100
+
+
+def test_product_rename_renders_pages_again(shop, client):
+    with shop.app_context():
+        product_id = BillItem.query.filter_by(bill_id=5).first().product_id
+        db.session.remove()
+    assert client.get("/billing/view/5").status_code == 200
+    before = _counts(shop)
+
+    assert client.put(f"/products/api/{product_id}", json={"name": "Renamed for the page"}).status_code == 200
+    page = client.get("/billing/view/5")
+    assert b"Renamed for the page" in page.data
+    assert _counts(shop)["rendered"] == before["rendered"] + 1
+    assert client.get("/billing/view/5").data == page.data  # cached again
+    assert _counts(shop)["rendered"] == before["rendered"] + 1
@@ -0,0 +1,98 @@
+# tests/test_segmentation.py
+"""RFM segments (segmentation.py) and the CRM's segment filter."""
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from conftest import login
+from models import db, Bill, Customer, CustomerSegment
+from segmentation import quantile_edges, recompute_segments, score_rfm
+from tenancy import tenant_context
+
+
+def test_ties_on_an_edge_score_low():
+    # most customers buy once: every frequency edge is 1, and 1 stays f=1
+    frequency = np.array([1, 1, 1, 1, 1, 1, 1, 2, 5])
+    assert quantile_edges(frequency)[:3] == [1, 1, 1]
+    scores, _ = score_rfm(np.arange(9), frequency, np.arange(9, dtype=float))
+    assert scores["f_score"].tolist() == [1] * 7 + [5, 5]
+
+
+def test_scores_run_one_to_five():
+    values = np.arange(100)
+    scores, edges = score_rfm(values, values, values.astype(float))
+    assert len(edges["r"]) == 4
+    # recency: the fewer days since the last purchase, the higher
+    assert (scores["r_score"][0], scores["r_score"][-1]) == (5, 1)
+    assert (scores["f_score"][0], scores["f_score"][-1]) == (1, 5)
+    assert sorted(set(scores["m_score"].tolist())) == [1, 2, 3, 4, 5]
+
+
+def test_given_edges_score_outliers_at_the_ends():
+    edges = {"r": [10, 20, 30, 40], "f": [1, 2, 3, 4], "m": [100, 200, 300, 400]}
+    scores, same = score_rfm(np.array([0, 1000]), np.array([50, 1]), np.array([1e6, 0.0]), edges)
+    assert same is edges
+    assert scores["r_score"].tolist() == [5, 1]
+    assert scores["f_score"].tolist() == [5, 1]
+    assert scores["m_score"].tolist() == [5, 1]
+
+
+@pytest.mark.parametrize("r, f, m, segment", [
+    (5, 5, 5, "champions"),
+    (3, 4, 1, "loyal"),
+    (5, 1, 1, "new"),
+    (4, 3, 2, "promising"),
+    (2, 3, 5, "at_risk"),
+    (1, 1, 1, "hibernating"),
+    (3, 2, 3, "needs_attention"),
+])
+def test_segment_labels(r, f, m, segment):
+    edges = {"r": [1, 2, 3, 4], "f": [1, 2, 3, 4], "m": [1, 2, 3, 4]}
+    # values that land on the wanted scores against these edges
+    scores, _ = score_rfm(np.array([6 - r]), np.array([f]), np.array([float(m)]), edges)
+    assert (scores["r_score"][0], scores["f_score"][0], scores["m_score"][0]) == (r, f, m)
+    assert scores["segment"][0] == segment
+
+
+def test_full_run_without_bills_clears_segments(make_app):
+    app = make_app()
+    with app.app_context():
+        customer = Customer(name="Asha", phone="1")
+        db.session.add(customer)
+        db.session.flush()
+        bill = Bill(customer_name="Asha", customer_id=customer.id, total=10.0, bill_date=datetime.utcnow())
+        db.session.add(bill)
+        db.session.commit()
+        assert recompute_segments(full=True)["customers_scored"] == 1
+        assert CustomerSegment.query.count() == 1
+
+        db.session.delete(bill)
+        db.session.commit()
+        assert recompute_segments(full=True) == {"full": True, "customers_scored": 0}
+        assert CustomerSegment.query.count() == 0
+        db.session.remove()
+
+
+@pytest.fixture(scope="module")
+def segmented(shop):
+    with shop.app_context(), tenant_context(1):
+        recompute_segments(full=True)
+        counts = dict(db.session.query(CustomerSegment.segment, db.func.count()).group_by(CustomerSegment.segment))
+        db.session.remove()
+    return counts
+
+
+def test_customers_filter_by_segment(shop, segmented):
+    client = login(shop.test_client())
+    wanted = sorted(segmented, key=segmented.get)[-2:]  # the two largest
+    customers = client.get(f"/crm/api/customers?segment={','.join(wanted)}").get_json()
+    assert {c["segment"] for c in customers} == set(wanted)
+    assert len(customers) == sum(segmented[s] for s in wanted)
+    assert len(client.get("/crm/api/customers").get_json()) >= len(customers)
+
+
+def test_unknown_segment_is_rejected(shop):
+    response = login(shop.test_client()).get("/crm/api/customers?segment=champions,vip")
+    assert response.status_code == 400
+    assert "vip" in response.get_json()["error"]
@@ -0,0 +1,67 @@
+# tests/test_stock_alerts.py
+"""Low-stock alerts (stock_alerts.py) and the reorder levels they follow."""
+import io
+
+import openpyxl
+import pytest
+
+from conftest import login
+from models import db, LowStock, Product
+from stock_alerts import alerts
+
+
+@pytest.fixture(scope="module")
+def client(shop):
+    return login(shop.test_client())
+
+
+@pytest.fixture
+def events():
+    received = []
+    callback = alerts.subscribe(received.append)
+    yield received
+    alerts.unsubscribe(callback)
+
+
+def _low_ids(client):
+    return [item["id"] for item in client.get("/products/api/low-stock").get_json()["items"]]
+
+
+def test_sale_raises_and_restock_clears_the_alert(shop, client, events):
+    response = client.post("/products/api", json={"name": "Alert tea", "price": 5, "stock": 6, "reorder_level": 5})
+    product_id = response.get_json()["product"]["id"]
+    assert product_id not in _low_ids(client) and events == []
+
+    response = client.post("/billing/create", json={"items": [{"id": product_id, "quantity": 2}]})
+    assert response.status_code == 201, response.get_json()
+    assert [(e["event"], e["product_id"], e["stock"]) for e in events] == [("low", product_id, 4)]
+    assert product_id in _low_ids(client)
+
+    assert client.put(f"/products/api/{product_id}", json={"stock": 20}).status_code == 200
+    assert [(e["event"], e["product_id"], e["stock"]) for e in events][1:] == [("restocked", product_id, 20)]
+    assert product_id not in _low_ids(client)
+    with shop.app_context():
+        assert db.session.get(LowStock, product_id) is None
+        db.session.remove()
+
+
+def test_blank_reorder_cells_keep_the_level(shop, client):
+    response = client.post("/products/api", json={"name": "Import level kept", "price": 5, "stock": 30,
+                                                  "reorder_level": 12})
+    assert response.status_code == 201
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "price", "stock", "reorder_level"])
+    sheet.append(["Import level kept", 5, 30, None])
+    sheet.append(["Import level default", 5, 30, ""])
+    sheet.append(["Import level set", 5, 30, 8])
+    data = io.BytesIO()
+    workbook.save(data)
+    data.seek(0)
+
+    response = client.post("/products/api/import", data={"file": (data, "products.xlsx")})
+    assert response.status_code == 200, response.get_json()
+    with shop.app_context():
+        levels = {p.name: p.reorder_level for p in Product.query.filter(Product.name.like("Import level %"))}
+        db.session.remove()
+    assert levels == {"Import level kept": 12, "Import level default": 5, "Import level set": 8}
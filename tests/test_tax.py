@@ -0,0 +1,260 @@
+# tests/test_tax.py
+"""GST in integer paise (tax.py) and rate validation on the routes."""
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import openpyxl
+import pytest
+from flask_migrate import upgrade
+
+from conftest import login, new_app, test_config
+from models import db, Product
+from routes.billing import _invoice_amounts
+from tax import compute_tax, normalize_rate, rate_to_bp, slab_summary, to_paise, DEFAULT_RATE_BP
+
+
+# ---- rates ----
+@pytest.mark.parametrize("percent, bp", [
+    (18, 1800), (18.0, 1800), ("18", 1800), ("18%", 1800), (" 18 % ", 1800),
+    (0, 0), (0.25, 25), (1, 100), (1.0, 100), (12.5, 1250), (100, 10000),
+    (np.float64(5), 500), (None, DEFAULT_RATE_BP), ("", DEFAULT_RATE_BP),
+])
+def test_rate_to_bp(percent, bp):
+    assert rate_to_bp(percent) == bp
+
+
+@pytest.mark.parametrize("percent", [-1, 100.01, "abc", "1a8", "18%%", float("nan"), float("inf"), True, [18]])
+def test_rate_to_bp_rejects(percent):
+    with pytest.raises(ValueError):
+        rate_to_bp(percent)
+
+
+def test_normalize_rate_is_percent():
+    assert normalize_rate("18%") == 18.0
+    assert normalize_rate(0.25) == 0.25  # a quarter of a percent, not 25 %
+    assert normalize_rate(12.346) == 12.35  # to the basis point
+    assert normalize_rate(None, default=0) == 0.0
+
+
+# ---- money ----
+@pytest.mark.parametrize("rupees, paise", [
+    (0, 0), (1, 100), (0.1, 10), (0.285, 29), (1.005, 101), (2.675, 268),
+    (19.99, 1999), (-0.285, -29), (-1.005, -101), (123456.78, 12345678),
+])
+def test_to_paise(rupees, paise):
+    assert to_paise(rupees) == paise
+
+
+def test_to_paise_array():
+    result = to_paise([0.285, 10.0, 99.995])
+    assert result.dtype == np.int64
+    assert result.tolist() == [29, 1000, 10000]
+
+
+# ---- engine ----
+def test_tax_rounds_half_up():
+    # 250 paise at 18 % is 45 paise; 25 paise at 18 % is 4.5 -> 5; 27 at 5 % is 1.35 -> 1
+    result = compute_tax([250, 25, 27], [1, 1, 1], [1800, 1800, 500])
+    assert result["tax"].tolist() == [45, 5, 1]
+
+
+def test_line_tax_is_on_the_line_not_the_unit():
+    # 3 x 0.33 rupees at 5 %: 99 paise taxable -> 4.95 -> 5, not 3 x 2
+    result = compute_tax([33], [3], [500])
+    assert result["taxable"].tolist() == [99]
+    assert result["tax"].tolist() == [5]
+
+
+def test_mixed_slabs_in_one_bill():
+    prices = to_paise([100.0, 49.99, 20.0, 10.0])
+    result = compute_tax(prices, [2, 1, 3, 1], [rate_to_bp(r) for r in (18, 5, 18, 0)])
+    assert result["taxable"].tolist() == [20000, 4999, 6000, 1000]
+    assert result["tax"].tolist() == [3600, 250, 1080, 0]
+    assert result["bill_taxable"].tolist() == [32000 - 1]
+    assert result["bill_tax"].tolist() == [4930]
+    assert result["bill_total"].tolist() == [31999 + 4930]
+    assert slab_summary(result) == [
+        {"rate": 0.0, "taxable": 10.0, "tax": 0.0},
+        {"rate": 5.0, "taxable": 49.99, "tax": 2.5},
+        {"rate": 18.0, "taxable": 260.0, "tax": 46.8},
+    ]
+
+
+def test_batch_of_bills():
+    result = compute_tax([1000, 1000, 500, 700], [1, 2, 1, 1], [1800, 500, 1200, 1800],
+                         bill_index=[0, 0, 1, 2], n_bills=4)
+    assert result["bill_taxable"].tolist() == [3000, 500, 700, 0]
+    assert result["bill_tax"].tolist() == [280, 60, 126, 0]
+    assert list(zip(result["slab_bill"].tolist(), result["slab_rate_bp"].tolist())) == [
+        (0, 500), (0, 1800), (1, 1200), (2, 1800),
+    ]
+    assert slab_summary(result, bill=1) == [{"rate": 12.0, "taxable": 5.0, "tax": 0.6}]
+    assert slab_summary(result, bill=3) == []
+
+
+def test_bill_totals_are_sums_of_lines():
+    rng = np.random.default_rng(1)
+    n = 5000
+    bills = np.sort(rng.integers(0, 400, n))
+    result = compute_tax(rng.integers(1, 10**6, n), rng.integers(1, 20, n),
+                         rng.choice([0, 500, 1200, 1800, 2800], n), bills, 400)
+    assert result["bill_tax"].sum() == result["tax"].sum() == result["slab_tax"].sum()
+    assert result["bill_taxable"].sum() == result["taxable"].sum() == result["slab_taxable"].sum()
+
+
+# ---- routes ----
+@pytest.fixture(scope="module")
+def client(shop):
+    return login(shop.test_client())
+
+
+def test_product_gst_saved_as_percent(client):
+    response = client.post("/products/api", json={"name": "GST probe", "price": 10, "stock": 1, "gst": "12%"})
+    assert response.status_code == 201
+    product = response.get_json()["product"]
+    assert product["gst"] == 12.0
+
+    response = client.put(f"/products/api/{product['id']}", json={"gst": 0.25})
+    assert response.status_code == 200
+    assert response.get_json()["product"]["gst"] == 0.25
+
+
+@pytest.mark.parametrize("gst", [-5, 150, "eighteen", "18 percent"])
+def test_bad_gst_is_rejected(client, gst):
+    response = client.post("/products/api", json={"name": "Bad GST", "price": 10, "stock": 1, "gst": gst})
+    assert response.status_code == 400
+    assert "GST rate" in response.get_json()["error"]
+
+    product_id = client.get("/products/api?q=Rice").get_json()["products"][0]["id"]
+    response = client.put(f"/products/api/{product_id}", json={"gst": gst})
+    assert response.status_code == 400
+
+
+def test_import_rejects_bad_gst_row(client, shop):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "price", "stock", "gst"])
+    sheet.append(["Import OK", 10, 5, 18])
+    sheet.append(["Import bad", 10, 5, 180])
+    data = io.BytesIO()
+    workbook.save(data)
+    data.seek(0)
+
+    response = client.post("/products/api/import", data={"file": (data, "products.xlsx")})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Row 3:")
+    with shop.app_context():
+        assert Product.query.filter(Product.name.like("Import %")).count() == 0  # nothing half-imported
+        db.session.remove()
+
+
+def test_import_reads_percent_formatted_cells(client, shop):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "price", "stock", "gst"])
+    sheet.append(["Formatted rate", 10, 5, 0.12])
+    sheet.append(["Plain rate", 10, 5, 12])
+    sheet["D2"].number_format = "0%"
+    data = io.BytesIO()
+    workbook.save(data)
+    data.seek(0)
+
+    response = client.post("/products/api/import", data={"file": (data, "products.xlsx")})
+    assert response.status_code == 200, response.get_json()
+    with shop.app_context():
+        rates = {p.name: p.gst for p in Product.query.filter(Product.name.like("% rate")).all()}
+        db.session.remove()
+    assert rates["Formatted rate"] == rates["Plain rate"] == 12.0
+
+
+def test_bill_with_invalid_stored_rate_is_a_client_error(client, shop):
+    with shop.app_context():
+        product = Product(name="Legacy rate", price=10, stock=10, gst=250.0)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+        db.session.remove()
+
+    response = client.post("/billing/create", json={"items": [{"id": product_id, "quantity": 1}]})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Legacy rate:")
+
+
+def test_bill_tax_uses_percent_rates(client, shop):
+    with shop.app_context():
+        product = Product(name="Percent rate", price=100, stock=10, gst=5.0)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+        db.session.remove()
+
+    response = client.post("/billing/create", json={"items": [{"id": product_id, "quantity": 2}]})
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body["subtotal"], body["gst"], body["total"]) == (200.0, 10.0, 210.0)
+    assert body["gst_breakdown"] == [{"rate": 5.0, "taxable": 200.0, "tax": 10.0}]
+
+
+def test_migration_stores_percent(tmp_path):
+    app = new_app(test_config(str(tmp_path)))
+    with app.app_context():
+        upgrade(revision="0009")
+        db.session.execute(db.text(
+            "INSERT INTO product (name, price, stock, gst) VALUES ('a', 1, 0, 0.18), ('b', 1, 0, 1.0), ('c', 1, 0, NULL)"))
+        db.session.commit()
+        upgrade(revision="0010")
+        rates = db.session.execute(db.text("SELECT gst FROM product ORDER BY name")).scalars().all()
+        db.session.remove()
+    assert rates == [pytest.approx(18.0), 100.0, None]
+
+
+def test_rates_are_converted_once(tmp_path):
+    app = new_app(test_config(str(tmp_path)))
+    with app.app_context():
+        upgrade(revision="0002")
+        db.session.execute(db.text(
+            "INSERT INTO product (name, price, stock, gst) VALUES ('a', 1, 0, 0.18), ('b', 1, 0, 1.0), ('c', 1, 0, 0.01)"))
+        db.session.commit()
+        upgrade(revision="0010")
+        rates = db.session.execute(db.text("SELECT gst FROM product ORDER BY name")).scalars().all()
+        db.session.remove()
+    assert rates == [pytest.approx(18.0), 100.0, pytest.approx(1.0)]  # 100 % stays 100 %
+
+
+def test_backfilled_bills_keep_their_charged_total(tmp_path):
+    app = new_app(test_config(str(tmp_path)))
+    with app.app_context():
+        upgrade(revision="0002")
+        # charged at 18 % when billed; the product is at 5 % now
+        for sql in (
+            "INSERT INTO product (id, name, price, stock, gst) VALUES (1, 'a', 50, 0, 0.05)",
+            "INSERT INTO bill (id, customer_name, total) VALUES (1, 'x', 118.0)",
+            "INSERT INTO bill_item (bill_id, product_id, quantity, subtotal) VALUES (1, 1, 2, 100.0)",
+        ):
+            db.session.execute(db.text(sql))
+        db.session.commit()
+        upgrade(revision="0003")
+        bill = db.session.execute(db.text("SELECT taxable_paise, tax_paise FROM bill")).one()
+        item = db.session.execute(db.text("SELECT gst_rate_bp, tax_paise FROM bill_item")).one()
+        db.session.remove()
+    assert tuple(bill) == (10000, 1800)
+    assert tuple(item) == (500, 500)
+
+
+def test_invoice_prints_the_charged_total():
+    items = [SimpleNamespace(gst_rate_bp=500, tax_paise=500)]
+    backfilled = SimpleNamespace(total=118.0, taxable_paise=10000, tax_paise=1800)
+    assert _invoice_amounts(backfilled, items, 100.0) == (100.0, 18.0, 118.0, [])
+
+    posted = SimpleNamespace(total=105.0, taxable_paise=10000, tax_paise=500)
+    assert _invoice_amounts(posted, items, 100.0) == (100.0, 5.0, 105.0, [(500, 500)])
+
+    legacy = SimpleNamespace(total=118.0, taxable_paise=None, tax_paise=None)
+    assert _invoice_amounts(legacy, items, 100.0) == (100.0, 18.0, 118.0, None)
+
+
+def test_invoice_pdf(client):
+    response = client.get("/billing/invoice/1/pdf")
+    assert response.status_code == 200
+    assert response.data.startswith(b"%PDF")
@@ -0,0 +1,164 @@
+# tests/test_tenancy.py
+"""Stores (tenancy.py): one store's rows never show up in another's."""
+import os
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+
+from conftest import login, new_app, test_config
+from instrumentation import _after_cursor_execute
+from inventory import stock_as_of
+from models import db, CustomerActivity, Product, StockMovement, StockSnapshot, StockSnapshotRun, Tenant, User
+from passwords import hash_password
+from tenancy import tenant_context
+
+OTHER_EMAIL, OTHER_PASSWORD = "other@example.com", "otherpass"
+
+
+@pytest.fixture(scope="module")
+def other_store(shop):
+    """Id of a second store in ``shop``, with one user and nothing else."""
+    with shop.app_context():
+        store = Tenant(name="Other store", slug="other")
+        db.session.add(store)
+        db.session.flush()
+        db.session.add(User(name="Other", email=OTHER_EMAIL, password=hash_password(OTHER_PASSWORD),
+                            tenant_id=store.id))
+        db.session.commit()
+        store_id = store.id
+        db.session.remove()
+    return store_id
+
+
+@pytest.fixture(scope="module")
+def clients(shop, other_store):
+    """(main store client, other store client)"""
+    return login(shop.test_client()), login(shop.test_client(), OTHER_EMAIL, OTHER_PASSWORD)
+
+
+def _create_product(client, name, stock):
+    response = client.post("/products/api", json={"name": name, "price": 5, "stock": stock})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["product"]["id"]
+
+
+def test_stock_movements_stay_in_their_store(shop, clients, other_store):
+    main, other = clients
+    product_id = _create_product(other, "Other's tea", 9)
+
+    own = other.get(f"/products/api/{product_id}/movements")
+    assert own.status_code == 200
+    assert [(m["kind"], m["quantity"]) for m in own.get_json()["movements"]] == [("adjustment", 9)]
+    assert other.get("/products/api/1/movements").status_code == 404
+    assert main.get(f"/products/api/{product_id}/movements").status_code == 404
+    with shop.app_context():
+        assert StockMovement.query.filter_by(product_id=product_id).one().tenant_id == other_store
+        db.session.remove()
+
+
+def test_activity_stays_in_its_store(shop, other_store, tmp_path):
+    app = new_app(test_config(str(tmp_path), ACTIVITY_LOG=True,
+                              SQLALCHEMY_DATABASE_URI=shop.config["SQLALCHEMY_DATABASE_URI"]))
+    main, other = login(app.test_client()), login(app.test_client(), OTHER_EMAIL, OTHER_PASSWORD)
+    response = other.post("/crm/api/customer", json={"name": "Other's customer", "phone": "555"})
+    customer_id = response.get_json()["customer_id"]
+    assert app.extensions["activity_log"].flush()
+
+    own = other.get(f"/crm/api/customer/{customer_id}/activity")
+    assert own.status_code == 200
+    assert [a["action"] for a in own.get_json()["activity"]] == ["customer_created"]
+    assert other.get("/crm/api/customer/1/activity").status_code == 404
+    assert main.get(f"/crm/api/customer/{customer_id}/activity").status_code == 404
+    with app.app_context():
+        assert CustomerActivity.query.filter_by(customer_id=customer_id).one().tenant_id == other_store
+        db.session.remove()
+
+
+def test_snapshots_run_per_store(shop, clients, other_store):
+    _, other = clients
+    product_id = _create_product(other, "Other's coffee", 4)
+    with shop.app_context(), tenant_context(other_store):
+        own = {p.id: p.stock for p in Product.query if p.stock}
+        db.session.remove()
+
+    result = shop.test_cli_runner().invoke(args=["stock-snapshot"])
+    assert result.exit_code == 0, result.output
+    assert "store 1: full snapshot" in result.output
+    assert f"store {other_store}: full snapshot of {len(own)} products" in result.output
+    with shop.app_context():
+        with tenant_context(other_store):
+            run = StockSnapshotRun.query.one()
+            assert {s.product_id for s in StockSnapshot.query} == set(own)
+            assert stock_as_of(run.taken_at) == own
+            assert own[product_id] == 4
+        assert StockSnapshot.query.filter_by(product_id=product_id).one().tenant_id == other_store
+        db.session.remove()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+@pytest.mark.parametrize("session_identity", [False, True])
+def test_assign_reaches_every_worker(shop, clients, other_store, monkeypatch, session_identity):
+    monkeypatch.setitem(shop.config, "USER_SESSION_IDENTITY", session_identity)
+    email = f"mover{int(session_identity)}@example.com"
+    with shop.app_context():
+        db.session.add(User(name="Mover", email=email, password=hash_password(OTHER_PASSWORD)))
+        db.session.commit()
+        db.session.remove()
+    _create_product(clients[1], f"Other's jam {email}", 1)
+    client = login(shop.test_client(), email, OTHER_PASSWORD)
+    url = f"/products/api?q=Other's jam {email}"
+    for _ in range(2):  # the second request is served from the cache (or cookie)
+        assert client.get(url).get_json()["products"] == []
+
+    pid = os.fork()
+    if pid == 0:  # `flask tenants assign` in a process of its own
+        status = 1
+        try:
+            with shop.app_context():
+                db.engine.dispose(close=False)
+            result = shop.test_cli_runner().invoke(args=["tenants", "assign", email, "other"])
+            status = result.exit_code
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    assert [p["name"] for p in client.get(url).get_json()["products"]] == [f"Other's jam {email}"]
+
+
+def test_migration_assigns_existing_rows_to_their_store(tmp_path):
+    app = new_app(test_config(str(tmp_path)))
+    with app.app_context():
+        upgrade(revision="0010")
+        for sql in (
+            "INSERT INTO tenant (id, name, slug) VALUES (2, 'Other', 'other')",
+            "INSERT INTO product (id, name, price, stock, tenant_id) VALUES (1, 'a', 1, 3, 1), (2, 'b', 1, 4, 2)",
+            "INSERT INTO customers (id, name, phone, tenant_id) VALUES (1, 'c', '1', 1), (2, 'd', '2', 2)",
+            "INSERT INTO customer_activity (customer_id, action) VALUES (1, 'x'), (2, 'y')",
+            "INSERT INTO stock_movement (product_id, kind, quantity, created_at) "
+            "VALUES (1, 'opening', 3, '2026-01-01'), (2, 'opening', 4, '2026-01-01'), (99, 'sale', -1, '2026-01-01')",
+        ):
+            db.session.execute(db.text(sql))
+        db.session.commit()
+        upgrade(revision="0011")
+        activity = db.session.execute(db.text("SELECT customer_id, tenant_id FROM customer_activity")).all()
+        movements = db.session.execute(db.text("SELECT product_id, tenant_id FROM stock_movement")).all()
+        db.session.remove()
+    assert sorted(activity) == [(1, 1), (2, 2)]
+    assert sorted(movements) == [(1, 1), (2, 2), (99, 1)]  # a deleted product's rows: the main store
+
+
+def test_store_databases_are_instrumented(tmp_path):
+    app = new_app(test_config(str(tmp_path), TENANT_DATABASES=True, INSTRUMENTATION=True))
+    with app.app_context():
+        upgrade()
+        store = Tenant(name="Own file", slug="own")
+        db.session.add(store)
+        db.session.commit()
+        engine = app.extensions["tenant_databases"].engine(store.id)  # creates and migrates its file
+        db.session.remove()
+    try:
+        assert event.contains(engine, "after_cursor_execute", _after_cursor_execute)
+    finally:
+        engine.dispose()
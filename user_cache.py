@@ -0,0 +1,175 @@
+# user_cache.py
+"""
+User loading for flask_login without a query per request.
+
+Two layers, both optional through config:
+
+- USER_CACHE_TTL / USER_CACHE_SIZE: in-process TTL + LRU of User column
+  snapshots keyed by id (TTL 0 disables it).
+- USER_SESSION_IDENTITY: keep {id, name, email, tenant_id} in the signed session
+  cookie and rebuild the user from it for USER_SESSION_IDENTITY_TTL seconds.
+
+Snapshots are re-attached with ``session.merge(load=False)``, which emits
+no SQL, so views can still modify and commit ``current_user``.
+
+Both layers carry the revision of a shared counter (a RevisionStore file,
+USER_CACHE_REVISIONS, default <instance>/user_cache.rev) as of when they
+were built. A committed change to a user (``invalidate_user``, ``flask
+tenants assign``) bumps it, and every worker on the host then reloads
+its users from the database on their next request instead of serving a
+stale store or profile until the TTL runs out.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, session
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from http_cache import RevisionStore
+from models import db, User
+
+SESSION_KEY = "_identity"
+IDENTITY_FIELDS = ("id", "name", "email", "tenant_id")  # tenant_id: every request reads it
+REVISION_KEY = "user"
+
+
+class UserCache:
+    """Thread-safe TTL + LRU map of user id -> detached User snapshot."""
+
+    def __init__(self, maxsize=1024, ttl=60, revisions=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.revisions = revisions  # RevisionStore shared by the host's workers
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def revision(self):
+        return self.revisions.get(REVISION_KEY)[0] if self.revisions is not None else 0
+
+    def get(self, user_id):
+        revision = self.revision()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None or entry[1] < time.monotonic() or entry[2] != revision:
+                if entry is not None:
+                    del self._data[user_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, snapshot, revision):
+        """Cache ``snapshot``, read from the database at ``revision``."""
+        with self._lock:
+            self._data[user_id] = (snapshot, time.monotonic() + self.ttl, revision)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(user_id, None)
+
+    def expire_all(self):
+        """Drop the cached users of every process sharing the revision file."""
+        if self.revisions is not None:
+            self.revisions.bump([REVISION_KEY])
+        self.invalidate()
+
+
+user_cache = UserCache()
+
+
+def configure_user_cache(app):
+    user_cache.maxsize = app.config.setdefault("USER_CACHE_SIZE", 1024)
+    user_cache.ttl = app.config.setdefault("USER_CACHE_TTL", 60)
+    app.config.setdefault("USER_SESSION_IDENTITY", False)
+    app.config.setdefault("USER_SESSION_IDENTITY_TTL", 300)
+    path = app.config.get("USER_CACHE_REVISIONS") or os.path.join(app.instance_path, "user_cache.rev")
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    user_cache.revisions = RevisionStore(None if path == ":memory:" else path)
+    user_cache.invalidate()
+
+
+def _snapshot(**columns):
+    """Detached User carrying ``columns``; anything missing lazy-loads."""
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return user
+
+
+def _column_values(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+# ==========================
+# Session identity
+# ==========================
+def remember_identity(user):
+    """Store the minimal identity in the (signed) session cookie."""
+    if current_app.config.get("USER_SESSION_IDENTITY"):
+        identity = {field: getattr(user, field) for field in IDENTITY_FIELDS}
+        identity["at"] = time.time()
+        identity["rev"] = user_cache.revision()
+        session[SESSION_KEY] = identity
+
+
+def forget_identity():
+    session.pop(SESSION_KEY, None)
+
+
+def _identity_from_session(user_id):
+    identity = session.get(SESSION_KEY)
+    if not identity or identity.get("id") != user_id or not identity.keys() >= set(IDENTITY_FIELDS):
+        return None
+    if time.time() - identity.get("at", 0) > current_app.config["USER_SESSION_IDENTITY_TTL"]:
+        return None
+    if identity.get("rev") != user_cache.revision():
+        return None
+    return _snapshot(**{field: identity[field] for field in IDENTITY_FIELDS})
+
+
+# ==========================
+# Loader / invalidation
+# ==========================
+def load_user(user_id):
+    """flask_login user_loader: session identity, then cache, then DB."""
+    config = current_app.config
+
+    if config.get("USER_SESSION_IDENTITY"):
+        snapshot = _identity_from_session(user_id)
+        if snapshot is not None:
+            return db.session.merge(snapshot, load=False)
+
+    if user_cache.ttl > 0:
+        snapshot = user_cache.get(user_id)
+        if snapshot is not None:
+            return db.session.merge(snapshot, load=False)
+
+    revision = user_cache.revision()  # before the read: a change committed meanwhile expires it
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+
+    if user_cache.ttl > 0:
+        user_cache.set(user_id, _snapshot(**_column_values(user)), revision)
+    if config.get("USER_SESSION_IDENTITY"):
+        remember_identity(user)
+    return user
+
+
+def invalidate_user(user):
+    """Call after committing changes to a user (profile, password)."""
+    user_cache.expire_all()
+    if session.get(SESSION_KEY, {}).get("id") == user.id:
+        remember_identity(user)
@@ -0,0 +1,32 @@
+# wsgi.py
+"""
+Production entry point.
+
+    gunicorn -c gunicorn.conf.py        # Linux / macOS
+    python wsgi.py                      # Windows (waitress)
+
+Worker / thread counts default from the CPU count, see gunicorn.conf.py;
+override with WEB_CONCURRENCY and WEB_THREADS.
+"""
+import os
+
+from dotenv import load_dotenv  #type: ignore
+
+load_dotenv()
+
+from app import create_app  # noqa: E402
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    from waitress import serve  #type: ignore
+
+    # waitress is a single process; hashing and SQLite release the GIL,
+    # so a few threads per core still pay off
+    serve(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 5000)),
+        threads=int(os.getenv("WEB_THREADS", 4 * (os.cpu_count() or 1))),
+    )